@@ -0,0 +1,32 @@
+from django.apps import AppConfig
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+
+def check_settings():
+    '''
+    Raise ImproperlyConfigured if the API's settings can't work
+    together.
+    '''
+
+    if (settings.API_RATES_ENGINE == 'snapshot' and
+            settings.API_CACHE_BACKEND == 'none'):
+        raise ImproperlyConfigured(
+            "API_RATES_ENGINE can't be 'snapshot' when API_CACHE_BACKEND "
+            "is 'none', since the snapshot is versioned by the API cache."
+        )
+    if (settings.API_RATES_SNAPSHOT_PATH and
+            settings.API_CACHE_BACKEND != 'redis'):
+        raise ImproperlyConfigured(
+            "API_CACHE_BACKEND must be 'redis' when API_RATES_SNAPSHOT_PATH "
+            "is set, since the snapshot file's version is compared across "
+            "processes."
+        )
+
+
+class DefaultApiApp(AppConfig):
+    name = 'api'
+    verbose_name = 'API'
+
+    def ready(self):
+        check_settings()
@@ -0,0 +1,270 @@
+'''
+Benchmarks for the public rates API. See the `benchmark` management
+command for details.
+'''
+
+import csv
+import os
+import tempfile
+
+from django.db.models import Avg, Max, Min, StdDev
+from django.http import HttpResponse, QueryDict
+from django.test import RequestFactory, override_settings
+from rest_framework.request import Request
+
+from api.pagination import (ContractPagination, ContractCursorPagination,
+                            EDUCATION_SORT)
+
+from api import cache
+from api.snapshot import (ContractsSnapshot, read_snapshot_file,
+                          write_snapshot_file)
+from api.views import (GetRates, get_contracts_queryset, get_contracts_sort,
+                       iter_contracts_csv_rows, iter_csv_chunks)
+from api.utils import (get_histogram, get_histogram_from_queryset,
+                       get_stats_from_queryset)
+from contracts.benchmarks import make_synthetic_contracts
+from contracts.models import Contract
+
+
+HISTOGRAM_BINS = 12
+
+
+def histogram(num_rows):
+    '''
+    Compare building the /api/rates/ wage histogram in Python with
+    building it in the database.
+    '''
+
+    make_synthetic_contracts(num_rows)
+    contracts = Contract.objects.all()
+
+    def in_python():
+        values = contracts.values_list('current_price', flat=True)
+        return get_histogram(values, HISTOGRAM_BINS)
+
+    def in_sql():
+        return get_histogram_from_queryset(contracts, 'current_price',
+                                           HISTOGRAM_BINS)
+
+    if in_python() != in_sql():
+        raise AssertionError('histograms do not match')
+
+    yield 'get_histogram (Python)', in_python
+    yield 'get_histogram_from_queryset (SQL)', in_sql
+
+
+def rates_stats(num_rows):
+    '''
+    Compare computing the /api/rates/ count, aggregate statistics and
+    wage histogram with separate queries against computing them with
+    a single query, for a typical multi-phrase search.
+    '''
+
+    make_synthetic_contracts(num_rows)
+    field = 'current_price'
+    contracts = Contract.objects.multi_phrase_search(
+        'engineer, analyst, manager', 'match_all')
+
+    def separate_queries():
+        stats = contracts.aggregate(Min(field), Max(field), Avg(field),
+                                    StdDev(field))
+        return (
+            contracts.count(),
+            stats,
+            get_histogram_from_queryset(
+                contracts, field, HISTOGRAM_BINS,
+                minimum=stats[field + '__min'],
+                maximum=stats[field + '__max'],
+            ),
+        )
+
+    def single_query():
+        return get_stats_from_queryset(contracts, field, HISTOGRAM_BINS)
+
+    count, stats, histogram = separate_queries()
+    combined = single_query()
+    if (count != combined['count'] or
+            stats[field + '__avg'] != combined['average'] or
+            histogram != combined['wage_histogram']):
+        raise AssertionError('statistics do not match')
+
+    yield 'aggregate + count + histogram (3 queries)', separate_queries
+    yield 'get_stats_from_queryset (1 query)', single_query
+
+
+def rates_deep_page(num_rows):
+    '''
+    Compare retrieving the last page of /api/rates/ results using page
+    numbers with retrieving it using a cursor.
+    '''
+
+    make_synthetic_contracts(num_rows)
+    # Break ties by id so that both approaches return the same page.
+    contracts = Contract.objects.order_by('current_price', 'id')
+    factory = RequestFactory()
+    page_size = ContractPagination().page_size
+    last_page = max((num_rows - 1) // page_size + 1, 1)
+    last_page_start = (last_page - 1) * page_size
+
+    # Find the row just before the last page, so we can make a cursor
+    # that points at it.
+    cursor = ''
+    if last_page_start > 0:
+        cursor_pagination = ContractCursorPagination()
+        preceding = contracts.annotate(education_sort=EDUCATION_SORT)[
+            last_page_start - 1]
+        cursor = cursor_pagination.encode_cursor(
+            cursor_pagination.get_position(preceding), reverse=False)
+
+    def page_number():
+        request = Request(factory.get('/api/rates/', {'page': last_page}))
+        return ContractPagination({'count': num_rows})\
+            .paginate_queryset(contracts, request)
+
+    def cursor_based():
+        request = Request(factory.get('/api/rates/', {
+            'pagination': 'cursor',
+            'cursor': cursor,
+        }))
+        return ContractCursorPagination(
+            {'count': num_rows},
+            not_null_fields=['current_price'],
+        ).paginate_queryset(contracts, request)
+
+    if [c.id for c in page_number()] != [c.id for c in cursor_based()]:
+        raise AssertionError('pages do not match')
+
+    yield 'page number (OFFSET)', page_number
+    yield 'cursor (keyset)', cursor_based
+
+
+def rates_csv(num_rows):
+    '''
+    Compare writing the /api/rates/csv/ export from model instances
+    into a single response with streaming it from a server-side cursor.
+    '''
+
+    make_synthetic_contracts(num_rows)
+    contracts = Contract.objects.order_by('current_price', 'id')
+
+    def model_instances():
+        response = HttpResponse(content_type='text/csv')
+        writer = csv.writer(response)
+        for c in contracts:
+            writer.writerow((c.idv_piid, c.get_readable_business_size(),
+                             c.schedule, c.contractor_site, c.contract_start,
+                             c.contract_end, c.sin, c.vendor_name,
+                             c.labor_category, c.get_education_level_display(),
+                             c.min_years_experience, c.current_price,
+                             c.next_year_price, c.second_year_price))
+        return response.content
+
+    def streaming():
+        return ''.join(
+            iter_csv_chunks(iter_contracts_csv_rows(contracts))
+        ).encode('utf-8')
+
+    if model_instances() != streaming():
+        raise AssertionError('CSV exports do not match')
+
+    yield 'model instances', model_instances
+    yield 'iter_contracts_csv_rows (streaming)', streaming
+
+
+def rates_revalidation(num_rows):
+    '''
+    Compare computing an /api/rates/ response, serving it from the
+    API cache, and answering a request to revalidate it with a 304.
+    '''
+
+    make_synthetic_contracts(num_rows)
+    factory = RequestFactory()
+    view = GetRates.as_view()
+    path = f'/api/rates/?q=engineer&histogram={HISTOGRAM_BINS}'
+
+    def get(**headers):
+        response = view(factory.get(path, **headers))
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    with override_settings(API_CACHE_BACKEND='locmem'):
+        def uncached():
+            cache.bump_data_version()
+            return get()
+
+        def cached():
+            return get()
+
+        def not_modified():
+            return get(HTTP_IF_NONE_MATCH=etag)
+
+        yield 'uncached', uncached
+
+        # Prime the cache for the data version the benchmark left us at.
+        etag = get()['ETag']
+        if not_modified().status_code != 304:
+            raise AssertionError('response was modified')
+
+        yield 'cached', cached
+        yield 'If-None-Match (304)', not_modified
+
+
+def rates_snapshot(num_rows):
+    '''
+    Compare computing the /api/rates/ results and statistics in the
+    database with computing them from an in-memory snapshot, for a
+    typical filtered multi-phrase search.
+    '''
+
+    make_synthetic_contracts(num_rows)
+    field = 'current_price'
+    params = QueryDict('q=engineer, analyst, manager&min_education=BA'
+                       '&price__lte=250&sort=-labor_category')
+    sort = get_contracts_sort(params, field)
+    snapshot = ContractsSnapshot.load()
+    page_size = ContractPagination().page_size
+
+    def orm():
+        contracts = get_contracts_queryset(params, field)
+        stats = get_stats_from_queryset(contracts, field, HISTOGRAM_BINS)
+        return stats, [c.id for c in contracts[:page_size]]
+
+    def in_memory():
+        contracts, stats = snapshot.query(params, field, sort,
+                                          HISTOGRAM_BINS)
+        return stats, [c.id for c in contracts[:page_size]]
+
+    orm_stats, _ = orm()
+    snapshot_stats, _ = in_memory()
+    if (orm_stats['count'] != snapshot_stats['count'] or
+            orm_stats['wage_histogram'] !=
+            snapshot_stats['wage_histogram']):
+        raise AssertionError('statistics do not match')
+
+    yield 'get_contracts_queryset (SQL)', orm
+    yield 'ContractsSnapshot (NumPy)', in_memory
+
+
+def rates_snapshot_reload(num_rows):
+    '''
+    Compare loading a rates snapshot from the database with mapping a
+    published snapshot file into memory.
+    '''
+
+    make_synthetic_contracts(num_rows)
+    with tempfile.TemporaryDirectory() as dirname:
+        path = os.path.join(dirname, 'rates.snapshot')
+        write_snapshot_file(ContractsSnapshot.load(), path)
+
+        def from_database():
+            return ContractsSnapshot.load()
+
+        def from_file():
+            return read_snapshot_file(path)
+
+        if len(from_database()) != len(from_file()):
+            raise AssertionError('snapshots do not match')
+
+        yield 'ContractsSnapshot.load (database)', from_database
+        yield 'read_snapshot_file (mmap)', from_file
@@ -0,0 +1,374 @@
+'''
+A cache for API responses that are expensive to compute from the
+contracts data, such as those from `/api/rates/`.
+
+Every cache entry is tagged with a global "contracts data version",
+which is bumped by bump_data_version() whenever the contracts data
+changes in bulk. Entries from older versions are never served, and
+are eventually evicted by the backend.
+
+Versions are random tokens rather than counters, so that a version is
+never reused, even by a process that has just started or by a redis
+instance that has lost its data. This matters because they're also
+used in ETags, which clients may hold on to for much longer than any
+one process or redis instance lives.
+
+The backend is configured by `settings.API_CACHE_BACKEND`, which can
+be one of:
+
+* `'locmem'`, which keeps entries in the memory of the current process,
+  evicting the least recently used ones once they take up more than
+  `settings.API_CACHE_MAX_SIZE` bytes. Because the data version is also
+  kept in memory, changes made by other processes (such as the RQ
+  worker's bulk uploads) aren't noticed until it expires, after
+  `settings.API_CACHE_TIMEOUT` seconds.
+
+* `'redis'`, which keeps entries in redis at
+  `settings.API_CACHE_REDIS_URL` for up to `settings.API_CACHE_TIMEOUT`
+  seconds. If redis can't be reached, responses are computed as if
+  caching were disabled, and bumping the data version does nothing.
+
+* `'none'`, which disables caching.
+'''
+
+import hashlib
+import json
+import logging
+import pickle  # nosec
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Union
+
+import django_rq
+import redis
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+
+
+STATS = ('hits', 'misses')
+
+logger = logging.getLogger('calc')
+
+
+def new_version() -> str:
+    '''
+    Return a new random contracts data version.
+    '''
+
+    return uuid.uuid4().hex
+
+
+class LocMemBackend:
+    '''
+    An in-memory least-recently-used cache that evicts entries once
+    the total size of their values exceeds `max_size` bytes. If
+    `timeout` is given, the version is bumped whenever it's been that
+    many seconds since it last was.
+
+    Examples:
+
+        >>> backend = LocMemBackend(max_size=10)
+        >>> backend.set('a', b'12345')
+        >>> backend.set('b', b'12345')
+        >>> backend.get('a')
+        b'12345'
+        >>> backend.set('c', b'12345')
+        >>> backend.get('b') is None
+        True
+        >>> backend.get('a')
+        b'12345'
+
+    Values larger than `max_size` aren't stored at all:
+
+        >>> backend.set('d', b'12345678901')
+        >>> backend.get('d') is None
+        True
+    '''
+
+    def __init__(self, max_size: int,
+                 timeout: Optional[int]=None) -> None:
+        self.max_size = max_size
+        self.timeout = timeout
+        self.size = 0
+        self.version = new_version()
+        self.version_bumped_at = time.monotonic()
+        self.stats = dict.fromkeys(STATS, 0)
+        self.entries: 'OrderedDict[str, bytes]' = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_size:
+            return
+        with self.lock:
+            old_value = self.entries.pop(key, None)
+            if old_value is not None:
+                self.size -= len(old_value)
+            self.entries[key] = value
+            self.size += len(value)
+            while self.size > self.max_size:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def get_version(self) -> str:
+        with self.lock:
+            if (self.timeout is not None and
+                    time.monotonic() - self.version_bumped_at >=
+                    self.timeout):
+                self._bump_version()
+            return self.version
+
+    def bump_version(self) -> None:
+        with self.lock:
+            self._bump_version()
+
+    def _bump_version(self) -> None:
+        self.version = new_version()
+        self.version_bumped_at = time.monotonic()
+
+    def incr_stat(self, name: str) -> None:
+        with self.lock:
+            self.stats[name] += 1
+
+    def get_stats(self) -> Dict[str, int]:
+        return dict(self.stats)
+
+
+class RedisBackend:
+    '''
+    A cache that stores entries in redis, where they expire after
+    `timeout` seconds.
+
+    Errors talking to redis are logged rather than raised, so that an
+    outage only disables caching: reads miss, writes do nothing, and
+    get_version() returns None. A version bump that fails is retried
+    by later calls to get_version(), which return None until it
+    succeeds, so that this process never serves data, or issues ETags,
+    at a version that should have been bumped.
+    '''
+
+    def __init__(self, url: str, timeout: int,
+                 prefix: str='calc:api_cache:') -> None:
+        self.redis = redis.StrictRedis.from_url(url)
+        self.timeout = timeout
+        self.prefix = prefix
+        self.bump_failed = False
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            return self.redis.get(self.prefix + key)
+        except redis.RedisError:
+            logger.warning('Unable to read from the API cache',
+                           exc_info=True)
+            return None
+
+    def set(self, key: str, value: bytes) -> None:
+        try:
+            self.redis.set(self.prefix + key, value, ex=self.timeout)
+        except redis.RedisError:
+            logger.warning('Unable to write to the API cache',
+                           exc_info=True)
+
+    def get_version(self) -> Optional[str]:
+        if self.bump_failed:
+            self.bump_version()
+            if self.bump_failed:
+                return None
+        key = self.prefix + 'version'
+        try:
+            # If there's no version yet, or redis has lost it, a new one
+            # is chosen, rather than starting again from a version that
+            # may already have been used.
+            pipe = self.redis.pipeline()
+            pipe.set(key, new_version(), nx=True)
+            pipe.get(key)
+            _, version = pipe.execute()
+            return version.decode('ascii')
+        except redis.RedisError:
+            logger.warning('Unable to read the API cache data version',
+                           exc_info=True)
+            return None
+
+    def bump_version(self) -> None:
+        try:
+            self.redis.set(self.prefix + 'version', new_version())
+            self.bump_failed = False
+        except redis.RedisError:
+            self.bump_failed = True
+            logger.exception('Unable to bump the API cache data version')
+
+    def incr_stat(self, name: str) -> None:
+        try:
+            self.redis.incr(self.prefix + 'stats:' + name)
+        except redis.RedisError:
+            pass
+
+    def get_stats(self) -> Dict[str, int]:
+        values = self.redis.mget([self.prefix + 'stats:' + name
+                                  for name in STATS])
+        return {name: int(value or 0) for name, value in zip(STATS, values)}
+
+
+_backend: Optional[Union[LocMemBackend, RedisBackend]] = None
+
+
+def get_backend():
+    '''
+    Return the configured cache backend, or None if caching is
+    disabled.
+    '''
+
+    global _backend
+
+    if _backend is None:
+        name = settings.API_CACHE_BACKEND
+        if name == 'locmem':
+            _backend = LocMemBackend(max_size=settings.API_CACHE_MAX_SIZE,
+                                     timeout=settings.API_CACHE_TIMEOUT)
+        elif name == 'redis':
+            _backend = RedisBackend(url=settings.API_CACHE_REDIS_URL,
+                                    timeout=settings.API_CACHE_TIMEOUT)
+        elif name != 'none':
+            raise ValueError(f'Unknown API_CACHE_BACKEND: {name}')
+    return _backend
+
+
+@receiver(setting_changed)
+def reset_backend(setting, **kwargs):
+    '''
+    Django signal handler to reconfigure the backend whenever anything
+    (presumably a test case) modifies the cache settings.
+    '''
+
+    global _backend
+
+    if setting.startswith('API_CACHE_'):
+        _backend = None
+
+
+def _enqueue_on_commit(func: str) -> None:
+    '''
+    Enqueue an RQ job that calls the function with the given dotted
+    name once the current transaction commits, logging rather than
+    raising an error if redis can't be reached.
+    '''
+
+    def enqueue():
+        try:
+            django_rq.enqueue(func)
+        except redis.RedisError:
+            logger.exception(f'Unable to enqueue {func}')
+
+    transaction.on_commit(enqueue)
+
+
+def bump_data_version() -> None:
+    '''
+    Invalidate all cached responses. This should be called whenever
+    the contracts data changes.
+    '''
+
+    if settings.API_RATES_DUMP_DIR:
+        # Rate dumps are versioned by the contracts change log rather
+        # than the cache, so they're republished even if it's disabled.
+        _enqueue_on_commit('api.dump.publish_dumps')
+    backend = get_backend()
+    if backend is None:
+        return
+    backend.bump_version()
+    # If we're in a transaction, responses computed before it commits
+    # will still reflect the old data, so invalidate them again once
+    # it does.
+    transaction.on_commit(backend.bump_version)
+    if settings.API_RATES_SNAPSHOT_PATH:
+        # This must be enqueued after the version is bumped, so that
+        # the snapshot is published at the new version. The snapshot
+        # module is referred to by name so that NumPy doesn't need to
+        # be loaded here.
+        _enqueue_on_commit('api.snapshot.publish_snapshot')
+
+
+def get_stats() -> Optional[Dict[str, int]]:
+    '''
+    Return the cache's hit/miss counters, or None if caching is
+    disabled.
+    '''
+
+    backend = get_backend()
+    if backend is None:
+        return None
+    return backend.get_stats()
+
+
+def make_key(name: str, params: Dict[str, Any]) -> str:
+    '''
+    Return a key for the given response name and parameters, which
+    should be JSON-serializable. Dictionary keys are sorted, so their
+    order doesn't matter.
+
+    Examples:
+
+        >>> make_key('rates', {'a': 1, 'b': 2}) == \\
+        ...     make_key('rates', {'b': 2, 'a': 1})
+        True
+    '''
+
+    data = json.dumps([name, params], sort_keys=True)
+    return name + ':' + hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def get_etag(name: str, params: Dict[str, Any]) -> Optional[str]:
+    '''
+    Return a strong ETag for the response with the given name and
+    parameters at the current data version, or None if caching is
+    disabled or unavailable, in which case the data version isn't
+    known.
+    '''
+
+    backend = get_backend()
+    if backend is None:
+        return None
+    version = backend.get_version()
+    if version is None:
+        return None
+    return f'"{version}-{make_key(name, params)}"'
+
+
+def get_or_set(name: str, params: Dict[str, Any],
+               get_data: Callable[[], Any]) -> Any:
+    '''
+    Return the cached data for the given response name and
+    parameters at the current data version, calling `get_data()` to
+    compute and cache it if there isn't any.
+    '''
+
+    backend = get_backend()
+    if backend is None:
+        return get_data()
+
+    # The version must be read before the data is computed, so that
+    # data computed while the version is bumped isn't cached under
+    # the new version.
+    version = backend.get_version()
+    if version is None:
+        return get_data()
+    key = f'{version}:{make_key(name, params)}'
+    value = backend.get(key)
+    if value is not None:
+        backend.incr_stat('hits')
+        # Entries are only ever written by this module.
+        return pickle.loads(value)  # nosec
+    backend.incr_stat('misses')
+    data = get_data()
+    backend.set(key, pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+    return data
@@ -0,0 +1,262 @@
+'''
+Compressed dumps of every current rate, which can be downloaded from
+`/api/rates/dump/` in one request rather than by paging through
+`/api/rates/`.
+
+The dumps are published to `settings.API_RATES_DUMP_DIR` by
+publish_dumps(), which runs as an RQ job whenever the contracts data
+changes. There's a gzipped CSV and a gzipped JSON Lines file, each of
+which contains the same fields as the results of `/api/rates/`, and
+is named after the version of the contracts data it reflects (see
+contracts.models.ContractChange). Files are written next to their
+final paths and then renamed, so a dump is never seen half-written,
+and dumps of older versions are deleted once a new one is published.
+Since they're only unlinked, downloads already in progress can finish.
+'''
+
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import re
+import tempfile
+from datetime import timedelta
+from typing import (Any, BinaryIO, Callable, Iterable, Iterator, NamedTuple,
+                    Optional, Sequence, Tuple)
+
+import django_rq
+from django.conf import settings
+from django_rq import job
+
+from api.serializers import ContractSerializer
+from contracts.models import Contract, ContractChange, EDUCATION_CHOICES
+
+
+FIELDS = ContractSerializer.Meta.fields
+
+EDUCATION_LEVELS = dict(EDUCATION_CHOICES)
+
+COMPRESS_LEVEL = 6
+
+# How long to wait before trying again to publish changes that are being
+# held back by a transaction that's still running.
+REPUBLISH_DELAY = timedelta(minutes=1)
+
+READ_CHUNK_SIZE = 64 * 1024
+
+logger = logging.getLogger('calc')
+
+
+def write_csv(f, rows: Iterable[Sequence[Any]]) -> None:
+    text = io.TextIOWrapper(f, encoding='utf-8', newline='')
+    writer = csv.writer(text)
+    writer.writerow(FIELDS)
+    writer.writerows(rows)
+    text.detach()
+
+
+def write_jsonl(f, rows: Iterable[Sequence[Any]]) -> None:
+    for row in rows:
+        line = json.dumps(dict(zip(FIELDS, row)), default=float)
+        f.write(line.encode('utf-8') + b'\n')
+
+
+class DumpFormat(NamedTuple):
+    extension: str
+    content_type: str
+    write: Callable[[Any, Iterable[Sequence[Any]]], None]
+
+
+FORMATS = {
+    'csv': DumpFormat('csv', 'text/csv', write_csv),
+    'jsonl': DumpFormat('jsonl', 'application/x-ndjson', write_jsonl),
+}
+
+
+class Dump(NamedTuple):
+    path: str
+    version: int
+
+
+def get_dump_filename(fmt: str, version: int) -> str:
+    '''
+    Return the name of the dump file in the given format at the given
+    contracts data version, e.g.:
+
+        >>> get_dump_filename('csv', 12)
+        'rates-12.csv.gz'
+    '''
+
+    return f'rates-{version}.{FORMATS[fmt].extension}.gz'
+
+
+def find_dumps(fmt: str, directory: Optional[str]=None) -> Iterable[Dump]:
+    directory = directory or settings.API_RATES_DUMP_DIR
+    extension = re.escape(FORMATS[fmt].extension)
+    pattern = re.compile(r'^rates-(\d+)\.' + extension + r'\.gz$')
+    for name in os.listdir(directory):
+        match = pattern.match(name)
+        if match:
+            yield Dump(os.path.join(directory, name), int(match.group(1)))
+
+
+def get_latest_dump(fmt: str, directory: Optional[str]=None) -> Optional[Dump]:
+    '''
+    Return the most recent dump in the given format, or None if none
+    has been published.
+    '''
+
+    dumps = sorted(find_dumps(fmt, directory), key=lambda dump: dump.version)
+    return dumps[-1] if dumps else None
+
+
+def iter_rows() -> Iterable[Sequence[Any]]:
+    education_index = FIELDS.index('education_level')
+    contracts = Contract.objects.order_by('id').values_list(*FIELDS)
+    for row in contracts.iterator():
+        row = list(row)
+        row[education_index] = EDUCATION_LEVELS.get(row[education_index])
+        yield row
+
+
+def write_dump(fmt: str, path: str) -> None:
+    '''
+    Write a dump of the current rates in the given format to the given
+    path, atomically replacing any existing file there.
+    '''
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                                    prefix='.dump-')
+    try:
+        with open(fd, 'wb') as f:
+            # The dump's ETag is its filename, so republishing the same
+            # data must write the same bytes, which means leaving the
+            # time out of the gzip header.
+            with gzip.GzipFile(fileobj=f, mode='wb',
+                               compresslevel=COMPRESS_LEVEL, mtime=0) as gz:
+                FORMATS[fmt].write(gz, iter_rows())
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+@job
+def publish_dumps(directory: Optional[str]=None, force: bool=False) -> bool:
+    '''
+    Write dumps of the current rates in every format to the given
+    directory, which defaults to `settings.API_RATES_DUMP_DIR`, and
+    delete older ones. Unless `force` is true, nothing is written if
+    the dumps there are already at the current contracts data version.
+
+    If some changes aren't published yet, because a transaction that
+    started before they were made is still running, the dumps are
+    published again once REPUBLISH_DELAY has passed, by the RQ
+    scheduler. Otherwise they'd stay out of date until the contracts
+    data next changes, if that transaction never changes contracts.
+
+    Returns whether any dumps were written.
+    '''
+
+    directory = directory or settings.API_RATES_DUMP_DIR
+    # As with the API cache, the version must be read before the data
+    # is, so that if the data changes in the meantime, the dump will be
+    # considered out of date.
+    version = ContractChange.objects.get_version()
+    published = False
+    for fmt in FORMATS:
+        path = os.path.join(directory, get_dump_filename(fmt, version))
+        if force or not os.path.exists(path):
+            write_dump(fmt, path)
+            published = True
+        for dump in find_dumps(fmt, directory):
+            # Versions aren't in numerical order, so any other version
+            # is an older one.
+            if dump.version != version:
+                os.unlink(dump.path)
+    if published:
+        logger.info(f'Published rates dumps at version {version} to '
+                    f'{directory}.')
+    if ContractChange.objects.unpublished().exists():
+        logger.info(f'Some changes are being held back by a running '
+                    f'transaction, so publishing rates dumps again in '
+                    f'{REPUBLISH_DELAY}.')
+        scheduler = django_rq.get_scheduler()
+        scheduler.enqueue_in(REPUBLISH_DELAY, publish_dumps, directory)
+    return published
+
+
+class UnsatisfiableRange(ValueError):
+    pass
+
+
+def parse_byte_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    '''
+    Parse the given HTTP `Range` header for a file of the given size,
+    returning the first and last byte positions it includes, or None
+    if it should be ignored and the whole file served, e.g.:
+
+        >>> parse_byte_range('bytes=0-99', 1000)
+        (0, 99)
+        >>> parse_byte_range('bytes=900-', 1000)
+        (900, 999)
+        >>> parse_byte_range('bytes=-100', 1000)
+        (900, 999)
+        >>> parse_byte_range('bytes=500-5000', 1000)
+        (500, 999)
+
+    Headers that aren't valid, or that ask for more than one range,
+    are ignored, as RFC 7233 allows:
+
+        >>> parse_byte_range('bytes=0-1,5-6', 1000) is None
+        True
+        >>> parse_byte_range('lines=1-2', 1000) is None
+        True
+
+    Ranges that don't overlap the file raise UnsatisfiableRange:
+
+        >>> parse_byte_range('bytes=1000-', 1000)
+        Traceback (most recent call last):
+        ...
+        api.dump.UnsatisfiableRange: bytes=1000-
+    '''
+
+    match = re.match(r'^bytes=(\d*)-(\d*)$', header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # A suffix range, i.e. the last N bytes.
+        if int(last) == 0:
+            raise UnsatisfiableRange(header)
+        return max(size - int(last), 0), size - 1
+    if last and int(last) < int(first):
+        return None
+    if int(first) >= size:
+        raise UnsatisfiableRange(header)
+    return int(first), min(int(last), size - 1) if last else size - 1
+
+
+def iter_file_range(f: BinaryIO, start: int, length: int,
+                    chunk_size: int=READ_CHUNK_SIZE) -> Iterator[bytes]:
+    '''
+    Yield `length` bytes of the given file from `start` in chunks of
+    at most `chunk_size` bytes, closing the file once they've all been
+    read, or once the iterator is closed.
+    '''
+
+    with f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
@@ -1,36 +1,164 @@
 import math
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque
+from urllib.parse import parse_qs, urljoin, urlparse
+
 import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
 from tqdm import tqdm
 from django.core.management import BaseCommand, CommandError
+from django.db import transaction
 
-from contracts.models import Contract
+from contracts.models import (Contract, ContractChange,
+                              ContractLoadCheckpoint, ContractSync,
+                              LaborCategoryCount)
+from api.cache import bump_data_version
 from api.serializers import ContractSerializer
 
 
-def iter_api_pages(url, start_page=1, end_page=None):
-    page = start_page
-    while True:
-        if end_page is not None and page > end_page:
-            break
-        res = requests.get(f"{url}?page={page}").json()
-        results = res['results']
-        for result in results:
+# Requests that fail to connect, or with one of these statuses, are
+# retried up to MAX_RETRIES times, waiting RETRY_BACKOFF_FACTOR * 2 ** n
+# seconds before the nth retry (see urllib3's Retry for details).
+MAX_RETRIES = 5
+
+RETRY_BACKOFF_FACTOR = 0.5
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def make_session(concurrency=1):
+    '''
+    Return a requests session that keeps up to `concurrency` connections
+    open for reuse, and retries failed requests with an exponential
+    backoff.
+    '''
+
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_maxsize=concurrency,
+        max_retries=Retry(
+            total=MAX_RETRIES,
+            backoff_factor=RETRY_BACKOFF_FACTOR,
+            status_forcelist=RETRY_STATUSES,
+        ),
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_api_page(session, url, page, keep_ids=False):
+    res = session.get(url, params={'page': page})
+    res.raise_for_status()
+    res = res.json()
+    if not keep_ids:
+        for result in res['results']:
             del result['id']
+    return res
 
-        if len(results):
-            max_page = math.ceil(res['count'] / len(results))
-        else:
-            max_page = page
-        if end_page is not None:
-            max_page = min(end_page, max_page)
-        total_pages = max_page - start_page + 1
+
+def get_api_changes(session, url, since=None):
+    '''
+    Return the changes to the rates at the given CALC API URL since the
+    given version, from its change feed (see api.views.GetRateChanges),
+    or None if the feed no longer has that version.
+    '''
+
+    params = {} if since is None else {'since': since}
+    res = session.get(urljoin(url, 'changes/'), params=params)
+    if since is not None and res.status_code == 400:
+        return None
+    res.raise_for_status()
+    return res.json()
+
+
+def iter_api_pages(url, start_page=1, end_page=None, concurrency=1,
+                   session=None, keep_ids=False):
+    '''
+    Yield a (results, total_pages) tuple for each page of the given
+    CALC API, in order. The rates' ids are removed from the results,
+    unless `keep_ids` is true.
+
+    The first page is fetched on its own, to find out how many pages
+    there are. The rest are fetched by a pool of `concurrency` threads,
+    with no more than two pages per thread fetched ahead of the one
+    being yielded.
+    '''
+
+    if session is None:
+        session = make_session(concurrency)
+
+    res = get_api_page(session, url, start_page, keep_ids)
+    results = res['results']
+    if len(results):
+        max_page = math.ceil(res['count'] / len(results))
+    else:
+        max_page = start_page
+    if end_page is not None:
+        max_page = min(end_page, max_page)
+    total_pages = max_page - start_page + 1
+
+    yield results, total_pages
+
+    if res['next'] is None:
+        return
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending: Deque[Future] = deque()
+        try:
+            for page in range(start_page + 1, max_page + 1):
+                pending.append(executor.submit(get_api_page, session, url,
+                                               page, keep_ids))
+                if len(pending) >= concurrency * 2:
+                    yield pending.popleft().result()['results'], total_pages
+            while pending:
+                yield pending.popleft().result()['results'], total_pages
+        finally:
+            # Don't bother fetching the rest if we're stopped early.
+            for future in pending:
+                future.cancel()
+
+
+def iter_api_cursor_pages(url, session=None, keep_ids=False):
+    '''
+    Yield a (results, total_pages) tuple for each page of the given
+    CALC API, in order, like iter_api_pages(), but following its
+    cursor pagination (see api.pagination.ContractCursorPagination).
+
+    Unlike page numbers, cursors never skip or repeat a rate, even if
+    rates share a price or are changed during the load, but each page
+    can only be fetched once the one before it has been.
+    '''
+
+    if session is None:
+        session = make_session()
+
+    params = {'pagination': 'cursor'}
+    total_pages = None
+    while True:
+        res = session.get(url, params=params)
+        res.raise_for_status()
+        res = res.json()
+        results = res['results']
+        if not keep_ids:
+            for result in results:
+                del result['id']
+        if total_pages is None:
+            total_pages = 1
+            if len(results):
+                total_pages = math.ceil(res['count'] / len(results))
 
         yield results, total_pages
 
-        if res['next'] is not None:
-            page += 1
-        else:
-            break
+        if res['next'] is None:
+            return
+        # Only the cursor is taken from the next link, since it may
+        # have been built with a different host than the one we're
+        # talking to (e.g. if the API is behind a proxy).
+        cursor = parse_qs(urlparse(res['next']).query)['cursor'][0]
+        params = {'pagination': 'cursor', 'cursor': cursor}
 
 
 class Command(BaseCommand):
@@ -73,7 +201,42 @@ class Command(BaseCommand):
             help=f'URL of CALC API (default is {self.DEFAULT_URL})'
         )
 
-    def process_pages(self, pages, dry_run):
+        parser.add_argument(
+            '-c', '--concurrency',
+            default=4,
+            type=int,
+            help='number of pages to fetch at once (default is 4)'
+        )
+
+        parser.add_argument(
+            '--resume',
+            default=False,
+            action='store_true',
+            help='continue an interrupted load from the same URL from the '
+                 'page after the last one it wrote'
+        )
+
+        parser.add_argument(
+            '--incremental',
+            default=False,
+            action='store_true',
+            help='only apply the changes made since the last incremental '
+                 'load from the same URL (the first one replaces every '
+                 'rate, keeping their ids)'
+        )
+
+    def validate_rate(self, rate):
+        serializer = ContractSerializer(data=rate)
+        if serializer.is_valid():
+            return serializer.validated_data
+        self.stderr.write(
+            f"Rate {self.style.WARNING(rate)} has "
+            f"error {self.style.ERROR(serializer.errors)}!"
+        )
+        return None
+
+    def process_pages(self, pages, dry_run, checkpoint=None,
+                      keep_ids=False):
         num_rates = 0
         num_pages = 0
         progress_bar = None
@@ -83,10 +246,15 @@ class Command(BaseCommand):
                 if progress_bar is None:
                     progress_bar = tqdm(total=total_pages)
                 serializer = ContractSerializer(data=rates, many=True)
+                num_valid_rates = 0
+                values = None
                 if serializer.is_valid():
-                    num_rates += len(rates)
-                    if not dry_run:
-                        serializer.save()
+                    num_valid_rates = len(rates)
+                    values = serializer.validated_data
+                    if keep_ids:
+                        # The id isn't writable, so isn't validated.
+                        values = [{**value, 'id': rate['id']}
+                                  for value, rate in zip(values, rates)]
                 else:
                     rates_with_errors = [
                         (r, e) for r, e in zip(rates, serializer.errors)
@@ -97,6 +265,12 @@ class Command(BaseCommand):
                             f"Rate {self.style.WARNING(rate)} has "
                             f"error {self.style.ERROR(error)}!"
                         )
+                if dry_run:
+                    values = None
+                if values is not None or checkpoint is not None:
+                    self.write_page(values, checkpoint, num_valid_rates,
+                                    keep_ids)
+                num_rates += num_valid_rates
                 progress_bar.update(1)
                 num_pages += 1
         finally:
@@ -105,29 +279,184 @@ class Command(BaseCommand):
 
         return num_rates, num_pages
 
+    @transaction.atomic
+    def write_page(self, values, checkpoint, num_rates, keep_ids=False):
+        '''
+        Write a page of rates along with the checkpoint that follows it,
+        so that a resumed load never writes the same page twice.
+        '''
+
+        if values is not None:
+            Contract.objects.copy_create(values, keep_ids=keep_ids)
+        if checkpoint is not None:
+            checkpoint.advance(num_rates)
+
+    def get_checkpoint(self, options):
+        url = options['url']
+        checkpoints = ContractLoadCheckpoint.objects.filter(url=url)
+
+        if not options['resume']:
+            checkpoints.delete()
+            return ContractLoadCheckpoint(url=url,
+                                          next_page=options['start_page'],
+                                          end_page=options['end_page'])
+
+        try:
+            return checkpoints.get()
+        except ContractLoadCheckpoint.DoesNotExist:
+            raise CommandError(f'There is no checkpoint to resume '
+                               f'loading from {url}!')
+
+    def apply_changes(self, changes, dry_run):
+        '''
+        Apply the given changes from a CALC API's change feed, returning
+        the number of rates that were changed.
+        '''
+
+        rates = []
+        for rate in changes['inserted'] + changes['updated']:
+            values = self.validate_rate(rate)
+            if values is not None:
+                rates.append({**values, 'id': rate['id']})
+        deleted_ids = changes['deleted']
+        if dry_run:
+            return len(rates) + len(deleted_ids)
+
+        # Rates are matched by id rather than by whether the feed says
+        # they were inserted or updated, in case we already applied
+        # some of these changes.
+        existing_ids = set(Contract._base_manager.filter(
+            pk__in=[rate['id'] for rate in rates]
+        ).values_list('id', flat=True))
+        deleted = Contract._base_manager.filter(pk__in=deleted_ids)
+        ContractChange.objects.record(ContractChange.DELETED, deleted)
+        deleted.delete()
+        Contract.objects.copy_update(
+            [rate for rate in rates if rate['id'] in existing_ids])
+        Contract.objects.copy_create(
+            [rate for rate in rates if rate['id'] not in existing_ids],
+            keep_ids=True)
+        LaborCategoryCount.objects.refresh()
+        bump_data_version()
+        return len(rates) + len(deleted_ids)
+
+    def load_everything(self, url, session, dry_run):
+        '''
+        Replace every rate with those at the given CALC API URL, keeping
+        their ids, and return a ContractSync for the version they're at.
+        '''
+
+        sync = ContractSync.objects.filter(url=url).first() or \
+            ContractSync(url=url)
+        sync.version = get_api_changes(session, url)['version']
+        if not dry_run:
+            # We're going to keep the rates' ids, so nothing else
+            # can be using them.
+            self.stdout.write("Deleting all existing rate information.")
+            contracts = Contract._base_manager.all()
+            ContractChange.objects.record(ContractChange.DELETED,
+                                          contracts)
+            contracts.delete()
+            LaborCategoryCount.objects.refresh()
+            bump_data_version()
+        # Page numbers can skip or repeat rates, and a repeated rate
+        # would fail to be inserted with the same id twice.
+        pages = iter_api_cursor_pages(url, session=session,
+                                      keep_ids=True)
+        num_rates, _ = self.process_pages(pages, dry_run, keep_ids=True)
+        self.stdout.write(f"Loaded {num_rates} rates.")
+        if not dry_run:
+            sync.save()
+        return sync
+
+    def load_incrementally(self, url, options):
+        dry_run = options['dry_run']
+        session = make_session(options['concurrency'])
+        sync = ContractSync.objects.filter(url=url).first()
+        loaded_everything = False
+
+        if sync is None:
+            self.stdout.write(f"Nothing has been incrementally loaded from "
+                              f"{url} yet, so loading every rate.")
+            sync = self.load_everything(url, session, dry_run)
+            loaded_everything = True
+
+        self.stdout.write(f"Loading changes since version {sync.version} "
+                          f"from {url}.")
+        num_changes = 0
+        while True:
+            changes = get_api_changes(session, url, sync.version)
+            if changes is None:
+                if loaded_everything:
+                    raise CommandError(f"Version {sync.version} isn't in "
+                                       f"the change feed at {url}!")
+                self.stdout.write(f"Version {sync.version} is no longer in "
+                                  f"the change feed at {url}, so loading "
+                                  f"every rate.")
+                sync = self.load_everything(url, session, dry_run)
+                loaded_everything = True
+                continue
+            with transaction.atomic():
+                num_changes += self.apply_changes(changes, dry_run)
+                sync.version = changes['version']
+                if not dry_run:
+                    sync.save()
+            if not changes['more']:
+                break
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done applying {num_changes} changes, up to version "
+            f"{sync.version}."))
+
     def handle(self, *args, **options):
         url = options['url']
         start_page = options['start_page']
         end_page = options['end_page']
         dry_run = options['dry_run']
+        checkpoint = None
 
         if end_page is not None and start_page > end_page:
             raise CommandError('Start page cannot be greater than end page!')
 
-        if not options['append'] and not dry_run:
-            self.stdout.write("Deleting all existing rate information.")
-            Contract.objects.all().delete()
+        if options['resume'] and dry_run:
+            raise CommandError('Dry runs cannot be resumed!')
+
+        if options['incremental']:
+            if options['resume'] or options['append']:
+                raise CommandError('Incremental loads cannot be resumed or '
+                                   'appended!')
+            return self.load_incrementally(url, options)
+
+        if not dry_run:
+            checkpoint = self.get_checkpoint(options)
+            start_page = checkpoint.next_page
+            end_page = checkpoint.end_page
+
+            if options['resume']:
+                self.stdout.write(
+                    f"Resuming from page {start_page}, after "
+                    f"{checkpoint.num_rates} rates were written.")
+            elif not options['append']:
+                self.stdout.write("Deleting all existing rate information.")
+                Contract.objects.all().delete()
+                LaborCategoryCount.objects.refresh()
+                bump_data_version()
 
         self.stdout.write(f"Loading new rate information from {url}.")
 
-        pages = iter_api_pages(url, start_page, end_page)
-        num_rates, num_pages = self.process_pages(pages, dry_run)
+        if checkpoint is not None:
+            checkpoint.save()
+        pages = iter_api_pages(url, start_page, end_page,
+                               concurrency=options['concurrency'])
+        num_rates, num_pages = self.process_pages(pages, dry_run, checkpoint)
 
         if dry_run:
             self.stdout.write(
                 f"Processed {num_rates} rates in dry run mode "
                 f"over {num_pages} pages.")
         else:
+            checkpoint.delete()
+            num_rates = checkpoint.num_rates
             if num_rates == 0:
                 self.stdout.write(self.style.WARNING(
                     f"No rates were written to the database."))
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from api.dump import publish_dumps
+
+
+class Command(BaseCommand):
+    help = '''
+    Publish gzipped dumps of the current rates to a directory, which
+    are served by /api/rates/dump/. See API_RATES_DUMP_DIR in
+    docs/environment.md for details.
+    '''
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-d', '--dir',
+            default=settings.API_RATES_DUMP_DIR,
+            help='directory to publish to (default is API_RATES_DUMP_DIR)'
+        )
+
+        parser.add_argument(
+            '--force',
+            default=False,
+            action='store_true',
+            help='publish even if the existing dumps are up-to-date'
+        )
+
+    def handle(self, *args, **options):
+        directory = options['dir']
+        if not directory:
+            raise CommandError('Please specify a directory, or set '
+                               'API_RATES_DUMP_DIR.')
+
+        if publish_dumps(directory, force=options['force']):
+            self.stdout.write(f'Published rates dumps to {directory}.')
+        else:
+            self.stdout.write(f'Rates dumps in {directory} are up-to-date.')
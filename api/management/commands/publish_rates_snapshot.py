@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from api.snapshot import publish_snapshot
+
+
+class Command(BaseCommand):
+    help = '''
+    Publish a snapshot of the current rates to a file, which processes
+    using the 'snapshot' rates engine will map into memory. See
+    API_RATES_SNAPSHOT_PATH in docs/environment.md for details.
+    '''
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-p', '--path',
+            default=settings.API_RATES_SNAPSHOT_PATH,
+            help='path to publish to (default is API_RATES_SNAPSHOT_PATH)'
+        )
+
+        parser.add_argument(
+            '--force',
+            default=False,
+            action='store_true',
+            help='publish even if the existing snapshot is up-to-date'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not path:
+            raise CommandError('Please specify a path, or set '
+                               'API_RATES_SNAPSHOT_PATH.')
+
+        if publish_snapshot(path, force=options['force']):
+            self.stdout.write(f'Published rates snapshot to {path}.')
+        else:
+            self.stdout.write(f'Rates snapshot at {path} is up-to-date.')
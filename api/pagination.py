@@ -1,7 +1,32 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from collections import OrderedDict
+from decimal import Decimal
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from contracts.models import Contract, EDUCATION_CHOICES
+
+
+class KnownCountPaginator(Paginator):
+    '''
+    A Paginator that can be told how many objects are in its
+    object list ahead of time, so it doesn't need to issue its own
+    `COUNT(*)` query.
+    '''
+
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        if count is not None:
+            # Paginator.count is a cached_property, so this pre-populates
+            # its cache.
+            self.__dict__['count'] = count
 
 
 class ContractPagination(pagination.PageNumberPagination):
@@ -13,9 +38,13 @@ class ContractPagination(pagination.PageNumberPagination):
         self.context = context
         self.page_size = settings.PAGINATION
 
+    def django_paginator_class(self, object_list, per_page):
+        return KnownCountPaginator(object_list, per_page,
+                                   count=self.context.get('count'))
+
     def get_paginated_response(self, data):
         return Response(OrderedDict([
-            ('count', self.page.paginator.count),
+            ('count', self.get_count()),
             ('next', self.get_next_link()),
             ('previous', self.get_previous_link()),
             ('average', self.get_average()),
@@ -26,6 +55,9 @@ class ContractPagination(pagination.PageNumberPagination):
             ('results', data)
         ]))
 
+    def get_count(self):
+        return self.page.paginator.count
+
     def get_average(self):
         return self.context.get('average', 0)
 
@@ -40,3 +72,234 @@ class ContractPagination(pagination.PageNumberPagination):
 
     def get_first_standard_deviation(self):
         return self.context.get('first_standard_deviation', 0)
+
+
+# This mirrors the SQL used by ContractsQuerySet.order_by() to sort on
+# education level.
+EDUCATION_SORT = Case(
+    *[When(education_level=code, then=Value(i + 1))
+      for i, (code, _) in enumerate(EDUCATION_CHOICES)],
+    default=Value(-1),
+    output_field=IntegerField()
+)
+
+
+class ContractCursorPagination(ContractPagination):
+    '''
+    Keyset ("cursor") pagination for contracts, which is an opt-in
+    alternative to ContractPagination.
+
+    Rather than using page numbers, which become `OFFSET n` scans
+    that get slower the deeper one goes, each page is located by a
+    cursor that encodes the sort keys (plus the `id`) of the row that
+    precedes it. This means that retrieving a page costs roughly the
+    same no matter how far into the results it is.
+
+    The response contains the same aggregate statistics as
+    ContractPagination.
+    '''
+
+    pagination_query_param = 'pagination'
+
+    pagination_query_value = 'cursor'
+
+    cursor_query_param = 'cursor'
+
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, context=None, ordering=('current_price',),
+                 not_null_fields=()):
+        '''
+        `ordering` is the list of fields the queryset is sorted on,
+        each optionally prefixed with `-` for descending order.
+        `not_null_fields` is a list of nullable fields that are known
+        to have been filtered to exclude nulls, which allows for
+        more efficient queries.
+        '''
+
+        super().__init__(context)
+        self.ordering = list(ordering)
+        self.not_null_fields = not_null_fields
+
+    @classmethod
+    def is_requested(cls, request):
+        return (request.query_params.get(cls.pagination_query_param) ==
+                cls.pagination_query_value)
+
+    def get_keys(self, reverse=False):
+        '''
+        Return a list of (field name, descending) tuples for the
+        keys the pagination is based on.
+        '''
+
+        keys = []
+        for field in self.ordering:
+            descending = field.startswith('-')
+            field = field.lstrip('-')
+            if field == 'education_level':
+                field = 'education_sort'
+            keys.append((field, descending != reverse))
+        keys.append(('id', reverse))
+        return keys
+
+    def is_nullable(self, field):
+        if field in ('education_sort', 'id') or field in self.not_null_fields:
+            return False
+        return Contract._meta.get_field(field).null
+
+    def get_key_field(self, field):
+        if field == 'education_sort':
+            return IntegerField()
+        return Contract._meta.get_field(field)
+
+    def clean_position(self, position):
+        '''
+        Convert each value of the given cursor position to the type of
+        the field it's for, raising NotFound if any of them can't be.
+        '''
+
+        cleaned = []
+        for (field, _), value in zip(self.get_keys(), position):
+            if value is not None:
+                try:
+                    value = self.get_key_field(field).to_python(value)
+                except (ArithmeticError, TypeError, ValidationError):
+                    raise NotFound(self.invalid_cursor_message)
+                if isinstance(value, Decimal) and not value.is_finite():
+                    raise NotFound(self.invalid_cursor_message)
+            cleaned.append(value)
+        return cleaned
+
+    def get_lower_bound(self, field, descending, value):
+        '''
+        Return a filter that rows after the given leading key value
+        must match. This is implied by get_keyset_filter(), but
+        spelling it out separately allows the database to jump
+        straight to the right place in the field's index.
+        '''
+
+        if value is None or self.is_nullable(field):
+            return Q()
+        if descending:
+            return Q(**{f'{field}__lte': value})
+        return Q(**{f'{field}__gte': value})
+
+    def get_after_filter(self, field, descending, value):
+        '''
+        Return a filter for rows whose value of the given field
+        comes strictly after the given value, or None if no rows can.
+        Note that PostgreSQL treats nulls as larger than any other
+        value, putting them last in ascending order and first in
+        descending order.
+        '''
+
+        if descending:
+            if value is None:
+                return Q(**{f'{field}__isnull': False})
+            return Q(**{f'{field}__lt': value})
+        if value is None:
+            return None
+        after = Q(**{f'{field}__gt': value})
+        if self.is_nullable(field):
+            after |= Q(**{f'{field}__isnull': True})
+        return after
+
+    def get_keyset_filter(self, keys, position):
+        match = None
+        equal = Q()
+        for (field, descending), value in zip(keys, position):
+            after = self.get_after_filter(field, descending, value)
+            if after is not None:
+                match = (equal & after) if match is None else (
+                    match | (equal & after))
+            if value is None:
+                equal &= Q(**{f'{field}__isnull': True})
+            else:
+                equal &= Q(**{field: value})
+        if match is None:
+            return Q(pk__in=[])
+        first_field, first_descending = keys[0]
+        return self.get_lower_bound(first_field, first_descending,
+                                    position[0]) & match
+
+    def get_position(self, instance):
+        position = []
+        for field, _ in self.get_keys():
+            value = getattr(instance, field)
+            if isinstance(value, Decimal):
+                value = str(value)
+            position.append(value)
+        return position
+
+    def encode_cursor(self, position, reverse):
+        data = json.dumps({'p': position, 'r': reverse})
+        return urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            data = json.loads(
+                urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            position = data['p']
+            reverse = data['r']
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if (not isinstance(position, list) or
+                len(position) != len(self.get_keys()) or
+                not isinstance(reverse, bool)):
+            raise NotFound(self.invalid_cursor_message)
+        return self.clean_position(position), reverse
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = remove_query_param(
+            request.build_absolute_uri(), self.page_query_param)
+        position, reverse = self.decode_cursor(request)
+
+        keys = self.get_keys(reverse)
+        queryset = queryset.annotate(education_sort=EDUCATION_SORT)\
+            .order_by(*[('-' if desc else '') + f for f, desc in keys])
+        if position is not None:
+            queryset = queryset.filter(self.get_keyset_filter(keys, position))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if reverse:
+            results.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        self.results = results
+        return results
+
+    def get_count(self):
+        return self.context.get('count')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.results:
+            # We were paging backwards and ran out of results, so the
+            # next page is the first one.
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        cursor = self.encode_cursor(self.get_position(self.results[-1]),
+                                    reverse=False)
+        return replace_query_param(self.base_url, self.cursor_query_param,
+                                   cursor)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.results:
+            return None
+        cursor = self.encode_cursor(self.get_position(self.results[0]),
+                                    reverse=True)
+        return replace_query_param(self.base_url, self.cursor_query_param,
+                                   cursor)
@@ -0,0 +1,703 @@
+'''
+An in-process, columnar snapshot of the current contracts, which can
+answer `/api/rates/` queries with vectorized NumPy operations rather
+than SQL.
+
+The snapshot is used instead of the database when
+`settings.API_RATES_ENGINE` is `'snapshot'`. It holds the columns
+used by get_contracts_queryset() as NumPy arrays: prices are stored
+as integer cents, and strings are dictionary-encoded as integer codes
+into a list of their distinct values, which is sorted by the database
+itself so that sorting on the codes matches the database's collation.
+
+The snapshot is reloaded whenever the contracts data version tracked
+by the API cache changes (see api/cache.py), so that engine can only
+be enabled along with it (see api.apps.check_settings()). While the
+version can't be read, the database is used instead.
+
+If `settings.API_RATES_SNAPSHOT_PATH` is set, each process doesn't
+load its own snapshot from the database. Instead, the snapshot is
+published to that path as a file of fixed-width columns by
+publish_snapshot(), and every process maps the file into memory
+read-only, so its pages are shared between them. A new file is
+published whenever the contracts data changes, atomically replacing
+the old one, and processes switch to it on their next request. Until
+it's published, get_snapshot() returns None, since the old file no
+longer reflects the data.
+'''
+
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from collections import Counter, OrderedDict
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import bleach
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django_rq import job
+
+from api import cache
+from api.utils import (fill_histogram_bins, get_histogram_bins,
+                       get_histogram_range)
+from contracts.models import Contract, EDUCATION_CHOICES, clean_search
+
+
+PRICE_FIELDS = ('current_price', 'next_year_price', 'second_year_price')
+
+STRING_FIELDS = (
+    'idv_piid', 'vendor_name', 'labor_category', '_normalized_labor_category',
+    'schedule', 'sin', 'contractor_site', 'business_size',
+)
+
+EDUCATION_LEVELS = [code for code, _ in EDUCATION_CHOICES]
+
+# Null prices are represented by this value, which sorts after every
+# other value just like nulls do in PostgreSQL.
+NULL_PRICE = np.iinfo(np.int64).max
+
+# The maximum number of search words whose matches are remembered.
+MAX_WORD_MATCHES = 1024
+
+# Snapshot files start with this, followed by the length of their JSON
+# header and then the header itself.
+FILE_MAGIC = b'CALCSNP1'
+
+FILE_PREFIX = struct.Struct('<8sQ')
+
+# Columns in snapshot files are aligned to this many bytes.
+FILE_ALIGNMENT = 64
+
+logger = logging.getLogger('calc')
+
+
+def get_education_sort_key(education_level: Optional[str]) -> int:
+    '''
+    Return the key the database sorts the given education level by,
+    which mirrors the SQL used by ContractsQuerySet.order_by().
+
+    Examples:
+
+        >>> get_education_sort_key('HS')
+        1
+        >>> get_education_sort_key('PHD')
+        5
+        >>> get_education_sort_key(None)
+        -1
+    '''
+
+    if education_level in EDUCATION_LEVELS:
+        return EDUCATION_LEVELS.index(education_level) + 1
+    return -1
+
+
+def sort_strings(values: List[str]) -> List[str]:
+    '''
+    Sort the given strings using the database's collation.
+    '''
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT value FROM unnest(CAST(%s AS text[])) AS value '
+            'ORDER BY value',
+            [values]
+        )
+        return [value for value, in cursor.fetchall()]
+
+
+class StringColumn:
+    '''
+    A dictionary-encoded column of strings, some of which may be null.
+
+    `upper_values` contains the distinct strings, upper-cased, in the
+    database's sort order of the original strings, followed by an
+    empty string for nulls if there are any; `not_null` says which of
+    them aren't null. `codes` contains the index into `upper_values`
+    of each row's string. Sorting on the codes is therefore the same
+    as sorting on the strings.
+    '''
+
+    def __init__(self, codes: np.ndarray, upper_values: np.ndarray,
+                 not_null: np.ndarray) -> None:
+        self.codes = codes
+        self.upper_values = upper_values
+        self.not_null = not_null
+
+    @classmethod
+    def from_strings(cls, strings: Sequence[Optional[str]]) -> 'StringColumn':
+        distinct = set(strings)
+        has_nulls = None in distinct
+        values: List[Optional[str]] = list(sort_strings(
+            [value for value in distinct if value is not None]))
+        if has_nulls:
+            values.append(None)
+        index = {value: i for i, value in enumerate(values)}
+        return cls(
+            codes=np.fromiter((index[s] for s in strings),
+                              dtype=np.int32, count=len(strings)),
+            upper_values=np.array([(value or '').upper() for value in values],
+                                  dtype=str),
+            not_null=np.array([value is not None for value in values],
+                              dtype=bool),
+        )
+
+    def get_columns(self, name: str) -> Dict[str, np.ndarray]:
+        return {
+            f'{name}.codes': self.codes,
+            f'{name}.upper_values': self.upper_values,
+            f'{name}.not_null': self.not_null,
+        }
+
+    @classmethod
+    def from_columns(cls, name: str,
+                     columns: Dict[str, np.ndarray]) -> 'StringColumn':
+        return cls(
+            codes=columns[f'{name}.codes'],
+            upper_values=columns[f'{name}.upper_values'],
+            not_null=columns[f'{name}.not_null'],
+        )
+
+    def match(self, predicate: Callable[[str], bool]) -> np.ndarray:
+        '''
+        Return a mask of the rows whose upper-cased string isn't null
+        and satisfies the given predicate, which is only evaluated once
+        per distinct string.
+        '''
+
+        table = np.array([predicate(v) for v in self.upper_values],
+                         dtype=bool)
+        return (table & self.not_null)[self.codes]
+
+    def contains(self, value: str) -> np.ndarray:
+        '''
+        Return a mask of the rows containing the given string, ignoring
+        case, like Django's `icontains` lookup.
+        '''
+
+        table = np.char.find(self.upper_values, value.upper()) >= 0
+        return (table & self.not_null)[self.codes]
+
+
+class ContractsSnapshot:
+    '''
+    A columnar snapshot of the current contracts at a particular
+    contracts data version.
+    '''
+
+    FIELDS = ('id', 'min_years_experience', 'education_level') + \
+        PRICE_FIELDS + STRING_FIELDS
+
+    def __init__(self, columns: Dict[str, np.ndarray],
+                 version: Optional[str]=None) -> None:
+        self.version = version
+        self.ids = columns['id']
+        self.experience = columns['min_years_experience']
+        self.education = columns['education_level']
+        self.prices: Dict[str, np.ndarray] = {
+            field: columns[field] for field in PRICE_FIELDS
+        }
+        self.strings: Dict[str, StringColumn] = {
+            field: StringColumn.from_columns(field, columns)
+            for field in STRING_FIELDS
+        }
+        self.word_matches: Dict[str, np.ndarray] = {}
+        # The map of the file the columns were read from, if any.
+        self.mmap: Optional[mmap.mmap] = None
+
+    def close(self) -> None:
+        '''
+        Unmap the file the snapshot was read from, if any. The snapshot
+        can't be used afterwards.
+        '''
+
+        data = self.mmap
+        # The map can't be closed while any arrays are views of it.
+        self.__dict__.clear()
+        if data is not None:
+            try:
+                data.close()
+            except BufferError:
+                # Something else still has a view of it, so it'll be
+                # unmapped once that has been freed instead.
+                pass
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Tuple[Any, ...]],
+                  version: Optional[str]=None) -> 'ContractsSnapshot':
+        '''
+        Create a snapshot from rows of the values of FIELDS.
+        '''
+
+        values = list(zip(*rows)) if rows else [()] * len(cls.FIELDS)
+        data = dict(zip(cls.FIELDS, values))
+
+        columns = {
+            'id': np.array(data['id'], dtype=np.int64),
+            'min_years_experience': np.array(data['min_years_experience'],
+                                             dtype=np.int64),
+            'education_level': np.array(
+                [get_education_sort_key(e) for e in data['education_level']],
+                dtype=np.int8),
+        }
+        for field in PRICE_FIELDS:
+            columns[field] = np.array(
+                [NULL_PRICE if p is None else int(p * 100)
+                 for p in data[field]], dtype=np.int64)
+        for field in STRING_FIELDS:
+            columns.update(StringColumn.from_strings(data[field])
+                           .get_columns(field))
+        return cls(columns, version)
+
+    @classmethod
+    def load(cls, version: Optional[str]=None) -> 'ContractsSnapshot':
+        '''
+        Load a snapshot of the current contracts from the database.
+        '''
+
+        return cls.from_rows(list(Contract.objects.order_by('id')
+                                  .values_list(*cls.FIELDS)), version)
+
+    def get_columns(self) -> Dict[str, np.ndarray]:
+        '''
+        Return the arrays the snapshot is made of, keyed by name.
+        '''
+
+        columns = OrderedDict([
+            ('id', self.ids),
+            ('min_years_experience', self.experience),
+            ('education_level', self.education),
+        ])
+        columns.update(self.prices)
+        for field, column in self.strings.items():
+            columns.update(column.get_columns(field))
+        return columns
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def match_word(self, word: str) -> np.ndarray:
+        '''
+        Return a mask of the distinct normalized labor categories that
+        contain the given word.
+        '''
+
+        matches = self.word_matches.get(word)
+        if matches is None:
+            column = self.strings['_normalized_labor_category']
+            matches = np.char.find(column.upper_values, word.upper()) >= 0
+            if len(self.word_matches) >= MAX_WORD_MATCHES:
+                self.word_matches.clear()
+            self.word_matches[word] = matches
+        return matches
+
+    def search(self, query: str, query_type: str='match_all') -> np.ndarray:
+        '''
+        Return a mask of the rows that
+        CurrentContractManager.multi_phrase_search() would return.
+        '''
+
+        column = self.strings['_normalized_labor_category']
+        table = np.zeros(len(column.upper_values), dtype=bool)
+        for phrase in clean_search(query):
+            if query_type == 'match_exact':
+                table |= column.upper_values == phrase.upper()
+            elif phrase.startswith("'") or phrase.startswith('"'):
+                table |= self.match_word(phrase)
+            else:
+                words = np.ones(len(column.upper_values), dtype=bool)
+                for word in phrase.split(' '):
+                    words &= self.match_word(word)
+                table |= words
+        return (table & column.not_null)[column.codes]
+
+    def filter(self, request_params, wage_field: str) -> np.ndarray:
+        '''
+        Return a mask of the rows that get_contracts_queryset() would
+        return for the given query parameters.
+        '''
+
+        prices = self.prices[wage_field]
+
+        query = request_params.get('q', None)
+        if query:
+            query_type = request_params.get('query_type', 'match_all')
+            mask = self.search(query, query_type)
+        else:
+            mask = prices != NULL_PRICE
+
+        exclude = request_params.getlist('exclude')
+        if exclude:
+            exclude = [int(pk) for pk in exclude[0].split(',')]
+            mask &= ~np.isin(self.ids, exclude)
+
+        min_experience = request_params.get('min_experience', None)
+        max_experience = request_params.get('max_experience', None)
+        experience_range = request_params.get('experience_range', None)
+        if experience_range:
+            years = experience_range.split(',')
+            min_experience = years[0]
+            if len(years) > 1:
+                max_experience = years[1]
+        if min_experience and min_experience.isdigit():
+            mask &= self.experience >= int(min_experience)
+        if max_experience and max_experience.isdigit():
+            mask &= self.experience <= int(max_experience)
+
+        min_education = request_params.get('min_education', None)
+        if min_education:
+            min_level = EDUCATION_LEVELS.index(min_education)
+            if min_level:
+                mask &= self.education > min_level
+
+        education = request_params.get('education', None)
+        if education:
+            degrees = [get_education_sort_key(value)
+                       for value in education.split(',')
+                       if value in EDUCATION_LEVELS]
+            if degrees:
+                mask &= np.isin(self.education, degrees)
+
+        schedule = request_params.get('schedule', None)
+        if schedule:
+            schedule = bleach.clean(schedule).upper()
+            mask &= self.strings['schedule'].match(lambda v: v == schedule)
+
+        site = request_params.get('site', None)
+        if site:
+            mask &= self.strings['contractor_site'].contains(bleach.clean(site))
+
+        business_size = request_params.get('business_size', None)
+        if business_size and business_size in ('s', 'o'):
+            prefix = business_size.upper()
+            mask &= self.strings['business_size'].match(
+                lambda v: v.startswith(prefix))
+
+        sin = request_params.get('sin', None)
+        if sin:
+            mask &= self.strings['sin'].contains(sin)
+
+        # Prices are compared the same way the database compares them,
+        # after being rounded to cents by the field.
+        field = Contract._meta.get_field(wage_field)
+
+        def to_cents(price):
+            return int(field.to_python(price) * 100)
+
+        price = request_params.get('price', None)
+        price__gte = request_params.get('price__gte')
+        price__lte = request_params.get('price__lte')
+        if price:
+            mask &= prices == to_cents(price)
+        else:
+            if price__gte:
+                mask &= (prices >= to_cents(price__gte)) & \
+                    (prices != NULL_PRICE)
+            if price__lte:
+                mask &= prices <= to_cents(price__lte)
+
+        return mask
+
+    def get_sort_key(self, field: str) -> np.ndarray:
+        if field in self.prices:
+            return self.prices[field]
+        if field in self.strings:
+            return self.strings[field].codes
+        if field == 'education_level':
+            return self.education
+        if field == 'min_years_experience':
+            return self.experience
+        raise ValueError(f'Unable to sort on the field "{field}"')
+
+    def sort(self, mask: np.ndarray, sort: List[str]) -> np.ndarray:
+        '''
+        Return the ids of the rows in the given mask, sorted by the
+        given fields (each optionally prefixed with `-` for descending
+        order) and then by id.
+        '''
+
+        rows = np.nonzero(mask)[0]
+        # numpy.lexsort() sorts by its last key first.
+        keys = [self.ids[rows]]
+        for field in reversed(sort):
+            key = self.get_sort_key(field.lstrip('-'))[rows]
+            keys.append(-key if field.startswith('-') else key)
+        return self.ids[rows[np.lexsort(keys)]]
+
+    def get_stats(self, mask: np.ndarray, wage_field: str,
+                  num_bins: Optional[int]=None) -> dict:
+        '''
+        Return the same statistics as get_stats_from_queryset() for the
+        given field of the rows in the given mask.
+        '''
+
+        prices = self.prices[wage_field][mask]
+        count = len(prices)
+        cents = prices[prices != NULL_PRICE]
+
+        stats: Dict[str, Any] = {
+            'count': count,
+            'minimum': None,
+            'maximum': None,
+            'average': None,
+            'stddev': None,
+        }
+        if len(cents):
+            # These are computed with exact integer arithmetic, like
+            # the database's numeric aggregates, before being converted
+            # to floats.
+            n = len(cents)
+            total = int(cents.sum())
+            sum_of_squares = int(np.dot(cents, cents))
+            stats['minimum'] = Decimal(int(cents.min())).scaleb(-2)
+            stats['maximum'] = Decimal(int(cents.max())).scaleb(-2)
+            stats['average'] = float(Decimal(total) / n / 100)
+            stats['stddev'] = float(
+                Decimal(n * sum_of_squares - total * total).sqrt() / n / 100)
+
+        if num_bins is not None:
+            if count:
+                mn, mx = get_histogram_range(float(stats['minimum']),
+                                             float(stats['maximum']))
+            else:
+                mn, mx = get_histogram_range(None, None)
+            bins = get_histogram_bins(mn, mx, num_bins)
+            thresholds = [b['min'] for b in bins] + [bins[-1]['max']]
+            # numpy.searchsorted() numbers buckets the same way as
+            # PostgreSQL's width_bucket() function.
+            buckets = np.searchsorted(thresholds, cents / 100, side='right')
+            stats['wage_histogram'] = fill_histogram_bins(
+                bins, mx, Counter(buckets.tolist()))
+
+        return stats
+
+    def query(self, request_params, wage_field: str, sort: List[str],
+              num_bins: Optional[int]=None) -> Tuple['ContractList', dict]:
+        '''
+        Return the contracts matching the given query parameters, sorted
+        by the given fields, along with their statistics.
+        '''
+
+        mask = self.filter(request_params, wage_field)
+        stats = self.get_stats(mask, wage_field, num_bins)
+        return ContractList(self.sort(mask, sort)), stats
+
+
+class ContractList:
+    '''
+    A list of the contracts with the given ids, which are only
+    fetched from the database when the list is sliced.
+    '''
+
+    def __init__(self, ids: np.ndarray) -> None:
+        self.ids = ids
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        ids = self.ids[key].tolist()
+        contracts = Contract.objects.in_bulk(ids)
+        # Contracts deleted since the snapshot was taken are skipped.
+        return [contracts[pk] for pk in ids if pk in contracts]
+
+
+def align(offset: int) -> int:
+    '''
+    Round the given offset up to the next multiple of FILE_ALIGNMENT.
+
+    Examples:
+
+        >>> align(0), align(1), align(64), align(65)
+        (0, 64, 64, 128)
+    '''
+
+    return -(-offset // FILE_ALIGNMENT) * FILE_ALIGNMENT
+
+
+def write_snapshot_file(snapshot: ContractsSnapshot, path: str) -> None:
+    '''
+    Write the given snapshot to a file at the given path, atomically
+    replacing any existing file there.
+
+    The file starts with FILE_MAGIC and the length of a JSON header
+    describing each column's name, dtype, shape and offset. The
+    columns follow the header, each aligned to FILE_ALIGNMENT bytes so
+    that they can be used directly from a memory map.
+    '''
+
+    columns = [(name, np.ascontiguousarray(array))
+               for name, array in snapshot.get_columns().items()]
+    offset = 0
+    header: Dict[str, Any] = {'version': snapshot.version, 'columns': []}
+    for name, array in columns:
+        header['columns'].append({
+            'name': name,
+            'dtype': array.dtype.str,
+            'shape': array.shape,
+            'offset': offset,
+        })
+        offset = align(offset + array.nbytes)
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_start = align(FILE_PREFIX.size + len(header_bytes))
+
+    # The file is written next to its final path, so that it can be
+    # moved there atomically once it's complete.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                                    prefix='.snapshot-')
+    try:
+        with open(fd, 'wb') as f:
+            f.write(FILE_PREFIX.pack(FILE_MAGIC, len(header_bytes)))
+            f.write(header_bytes)
+            for (name, array), info in zip(columns, header['columns']):
+                f.seek(data_start + info['offset'])
+                f.write(array.tobytes())
+            f.truncate(data_start + offset)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def read_snapshot_file(path: str) -> ContractsSnapshot:
+    '''
+    Map the snapshot file at the given path into memory, returning a
+    snapshot whose columns are read-only views of the map.
+    '''
+
+    with open(path, 'rb') as f:
+        magic, header_length = FILE_PREFIX.unpack(f.read(FILE_PREFIX.size))
+        if magic != FILE_MAGIC:
+            raise ValueError(f'{path} is not a snapshot file')
+        header = json.loads(f.read(header_length).decode('utf-8'))
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    data_start = align(FILE_PREFIX.size + header_length)
+    # NumPy doesn't keep the map's buffer exported, but a memoryview
+    # does, which stops the map being closed while any of the columns
+    # are still in use.
+    view = memoryview(data)  # type: ignore
+
+    columns: Dict[str, np.ndarray] = {}
+    for info in header['columns']:
+        dtype = np.dtype(info['dtype'])
+        shape = tuple(info['shape'])
+        count = int(np.prod(shape))
+        if count:
+            array = np.frombuffer(view, dtype=dtype, count=count,
+                                  offset=data_start + info['offset'])
+        else:
+            array = np.empty(0, dtype=dtype)
+        columns[info['name']] = array.reshape(shape)
+    snapshot = ContractsSnapshot(columns, header['version'])
+    snapshot.mmap = data
+    return snapshot
+
+
+def read_snapshot_version(path: str) -> Optional[str]:
+    '''
+    Return the contracts data version of the snapshot file at the
+    given path, without mapping the rest of it.
+    '''
+
+    with open(path, 'rb') as f:
+        _, header_length = FILE_PREFIX.unpack(f.read(FILE_PREFIX.size))
+        return json.loads(f.read(header_length).decode('utf-8'))['version']
+
+
+@job
+def publish_snapshot(path: Optional[str]=None, force: bool=False) -> bool:
+    '''
+    Write a snapshot of the current contracts to the given path, which
+    defaults to `settings.API_RATES_SNAPSHOT_PATH`. Unless `force` is
+    true, nothing is written if the file there is already at the
+    current contracts data version.
+
+    Returns whether a snapshot was written.
+    '''
+
+    path = path or settings.API_RATES_SNAPSHOT_PATH
+    backend = cache.get_backend()
+    version = None if backend is None else backend.get_version()
+    if (not force and version is not None and os.path.exists(path) and
+            read_snapshot_version(path) == version):
+        return False
+    write_snapshot_file(ContractsSnapshot.load(version), path)
+    logger.info(f'Published rates snapshot at version {version} to {path}.')
+    return True
+
+
+_snapshot: Optional[ContractsSnapshot] = None
+
+# This identifies where the current snapshot came from: either the API
+# cache backend whose version it was loaded at, or the path, device and
+# inode of the file it was mapped from.
+_snapshot_source: Any = None
+
+_lock = threading.Lock()
+
+
+def get_snapshot() -> Optional[ContractsSnapshot]:
+    '''
+    Return a snapshot of the current contracts, reloading it if the
+    contracts data version has changed since it was taken.
+
+    Return None if the contracts data version isn't known, or if
+    snapshots are published to a file and the file doesn't exist or
+    isn't at the current version.
+
+    The snapshot is closed once it's replaced, so it shouldn't be kept
+    past the end of the current request.
+    '''
+
+    backend = cache.get_backend()
+    # As with the API cache, the version must be read before the data
+    # is loaded.
+    version = None if backend is None else backend.get_version()
+    path = settings.API_RATES_SNAPSHOT_PATH
+    with _lock:
+        snapshot = _snapshot
+        if path:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                return None
+            source = (path, stat.st_dev, stat.st_ino)
+            if snapshot is None or _snapshot_source != source:
+                snapshot = _replace_snapshot(read_snapshot_file(path),
+                                             source)
+            if snapshot.version != version:
+                return None
+        elif version is None:
+            return None
+        elif (snapshot is None or _snapshot_source is not backend or
+                snapshot.version != version):
+            snapshot = _replace_snapshot(ContractsSnapshot.load(version),
+                                         backend)
+        return snapshot
+
+
+def _replace_snapshot(snapshot: ContractsSnapshot,
+                      source: Any) -> ContractsSnapshot:
+    global _snapshot, _snapshot_source
+
+    if _snapshot is not None:
+        # Each process handles one request at a time, so nothing is
+        # using the old snapshot any more, and this unmaps its file now
+        # rather than whenever it's garbage collected.
+        _snapshot.close()
+    _snapshot = snapshot
+    _snapshot_source = source
+    return snapshot
@@ -0,0 +1,31 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+
+from api.apps import check_settings
+
+
+class CheckSettingsTests(SimpleTestCase):
+    @override_settings(API_RATES_ENGINE='snapshot', API_CACHE_BACKEND='none')
+    def test_snapshot_engine_requires_cache(self):
+        with self.assertRaisesRegex(ImproperlyConfigured, 'snapshot'):
+            check_settings()
+
+    @override_settings(API_RATES_ENGINE='snapshot',
+                       API_CACHE_BACKEND='locmem')
+    def test_snapshot_engine_works_with_cache(self):
+        check_settings()
+
+    @override_settings(API_RATES_ENGINE='orm', API_CACHE_BACKEND='none')
+    def test_orm_engine_works_without_cache(self):
+        check_settings()
+
+    @override_settings(API_RATES_SNAPSHOT_PATH='/tmp/rates.snapshot',
+                       API_CACHE_BACKEND='locmem')
+    def test_snapshot_path_requires_redis(self):
+        with self.assertRaisesRegex(ImproperlyConfigured, 'redis'):
+            check_settings()
+
+    @override_settings(API_RATES_SNAPSHOT_PATH='/tmp/rates.snapshot',
+                       API_CACHE_BACKEND='redis')
+    def test_snapshot_path_works_with_redis(self):
+        check_settings()
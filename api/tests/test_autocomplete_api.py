@@ -53,3 +53,26 @@ class GetAutocompleteTests(TestCase):
         self.assertEqual(res.status_code, 200)
         data = res.json()
         self.assertEqual(len(data), GetAutocomplete.MAX_RESULTS)
+
+    def test_returns_counts_in_descending_order(self):
+        get_contract_recipe().make(
+            _quantity=6,
+            labor_category=cycle(['Tester', 'Test Lead', 'Tester'])
+        )
+        res = self.client.get(self.path + '?q=test')
+        self.assertEqual(res.json(), [
+            {'labor_category': 'tester', 'count': 4},
+            {'labor_category': 'test lead', 'count': 2},
+        ])
+
+    def test_match_exact(self):
+        self.make_test_contracts(3)
+        res = self.client.get(self.path + '?q=test_1&query_type=match_exact')
+        self.assertEqual(res.json(), [
+            {'labor_category': 'test_1', 'count': 1},
+        ])
+
+    def test_uses_one_query(self):
+        self.make_test_contracts(3)
+        with self.assertNumQueries(1):
+            self.client.get(self.path + '?q=test')
@@ -0,0 +1,307 @@
+import os
+import uuid
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from contracts.models import Contract, ScheduleMetadata
+from contracts.mommy_recipes import get_contract_recipe
+from .. import cache
+
+
+class LocMemBackendTests(SimpleTestCase):
+    def test_eviction_accounts_for_replaced_values(self):
+        backend = cache.LocMemBackend(max_size=10)
+        backend.set('a', b'12345')
+        backend.set('a', b'1234567')
+        backend.set('b', b'123')
+        self.assertEqual(backend.size, 10)
+        self.assertEqual(backend.get('a'), b'1234567')
+        self.assertEqual(backend.get('b'), b'123')
+
+    def test_bump_version_works(self):
+        backend = cache.LocMemBackend(max_size=10)
+        version = backend.get_version()
+        self.assertEqual(backend.get_version(), version)
+        backend.bump_version()
+        self.assertNotEqual(backend.get_version(), version)
+
+    def test_versions_differ_between_processes(self):
+        self.assertNotEqual(cache.LocMemBackend(max_size=10).get_version(),
+                            cache.LocMemBackend(max_size=10).get_version())
+
+    @patch('time.monotonic')
+    def test_version_expires_after_timeout(self, monotonic):
+        monotonic.return_value = 100
+        backend = cache.LocMemBackend(max_size=10, timeout=60)
+        monotonic.return_value = 159
+        version = backend.get_version()
+        monotonic.return_value = 160
+        new_version = backend.get_version()
+        self.assertNotEqual(new_version, version)
+        self.assertEqual(backend.get_version(), new_version)
+
+    def test_stats_work(self):
+        backend = cache.LocMemBackend(max_size=10)
+        backend.incr_stat('hits')
+        backend.incr_stat('hits')
+        backend.incr_stat('misses')
+        self.assertEqual(backend.get_stats(), {'hits': 2, 'misses': 1})
+
+
+class RedisBackendTests(SimpleTestCase):
+    def setUp(self):
+        self.backend = cache.RedisBackend(
+            url=os.environ['REDIS_TEST_URL'],
+            timeout=60,
+            prefix=f'test_api_cache:{uuid.uuid4()}:'
+        )
+
+    def tearDown(self):
+        keys = self.backend.redis.keys(self.backend.prefix + '*')
+        if keys:
+            self.backend.redis.delete(*keys)
+
+    def test_get_and_set_work(self):
+        self.assertIsNone(self.backend.get('a'))
+        self.backend.set('a', b'123')
+        self.assertEqual(self.backend.get('a'), b'123')
+        self.assertEqual(
+            self.backend.redis.ttl(self.backend.prefix + 'a'), 60)
+
+    def test_bump_version_works(self):
+        version = self.backend.get_version()
+        self.assertEqual(self.backend.get_version(), version)
+        self.backend.bump_version()
+        self.assertNotEqual(self.backend.get_version(), version)
+
+    def test_lost_version_is_not_reused(self):
+        version = self.backend.get_version()
+        self.backend.redis.delete(self.backend.prefix + 'version')
+        self.assertNotEqual(self.backend.get_version(), version)
+
+    def test_failed_bump_is_retried(self):
+        version = self.backend.get_version()
+        with patch.object(self.backend.redis, 'set',
+                          side_effect=cache.redis.ConnectionError()):
+            with self.assertLogs('calc', 'ERROR'):
+                self.backend.bump_version()
+            with self.assertLogs('calc', 'ERROR'):
+                self.assertIsNone(self.backend.get_version())
+        self.assertNotEqual(self.backend.get_version(), version)
+
+    def test_stats_work(self):
+        self.assertEqual(self.backend.get_stats(), {'hits': 0, 'misses': 0})
+        self.backend.incr_stat('misses')
+        self.assertEqual(self.backend.get_stats(), {'hits': 0, 'misses': 1})
+
+
+class UnavailableRedisBackendTests(TestCase):
+    def setUp(self):
+        # Nothing listens on port 1, so every command fails to connect.
+        self.backend = cache.RedisBackend(url='redis://127.0.0.1:1/0',
+                                          timeout=60)
+
+    def test_reads_miss(self):
+        with self.assertLogs('calc', 'WARNING'):
+            self.assertIsNone(self.backend.get('a'))
+        with self.assertLogs('calc', 'WARNING'):
+            self.assertIsNone(self.backend.get_version())
+
+    def test_writes_do_nothing(self):
+        with self.assertLogs('calc', 'WARNING'):
+            self.backend.set('a', b'123')
+        with self.assertLogs('calc', 'ERROR'):
+            self.backend.bump_version()
+        self.backend.incr_stat('hits')
+
+    def test_responses_are_computed_without_caching(self):
+        with patch.object(cache, 'get_backend', return_value=self.backend):
+            with self.assertLogs('calc', 'WARNING'):
+                self.assertEqual(
+                    cache.get_or_set('foo', {}, lambda: [1]), [1])
+                self.assertIsNone(cache.get_etag('foo', {}))
+                cache.bump_data_version()
+
+
+class GetBackendTests(SimpleTestCase):
+    def test_returns_none_when_disabled(self):
+        with override_settings(API_CACHE_BACKEND='none'):
+            self.assertIsNone(cache.get_backend())
+            self.assertIsNone(cache.get_stats())
+
+    def test_returns_configured_backend(self):
+        with override_settings(API_CACHE_BACKEND='locmem',
+                               API_CACHE_MAX_SIZE=50):
+            backend = cache.get_backend()
+            self.assertIsInstance(backend, cache.LocMemBackend)
+            self.assertEqual(backend.max_size, 50)
+            self.assertIs(cache.get_backend(), backend)
+
+    def test_raises_error_on_unknown_backend(self):
+        with override_settings(API_CACHE_BACKEND='blarg'):
+            with self.assertRaisesRegexp(ValueError, 'Unknown'):
+                cache.get_backend()
+
+
+class FreshBackendMixin:
+    def setUp(self):
+        super().setUp()
+        # Settings overridden on a class only change once for all of its
+        # tests, so make sure each test starts with an empty cache.
+        cache.reset_backend(setting='API_CACHE_BACKEND')
+
+
+@override_settings(API_CACHE_BACKEND='locmem')
+class GetOrSetTests(FreshBackendMixin, TestCase):
+    def test_caches_data(self):
+        self.assertEqual(cache.get_or_set('foo', {'a': 1}, lambda: [1]), [1])
+        self.assertEqual(cache.get_or_set('foo', {'a': 1}, lambda: [2]), [1])
+        self.assertEqual(cache.get_stats(), {'hits': 1, 'misses': 1})
+
+    def test_keys_on_name_and_params(self):
+        cache.get_or_set('foo', {'a': 1}, lambda: [1])
+        self.assertEqual(cache.get_or_set('bar', {'a': 1}, lambda: [2]), [2])
+        self.assertEqual(cache.get_or_set('foo', {'a': 2}, lambda: [3]), [3])
+
+    def test_bump_data_version_invalidates_data(self):
+        cache.get_or_set('foo', {}, lambda: [1])
+        cache.bump_data_version()
+        self.assertEqual(cache.get_or_set('foo', {}, lambda: [2]), [2])
+
+
+@override_settings(API_CACHE_BACKEND='locmem')
+class CachedResponseTests(FreshBackendMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        get_contract_recipe().make(
+            _quantity=3,
+            labor_category='Engineer',
+        )
+
+    def assertCached(self, path, other_path=None):
+        first = self.client.get(path)
+        with self.assertNumQueries(0):
+            second = self.client.get(other_path or path)
+        self.assertEqual(first.json(), second.json())
+
+    def test_rates_are_cached(self):
+        self.assertCached('/api/rates/?q=engineer&histogram=2')
+
+    def test_rates_query_params_are_canonicalized(self):
+        self.assertCached('/api/rates/?q=Engineer&sort=labor_category',
+                          '/api/rates/?sort=labor_category&q= engineer'
+                          '&contract-year=0')
+
+    def test_rates_with_different_params_are_not_shared(self):
+        self.client.get('/api/rates/?q=engineer')
+        res = self.client.get('/api/rates/?q=manager')
+        self.assertEqual(res.json()['count'], 0)
+
+    def test_rates_are_not_shared_across_hosts(self):
+        self.client.get('/api/rates/', HTTP_HOST='foo')
+        res = self.client.get('/api/rates/')
+        self.assertTrue(res.json()['results'])
+        self.assertEqual(cache.get_stats(), {'hits': 0, 'misses': 2})
+
+    def test_autocomplete_is_cached(self):
+        self.assertCached('/api/search/?q=Engineer',
+                          '/api/search/?q=engineer&foo=bar')
+
+    def test_schedules_are_cached(self):
+        self.assertCached('/api/schedules/')
+
+    def test_bulk_create_invalidates_cache(self):
+        self.client.get('/api/rates/')
+        contract = Contract.objects.first()
+        contract.pk = None
+        Contract.objects.bulk_create([contract])
+        self.assertEqual(self.client.get('/api/rates/').json()['count'], 4)
+
+    def test_saving_schedule_metadata_invalidates_cache(self):
+        self.client.get('/api/schedules/')
+        ScheduleMetadata.objects.create(schedule='BLARG', name='Blarg')
+        res = self.client.get('/api/schedules/')
+        self.assertIn('BLARG', [s['schedule'] for s in res.json()])
+
+
+@override_settings(API_CACHE_BACKEND='locmem')
+class ConditionalGetTests(FreshBackendMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        get_contract_recipe().make(labor_category='Engineer')
+
+    def assertNotModified(self, path):
+        etag = self.client.get(path)['ETag']
+        with self.assertNumQueries(0):
+            res = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res['ETag'], etag)
+        self.assertEqual(res.content, b'')
+
+    def test_rates_can_be_not_modified(self):
+        self.assertNotModified('/api/rates/?q=engineer')
+
+    def test_rates_csv_can_be_not_modified(self):
+        self.assertNotModified('/api/rates/csv/?q=engineer')
+
+    def test_autocomplete_can_be_not_modified(self):
+        self.assertNotModified('/api/search/?q=engineer')
+
+    def test_schedules_can_be_not_modified(self):
+        self.assertNotModified('/api/schedules/')
+
+    def test_etag_is_strong(self):
+        etag = self.client.get('/api/rates/')['ETag']
+        self.assertRegex(etag, r'^"[^"]+"$')
+
+    def test_etag_matches_canonical_query(self):
+        etag = self.client.get('/api/rates/?q=Engineer&sort=labor_category')[
+            'ETag']
+        res = self.client.get('/api/rates/?sort=labor_category&q=engineer',
+                              HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 304)
+
+    def test_etag_varies_by_query(self):
+        etag = self.client.get('/api/rates/?q=engineer')['ETag']
+        res = self.client.get('/api/rates/?q=manager',
+                              HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_etag_varies_by_format(self):
+        etag = self.client.get('/api/rates/')['ETag']
+        res = self.client.get('/api/rates/?format=api',
+                              HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+
+    def test_etag_changes_when_version_resets(self):
+        etag = self.client.get('/api/rates/')['ETag']
+        # This is what happens when the server restarts.
+        cache.reset_backend(setting='API_CACHE_BACKEND')
+        res = self.client.get('/api/rates/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_etag_changes_when_data_changes(self):
+        etag = self.client.get('/api/rates/')['ETag']
+        cache.bump_data_version()
+        res = self.client.get('/api/rates/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_weak_and_multiple_etags_match(self):
+        etag = self.client.get('/api/rates/')['ETag']
+        res = self.client.get('/api/rates/',
+                              HTTP_IF_NONE_MATCH=f'"foo", W/{etag}')
+        self.assertEqual(res.status_code, 304)
+
+    def test_wildcard_matches(self):
+        res = self.client.get('/api/rates/', HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(res.status_code, 304)
+
+    @override_settings(API_CACHE_BACKEND='none')
+    def test_no_etag_when_cache_is_disabled(self):
+        res = self.client.get('/api/rates/', HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('ETag', res)
@@ -1,11 +1,22 @@
 import io
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
+
+import requests
 from django.core.management import call_command, CommandError
-from django.test import LiveServerTestCase, SimpleTestCase, override_settings
+from django.test import (LiveServerTestCase, SimpleTestCase, TestCase,
+                         override_settings)
 from httmock import all_requests, response, HTTMock
 
 from contracts.mommy_recipes import get_contract_recipe
-from contracts.models import Contract
+from contracts.models import Contract, ContractLoadCheckpoint, ContractSync
+from api.management.commands import load_api_data
 from api.management.commands.load_api_data import (
+    iter_api_cursor_pages,
     iter_api_pages,
     Command,
 )
@@ -63,6 +74,17 @@ class LiveServerTests(LiveServerTestCase):
             'Processed 2 rates in dry run mode over 1 pages'
         )
 
+    @override_settings(PAGINATION=2)
+    def test_cursor_pages_include_rates_with_the_same_price_once(self):
+        contracts = get_contract_recipe().make(_quantity=5,
+                                               current_price=10)
+        pages = list(iter_api_cursor_pages(
+            f"{self.live_server_url}/api/rates/", keep_ids=True))
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(
+            sorted(r['id'] for results, _ in pages for r in results),
+            sorted(c.id for c in contracts))
+
     def test_rewriting_from_self_is_empty_db(self):
         get_contract_recipe().make()
         stdout = io.StringIO()
@@ -156,3 +178,253 @@ class SimpleTests(SimpleTestCase):
             stderr.getvalue(),
             r'Rate .*blah.* has error .*This field is required.*'
         )
+
+
+def make_fixture_rate(i):
+    return {
+        'id': i + 1,
+        'idv_piid': f'GS-{i}',
+        'vendor_name': 'Acme Inc.',
+        'labor_category': f'Engineer {i}',
+        'education_level': 'Bachelors',
+        'min_years_experience': 5,
+        'hourly_rate_year1': 50.0,
+        'current_price': 50.0,
+        'next_year_price': 51.0,
+        'second_year_price': 52.0,
+        'schedule': 'MOBIS',
+        'sin': '874-1',
+        'contractor_site': 'Customer',
+        'business_size': 'S',
+    }
+
+
+def make_fixture_pages(num_rates, page_size):
+    rates = [make_fixture_rate(i) for i in range(num_rates)]
+    pages = [rates[i:i + page_size] for i in range(0, num_rates, page_size)]
+    return [{
+        'count': num_rates,
+        'results': results,
+        'next': 'more' if page < len(pages) else None,
+    } for page, results in enumerate(pages, start=1)]
+
+
+class FixturePageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path.endswith('/changes/'):
+            since = int(query['since'][0]) if 'since' in query else None
+            if since not in server.changes:
+                return self.send_json({'detail': 'Invalid'}, status=400)
+            return self.send_json(server.changes[since])
+        if query.get('pagination') == ['cursor']:
+            page = int(query.get('cursor', ['1'])[0])
+            data = server.pages[page - 1]
+            if data['next'] is not None:
+                # The stand-in's links point somewhere else, like they
+                # might if the real API were behind a proxy.
+                data = {**data, 'next': 'http://internal/api/rates/?'
+                                        f'pagination=cursor&cursor={page + 1}'}
+            with server.lock:
+                server.requested_pages.append(page)
+            return self.send_json(data)
+        page = int(query['page'][0])
+        with server.lock:
+            server.requested_pages.append(page)
+            failing = server.failures.get(page, 0) > 0
+            if failing:
+                server.failures[page] -= 1
+        if failing:
+            self.send_response(503)
+            self.end_headers()
+            return
+        self.send_json(server.pages[page - 1])
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FixturePageServer(ThreadingMixIn, HTTPServer):
+    '''
+    A stand-in for another CALC instance's API, which serves the given
+    pages and responds with a 503 to the first `failures[page]`
+    requests for each page. The pages can also be requested by
+    cursor, in which case their cursors are their page numbers. Its
+    change feed serves `changes[since]`, or a 400 if there isn't one.
+    '''
+
+    daemon_threads = True
+
+    def __init__(self, pages, failures=None, changes=None):
+        super().__init__(('127.0.0.1', 0), FixturePageHandler)
+        self.pages = pages
+        self.failures = failures or {}
+        self.changes = changes or {}
+        self.requested_pages = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}/api/rates/'
+
+
+@patch.object(load_api_data, 'RETRY_BACKOFF_FACTOR', 0)
+class StandInServerTests(TestCase):
+    def setUp(self):
+        self.server = FixturePageServer(make_fixture_pages(9, 2))
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def load(self, **kwargs):
+        stdout = io.StringIO()
+        call_command('load_api_data', url=self.server.url,
+                     concurrency=2, stdout=stdout, **kwargs)
+        return stdout.getvalue()
+
+    def test_pages_are_loaded_in_order(self):
+        pages = list(iter_api_pages(self.server.url, concurrency=3))
+        self.assertEqual([len(results) for results, _ in pages],
+                         [2, 2, 2, 2, 1])
+        self.assertEqual(pages[1][0][0]['labor_category'], 'Engineer 2')
+        self.assertEqual({total for _, total in pages}, {5})
+        self.assertNotIn('id', pages[0][0][0])
+
+    def test_cursor_pages_are_loaded_in_order(self):
+        pages = list(iter_api_cursor_pages(self.server.url, keep_ids=True))
+        self.assertEqual([len(results) for results, _ in pages],
+                         [2, 2, 2, 2, 1])
+        self.assertEqual([r['id'] for results, _ in pages for r in results],
+                         list(range(1, 10)))
+        self.assertEqual({total for _, total in pages}, {5})
+        self.assertEqual(self.server.requested_pages, [1, 2, 3, 4, 5])
+
+    def test_failed_requests_are_retried(self):
+        self.server.failures = {2: 2}
+        self.assertRegex(self.load(),
+                         'Done writing 9 rates to the database')
+        self.assertEqual(self.server.requested_pages.count(2), 3)
+        self.assertEqual(Contract.objects.count(), 9)
+        self.assertFalse(ContractLoadCheckpoint.objects.exists())
+
+    @patch.object(load_api_data, 'MAX_RETRIES', 1)
+    def test_interrupted_load_can_be_resumed(self):
+        get_contract_recipe().make()
+        self.server.failures = {4: 2}
+        with self.assertRaises(requests.exceptions.RetryError):
+            self.load()
+        self.assertEqual(Contract.objects.count(), 6)
+        checkpoint = ContractLoadCheckpoint.objects.get()
+        self.assertEqual(checkpoint.url, self.server.url)
+        self.assertEqual(checkpoint.next_page, 4)
+        self.assertEqual(checkpoint.end_page, None)
+        self.assertEqual(checkpoint.num_rates, 6)
+
+        self.server.requested_pages = []
+        output = self.load(resume=True)
+        self.assertRegex(output, 'Resuming from page 4')
+        self.assertNotRegex(output, 'Deleting')
+        self.assertRegex(output, 'Done writing 9 rates to the database')
+        self.assertEqual(sorted(self.server.requested_pages), [4, 5])
+        self.assertEqual(
+            sorted(Contract.objects.values_list('idv_piid', flat=True)),
+            [f'GS-{i}' for i in range(9)])
+        self.assertFalse(ContractLoadCheckpoint.objects.exists())
+
+    def test_resume_requires_checkpoint(self):
+        with self.assertRaisesRegex(CommandError, 'no checkpoint'):
+            self.load(resume=True)
+
+    def test_resume_requires_same_url(self):
+        ContractLoadCheckpoint.objects.create(url='http://other/',
+                                              next_page=2)
+        with self.assertRaisesRegex(CommandError, 'no checkpoint'):
+            self.load(resume=True)
+
+    def test_checkpoint_is_saved_with_each_page(self):
+        advance = ContractLoadCheckpoint.advance
+
+        def advance_then_fail(checkpoint, num_rates):
+            advance(checkpoint, num_rates)
+            if checkpoint.next_page == 4:
+                raise KeyboardInterrupt()
+
+        with patch.object(ContractLoadCheckpoint, 'advance',
+                          advance_then_fail):
+            with self.assertRaises(KeyboardInterrupt):
+                self.load()
+        # The third page's rates were rolled back along with its
+        # checkpoint, so resuming won't write them twice.
+        self.assertEqual(Contract.objects.count(), 4)
+        self.assertEqual(ContractLoadCheckpoint.objects.get().num_rates, 4)
+
+        self.load(resume=True)
+        self.assertEqual(
+            sorted(Contract.objects.values_list('idv_piid', flat=True)),
+            [f'GS-{i}' for i in range(9)])
+
+    def test_incremental_load_applies_only_changes(self):
+        get_contract_recipe().make(id=100)
+        changed = make_fixture_rate(0)
+        changed['labor_category'] = 'Changed'
+        self.server.changes = {
+            None: {'version': 7},
+            7: {'version': 9, 'more': True, 'inserted': [],
+                'updated': [changed], 'deleted': [2]},
+            9: {'version': 10, 'more': False, 'inserted': [
+                make_fixture_rate(20)], 'updated': [], 'deleted': []},
+            10: {'version': 10, 'more': False, 'inserted': [],
+                 'updated': [], 'deleted': []},
+        }
+
+        output = self.load(incremental=True)
+        self.assertRegex(output, 'so loading every rate')
+        self.assertRegex(output, 'Loaded 9 rates')
+        self.assertRegex(output, 'Done applying 3 changes, up to version 10')
+        contracts = dict(Contract.objects.values_list('id', 'labor_category'))
+        self.assertEqual(sorted(contracts), [1, 3, 4, 5, 6, 7, 8, 9, 21])
+        self.assertEqual(contracts[1], 'Changed')
+        self.assertEqual(ContractSync.objects.get().version, 10)
+
+        self.server.requested_pages = []
+        output = self.load(incremental=True)
+        self.assertRegex(output, 'Loading changes since version 10')
+        self.assertRegex(output, 'Done applying 0 changes')
+        self.assertEqual(self.server.requested_pages, [])
+        self.assertEqual(Contract.objects.count(), 9)
+
+    def test_incremental_load_reloads_if_version_has_expired(self):
+        ContractSync.objects.create(url=self.server.url, version=3)
+        self.server.changes = {
+            None: {'version': 7},
+            7: {'version': 7, 'more': False, 'inserted': [],
+                'updated': [], 'deleted': []},
+        }
+
+        output = self.load(incremental=True)
+        self.assertRegex(output, 'Version 3 is no longer in the change feed')
+        self.assertRegex(output, 'Loaded 9 rates')
+        self.assertEqual(Contract.objects.count(), 9)
+        self.assertEqual(ContractSync.objects.get().version, 7)
+
+    def test_incremental_load_does_not_reload_forever(self):
+        self.server.changes = {None: {'version': 7}}
+        with self.assertRaisesRegex(CommandError, "Version 7 isn't in"):
+            self.load(incremental=True)
+
+    def test_incremental_load_cannot_be_appended(self):
+        with self.assertRaisesRegex(CommandError, 'cannot be resumed or '
+                                                  'appended'):
+            self.load(incremental=True, append=True)
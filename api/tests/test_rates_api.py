@@ -4,6 +4,8 @@ from model_mommy.recipe import seq
 from contracts.models import Contract
 from contracts.mommy_recipes import get_contract_recipe
 
+import json
+from base64 import urlsafe_b64encode
 from itertools import cycle
 
 
@@ -32,6 +34,11 @@ class ContractsPaginationTest(TestCase):
         self.assertEqual(resp.data['next'], self.absolute_uri('?page=3'))
         self.assertEqual(resp.data['previous'], self.absolute_uri())
 
+    def test_count_is_not_queried_separately(self):
+        with self.assertNumQueries(2):
+            resp = self.client.get(self.path + '?page=2')
+        self.assertEqual(resp.data['count'], 4)
+
     def test_nonexistent_page(self):
         resp = self.client.get(self.path + '?page=99999')
         self.assertEqual(resp.status_code, 404)
@@ -41,6 +48,111 @@ class ContractsPaginationTest(TestCase):
         self.assertEqual(resp.status_code, 404)
 
 
+@override_settings(PAGINATION=2)
+class ContractsCursorPaginationTest(TestCase):
+
+    def setUp(self):
+        get_contract_recipe().make(
+            _quantity=9,
+            vendor_name=cycle(['Zeta', 'Alpha']),
+            current_price=cycle([18, 24, 33, 24]),
+            education_level=cycle(['BA', None, 'HS']),
+            next_year_price=cycle([20, None]),
+        )
+        self.path = RATES_API_PATH
+
+    def get_all_pages(self, params):
+        url = self.path
+        params = dict(pagination='cursor', **params)
+        pages = []
+        while url:
+            resp = self.client.get(url, params)
+            self.assertEqual(resp.status_code, 200)
+            pages.append(resp.data)
+            url, params = resp.data['next'], {}
+        return pages
+
+    def assertPagesAreSorted(self, sort='current_price'):
+        pages = self.get_all_pages({'sort': sort})
+        self.assertEqual(len(pages), 5)
+        ids = [r['id'] for page in pages for r in page['results']]
+        expected = Contract.objects.order_by(*sort.split(','), 'id')\
+            .values_list('id', flat=True)
+        self.assertEqual(ids, list(expected))
+
+        # Now walk backwards through the pages.
+        url = pages[-1]['previous']
+        for page in reversed(pages[:-1]):
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.data['results'], page['results'])
+            url = resp.data['previous']
+        self.assertIsNone(url)
+
+    def test_default_sort(self):
+        self.assertPagesAreSorted()
+
+    def test_descending_sort(self):
+        self.assertPagesAreSorted('-current_price')
+
+    def test_multiple_sort_fields(self):
+        self.assertPagesAreSorted('-current_price,vendor_name')
+
+    def test_sort_on_nullable_field(self):
+        self.assertPagesAreSorted('next_year_price')
+        self.assertPagesAreSorted('-next_year_price,current_price')
+
+    def test_search_pages_through_null_wage_field(self):
+        # Searches include rates without a price for the wage field.
+        pages = self.get_all_pages({'q': 'analyst', 'contract-year': 1})
+        ids = [r['id'] for page in pages for r in page['results']]
+        expected = Contract.objects.order_by('next_year_price', 'id')\
+            .values_list('id', flat=True)
+        self.assertEqual(ids, list(expected))
+
+    def test_sort_on_education_level(self):
+        self.assertPagesAreSorted('education_level')
+        self.assertPagesAreSorted('-education_level,-current_price')
+
+    def test_response_contains_stats(self):
+        resp = self.client.get(self.path, {'pagination': 'cursor',
+                                           'histogram': 2})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(list(resp.data.keys()), [
+            'count', 'next', 'previous', 'average', 'minimum', 'maximum',
+            'wage_histogram', 'first_standard_deviation', 'results',
+        ])
+        self.assertEqual(resp.data['count'], 9)
+        self.assertEqual(len(resp.data['wage_histogram']), 2)
+        self.assertIsNone(resp.data['previous'])
+        self.assertIn('cursor=', resp.data['next'])
+        self.assertIn('pagination=cursor', resp.data['next'])
+
+    def test_deep_pages_do_not_use_offset(self):
+        pages = self.get_all_pages({})
+        with self.assertNumQueries(2) as ctx:
+            resp = self.client.get(pages[-2]['next'])
+        self.assertEqual(resp.status_code, 200)
+        for query in ctx.captured_queries:
+            self.assertNotIn('OFFSET', query['sql'])
+
+    def test_invalid_cursor(self):
+        for cursor in ('blarg', 'e30=', 'eyJwIjogWzFdLCAiciI6IGZhbHNlfQ=='):
+            resp = self.client.get(self.path, {'pagination': 'cursor',
+                                               'cursor': cursor})
+            self.assertEqual(resp.status_code, 404)
+
+    def test_cursor_with_invalid_position_values(self):
+        for position in ([{'a': 1}, 1], ['abc', 1], ['Infinity', 1],
+                         ['18.00', 'x'], ['18.00', [1]]):
+            data = json.dumps({'p': position, 'r': False}).encode('utf-8')
+            resp = self.client.get(self.path, {
+                'pagination': 'cursor',
+                'cursor': urlsafe_b64encode(data).decode('ascii'),
+            })
+            self.assertEqual(resp.status_code, 404, position)
+
+
 class GetRatesTests(TestCase):
     """ tests for the /api/rates endpoint """
     BUSINESS_SIZES = ('small business', 'other than small business')
@@ -992,6 +1104,18 @@ class GetRatesTests(TestCase):
             {'count': 1, 'min': 33.0, 'max': 50.0}
         ])
 
+    def test_stats_histogram_and_count_use_one_query(self):
+        self.make_test_set()
+        # One query for the stats (including the count and histogram),
+        # and one for the page of results.
+        with self.assertNumQueries(2):
+            resp = self.c.get(self.path, {'q': 'accounting,legal',
+                                          'query_type': 'match_phrase',
+                                          'histogram': 2})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['count'], 2)
+        self.assertEqual(len(resp.data['results']), 2)
+
     def test_filter_by_site(self):
         get_contract_recipe().make(_quantity=3, contractor_site=seq('Q'))
         resp = self.c.get(self.path, {'site': 'Q3'})
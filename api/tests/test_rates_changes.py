@@ -0,0 +1,90 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from contracts.mommy_recipes import get_contract_recipe
+from contracts.models import ContractChange
+from api.views import GetRateChanges
+
+RATES_CHANGES_PATH = '/api/rates/changes/'
+
+
+class GetRateChangesTests(TestCase):
+    def get(self, **params):
+        resp = self.client.get(RATES_CHANGES_PATH, params)
+        self.assertEqual(resp.status_code, 200)
+        return resp.json()
+
+    def test_version_is_returned_without_since(self):
+        self.assertEqual(self.get(), {'version': 0})
+        get_contract_recipe().make()
+        self.assertEqual(self.get(), {
+            'version': ContractChange.objects.get_version()})
+
+    def test_invalid_since_raises_400(self):
+        resp = self.client.get(RATES_CHANGES_PATH, {'since': '-1'})
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json(),
+                         ['"since" must be a non-negative integer'])
+
+    def test_unknown_since_raises_400(self):
+        resp = self.client.get(RATES_CHANGES_PATH, {'since': '5'})
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json(),
+                         ['"since" must be a version returned by this '
+                          'endpoint'])
+
+    def test_changes_since_version_are_returned(self):
+        updated, deleted = get_contract_recipe().make(_quantity=2)
+        version = ContractChange.objects.get_version()
+        updated.labor_category = 'Changed'
+        updated.save()
+        deleted_id = deleted.id
+        deleted.delete()
+        inserted = get_contract_recipe().make(labor_category='New')
+
+        data = self.get(since=version)
+        self.assertEqual(data['version'],
+                         ContractChange.objects.get_version())
+        self.assertFalse(data['more'])
+        self.assertEqual([r['id'] for r in data['inserted']], [inserted.id])
+        self.assertEqual(data['inserted'][0]['labor_category'], 'New')
+        self.assertEqual([r['id'] for r in data['updated']], [updated.id])
+        self.assertEqual(data['updated'][0]['labor_category'], 'Changed')
+        self.assertEqual(data['deleted'], [deleted_id])
+
+        self.assertEqual(self.get(since=data['version']), {
+            'version': data['version'],
+            'more': False,
+            'inserted': [],
+            'updated': [],
+            'deleted': [],
+        })
+
+    def test_only_current_state_of_rates_is_returned(self):
+        contract = get_contract_recipe().make()
+        contract.save()
+        contract_id = contract.id
+        get_contract_recipe().make(current_price=None)
+        contract.delete()
+        data = self.get(since=0)
+        self.assertEqual(data['inserted'], [])
+        self.assertEqual(data['updated'], [])
+        self.assertEqual(len(data['deleted']), 2)
+        self.assertEqual(data['deleted'][0], contract_id)
+
+    @patch.object(GetRateChanges, 'MAX_CHANGES', 2)
+    def test_changes_are_paginated(self):
+        contracts = get_contract_recipe().make(_quantity=3)
+        first_version = ContractChange.objects.order_by('id')[1].id
+
+        data = self.get(since=0)
+        self.assertTrue(data['more'])
+        self.assertEqual(data['version'], first_version)
+        self.assertEqual([r['id'] for r in data['inserted']],
+                         [c.id for c in contracts[:2]])
+
+        data = self.get(since=first_version)
+        self.assertFalse(data['more'])
+        self.assertEqual([r['id'] for r in data['inserted']],
+                         [contracts[2].id])
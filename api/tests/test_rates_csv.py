@@ -1,7 +1,11 @@
 import urllib
+from datetime import date
+from itertools import cycle
 
 from django.test import TestCase
 
+from contracts.mommy_recipes import get_contract_recipe
+from api.views import iter_csv_chunks
 from . import test_rates_api
 
 RATES_CSV_PATH = '/api/rates/csv'
@@ -33,3 +37,61 @@ class GetRatesCSVTests(TestCase):
         self.assertEqual(resp.json(), [
             '"blarg" is not a valid field to sort on'
         ])
+
+
+class GetRatesCSVContentTests(TestCase):
+    def setUp(self):
+        get_contract_recipe().make(
+            _quantity=4,
+            business_size=cycle(['S', 'other']),
+            education_level=cycle(['BA', None, 'PHD']),
+            labor_category=cycle(['Legal, "Stuff"', 'Accounting\nCPA']),
+            contract_start=cycle([date(2015, 1, 2), None]),
+            contract_end=cycle([date(2020, 1, 2), None]),
+            contractor_site=cycle(['Customer', None]),
+        )
+
+    def test_response_is_streamed(self):
+        resp = self.client.get(f'{RATES_CSV_PATH}/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        self.assertEqual(resp['Content-Type'], 'text/csv')
+        self.assertEqual(resp['Content-Disposition'],
+                         'attachment; filename="pricing_results.csv"')
+
+    def test_content(self):
+        resp = self.client.get(f'{RATES_CSV_PATH}/', {
+            'sort': '-education_level,vendor_name',
+            'min_experience': '5',
+        })
+        self.assertEqual(b''.join(resp.streaming_content).decode('utf-8'), (
+            'Search Query,Minimum Education Level,Minimum Years Experience,'
+            'Worksite,Business Size,,,,,,,,,\r\n'
+            'None,None Specified,5,None Specified,None Specified,'
+            ',,,,,,,,\r\n'
+            'Contract #,Business Size,Schedule,Site,Begin Date,End Date,SIN,'
+            'Vendor Name,Labor Category,education Level,'
+            'Minimum Years Experience,Current Year Labor Price,'
+            'Next Year Labor Price,Second Year Labor Price\r\n'
+            'ABC1233,small business,MOBIS,Customer,2015-01-02,2020-01-02,'
+            '"541-4B, 541-4BRC",CompanyName3,"Legal, ""Stuff""",Ph.D.,8,'
+            '23.00,33.00,43.00\r\n'
+            'ABC1231,small business,MOBIS,Customer,2015-01-02,2020-01-02,'
+            '"541-4B, 541-4BRC",CompanyName1,"Legal, ""Stuff""",Bachelors,6,'
+            '21.00,31.00,41.00\r\n'
+            'ABC1234,other than small business,PES,,,,871 3,CompanyName4,'
+            '"Accounting\nCPA",Bachelors,9,24.00,34.00,44.00\r\n'
+            'ABC1232,other than small business,PES,,,,871 3,CompanyName2,'
+            '"Accounting\nCPA",,7,22.00,32.00,42.00\r\n'
+        ))
+
+
+class IterCSVChunksTests(TestCase):
+    def test_yields_chunks(self):
+        rows = [('a', 'b')] * 10
+        chunks = list(iter_csv_chunks(rows, chunk_size=8))
+        self.assertEqual(len(chunks), 6)
+        self.assertEqual(''.join(chunks), 'a,b\r\n' * 10)
+
+    def test_yields_empty_chunk_when_there_are_no_rows(self):
+        self.assertEqual(list(iter_csv_chunks([])), [''])
@@ -0,0 +1,243 @@
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.core.management import call_command, CommandError
+from django.db import connection
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings)
+
+from contracts.mommy_recipes import get_contract_recipe
+from contracts.models import ContractChange
+from api import cache, dump
+from api.views import get_dump_response
+
+RATES_DUMP_PATH = '/api/rates/dump/'
+
+
+def read_dump(path):
+    with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+        return f.read()
+
+
+class DumpTestCase(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dir = self.tmpdir.name
+        self.settings = override_settings(API_RATES_DUMP_DIR=self.dir)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.tmpdir.cleanup()
+
+    def make_contracts(self):
+        return [
+            get_contract_recipe().make(labor_category='Engineer',
+                                       education_level='BA',
+                                       current_price=100),
+            get_contract_recipe().make(labor_category='Tester, "QA"',
+                                       education_level=None,
+                                       current_price=50.5),
+        ]
+
+
+class PublishDumpsTests(DumpTestCase):
+    def test_dumps_contain_current_rates(self):
+        engineer, tester = self.make_contracts()
+        self.assertTrue(dump.publish_dumps())
+        version = ContractChange.objects.get_version()
+
+        csv_dump = dump.get_latest_dump('csv')
+        self.assertEqual(csv_dump.version, version)
+        rows = list(csv.DictReader(io.StringIO(read_dump(csv_dump.path))))
+        self.assertEqual([row['id'] for row in rows],
+                         [str(engineer.id), str(tester.id)])
+        self.assertEqual(rows[0]['education_level'], 'Bachelors')
+        self.assertEqual(rows[1]['labor_category'], 'Tester, "QA"')
+        self.assertEqual(rows[1]['education_level'], '')
+        self.assertEqual(rows[1]['current_price'], '50.50')
+
+        jsonl_dump = dump.get_latest_dump('jsonl')
+        rates = [json.loads(line) for line in
+                 read_dump(jsonl_dump.path).splitlines()]
+        self.assertEqual(list(rates[0]), list(dump.FIELDS))
+        self.assertEqual(rates[0]['current_price'], 100.0)
+        self.assertEqual(rates[0]['education_level'], 'Bachelors')
+        self.assertIsNone(rates[1]['education_level'])
+
+    def test_up_to_date_dumps_are_not_republished(self):
+        self.assertTrue(dump.publish_dumps())
+        self.assertFalse(dump.publish_dumps())
+        self.assertTrue(dump.publish_dumps(force=True))
+
+    def test_republished_dumps_are_identical(self):
+        self.make_contracts()
+        dump.publish_dumps()
+        path = dump.get_latest_dump('csv').path
+        with open(path, 'rb') as f:
+            contents = f.read()
+        with mock.patch('time.time', return_value=0x12345678):
+            dump.publish_dumps(force=True)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), contents)
+
+    def test_old_dumps_are_deleted(self):
+        dump.publish_dumps()
+        old_path = dump.get_latest_dump('csv').path
+        self.make_contracts()
+        self.assertTrue(dump.publish_dumps())
+        self.assertFalse(os.path.exists(old_path))
+        self.assertEqual(sorted(os.listdir(self.dir)), [
+            dump.get_dump_filename(fmt, ContractChange.objects.get_version())
+            for fmt in ['csv', 'jsonl']
+        ])
+
+    def test_no_dump_is_found_before_publishing(self):
+        self.assertIsNone(dump.get_latest_dump('csv'))
+
+    def test_command_publishes_dumps(self):
+        out = io.StringIO()
+        call_command('publish_rates_dump', stdout=out)
+        self.assertIn('Published rates dumps', out.getvalue())
+        call_command('publish_rates_dump', stdout=out)
+        self.assertIn('up-to-date', out.getvalue())
+
+    @override_settings(API_RATES_DUMP_DIR='')
+    def test_command_requires_dir(self):
+        with self.assertRaisesRegex(CommandError, 'specify a directory'):
+            call_command('publish_rates_dump')
+
+
+class GetRatesDumpTests(DumpTestCase):
+    def setUp(self):
+        super().setUp()
+        self.make_contracts()
+        dump.publish_dumps()
+        self.path = dump.get_latest_dump('csv').path
+        with open(self.path, 'rb') as f:
+            self.contents = f.read()
+        self.etag = f'"{os.path.basename(self.path)}"'
+
+    def get(self, params=None, **headers):
+        return self.client.get(RATES_DUMP_PATH, params or {}, **headers)
+
+    def test_whole_file_is_served(self):
+        res = self.get()
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(b''.join(res.streaming_content), self.contents)
+        self.assertEqual(res['Content-Length'], str(len(self.contents)))
+        self.assertEqual(res['Content-Type'], 'application/gzip')
+        self.assertEqual(res['Accept-Ranges'], 'bytes')
+        self.assertEqual(res['ETag'], self.etag)
+        self.assertIn('rates.csv.gz', res['Content-Disposition'])
+
+    def test_jsonl_is_served(self):
+        res = self.get({'type': 'jsonl'})
+        self.assertEqual(res.status_code, 200)
+        content = gzip.decompress(b''.join(res.streaming_content))
+        self.assertEqual(len(content.splitlines()), 2)
+
+    def test_invalid_type_raises_400(self):
+        res = self.get({'type': 'xml'})
+        self.assertEqual(res.status_code, 400)
+
+    def test_matching_etag_returns_304(self):
+        res = self.get(HTTP_IF_NONE_MATCH=self.etag)
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res['ETag'], self.etag)
+
+    def test_range_is_served(self):
+        res = self.get(HTTP_RANGE='bytes=10-19')
+        self.assertEqual(res.status_code, 206)
+        self.assertEqual(b''.join(res.streaming_content),
+                         self.contents[10:20])
+        self.assertEqual(res['Content-Length'], '10')
+        self.assertEqual(res['Content-Range'],
+                         f'bytes 10-19/{len(self.contents)}')
+
+    def test_stale_if_range_serves_whole_file(self):
+        res = self.get(HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"old"')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(b''.join(res.streaming_content), self.contents)
+
+    def test_unsatisfiable_range_returns_416(self):
+        size = len(self.contents)
+        res = self.get(HTTP_RANGE=f'bytes={size}-')
+        self.assertEqual(res.status_code, 416)
+        self.assertEqual(res['Content-Range'], f'bytes */{size}')
+
+    def test_unsatisfiable_range_closes_file(self):
+        request = RequestFactory().get(RATES_DUMP_PATH, HTTP_RANGE='bytes=5-')
+        f = io.BytesIO(b'1234')
+        res = get_dump_response(request, f, 4, self.etag)
+        self.assertEqual(res.status_code, 416)
+        self.assertTrue(f.closed)
+
+    def test_any_accept_header_is_served(self):
+        res = self.get(HTTP_ACCEPT='application/gzip')
+        self.assertEqual(res.status_code, 200)
+
+    def test_unpublished_dump_returns_404(self):
+        os.unlink(self.path)
+        self.assertEqual(self.get().status_code, 404)
+
+    @override_settings(API_RATES_DUMP_DIR='')
+    def test_disabled_dumps_return_404(self):
+        self.assertEqual(self.get().status_code, 404)
+
+
+class IterFileRangeTests(SimpleTestCase):
+    def test_range_is_read_in_chunks(self):
+        f = io.BytesIO(b'0123456789')
+        self.assertEqual(list(dump.iter_file_range(f, 2, 5, chunk_size=2)),
+                         [b'23', b'45', b'6'])
+        self.assertTrue(f.closed)
+
+
+@override_settings(API_CACHE_BACKEND='none',
+                   API_RATES_DUMP_DIR='/tmp/rates-dumps')
+class PublishOnChangeTests(TransactionTestCase):
+    @mock.patch('api.cache.django_rq.enqueue')
+    def test_data_changes_publish_dumps(self, enqueue):
+        cache.bump_data_version()
+        enqueue.assert_called_once_with('api.dump.publish_dumps')
+
+    @override_settings(API_RATES_DUMP_DIR='')
+    @mock.patch('api.cache.django_rq.enqueue')
+    def test_nothing_is_published_without_dir(self, enqueue):
+        cache.bump_data_version()
+        enqueue.assert_not_called()
+
+
+class HeldBackChangesTests(TransactionTestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+        # This transaction starts before the contract below is made, and
+        # is still running when the dumps are published.
+        self.other = connection.get_new_connection(
+            connection.get_connection_params())
+        self.addCleanup(self.other.close)
+        with self.other.cursor() as cursor:
+            cursor.execute('SELECT txid_current()')
+
+    @mock.patch('api.dump.django_rq.get_scheduler')
+    def test_dumps_are_republished_later(self, get_scheduler):
+        get_contract_recipe().make()
+        self.assertEqual(ContractChange.objects.get_version(), 0)
+        self.assertTrue(dump.publish_dumps(self.tmpdir.name))
+        get_scheduler.return_value.enqueue_in.assert_called_once_with(
+            dump.REPUBLISH_DELAY, dump.publish_dumps, self.tmpdir.name)
+
+        self.other.rollback()
+        get_scheduler.reset_mock()
+        self.assertTrue(dump.publish_dumps(self.tmpdir.name))
+        self.assertNotEqual(dump.get_latest_dump('csv', self.tmpdir.name)
+                            .version, 0)
+        get_scheduler.return_value.enqueue_in.assert_not_called()
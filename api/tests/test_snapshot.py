@@ -0,0 +1,385 @@
+import os
+import random
+import tempfile
+from decimal import Decimal
+from itertools import cycle
+from unittest import mock
+
+import numpy as np
+import redis
+from django.core.management import call_command, CommandError
+from django.http import QueryDict
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from contracts.benchmarks import (ROLES, SCHEDULES, SITES,
+                                  make_synthetic_contracts)
+from contracts.models import Contract
+from contracts.mommy_recipes import get_contract_recipe
+from api import cache, snapshot
+from api.utils import get_stats_from_queryset
+from api.views import get_contracts_queryset, get_contracts_sort
+from .test_cache import FreshBackendMixin
+
+
+SORTS = ['current_price', '-next_year_price', 'labor_category',
+         '-vendor_name,education_level', 'min_years_experience,-schedule',
+         '-education_level,idv_piid', 'business_size,-contractor_site,schedule']
+
+
+def make_random_query(rand: random.Random) -> QueryDict:
+    params = QueryDict(mutable=True)
+    if rand.random() < 0.7:
+        params['q'] = ', '.join(rand.sample(ROLES, rand.randrange(1, 3)))
+        params['query_type'] = rand.choice(
+            ['match_all', 'match_phrase', 'match_exact'])
+    if rand.random() < 0.3:
+        params['experience_range'] = f'{rand.randrange(10)},' \
+                                     f'{rand.randrange(10, 20)}'
+    if rand.random() < 0.3:
+        params['min_education'] = rand.choice(['AA', 'BA', 'MA'])
+    if rand.random() < 0.2:
+        params['education'] = rand.choice(['HS,BA', 'PHD', 'MA,blarg'])
+    if rand.random() < 0.3:
+        params['schedule'] = rand.choice(SCHEDULES).lower()
+    if rand.random() < 0.2:
+        params['site'] = rand.choice(SITES)[:4]
+    if rand.random() < 0.2:
+        params['business_size'] = rand.choice(['s', 'o'])
+    if rand.random() < 0.3:
+        params['price__gte'] = str(rand.randrange(20, 150))
+    if rand.random() < 0.3:
+        params['price__lte'] = str(rand.randrange(150, 300))
+    if rand.random() < 0.1:
+        params['sin'] = str(rand.randrange(1, 9))
+    params['sort'] = rand.choice(SORTS)
+    return params
+
+
+class ContractsSnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_synthetic_contracts(300)
+        get_contract_recipe().make(
+            _quantity=5,
+            labor_category='Engineer of Consulting',
+            current_price=Decimal('50.00'),
+            next_year_price=None,
+            second_year_price=None,
+        )
+
+    def setUp(self):
+        self.snapshot = snapshot.ContractsSnapshot.load()
+
+    def get_sort_values(self, contracts, sort):
+        fields = [field.lstrip('-') for field in sort]
+        return [tuple(snapshot.get_education_sort_key(c.education_level)
+                      if field == 'education_level' else getattr(c, field)
+                      for field in fields)
+                for c in contracts]
+
+    def assertMatchesQueryset(self, params, wage_field, num_bins=10):
+        queryset = get_contracts_queryset(params, wage_field)
+        sort = get_contracts_sort(params, wage_field)
+        contracts, stats = self.snapshot.query(params, wage_field, sort,
+                                               num_bins)
+        expected = get_stats_from_queryset(queryset, wage_field, num_bins)
+        msg = f'query: {params.urlencode()}'
+
+        for key in ('count', 'minimum', 'maximum', 'wage_histogram'):
+            self.assertEqual(stats[key], expected[key], msg)
+        for key in ('average', 'stddev'):
+            if expected[key] is None:
+                self.assertIsNone(stats[key], msg)
+            else:
+                self.assertAlmostEqual(stats[key], expected[key], 6, msg)
+
+        results = list(contracts[:len(contracts)])
+        expected_results = list(queryset)
+        self.assertEqual({c.id for c in results},
+                         {c.id for c in expected_results}, msg)
+        self.assertEqual(self.get_sort_values(results, sort),
+                         self.get_sort_values(expected_results, sort), msg)
+
+    def test_matches_queryset_for_random_queries(self):
+        rand = random.Random(1)
+        for _ in range(60):
+            self.assertMatchesQueryset(
+                make_random_query(rand),
+                rand.choice(snapshot.PRICE_FIELDS),
+            )
+
+    def test_matches_queryset_without_query(self):
+        self.assertMatchesQueryset(QueryDict(), 'next_year_price')
+
+    def test_matches_queryset_when_nothing_matches(self):
+        self.assertMatchesQueryset(QueryDict('q=blarg'), 'current_price')
+
+    def test_search_includes_null_prices(self):
+        _, stats = self.snapshot.query(QueryDict('q=consulting'),
+                                       'next_year_price', ['next_year_price'])
+        self.assertEqual(stats['count'], 5)
+        self.assertIsNone(stats['average'])
+
+    def test_exclude_works(self):
+        ids = list(Contract.objects.values_list('id', flat=True)[:2])
+        params = QueryDict(f'exclude={ids[0]},{ids[1]}')
+        contracts, _ = self.snapshot.query(params, 'current_price',
+                                           ['current_price'])
+        self.assertEqual(len(contracts), 303)
+        self.assertNotIn(ids[0], contracts.ids)
+
+
+class SnapshotFileTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'rates.snapshot')
+        get_contract_recipe().make(
+            _quantity=4,
+            labor_category=cycle(['Engineer', 'Manager']),
+            next_year_price=cycle([Decimal('20.00'), None]),
+            education_level=cycle(['BA', None]),
+        )
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def assertSnapshotsEqual(self, a, b):
+        a_columns, b_columns = a.get_columns(), b.get_columns()
+        self.assertEqual(list(a_columns), list(b_columns))
+        for name, array in a_columns.items():
+            self.assertEqual(array.dtype, b_columns[name].dtype, name)
+            np.testing.assert_array_equal(array, b_columns[name], name)
+        self.assertEqual(a.version, b.version)
+
+    def test_round_trip_works(self):
+        original = snapshot.ContractsSnapshot.load('5')
+        snapshot.write_snapshot_file(original, self.path)
+        mapped = snapshot.read_snapshot_file(self.path)
+        self.assertSnapshotsEqual(mapped, original)
+        self.assertEqual(snapshot.read_snapshot_version(self.path), '5')
+
+        params = QueryDict('q=engineer&education=BA')
+        contracts, stats = mapped.query(params, 'next_year_price',
+                                        ['labor_category'], 2)
+        expected, expected_stats = original.query(
+            params, 'next_year_price', ['labor_category'], 2)
+        self.assertEqual(contracts.ids.tolist(), expected.ids.tolist())
+        self.assertEqual(stats, expected_stats)
+
+    def test_round_trip_works_without_contracts(self):
+        Contract.objects.all().delete()
+        original = snapshot.ContractsSnapshot.load()
+        snapshot.write_snapshot_file(original, self.path)
+        mapped = snapshot.read_snapshot_file(self.path)
+        self.assertSnapshotsEqual(mapped, original)
+        self.assertEqual(mapped.query(QueryDict(), 'current_price',
+                                      ['current_price'])[1]['count'], 0)
+
+    def test_columns_are_read_only_and_aligned(self):
+        snapshot.write_snapshot_file(snapshot.ContractsSnapshot.load(),
+                                     self.path)
+        mapped = snapshot.read_snapshot_file(self.path)
+        for name, array in mapped.get_columns().items():
+            self.assertFalse(array.flags.writeable, name)
+            self.assertTrue(array.flags.aligned, name)
+
+    def test_file_is_replaced_atomically(self):
+        snapshot.write_snapshot_file(snapshot.ContractsSnapshot.load(1),
+                                     self.path)
+        old = snapshot.read_snapshot_file(self.path)
+        Contract.objects.all().delete()
+        snapshot.write_snapshot_file(snapshot.ContractsSnapshot.load(2),
+                                     self.path)
+        # The old file remains mapped until it's no longer used.
+        self.assertEqual(len(old), 4)
+        self.assertEqual(len(snapshot.read_snapshot_file(self.path)), 0)
+        self.assertEqual(os.listdir(self.dir.name), ['rates.snapshot'])
+
+    def test_invalid_files_are_rejected(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'blarg' * 10)
+        with self.assertRaisesRegex(ValueError, 'not a snapshot file'):
+            snapshot.read_snapshot_file(self.path)
+
+
+class ContractListTests(TestCase):
+    def setUp(self):
+        self.contracts = get_contract_recipe().make(_quantity=3)
+        self.ids = [c.id for c in reversed(self.contracts)]
+        self.contract_list = snapshot.ContractList(np.array(self.ids))
+
+    def test_count_works(self):
+        self.assertEqual(len(self.contract_list), 3)
+        self.assertEqual(self.contract_list.count(), 3)
+
+    def test_slicing_preserves_order(self):
+        self.assertEqual([c.id for c in self.contract_list[1:]],
+                         self.ids[1:])
+
+    def test_indexing_works(self):
+        self.assertEqual(self.contract_list[0].id, self.ids[0])
+
+    def test_deleted_contracts_are_skipped(self):
+        self.contracts[0].delete()
+        self.assertEqual([c.id for c in self.contract_list[:3]],
+                         self.ids[:2])
+
+
+@override_settings(API_CACHE_BACKEND='locmem')
+class GetSnapshotTests(FreshBackendMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        get_contract_recipe().make(_quantity=2)
+
+    def test_snapshot_is_reused(self):
+        self.assertIs(snapshot.get_snapshot(), snapshot.get_snapshot())
+
+    def test_snapshot_is_reloaded_when_data_changes(self):
+        old = snapshot.get_snapshot()
+        get_contract_recipe().make()
+        cache.bump_data_version()
+        new = snapshot.get_snapshot()
+        self.assertIsNot(new, old)
+        self.assertEqual(len(new), 3)
+
+    @override_settings(API_CACHE_BACKEND='none')
+    def test_nothing_is_returned_when_cache_is_disabled(self):
+        self.assertIsNone(snapshot.get_snapshot())
+
+    def test_nothing_is_returned_when_version_is_unknown(self):
+        with mock.patch.object(cache.get_backend(), 'get_version',
+                               return_value=None):
+            self.assertIsNone(snapshot.get_snapshot())
+
+
+@override_settings(API_CACHE_BACKEND='locmem')
+class PublishedSnapshotTests(FreshBackendMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'rates.snapshot')
+        self.settings = override_settings(API_RATES_SNAPSHOT_PATH=self.path)
+        self.settings.enable()
+        get_contract_recipe().make(_quantity=2)
+
+    def tearDown(self):
+        self.settings.disable()
+        self.dir.cleanup()
+        super().tearDown()
+
+    def test_nothing_is_returned_until_published(self):
+        self.assertIsNone(snapshot.get_snapshot())
+        self.assertTrue(snapshot.publish_snapshot())
+        self.assertEqual(len(snapshot.get_snapshot()), 2)
+
+    def test_published_snapshot_is_reused(self):
+        snapshot.publish_snapshot()
+        self.assertIs(snapshot.get_snapshot(), snapshot.get_snapshot())
+
+    def test_nothing_is_returned_when_out_of_date(self):
+        snapshot.publish_snapshot()
+        cache.bump_data_version()
+        self.assertIsNone(snapshot.get_snapshot())
+
+    def test_new_snapshot_is_mapped_when_published(self):
+        snapshot.publish_snapshot()
+        old = snapshot.get_snapshot()
+        get_contract_recipe().make()
+        cache.bump_data_version()
+        snapshot.publish_snapshot()
+        new = snapshot.get_snapshot()
+        self.assertIsNot(new, old)
+        self.assertEqual(len(new), 3)
+
+    def test_old_snapshot_is_unmapped_when_replaced(self):
+        snapshot.publish_snapshot()
+        data = snapshot.get_snapshot().mmap
+        cache.bump_data_version()
+        snapshot.publish_snapshot()
+        snapshot.get_snapshot()
+        self.assertTrue(data.closed)
+
+    def test_closing_snapshot_in_use_leaves_it_mapped(self):
+        snapshot.publish_snapshot()
+        mapped = snapshot.read_snapshot_file(self.path)
+        data = mapped.mmap
+        ids = mapped.ids
+        mapped.close()
+        self.assertFalse(data.closed)
+        self.assertEqual(sorted(ids),
+                         sorted(Contract.objects.values_list('id', flat=True)))
+
+    def test_up_to_date_snapshot_is_not_republished(self):
+        self.assertTrue(snapshot.publish_snapshot())
+        self.assertFalse(snapshot.publish_snapshot())
+        self.assertTrue(snapshot.publish_snapshot(force=True))
+
+    def test_command_works(self):
+        path = os.path.join(self.dir.name, 'other.snapshot')
+        call_command('publish_rates_snapshot', path=path)
+        self.assertEqual(len(snapshot.read_snapshot_file(path)), 2)
+
+    @override_settings(API_RATES_SNAPSHOT_PATH='')
+    def test_command_requires_path(self):
+        with self.assertRaisesRegex(CommandError, 'specify a path'):
+            call_command('publish_rates_snapshot')
+
+
+@override_settings(API_CACHE_BACKEND='locmem',
+                   API_RATES_SNAPSHOT_PATH='/tmp/rates.snapshot')
+class PublishOnChangeTests(FreshBackendMixin, TransactionTestCase):
+    @mock.patch('api.cache.django_rq.enqueue')
+    def test_data_changes_publish_snapshot(self, enqueue):
+        cache.bump_data_version()
+        enqueue.assert_called_once_with('api.snapshot.publish_snapshot')
+
+    @mock.patch('api.cache.django_rq.enqueue',
+                side_effect=redis.ConnectionError)
+    def test_enqueue_errors_are_logged(self, enqueue):
+        with self.assertLogs('calc', 'ERROR'):
+            cache.bump_data_version()
+
+    @override_settings(API_RATES_SNAPSHOT_PATH='')
+    @mock.patch('api.cache.django_rq.enqueue')
+    def test_nothing_is_published_without_path(self, enqueue):
+        cache.bump_data_version()
+        enqueue.assert_not_called()
+
+
+@override_settings(API_RATES_ENGINE='snapshot', API_CACHE_BACKEND='locmem')
+class SnapshotEngineTests(FreshBackendMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        get_contract_recipe().make(
+            _quantity=3,
+            labor_category='Engineer',
+            current_price=Decimal('10.00'),
+        )
+        get_contract_recipe().make(
+            labor_category='Manager',
+            current_price=Decimal('20.00'),
+        )
+
+    def test_rates_api_uses_snapshot(self):
+        self.client.get('/api/rates/')
+        # The snapshot is already loaded, so only the page of results
+        # is fetched from the database.
+        with self.assertNumQueries(1):
+            res = self.client.get('/api/rates/?q=engineer&histogram=2'
+                                  '&sort=-labor_category')
+        data = res.json()
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(data['average'], 10.0)
+        self.assertEqual([r['labor_category'] for r in data['results']],
+                         ['Engineer'] * 3)
+
+    def test_cursor_pagination_uses_database(self):
+        res = self.client.get('/api/rates/?pagination=cursor&sort=labor_category')
+        data = res.json()
+        self.assertEqual([r['labor_category'] for r in data['results']],
+                         ['Engineer'] * 3 + ['Manager'])
+
+    @override_settings(API_RATES_SNAPSHOT_PATH='/tmp/nonexistent.snapshot')
+    def test_rates_api_falls_back_to_database(self):
+        res = self.client.get('/api/rates/?q=engineer')
+        self.assertEqual(res.json()['count'], 3)
@@ -3,7 +3,13 @@ import unittest
 import random
 import decimal
 
-from api.utils import get_histogram
+from django.db.models import Avg, Count, Max, Min, StdDev
+from django.test import TestCase
+
+from api.utils import (get_histogram, get_histogram_from_queryset,
+                       get_stats_from_queryset)
+from contracts.models import Contract
+from contracts.mommy_recipes import get_contract_recipe
 
 
 class HistogramTests(unittest.TestCase):
@@ -58,3 +64,111 @@ class HistogramTests(unittest.TestCase):
         mn = min(values)
         self.assertEqual(bins[0]['min'], mn)
         self.assertEqual(bins[-1]['max'], mx)
+
+
+class HistogramFromQuerysetTests(TestCase):
+    def make_contracts(self, prices):
+        get_contract_recipe().make(
+            _quantity=len(prices),
+            current_price=iter(prices),
+        )
+
+    def assertMatchesGetHistogram(self, num_bins, **kwargs):
+        qs = Contract.objects.all()
+        values = qs.values_list('current_price', flat=True)
+        self.assertEqual(
+            get_histogram_from_queryset(qs, 'current_price', num_bins,
+                                        **kwargs),
+            get_histogram(list(values), num_bins)
+        )
+
+    def test_empty_queryset(self):
+        self.assertMatchesGetHistogram(10)
+
+    def test_when_values_are_same(self):
+        self.make_contracts([decimal.Decimal('5.00')] * 3)
+        self.assertMatchesGetHistogram(2)
+
+    def test_simple_histogram(self):
+        self.make_contracts([decimal.Decimal(v) for v in (16, 18, 24, 50)])
+        self.assertMatchesGetHistogram(2)
+        self.assertMatchesGetHistogram(3)
+
+    def test_random_values(self):
+        rand = random.Random(1)
+        self.make_contracts([
+            decimal.Decimal(rand.randrange(1000, 30000)) / 100
+            for _ in range(200)
+        ])
+        for num_bins in (1, 3, 7, 10, 12):
+            self.assertMatchesGetHistogram(num_bins)
+
+    def test_uses_given_minimum_and_maximum(self):
+        self.make_contracts([decimal.Decimal(v) for v in (10, 20, 30)])
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                get_histogram_from_queryset(
+                    Contract.objects.all(), 'current_price', 2,
+                    minimum=10, maximum=30),
+                get_histogram([10, 20, 30], 2)
+            )
+
+    def test_raises_on_invalid_num_bins(self):
+        self.make_contracts([decimal.Decimal(1)])
+        with self.assertRaises(ValueError):
+            get_histogram_from_queryset(Contract.objects.all(),
+                                        'current_price', 0)
+
+
+class StatsFromQuerysetTests(TestCase):
+    def make_contracts(self, prices):
+        get_contract_recipe().make(
+            _quantity=len(prices),
+            current_price=iter(prices),
+        )
+
+    def assertMatchesAggregates(self, qs, num_bins=None):
+        expected = qs.aggregate(
+            count=Count('*'),
+            minimum=Min('current_price'),
+            maximum=Max('current_price'),
+            average=Avg('current_price'),
+            stddev=StdDev('current_price'),
+        )
+        if num_bins is not None:
+            values = qs.values_list('current_price', flat=True)
+            expected['wage_histogram'] = get_histogram(list(values),
+                                                       num_bins)
+        with self.assertNumQueries(1):
+            stats = get_stats_from_queryset(qs, 'current_price', num_bins)
+        self.assertEqual(stats, expected)
+
+    def test_empty_queryset(self):
+        self.assertMatchesAggregates(Contract.objects.all())
+        self.assertMatchesAggregates(Contract.objects.all(), 10)
+
+    def test_when_values_are_same(self):
+        self.make_contracts([decimal.Decimal('5.00')] * 3)
+        self.assertMatchesAggregates(Contract.objects.all(), 2)
+
+    def test_random_values(self):
+        rand = random.Random(1)
+        self.make_contracts([
+            decimal.Decimal(rand.randrange(1000, 30000)) / 100
+            for _ in range(200)
+        ])
+        qs = Contract.objects.all()
+        self.assertMatchesAggregates(qs)
+        for num_bins in (1, 3, 7, 10, 12):
+            self.assertMatchesAggregates(qs, num_bins)
+
+    def test_filtered_and_ordered_queryset(self):
+        self.make_contracts([decimal.Decimal(v) for v in (16, 18, 24, 50)])
+        qs = Contract.objects.filter(current_price__lt=30)\
+            .order_by('-current_price')
+        self.assertMatchesAggregates(qs, 3)
+
+    def test_raises_on_invalid_num_bins(self):
+        with self.assertRaises(ValueError):
+            get_stats_from_queryset(Contract.objects.all(),
+                                    'current_price', 0)
@@ -7,6 +7,8 @@ from api import views
 urlpatterns = [
     url(r'^rates/$', views.GetRates.as_view()),
     url(r'^rates/csv/$', views.GetRatesCSV.as_view()),
+    url(r'^rates/changes/$', views.GetRateChanges.as_view()),
+    url(r'^rates/dump/$', views.GetRatesDump.as_view()),
     url(r'^search/$', views.GetAutocomplete.as_view()),
     url(r'^schedules/$', views.ScheduleMetadataList.as_view()),
     url(r'^docs/', include_docs_urls(
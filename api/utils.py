@@ -1,25 +1,20 @@
-from typing import List, SupportsFloat
+from typing import Dict, List, Optional, SupportsFloat, Tuple
 
+from django.db import connection
+from django.db.models import Max, Min
 
-def get_histogram(values: List[SupportsFloat], num_bins: int=10) -> List[dict]:
+
+def get_histogram_range(mn: Optional[float],
+                        mx: Optional[float]) -> Tuple[float, float]:
     """
-    Get a histogram of a list of numeric values.
-    Returns array of "bin" dicts with keys `count`, `max`, and `min`.
+    Get the range a histogram should span, given the minimum and
+    maximum of its values (or `None` for both if there are no values).
     """
 
-    if (num_bins <= 0):
-        raise ValueError('num_bins must be greater than 0')
-
-    # convert values to floats
-    fvalues = [float(v) for v in values]
-
     # When input array is empty, can't determine range so use 0.0 - 1.0
     # as numpy.histogram does
-    if (len(fvalues) == 0):
+    if mn is None or mx is None:
         mn, mx = 0.0, 1.0
-    else:
-        # find the min and max
-        mn, mx = min(fvalues), max(fvalues)
 
     # Adjust mn and mx if they are equivalent (ie, the input array
     # values are all the same number)
@@ -27,15 +22,45 @@ def get_histogram(values: List[SupportsFloat], num_bins: int=10) -> List[dict]:
         mn -= 0.5
         mx += 0.5
 
+    return mn, mx
+
+
+def get_histogram_bins(mn: float, mx: float, num_bins: int=10) -> List[dict]:
+    """
+    Get an empty histogram spanning the range returned by
+    get_histogram_range(). Returns array of "bin" dicts with keys
+    `count` (always 0), `max`, and `min`.
+    """
+
+    if (num_bins <= 0):
+        raise ValueError('num_bins must be greater than 0')
+
     bin_width = (mx - mn) / num_bins
 
-    # initialize the bins
-    bins = [{
+    return [{
         'min': mn + bin_width * i,
         'max': mn + bin_width * (i + 1),
         'count': 0
     } for i in range(0, num_bins)]
 
+
+def get_histogram(values: List[SupportsFloat], num_bins: int=10) -> List[dict]:
+    """
+    Get a histogram of a list of numeric values.
+    Returns array of "bin" dicts with keys `count`, `max`, and `min`.
+    """
+
+    # convert values to floats
+    fvalues = [float(v) for v in values]
+
+    if (len(fvalues) == 0):
+        mn, mx = get_histogram_range(None, None)
+    else:
+        # find the min and max
+        mn, mx = get_histogram_range(min(fvalues), max(fvalues))
+
+    bins = get_histogram_bins(mn, mx, num_bins)
+
     # bin the values
     for val in fvalues:
         for b in bins:
@@ -46,3 +71,186 @@ def get_histogram(values: List[SupportsFloat], num_bins: int=10) -> List[dict]:
             b['count'] += 1
 
     return bins
+
+
+def fill_histogram_bins(bins: List[dict], mx: float,
+                        bucket_counts: Dict[int, int]) -> List[dict]:
+    """
+    Fill in the `count` of each of the given bins exactly as
+    get_histogram() would have, given the maximum of the histogram's
+    range and a mapping from bucket numbers returned by PostgreSQL's
+    `width_bucket(operand, thresholds)` function to the number of
+    values in each bucket.
+
+    Buckets 1 through `len(bins)` correspond to the bins themselves,
+    while bucket `len(bins) + 1` holds values greater than or equal to
+    the final threshold, which get_histogram() only counts when the
+    final threshold is exactly the maximum:
+
+        >>> bins = get_histogram_bins(1.0, 3.0, 2)
+        >>> [b['count'] for b in fill_histogram_bins(bins, 3.0, {1: 1, 3: 2})]
+        [1, 2]
+    """
+
+    num_bins = len(bins)
+    for bucket, count in bucket_counts.items():
+        if 1 <= bucket <= num_bins:
+            bins[bucket - 1]['count'] += count
+        elif bucket == num_bins + 1 and bins[-1]['max'] == mx:
+            bins[-1]['count'] += count
+    return bins
+
+
+def get_histogram_from_queryset(queryset, field: str, num_bins: int=10,
+                                minimum: Optional[SupportsFloat]=None,
+                                maximum: Optional[SupportsFloat]=None
+                                ) -> List[dict]:
+    """
+    Like get_histogram(), but bins the values of the given field in
+    the given queryset with a single `GROUP BY width_bucket(...)`
+    query rather than pulling every value out of the database.
+
+    If the minimum and maximum values of the field are already known,
+    they can be passed in to save an aggregate query; otherwise they
+    will be looked up.
+
+    The bin thresholds are computed in Python using the same
+    floating-point arithmetic as get_histogram(), and the field's values
+    are cast to `double precision` before being compared against them,
+    so the results are identical.
+    """
+
+    if minimum is None or maximum is None:
+        stats = queryset.aggregate(Min(field), Max(field))
+        minimum, maximum = stats[field + '__min'], stats[field + '__max']
+
+    if minimum is None or maximum is None:
+        return get_histogram_bins(*get_histogram_range(None, None), num_bins)
+
+    mn, mx = get_histogram_range(float(minimum), float(maximum))
+    bins = get_histogram_bins(mn, mx, num_bins)
+    thresholds = [b['min'] for b in bins] + [bins[-1]['max']]
+
+    values = queryset.order_by().values_list(field)
+    values_sql, values_params = values.query.sql_with_params()
+    sql = (  # nosec
+        "SELECT width_bucket("
+        "    CAST(matches.value AS double precision),"
+        "    CAST(%s AS double precision[])"
+        "  ), COUNT(*)"
+        "  FROM (" + values_sql + ") AS matches (value)"
+        "  GROUP BY 1"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [thresholds] + list(values_params))
+        bucket_counts = dict(cursor.fetchall())
+
+    return fill_histogram_bins(bins, mx, bucket_counts)
+
+
+def get_stats_from_queryset(queryset, field: str,
+                            num_bins: Optional[int]=None) -> dict:
+    """
+    Get the count, minimum, maximum, average and standard deviation
+    of the given field in the given queryset, along with a histogram
+    of its values if `num_bins` is provided, all from a single query
+    that only scans the matching rows once.
+
+    The returned dict has the keys `count`, `minimum`, `maximum`,
+    `average`, `stddev` and, if a histogram was requested,
+    `wage_histogram`. The values are the same as the ones that
+    Django's Count, Min, Max, Avg and StdDev aggregates and
+    get_histogram_from_queryset() would return.
+    """
+
+    if num_bins is not None and num_bins <= 0:
+        raise ValueError('num_bins must be greater than 0')
+
+    values = queryset.order_by().values_list(field)
+    values_sql, values_params = values.query.sql_with_params()
+
+    # Common table expressions referenced more than once are only
+    # evaluated once by PostgreSQL, so the (potentially expensive)
+    # filtering of the queryset only happens a single time here.
+    # Similarly, the histogram thresholds are fetched with an
+    # uncorrelated subquery so they're only computed once, rather than
+    # once per row.
+    sql = (  # nosec
+        "WITH matches (value) AS (" + values_sql + "),"
+        "  stats AS ("
+        "    SELECT COUNT(*) AS count, MIN(value) AS minimum,"
+        "      MAX(value) AS maximum, AVG(value) AS average,"
+        "      STDDEV_POP(value) AS stddev"
+        "    FROM matches"
+        "  )"
+    )
+    params = list(values_params)
+
+    if num_bins is None:
+        sql += (
+            " SELECT count, minimum, maximum, average, stddev, NULL, NULL"
+            "  FROM stats"
+        )
+    else:
+        # This mirrors the arithmetic in get_histogram_range() and
+        # get_histogram_bins(); PostgreSQL's double precision math is
+        # the same IEEE 754 math Python uses for floats, so the
+        # thresholds are identical to the ones get_histogram() uses.
+        sql += (
+            ", histogram_range AS ("
+            "    SELECT"
+            "      CAST(minimum AS double precision)"
+            "        - CASE WHEN minimum = maximum THEN 0.5 ELSE 0 END AS mn,"
+            "      CAST(maximum AS double precision)"
+            "        + CASE WHEN minimum = maximum THEN 0.5 ELSE 0 END AS mx"
+            "    FROM stats"
+            "  ),"
+            "  thresholds AS ("
+            "    SELECT ARRAY("
+            "      SELECT mn + ((mx - mn) / CAST(%s AS double precision)) * i"
+            "        FROM generate_series(0, %s) AS i"
+            "    ) AS thresholds"
+            "    FROM histogram_range"
+            "    WHERE mn IS NOT NULL"
+            "  ),"
+            "  buckets AS ("
+            "    SELECT width_bucket("
+            "      CAST(value AS double precision),"
+            "      (SELECT thresholds FROM thresholds)"
+            "    ) AS bucket, COUNT(*) AS count"
+            "    FROM matches"
+            "    GROUP BY 1"
+            "  )"
+            " SELECT stats.count, minimum, maximum, average, stddev,"
+            "   buckets.bucket, buckets.count"
+            "  FROM stats LEFT OUTER JOIN buckets ON TRUE"
+        )
+        params += [num_bins, num_bins]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    count, minimum, maximum, average, stddev = rows[0][:5]
+    stats = {
+        'count': count,
+        'minimum': minimum,
+        'maximum': maximum,
+        # Django's Avg and StdDev aggregates return floats.
+        'average': None if average is None else float(average),
+        'stddev': None if stddev is None else float(stddev),
+    }
+
+    if num_bins is not None:
+        if count:
+            mn, mx = get_histogram_range(float(minimum), float(maximum))
+        else:
+            mn, mx = get_histogram_range(None, None)
+        bins = get_histogram_bins(mn, mx, num_bins)
+        bucket_counts = {
+            bucket: bucket_count for _, _, _, _, _, bucket, bucket_count
+            in rows if bucket is not None
+        }
+        stats['wage_histogram'] = fill_histogram_bins(bins, mx, bucket_counts)
+
+    return stats
@@ -1,24 +1,35 @@
 import bleach
 import csv
+import io
+import itertools
+import os
 from decimal import Decimal
+from functools import lru_cache
 from textwrap import dedent
+from typing import Dict, List
 
-from django.http import HttpResponse
-from django.db.models import Avg, Max, Min, Count, StdDev
+from django.conf import settings
+from django.http import (HttpResponse, HttpResponseNotModified,
+                         StreamingHttpResponse)
+from django.utils.http import http_date, parse_etags
 from django.utils.safestring import SafeString
 
 from markdown import markdown
 from rest_framework import serializers
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.schemas import AutoSchema
 from rest_framework.compat import coreapi, coreschema
 from rest_framework import generics
 
-from api.pagination import ContractPagination
+from api import cache, dump
+from api.pagination import ContractPagination, ContractCursorPagination
 from api.serializers import ContractSerializer, ScheduleMetadataSerializer
-from api.utils import get_histogram
-from contracts.models import Contract, EDUCATION_CHOICES, ScheduleMetadata
+from api.utils import get_stats_from_queryset
+from contracts.models import (Contract, ContractChange, EDUCATION_CHOICES,
+                              LaborCategoryCount, ScheduleMetadata,
+                              clean_search)
 from calc.utils import humanlist, backtickify
 
 
@@ -28,6 +39,11 @@ This API is used by CALC's front-end Data Explorer application,
 and can also be accessed by any third-party application over
 the public internet.
 
+Responses from the rates, autocomplete, schedules and dump endpoints
+include an `ETag` header. Clients that send it back in an
+`If-None-Match` header will receive an empty `304 Not Modified`
+response if the data hasn't changed since.
+
 For more developer documentation on CALC, please visit
 [/docs/](/docs/).
 """)
@@ -277,6 +293,23 @@ def get_contracts_queryset(request_params, wage_field):
         if price__lte:
             contracts = contracts.filter(**{wage_field + '__lte': price__lte})
 
+    return contracts.order_by(*get_contracts_sort(request_params, wage_field))
+
+
+def get_contracts_sort(request_params, wage_field):
+    """ Returns the list of fields to sort contracts by, based on query
+    params
+
+    Args:
+        request_params (dict): the request query parameters, corresponding
+            to GET_CONTRACTS_QUERYARGS above.
+        wage_field (str): the name of the field currently being used for
+            wage calculations and sorting
+
+    Returns:
+        list: field names, prefixed with `-` for descending order
+    """
+
     # get any sorting params and sort by them.
     sort = request_params.get('sort', wage_field).split(',')
     for field in sort:
@@ -287,7 +320,106 @@ def get_contracts_queryset(request_params, wage_field):
         if field not in SORTABLE_CONTRACT_FIELDS:
             raise serializers.ValidationError(f'Unable to sort on the field "{field}"')
 
-    return contracts.order_by(*sort)
+    return sort
+
+
+@lru_cache(maxsize=1024)
+def get_canonical_query(query):
+    """ Returns the normalized search terms for a search query
+
+    This is memoized because `clean_search` is relatively slow, and
+    is used to check whether responses are up to date before doing
+    anything else.
+
+    Args:
+        query (str): the search query
+
+    Returns:
+        tuple: the terms returned by `clean_search`
+    """
+
+    return tuple(clean_search(query))
+
+
+def get_cache_query_params(request_params, wage_field):
+    """ Canonicalizes query params for use in a response cache key
+
+    Args:
+        request_params (dict): the request query parameters, corresponding
+            to GET_CONTRACTS_QUERYARGS above.
+        wage_field (str): the name of the field currently being used for
+            wage calculations and sorting
+
+    Returns:
+        list: a sorted list of (name, values) pairs, in which the search
+        query is normalized and the contract year is replaced by the
+        wage field it resolves to
+    """
+
+    params = [('wage_field', [wage_field])]
+    for name, values in request_params.lists():
+        if name == 'contract-year':
+            continue
+        if name == 'q':
+            if not request_params.get('q'):
+                continue
+            values = get_canonical_query(request_params.get('q'))
+        params.append((name, values))
+    return sorted(params)
+
+
+def get_etag(request, name, cache_params):
+    """ Returns a strong ETag for a response
+
+    The ETag changes whenever the contracts data does, so it can be
+    computed without querying the database.
+
+    Args:
+        request (Request): the request being responded to
+        name (str): the name of the response in the API cache
+        cache_params (dict): the canonicalized parameters the response
+            depends on
+
+    Returns:
+        str: the quoted ETag, or None if the API cache is disabled
+    """
+
+    return cache.get_etag(name, {
+        'params': cache_params,
+        'format': request.accepted_renderer.format,
+    })
+
+
+def get_not_modified_response(request, etag):
+    """ Returns a 304 response if the request's `If-None-Match` header
+    matches the given ETag
+
+    Args:
+        request (Request): the request being responded to
+        etag (str): the quoted ETag of the current response, or None
+
+    Returns:
+        HttpResponseNotModified: the response, or None if the client's
+        copy of the response is missing or out of date
+    """
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if etag is None or not if_none_match:
+        return None
+    # If-None-Match uses the weak comparison function, as per RFC 7232.
+    etags = [e[2:] if e.startswith('W/') else e
+             for e in parse_etags(if_none_match)]
+    if etags != ['*'] and etag not in etags:
+        return None
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    return response
+
+
+def add_etag(response, etag):
+    if etag is not None:
+        response['ETag'] = etag
+    return response
 
 
 def quantize(num, precision=2):
@@ -306,6 +438,9 @@ class GetRates(APIView):
     `null` if no additional pages are available.
     * `previous` is a URL that points to the previous page of
     results, or `null` if no previous pages are available.
+    By default these URLs use page numbers, but if the `pagination`
+    query parameter is `cursor`, they use cursors instead, which
+    are much faster for pages deep into the results.
     * `results` is an array containing the results for the
     current page. Each item in the array contains the following keys:
         * `id` is the internal ID of the rate in the CALC database.
@@ -371,12 +506,31 @@ class GetRates(APIView):
                 If not provided, no histogram data will be returned.
                 """
             ),
+            queryarg(
+                "pagination",
+                str,
+                """
+                Set to `cursor` to page through results using cursors
+                rather than page numbers. This is much faster for pages
+                deep into the results. In this mode, the `next` and
+                `previous` URLs contain a `cursor` query parameter
+                instead of a `page`.
+                """
+            ),
+            queryarg(
+                "cursor",
+                str,
+                """
+                The position of the page to return when `pagination`
+                is `cursor`. Values for this should be taken from the
+                `next` and `previous` URLs of a response, rather than
+                constructed by hand.
+                """
+            ),
         ] + GET_CONTRACTS_QUERYARGS
     )
 
     def get(self, request):
-        bins = request.query_params.get('histogram', None)
-
         """
         wage_field determines prices for a given year:
         This year, next year, or the year after.
@@ -388,29 +542,77 @@ class GetRates(APIView):
         possible_wage_fields = ['current_price', 'next_year_price', 'second_year_price']
         year = request.query_params.get('contract-year', 0)
         wage_field = possible_wage_fields[int(year)]
-        contracts_all = self.get_queryset(request.query_params, wage_field)
 
-        stats = contracts_all.aggregate(
-            Min(wage_field), Max(wage_field),
-            Avg(wage_field), StdDev(wage_field))
+        # The pagination links are absolute URLs, so responses for
+        # different hosts can't be shared.
+        cache_params = {
+            'url': request.build_absolute_uri(request.path),
+            'query': get_cache_query_params(request.query_params,
+                                            wage_field),
+        }
+        etag = get_etag(request, 'rates', cache_params)
+        not_modified = get_not_modified_response(request, etag)
+        if not_modified is not None:
+            return not_modified
 
-        page_stats = {
-            'minimum': stats[wage_field + '__min'],
-            'maximum': stats[wage_field + '__max'],
-            'average': quantize(stats[wage_field + '__avg']),
-            'first_standard_deviation': quantize(
-                stats[wage_field + '__stddev']
+        data = cache.get_or_set('rates', cache_params,
+                                lambda: self.get_data(request, wage_field))
+        return add_etag(Response(data), etag)
+
+    def get_data(self, request, wage_field):
+        bins = request.query_params.get('histogram', None)
+        num_bins = int(bins) if bins and bins.isnumeric() else None
+        use_cursor = ContractCursorPagination.is_requested(request)
+
+        snapshot = None
+        if settings.API_RATES_ENGINE == 'snapshot' and not use_cursor:
+            # This is imported lazily so that processes which don't use
+            # the snapshot engine don't need to load NumPy.
+            from api.snapshot import get_snapshot
+
+            snapshot = get_snapshot()
+
+        if snapshot is not None:
+            contracts_all, stats = snapshot.query(
+                request.query_params,
+                wage_field,
+                get_contracts_sort(request.query_params, wage_field),
+                num_bins,
             )
-        }
+        else:
+            contracts_all = self.get_queryset(request.query_params,
+                                              wage_field)
+            stats = get_stats_from_queryset(contracts_all, wage_field,
+                                            num_bins)
 
-        if bins and bins.isnumeric():
-            values = contracts_all.values_list(wage_field, flat=True)
-            page_stats['wage_histogram'] = get_histogram(values, int(bins))
+        page_stats = {
+            'count': stats['count'],
+            'minimum': stats['minimum'],
+            'maximum': stats['maximum'],
+            'average': quantize(stats['average']),
+            'first_standard_deviation': quantize(stats['stddev'])
+        }
 
-        pagination = self.pagination_class(page_stats)
+        if num_bins is not None:
+            page_stats['wage_histogram'] = stats['wage_histogram']
+
+        if use_cursor:
+            # Searches don't exclude contracts without a price for the
+            # wage field, so it can only be assumed to be non-null when
+            # there's no search.
+            not_null_fields: List[str] = []
+            if not request.query_params.get('q'):
+                not_null_fields = [wage_field]
+            pagination = ContractCursorPagination(
+                page_stats,
+                ordering=get_contracts_sort(request.query_params, wage_field),
+                not_null_fields=not_null_fields,
+            )
+        else:
+            pagination = self.pagination_class(page_stats)
         results = pagination.paginate_queryset(contracts_all, request)
         serializer = ContractSerializer(results, many=True)
-        return pagination.get_paginated_response(serializer.data)
+        return pagination.get_paginated_response(serializer.data).data
 
     def get_queryset(self, request, wage_field):
         return get_contracts_queryset(request, wage_field)
@@ -431,6 +633,19 @@ class ScheduleMetadataList(generics.ListAPIView):
     queryset = ScheduleMetadata.objects.all()
     serializer_class = ScheduleMetadataSerializer
 
+    def list(self, request, *args, **kwargs):
+        etag = get_etag(request, 'schedules', {})
+        not_modified = get_not_modified_response(request, etag)
+        if not_modified is not None:
+            return not_modified
+
+        data = cache.get_or_set(
+            'schedules', {},
+            lambda: super(ScheduleMetadataList, self).list(
+                request, *args, **kwargs).data
+        )
+        return add_etag(Response(data), etag)
+
 
 class GetRatesCSV(APIView):
     """
@@ -446,6 +661,14 @@ class GetRatesCSV(APIView):
     )
 
     def get(self, request, format=None):
+        # The query params are echoed in the CSV, so they aren't
+        # normalized.
+        etag = get_etag(request, 'rates_csv',
+                        {'query': sorted(request.query_params.lists())})
+        not_modified = get_not_modified_response(request, etag)
+        if not_modified is not None:
+            return not_modified
+
         wage_field = 'current_price'
         contracts_all = get_contracts_queryset(request.GET, wage_field)
 
@@ -474,33 +697,321 @@ class GetRatesCSV(APIView):
         if business_size_set:
             business_size = business_size_set
 
-        response = HttpResponse(content_type="text/csv")
+        metadata_rows = [
+            ("Search Query", "Minimum Education Level",
+             "Minimum Years Experience", "Worksite",
+             "Business Size", "", "", "", "", "", "", "", "", ""),
+            (q, min_education, min_experience, site,
+             business_size, "", "", "", "", "", "", "", "", ""),
+            ("Contract #", "Business Size", "Schedule", "Site",
+             "Begin Date", "End Date", "SIN", "Vendor Name",
+             "Labor Category", "education Level",
+             "Minimum Years Experience",
+             "Current Year Labor Price", "Next Year Labor Price",
+             "Second Year Labor Price"),
+        ]
+
+        rows = itertools.chain(metadata_rows,
+                               iter_contracts_csv_rows(contracts_all))
+        response = StreamingHttpResponse(iter_csv_chunks(rows),
+                                         content_type="text/csv")
         response['Content-Disposition'] = ('attachment; '
                                            'filename="pricing_results.csv"')
-        writer = csv.writer(response)
-        writer.writerow(("Search Query", "Minimum Education Level",
-                         "Minimum Years Experience", "Worksite",
-                         "Business Size", "", "", "", "", "", "", "", "", ""))
-        writer.writerow((q, min_education, min_experience, site,
-                         business_size, "", "", "", "", "", "", "", "", ""))
-        writer.writerow(("Contract #", "Business Size", "Schedule", "Site",
-                         "Begin Date", "End Date", "SIN", "Vendor Name",
-                         "Labor Category", "education Level",
-                         "Minimum Years Experience",
-                         "Current Year Labor Price", "Next Year Labor Price",
-                         "Second Year Labor Price"))
-
-        for c in contracts_all:
-            writer.writerow((c.idv_piid, c.get_readable_business_size(),
-                             c.schedule, c.contractor_site, c.contract_start,
-                             c.contract_end, c.sin, c.vendor_name,
-                             c.labor_category, c.get_education_level_display(),
-                             c.min_years_experience, c.current_price,
-                             c.next_year_price, c.second_year_price))
+        return add_etag(response, etag)
+
+
+CSV_CONTRACT_FIELDS = (
+    'idv_piid', 'business_size', 'schedule', 'contractor_site',
+    'contract_start', 'contract_end', 'sin', 'vendor_name',
+    'labor_category', 'education_level', 'min_years_experience',
+    'current_price', 'next_year_price', 'second_year_price',
+)
+
+
+def iter_contracts_csv_rows(contracts):
+    """ Yields a CSV row for each contract in the given queryset
+
+    Rows are read from the database in chunks via a server-side cursor,
+    without instantiating a model for each one, so memory use stays
+    constant regardless of how many contracts there are.
+
+    Args:
+        contracts (QuerySet): the Contract objects to yield rows for
+
+    Returns:
+        iterator: a tuple of CSV field values for each contract
+    """
+
+    education_levels = dict(EDUCATION_CHOICES)
+    business_sizes: Dict[str, str] = {}
+
+    for (idv_piid, business_size, schedule, contractor_site,
+         contract_start, contract_end, sin, vendor_name, labor_category,
+         education_level, min_years_experience, current_price,
+         next_year_price, second_year_price) in contracts.values_list(
+             *CSV_CONTRACT_FIELDS).iterator():
+        if business_size not in business_sizes:
+            business_sizes[business_size] = \
+                Contract.readable_business_size(business_size)
+        yield (idv_piid, business_sizes[business_size], schedule,
+               contractor_site, contract_start, contract_end, sin,
+               vendor_name, labor_category,
+               education_levels.get(education_level, education_level),
+               min_years_experience, current_price, next_year_price,
+               second_year_price)
+
+
+def iter_csv_chunks(rows, chunk_size=65536):
+    """ Writes the given rows as CSV, yielding the output in chunks
+
+    Args:
+        rows (iterable): the rows to write, each of which is an
+            iterable of field values
+        chunk_size (int): the approximate size of each chunk, in
+            characters
+
+    Returns:
+        iterator: strings of CSV data
+    """
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+class GetRateChanges(APIView):
+    """
+    Get the labor rates that have been inserted, updated or deleted
+    since a given version of CALC's data, so that a copy of it can be
+    kept up-to-date without downloading every rate again.
+
+    The JSON response contains the following keys:
+
+    * `version` is the version of the data that applying the changes
+    brings a copy up to. Pass it as `since` to get the next changes.
+    * `more` is `true` if there are more changes after `version`.
+    * `inserted` and `updated` are arrays of the rates that have been
+    inserted and updated, with the same keys as the results of
+    [/api/rates/](/api/rates/).
+    * `deleted` is an array of the `id`s of the rates that have been
+    deleted, or that no longer have a current price.
+
+    If `since` isn't given, the response only contains the current
+    `version`, which a copy made from [/api/rates/](/api/rates/) can
+    be synced from.
+
+    Versions aren't necessarily in numerical order, and changes only
+    appear here once every change that could come before them has
+    been committed, so they may briefly lag behind other endpoints
+    while a large upload is being processed.
+
+    Changes are only kept for a limited time. If `since` is a version
+    older than that, the response is a 400, and a copy needs to be
+    made from [/api/rates/](/api/rates/) again.
+    """
+
+    schema = AutoSchema(
+        manual_fields=[
+            queryarg(
+                "since",
+                int,
+                "Only return the changes made after this version."
+            )
+        ]
+    )
+
+    MAX_CHANGES = 5000
 
+    def get(self, request, format=None):
+        since = request.query_params.get('since')
+        if since is None:
+            return Response({
+                'version': ContractChange.objects.get_version(),
+            })
+        if not since.isdigit():
+            raise serializers.ValidationError(
+                '"since" must be a non-negative integer')
+        since = int(since)
+
+        try:
+            changes = list(
+                ContractChange.objects.after(since)
+                .values_list('id', 'contract_id', 'kind')
+                [:self.MAX_CHANGES + 1]
+            )
+        except ContractChange.DoesNotExist:
+            raise serializers.ValidationError(
+                '"since" must be a version returned by this endpoint')
+        more = len(changes) > self.MAX_CHANGES
+        changes = changes[:self.MAX_CHANGES]
+
+        # A rate may have changed more than once, but only its current
+        # state matters. It was inserted if its first change was.
+        first_kinds: Dict[int, str] = {}
+        for _, contract_id, kind in changes:
+            first_kinds.setdefault(contract_id, kind)
+        contracts = Contract.objects.filter(id__in=list(first_kinds))
+        rates = {rate['id']: rate for rate in
+                 ContractSerializer(contracts, many=True).data}
+
+        inserted = []
+        updated = []
+        deleted = []
+        for contract_id, kind in first_kinds.items():
+            rate = rates.get(contract_id)
+            if rate is None:
+                deleted.append(contract_id)
+            elif kind == ContractChange.INSERTED:
+                inserted.append(rate)
+            else:
+                updated.append(rate)
+
+        return Response({
+            'version': changes[-1][0] if changes else since,
+            'more': more,
+            'inserted': inserted,
+            'updated': updated,
+            'deleted': deleted,
+        })
+
+
+class GetRatesDump(APIView):
+    """
+    Download every current labor rate as a gzipped file, which is much
+    faster than paging through [/api/rates/](/api/rates/).
+
+    The file is regenerated in the background whenever CALC's data
+    changes, so it may briefly lag behind the other endpoints. Its
+    rates have the same fields as the results of
+    [/api/rates/](/api/rates/), and it can be either a CSV file with a
+    header row or a JSON Lines file with one rate per line.
+
+    Interrupted downloads can be resumed by sending a `Range` header
+    for the rest of the file, along with an `If-Range` header with the
+    `ETag` that was returned for it, in case it has since changed.
+    """
+
+    schema = AutoSchema(
+        manual_fields=[
+            queryarg(
+                "type",
+                str,
+                "The type of file to download: `csv` (the default) or "
+                "`jsonl`."
+            )
+        ]
+    )
+
+    def perform_content_negotiation(self, request, force=False):
+        # The file is served as-is, whatever the client accepts.
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, format=None):
+        dump_type = request.query_params.get('type', 'csv')
+        if dump_type not in dump.FORMATS:
+            raise serializers.ValidationError(
+                f'"type" must be one of {humanlist(list(dump.FORMATS))}')
+        if not settings.API_RATES_DUMP_DIR:
+            raise NotFound('Rate dumps are disabled.')
+
+        f, latest = open_latest_dump(dump_type)
+        response = None
+        try:
+            stat = os.fstat(f.fileno())
+            etag = f'"{os.path.basename(latest.path)}"'
+            response = get_not_modified_response(request, etag)
+            if response is None:
+                response = get_dump_response(request, f, stat.st_size, etag)
+        finally:
+            # If the file is being streamed, the response has taken
+            # ownership of it.
+            if not isinstance(response, StreamingHttpResponse):
+                f.close()
+
+        if isinstance(response, StreamingHttpResponse):
+            response['Content-Type'] = 'application/gzip'
+            response['Content-Disposition'] = (
+                f'attachment; filename="rates.{dump_type}.gz"')
+            response['Last-Modified'] = http_date(stat.st_mtime)
+            add_etag(response, etag)
+        response['Accept-Ranges'] = 'bytes'
         return response
 
 
+def open_latest_dump(dump_type):
+    """ Opens the most recently published dump of the given type
+
+    Args:
+        dump_type (str): the type of dump, one of `dump.FORMATS`
+
+    Returns:
+        tuple: the open file and its `dump.Dump`
+
+    Raises:
+        NotFound: if no dump has been published
+    """
+
+    # A newer dump may be published, and this one deleted, between
+    # finding and opening it, in which case the newer one is served.
+    for _ in range(3):
+        latest = dump.get_latest_dump(dump_type)
+        if latest is None:
+            break
+        try:
+            return open(latest.path, 'rb'), latest
+        except FileNotFoundError:
+            continue
+    raise NotFound('The rates dump has not been published yet.')
+
+
+def get_dump_response(request, f, size, etag):
+    """ Returns a response streaming the given dump file, or the range
+    of it requested by the `Range` header
+
+    Args:
+        request (Request): the request being responded to
+        f (file): the open dump file, which a streaming response
+            closes once it's been sent, and which is closed straight
+            away if none of it is going to be sent
+        size (int): the size of the file, in bytes
+        etag (str): the quoted ETag of the file
+
+    Returns:
+        HttpResponse: the response
+    """
+
+    range_header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    byte_range = None
+    if range_header and (if_range is None or if_range == etag):
+        try:
+            byte_range = dump.parse_byte_range(range_header, size)
+        except dump.UnsatisfiableRange:
+            f.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if byte_range is None:
+        response = StreamingHttpResponse(dump.iter_file_range(f, 0, size))
+        response['Content-Length'] = str(size)
+        return response
+
+    first, last = byte_range
+    length = last - first + 1
+    response = StreamingHttpResponse(dump.iter_file_range(f, first, length),
+                                     status=206)
+    response['Content-Length'] = str(length)
+    response['Content-Range'] = f'bytes {first}-{last}/{size}'
+    return response
+
+
 class GetAutocomplete(APIView):
     """
     Return autocomplete suggestions for a given query.
@@ -535,19 +1046,30 @@ class GetAutocomplete(APIView):
         query_type = request.query_params.get('query_type', 'match_all')
 
         if q:
-            data = Contract.objects.multi_phrase_search(q, query_type)
+            cache_params = {'q': get_canonical_query(q),
+                            'query_type': query_type}
+            etag = get_etag(request, 'search', cache_params)
+            not_modified = get_not_modified_response(request, etag)
+            if not_modified is not None:
+                return not_modified
+
+            data = cache.get_or_set('search', cache_params,
+                                    lambda: self.get_data(q, query_type))
+            return add_etag(Response(data), etag)
+        else:
+            return Response([])
 
-            data = data.values('_normalized_labor_category').annotate(
-                count=Count('_normalized_labor_category')).order_by('-count')
+    def get_data(self, q, query_type):
+        # Rather than aggregating every matching contract, search
+        # the precomputed counts of each labor category.
+        data = LaborCategoryCount.objects.multi_phrase_search(
+            q, query_type).order_by('-count', 'labor_category')
 
-            # limit data to MAX_RESULTS
-            data = data[:self.MAX_RESULTS]
+        # limit data to MAX_RESULTS
+        data = data[:self.MAX_RESULTS]
 
-            data = [
-                {'labor_category': d['_normalized_labor_category'],
-                 'count': d['count']}
-                for d in data
-            ]
-            return Response(data)
-        else:
-            return Response([])
+        return [
+            {'labor_category': d.labor_category,
+             'count': d.count}
+            for d in data
+        ]
@@ -6,6 +6,7 @@ from django.http import JsonResponse
 from django.db.migrations.executor import MigrationExecutor
 from django.db import connections, DEFAULT_DB_ALIAS
 
+from api import cache
 from calc import __version__
 from calc.site_utils import get_canonical_url
 
@@ -48,6 +49,7 @@ def healthcheck(request):
         'request_url': request_url,
         'canonical_url_matches_request_url': canonical_url == request_url,
         'rq_jobs': len(django_rq.get_queue().jobs),
+        'api_cache': cache.get_stats(),
         **get_database_info(),
     }
 
@@ -136,7 +136,7 @@ INSTALLED_APPS = (
     'data_explorer',
     'contracts.apps.DefaultContractsApp',
     'data_capture.apps.{}'.format(DATA_CAPTURE_APP_CONFIG),
-    'api',
+    'api.apps.DefaultApiApp',
     'rest_framework',
     'corsheaders',
     'uaa_client',
@@ -228,6 +228,48 @@ if is_running_tests():
 
 PAGINATION = 200
 
+# Responses from the rates, autocomplete and schedules APIs are cached
+# until the contracts data changes. See api/cache.py for details.
+API_CACHE_BACKEND = os.environ.get('API_CACHE_BACKEND', 'redis')
+
+API_CACHE_MAX_SIZE = int(os.environ.get('API_CACHE_MAX_SIZE',
+                                        str(64 * 1024 * 1024)))
+
+API_CACHE_TIMEOUT = int(os.environ.get('API_CACHE_TIMEOUT',
+                                       str(24 * 60 * 60)))
+
+API_CACHE_REDIS_URL = RQ_QUEUES['default']['URL']
+
+# This can be 'orm' to answer /api/rates/ queries with the database, or
+# 'snapshot' to answer them with the in-memory snapshot in api/snapshot.py.
+API_RATES_ENGINE = os.environ.get('API_RATES_ENGINE', 'orm')
+
+# If this is set, the snapshot used by the 'snapshot' engine is published
+# to this file whenever the contracts data changes, and shared between
+# processes by mapping it into memory.
+API_RATES_SNAPSHOT_PATH = os.environ.get('API_RATES_SNAPSHOT_PATH', '')
+
+# If this is set, gzipped dumps of every current rate are published to this
+# directory whenever the contracts data changes, and served by
+# /api/rates/dump/. See api/dump.py.
+API_RATES_DUMP_DIR = os.environ.get('API_RATES_DUMP_DIR', '')
+
+# Changes to contracts are logged for /api/rates/changes/ for this many days.
+CONTRACT_CHANGE_MAX_AGE_DAYS = int(os.environ.get(
+    'CONTRACT_CHANGE_MAX_AGE_DAYS', '30'))
+
+# The number of processes that convert the rows of Region 10 bulk uploads.
+# If this is 1, rows are converted in the process doing the upload.
+BULK_UPLOAD_WORKERS = int(os.environ.get('BULK_UPLOAD_WORKERS', '1'))
+
+# If this is set, Region 10 bulk uploads commit their changes in batches,
+# so that an interrupted upload can be resumed. See data_capture/jobs.py.
+BULK_UPLOAD_CHECKPOINTED = 'BULK_UPLOAD_CHECKPOINTED' in os.environ
+
+if is_running_tests():
+    # Tests that want caching can enable it via override_settings().
+    API_CACHE_BACKEND = 'none'
+
 REST_FRAMEWORK = {
     'COERCE_DECIMAL_TO_STRING': False,
 }
@@ -328,6 +370,13 @@ if 'FORCE_DISABLE_SECURE_SSL_REDIRECT' in os.environ:
 SESSION_COOKIE_SECURE = CSRF_COOKIE_SECURE = SECURE_SSL_REDIRECT
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
 
+# These are Django's default upload handlers, but they also hash uploaded
+# files as they arrive; see data_capture/upload_handlers.py.
+FILE_UPLOAD_HANDLERS = [
+    'data_capture.upload_handlers.HashingMemoryFileUploadHandler',
+    'data_capture.upload_handlers.HashingTemporaryFileUploadHandler',
+]
+
 CSRF_COOKIE_HTTPONLY = True
 
 # Amazon ELBs pass on X-Forwarded-Proto.
@@ -102,6 +102,13 @@ class HealthcheckTests(DjangoTestCase):
     def test_it_includes_rq_jobs(self):
         self.assertResponseContains({'rq_jobs': 0})
 
+    def test_it_includes_api_cache_stats(self):
+        self.assertResponseContains({'api_cache': None})
+        with override_settings(API_CACHE_BACKEND='locmem'):
+            self.assertResponseContains({
+                'api_cache': {'hits': 0, 'misses': 0},
+            })
+
     def test_it_includes_version(self):
         self.assertResponseContains({'version': __version__})
 
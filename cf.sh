@@ -7,10 +7,13 @@ if [ $CF_INSTANCE_INDEX = "0" ]; then
     python manage.py migrate --noinput
 
     echo "----- Updating search field -----"
-    python manage.py update_search_field
+    python manage.py update_search_field --only-changed
 
     echo "----- Initializing Groups -----"
     python manage.py initgroups
+
+    echo "----- Moving uploaded files to chunked storage -----"
+    python manage.py migrate_slowpoke_storage
 fi
 echo "------ Starting APP ------"
 gunicorn calc.wsgi:application
@@ -0,0 +1,210 @@
+'''
+Helpers for benchmarking contract-related code against large amounts
+of synthetic data. See the `benchmark` management command for details.
+'''
+
+import random
+from datetime import date
+from decimal import Decimal
+from typing import Iterator, List, Optional
+
+from django.db import connection, transaction
+from django.db.models import Count
+
+from .models import Contract, EDUCATION_CHOICES, LaborCategoryCount
+
+
+SENIORITIES = ['', 'Junior', 'Senior', 'Sr.', 'Jr.', 'Lead', 'Principal']
+
+ROLES = [
+    'Business Analyst', 'Software Engineer', 'Project Manager',
+    'Subject Matter Expert', 'Database Administrator', 'Technical Writer',
+    'Accountant', 'Systems Architect', 'Graphic Designer', 'Trainer',
+    'Program Manager', 'Consultant', 'Data Scientist', 'Help Desk Specialist',
+]
+
+LEVELS = ['', 'I', 'II', 'III', 'IV']
+
+SCHEDULES = ['MOBIS', 'PES', 'Consolidated', 'IT Schedule 70', 'AIMS',
+             'Logistics', 'Environmental', 'Language Services', 'FABS']
+
+SITES = ['Customer', 'Contractor', 'Both']
+
+BUSINESS_SIZES = ['S', 'O']
+
+
+def make_labor_category(rand: random.Random) -> str:
+    return ' '.join(filter(None, [
+        rand.choice(SENIORITIES),
+        rand.choice(ROLES),
+        rand.choice(LEVELS),
+    ]))
+
+
+def iter_synthetic_contracts(num_rows: int,
+                             seed: int=1) -> Iterator[Contract]:
+    '''
+    Yield the given number of unsaved, randomly-generated (but
+    reproducible) Contract models.
+    '''
+
+    rand = random.Random(seed)
+    education_levels: List[Optional[str]] = [
+        code for code, _ in EDUCATION_CHOICES]
+    education_levels.append(None)
+
+    for i in range(num_rows):
+        base_rate = Decimal(rand.randrange(2000, 30000)) / 100
+        start = date(rand.randrange(2005, 2018), rand.randrange(1, 13), 1)
+        rates = [(base_rate * Decimal('1.03') ** year).quantize(Decimal('.01'))
+                 for year in range(5)]
+        year = rand.randrange(1, 4)
+        yield Contract(
+            idv_piid=f'GS-{rand.randrange(10, 99)}F-{i:06d}',
+            vendor_name=f'Synthetic Vendor {rand.randrange(num_rows // 20 + 1)}',
+            labor_category=make_labor_category(rand),
+            education_level=rand.choice(education_levels),
+            min_years_experience=rand.randrange(0, 20),
+            hourly_rate_year1=rates[0],
+            hourly_rate_year2=rates[1],
+            hourly_rate_year3=rates[2],
+            hourly_rate_year4=rates[3],
+            hourly_rate_year5=rates[4],
+            current_price=rates[year - 1],
+            next_year_price=rates[year],
+            second_year_price=rates[year + 1],
+            contract_year=year,
+            contract_start=start,
+            contract_end=date(start.year + 5, start.month, 1),
+            schedule=rand.choice(SCHEDULES),
+            sin=f'{rand.randrange(100, 999)}-{rand.randrange(1, 9)}',
+            contractor_site=rand.choice(SITES),
+            business_size=rand.choice(BUSINESS_SIZES),
+        )
+
+
+def make_synthetic_contracts(num_rows: int, seed: int=1,
+                             batch_size: int=5000) -> int:
+    '''
+    Save the given number of randomly-generated Contract models to
+    the database, returning the number saved.
+    '''
+
+    batch: List[Contract] = []
+    for contract in iter_synthetic_contracts(num_rows, seed):
+        batch.append(contract)
+        if len(batch) == batch_size:
+            Contract.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        Contract.objects.bulk_create(batch)
+    return num_rows
+
+
+def bulk_load(num_rows):
+    '''
+    Compare saving contracts in batches with bulk_create(), which
+    inserts them and then updates their search indexes, with
+    streaming them into the database with copy_create().
+    '''
+
+    fields = [f.name for f in Contract._meta.concrete_fields
+              if f.name != 'id']
+
+    def get_contracts():
+        return list(Contract.objects.order_by('idv_piid')
+                    .values_list(*fields))
+
+    def with_bulk_create():
+        make_synthetic_contracts(num_rows)
+
+    def with_copy():
+        Contract.objects.copy_create(iter_synthetic_contracts(num_rows))
+
+    results = []
+    for func in (with_bulk_create, with_copy):
+        sid = transaction.savepoint()
+        func()
+        results.append(get_contracts())
+        transaction.savepoint_rollback(sid)
+    if results[0] != results[1]:
+        raise AssertionError('loaded contracts do not match')
+
+    yield 'bulk_create', with_bulk_create
+    yield 'copy_create', with_copy
+
+
+SEARCHES = [
+    ('engineer', 'match_all'),
+    ('senior business analyst, program manager iii', 'match_all'),
+    ('data scientist', 'match_phrase'),
+    ('lead technical writer ii', 'match_exact'),
+]
+
+
+def search(num_rows):
+    '''
+    Compare searching labor categories with and without the indexes
+    that back CurrentContractManager.multi_phrase_search().
+    '''
+
+    make_synthetic_contracts(num_rows)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE contracts_contract')
+
+    def indexed():
+        return [Contract.objects.multi_phrase_search(query, query_type).count()
+                for query, query_type in SEARCHES]
+
+    def sequential_scan():
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_indexscan = off')
+            cursor.execute('SET LOCAL enable_bitmapscan = off')
+            try:
+                return indexed()
+            finally:
+                cursor.execute('RESET enable_indexscan')
+                cursor.execute('RESET enable_bitmapscan')
+
+    if indexed() != sequential_scan():
+        raise AssertionError('search results do not match')
+
+    yield 'sequential scan', sequential_scan
+    yield 'multi_phrase_search (indexed)', indexed
+
+
+def autocomplete(num_rows):
+    '''
+    Compare aggregating matching contracts to find labor category
+    suggestions with looking them up in the LaborCategoryCount table.
+    '''
+
+    make_synthetic_contracts(num_rows)
+    LaborCategoryCount.objects.refresh()
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE contracts_contract')
+        cursor.execute('ANALYZE contracts_laborcategorycount')
+
+    def aggregate():
+        return [
+            list(Contract.objects.multi_phrase_search(query, query_type)
+                 .values_list('_normalized_labor_category')
+                 .annotate(count=Count('id'))
+                 .order_by('-count', '_normalized_labor_category')[:20])
+            for query, query_type in SEARCHES
+        ]
+
+    def precomputed():
+        return [
+            list(LaborCategoryCount.objects
+                 .multi_phrase_search(query, query_type)
+                 .values_list('labor_category', 'count')
+                 .order_by('-count', 'labor_category')[:20])
+            for query, query_type in SEARCHES
+        ]
+
+    if aggregate() != precomputed():
+        raise AssertionError('autocomplete results do not match')
+
+    yield 'aggregate contracts', aggregate
+    yield 'LaborCategoryCount', precomputed
@@ -1,89 +1,139 @@
+import hashlib
 from datetime import datetime
 
+from django.db import connection
+
 from contracts.models import Contract
 
 FEDERAL_MIN_CONTRACT_RATE = 10.20
 
 
 class Region10Loader(object):
+    # The fields that identify the same labor category of the same
+    # contract across different uploads.
+    KEY_FIELDS = ['idv_piid', 'labor_category', 'vendor_name']
+
+    # All the fields that make_contract() sets from a row (aside from
+    # upload_source), which are compared to tell whether a row has
+    # changed since the last upload.
+    CONTENT_FIELDS = KEY_FIELDS + [
+        'education_level', 'schedule', 'business_size', 'contract_year',
+        'sin', 'contract_start', 'contract_end', 'min_years_experience',
+        'hourly_rate_year1', 'hourly_rate_year2', 'hourly_rate_year3',
+        'hourly_rate_year4', 'hourly_rate_year5', 'current_price',
+        'next_year_price', 'second_year_price', 'contractor_site',
+    ]
+
+    @classmethod
+    def get_natural_key(cls, values):
+        '''
+        Returns the natural key of the contract with the given field
+        values, as returned by make_contract_values().
+        '''
+        return tuple(values[name] for name in cls.KEY_FIELDS)
+
+    @classmethod
+    def get_content_hash(cls, values):
+        '''
+        Returns a hash of the content fields of the contract with the
+        given field values, which is the same whether they were just
+        made from a row or were loaded from the database.
+        '''
+        content = hashlib.sha256()
+        for name in cls.CONTENT_FIELDS:
+            field = Contract._meta.get_field(name)
+            # This is how the value is sent to the database, e.g. with
+            # rates rounded to cents.
+            value = field.get_db_prep_save(values[name], connection)
+            content.update(repr(value).encode('utf-8') + b'\0')
+        return content.digest()
+
     @classmethod
     def make_contract(cls, line, upload_source=None):
-        if line[0]:
-            # create contract record, unique to vendor, labor cat
-            idv_piid = line[11]
-            vendor_name = line[10]
-            labor_category = line[0].strip().replace('\n', ' ')
-
-            contract = Contract()
-            contract.idv_piid = idv_piid
-            contract.labor_category = labor_category
-            contract.vendor_name = vendor_name
-
-            contract.education_level = contract.get_education_code(
-                line[6]
-            )
-            contract.schedule = line[12]
-            contract.business_size = line[8]
-            current_contract_year = int(float(line[14]))
-            contract.contract_year = current_contract_year
-            contract.sin = line[13]
-
-            if line[15] != '':
-                contract.contract_start = datetime.strptime(
-                    line[15], '%m/%d/%Y').date()
-            if line[16] != '':
-                contract.contract_end = datetime.strptime(
-                    line[16], '%m/%d/%Y').date()
-
-            if line[7].strip() != '':
-                contract.min_years_experience = int(float(line[7]))
-            else:
-                contract.min_years_experience = 0
+        contract = Contract(**cls.make_contract_values(line))
 
-            if line[1] and line[1] != '':
-                contract.hourly_rate_year1 = contract.normalize_rate(
-                    line[1]
-                )
-            else:
-                # there's no pricing info
-                raise ValueError('missing price')
-
-            for count, rate in enumerate(line[2:6]):
-                if rate and rate.strip() != '':
-                    setattr(contract, 'hourly_rate_year' +
-                            str(count + 2),
-                            contract.normalize_rate(rate))
-
-            if line[14] and line[14] != '':
-                price_fields = {
-                    'current_price': getattr(contract,
-                                             'hourly_rate_year' +
-                                             str(current_contract_year), 0)
-                }
-                # we have up to five years of rate data
-                if current_contract_year < 5:
-                    price_fields['next_year_price'] = getattr(
-                        contract, 'hourly_rate_year' +
-                        str(current_contract_year + 1), 0
-                    )
-                    if current_contract_year < 4:
-                        price_fields['second_year_price'] = getattr(
-                            contract, 'hourly_rate_year' +
-                            str(current_contract_year + 2), 0
-                        )
-
-                # don't create display prices for records where the
-                # rate is under the federal minimum contract rate
-                for field in price_fields:
-                    price = price_fields.get(field)
-                    if price and price >= FEDERAL_MIN_CONTRACT_RATE:
-                        setattr(contract, field, price)
-
-            contract.contractor_site = line[9]
-
-            if upload_source:
-                contract.upload_source = upload_source
-
-            return contract
-        else:
+        if upload_source:
+            contract.upload_source = upload_source
+
+        return contract
+
+    @classmethod
+    def make_contract_values(cls, line):
+        '''
+        Like make_contract(), but returns a dict mapping the names of
+        the contract's CONTENT_FIELDS to their values, which is much
+        cheaper to make than a Contract and can be pickled.
+        '''
+        if not line[0]:
             raise ValueError('missing labor category')
+
+        # create contract record, unique to vendor, labor cat
+        current_contract_year = int(float(line[14]))
+
+        if not line[1]:
+            # there's no pricing info
+            raise ValueError('missing price')
+
+        rates = [normalize_rate(line[1])]
+        for rate in line[2:6]:
+            if rate and rate.strip() != '':
+                rates.append(normalize_rate(rate))
+            else:
+                rates.append(None)
+
+        def get_rate(year):
+            # we have up to five years of rate data
+            if 1 <= year <= len(rates):
+                return rates[year - 1]
+            return 0
+
+        price_fields = {
+            'current_price': get_rate(current_contract_year)
+        }
+        if current_contract_year < 5:
+            price_fields['next_year_price'] = get_rate(
+                current_contract_year + 1)
+            if current_contract_year < 4:
+                price_fields['second_year_price'] = get_rate(
+                    current_contract_year + 2)
+
+        values = {
+            'idv_piid': line[11],
+            'labor_category': line[0].strip().replace('\n', ' '),
+            'vendor_name': line[10],
+            'education_level': get_education_code(line[6]),
+            'schedule': line[12],
+            'business_size': line[8],
+            'contract_year': current_contract_year,
+            'sin': line[13],
+            'contract_start': parse_date(line[15]),
+            'contract_end': parse_date(line[16]),
+            'min_years_experience':
+                int(float(line[7])) if line[7].strip() != '' else 0,
+            'current_price': None,
+            'next_year_price': None,
+            'second_year_price': None,
+            'contractor_site': line[9],
+        }
+
+        for year, rate in enumerate(rates, start=1):
+            values[f'hourly_rate_year{year}'] = rate
+
+        # don't create display prices for records where the
+        # rate is under the federal minimum contract rate
+        for field, price in price_fields.items():
+            if price and price >= FEDERAL_MIN_CONTRACT_RATE:
+                values[field] = price
+
+        return values
+
+
+normalize_rate = Contract.normalize_rate
+
+get_education_code = Contract.get_education_code
+
+
+def parse_date(value):
+    if value == '':
+        return None
+    return datetime.strptime(value, '%m/%d/%Y').date()
@@ -1,14 +1,73 @@
+import time
+
 from django.core.management.base import BaseCommand
 
 from contracts.models import Contract
 
 
 class Command(BaseCommand):
-    def handle(self, *args, **kwargs):
+    help = '''
+    Normalize Contract labor categories and then update their full-text
+    search indexes, in batches that are committed as they go.
+    '''
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--only-changed',
+            default=False,
+            action='store_true',
+            help='only examine contracts normalized with an older version '
+                 'of the normalization logic'
+        )
+
+        parser.add_argument(
+            '--dry-run',
+            default=False,
+            action='store_true',
+            help='report how many contracts would be updated, without '
+                 'updating them'
+        )
+
+        parser.add_argument(
+            '-b', '--batch-size',
+            type=int,
+            default=5000,
+            help='number of contracts to update per transaction '
+                 '(default is 5000)'
+        )
+
+        parser.add_argument(
+            '-w', '--workers',
+            type=int,
+            default=1,
+            help='number of processes to normalize labor categories with '
+                 '(default is 1)'
+        )
+
+    def handle(self, *args, **options):
         '''
         This normalizes Contract labor categories
         and then updates the full-text search indexes.
         '''
 
-        print("Updating normalized labor categories...")
-        Contract.objects.bulk_update_normalized_labor_categories()
+        self.stdout.write("Updating normalized labor categories...")
+        start_time = time.monotonic()
+
+        def report(num_examined, num_updated, total):
+            elapsed = time.monotonic() - start_time
+            rate = num_examined / elapsed if elapsed else 0
+            self.stdout.write(
+                f"  {num_examined} of {total} contracts examined "
+                f"({rate:.0f}/sec), {num_updated} updated."
+            )
+
+        num_updated = Contract.objects.bulk_update_normalized_labor_categories(
+            only_changed=options['only_changed'],
+            dry_run=options['dry_run'],
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            progress=report,
+        )
+
+        verb = 'would be' if options['dry_run'] else 'were'
+        self.stdout.write(f"Done. {num_updated} contracts {verb} updated.")
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import logging
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+logger = logging.getLogger('calc')
+
+
+def create_trigram_index(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            logger.warning(
+                'The pg_trgm extension is not available, so labor '
+                'category searches will not be indexed.'
+            )
+            return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # Django's "icontains" lookup compares the upper-cased value of the
+    # field, so the index is on that expression.
+    schema_editor.execute(
+        'CREATE INDEX contracts_contract_nlc_upper_trgm '
+        'ON contracts_contract '
+        'USING gin (UPPER(_normalized_labor_category) gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    schema_editor.execute(
+        'DROP INDEX IF EXISTS contracts_contract_nlc_upper_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contracts', '0024_populate_schedulemetadata'),
+    ]
+
+    operations = [
+        # The B-tree index on search_index can't be used for full-text
+        # search; the GIN index created in 0009 is used instead.
+        migrations.AlterField(
+            model_name='contract',
+            name='search_index',
+            field=django.contrib.postgres.search.SearchVectorField(default='', editable=False),
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+        # This is used by the "iexact" lookup, which also compares the
+        # upper-cased value of the field.
+        migrations.RunSQL(
+            ' CREATE INDEX contracts_contract_nlc_upper '
+            'ON contracts_contract (UPPER(_normalized_labor_category)); ',
+            ' DROP INDEX contracts_contract_nlc_upper; '
+        ),
+    ]
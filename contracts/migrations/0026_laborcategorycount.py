@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import logging
+
+from django.db import migrations, models
+
+
+logger = logging.getLogger('calc')
+
+
+def populate_labor_category_counts(apps, schema_editor):
+    schema_editor.execute(
+        'INSERT INTO contracts_laborcategorycount (labor_category, count) '
+        'SELECT _normalized_labor_category, COUNT(id) '
+        'FROM contracts_contract '
+        'WHERE current_price > 0 AND current_price IS NOT NULL '
+        'GROUP BY _normalized_labor_category'
+    )
+
+
+def create_trigram_index(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            logger.warning(
+                'The pg_trgm extension is not installed, so labor '
+                'category autocomplete will not be indexed.'
+            )
+            return
+    schema_editor.execute(
+        'CREATE INDEX contracts_laborcategorycount_upper_trgm '
+        'ON contracts_laborcategorycount '
+        'USING gin (UPPER(labor_category) gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    schema_editor.execute(
+        'DROP INDEX IF EXISTS contracts_laborcategorycount_upper_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contracts', '0025_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LaborCategoryCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('labor_category', models.TextField(unique=True)),
+                ('count', models.IntegerField()),
+            ],
+        ),
+        migrations.RunPython(populate_labor_category_counts,
+                             migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2018-08-06 15:12
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contracts', '0026_laborcategorycount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bulkuploadcontractsource',
+            name='converted_rows',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='bulkuploadcontractsource',
+            name='heading_indices',
+            field=django.contrib.postgres.fields.jsonb.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='bulkuploadcontractsource',
+            name='num_rows',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2018-08-09 14:27
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contracts', '0027_bulkuploadcontractsource_converted_rows'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bulkuploadcontractsource',
+            name='load_checkpoint',
+            field=django.contrib.postgres.fields.jsonb.JSONField(blank=True, null=True),
+        ),
+    ]
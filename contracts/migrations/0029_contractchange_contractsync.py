@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2018-08-13 16:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contracts', '0028_bulkuploadcontractsource_load_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContractChange',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('contract_id', models.IntegerField()),
+                ('kind', models.CharField(choices=[('I', 'Inserted'), ('U', 'Updated'), ('D', 'Deleted')], max_length=1)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ContractSync',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.TextField(unique=True)),
+                ('version', models.BigIntegerField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
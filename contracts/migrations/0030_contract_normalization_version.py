@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contracts', '0029_contractchange_contractsync'),
+    ]
+
+    operations = [
+        # Existing contracts are marked as normalized with an unknown
+        # version, so that `update_search_field --only-changed` examines
+        # all of them the first time it's run.
+        migrations.AddField(
+            model_name='contract',
+            name='normalization_version',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='contract',
+            name='normalization_version',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+    ]
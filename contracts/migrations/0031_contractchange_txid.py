@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2018-08-20 14:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contracts', '0030_contract_normalization_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contractchange',
+            name='txid',
+            field=models.BigIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='contractchange',
+            index=models.Index(fields=['txid', 'id'], name='contracts_c_txid_e449f3_idx'),
+        ),
+    ]
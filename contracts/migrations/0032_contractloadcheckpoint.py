@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2018-08-21 10:37
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contracts', '0031_contractchange_txid'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContractLoadCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.TextField(unique=True)),
+                ('next_page', models.IntegerField()),
+                ('end_page', models.IntegerField(blank=True, null=True)),
+                ('num_rates', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
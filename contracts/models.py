@@ -1,14 +1,23 @@
 import bleach
 import csv
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
 from decimal import Decimal
 
-from django.db import models, connection
+from django.db import models, connection, transaction
+from django.db.models import Count, Q
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.contrib.postgres.fields import JSONField
 from django.contrib.postgres.search import SearchVectorField, SearchVector
+from django.core.exceptions import EmptyResultSet
+from django.core.management.color import no_style
+from django.utils import timezone
 from django.utils.html import strip_tags
 
+from api.cache import bump_data_version
 from calc.utils import markdown_to_sanitized_html
+from .pg_copy import CopyFile
 
 EDUCATION_CHOICES = (
     ('HS', 'High School'),
@@ -22,6 +31,11 @@ MIN_ESCALATION_RATE = 0
 MAX_ESCALATION_RATE = 99
 NUM_CONTRACT_YEARS = 5
 
+# This should be incremented whenever Contract.normalize_labor_category()
+# changes, so that `manage.py update_search_field --only-changed` knows
+# which contracts were normalized with the old logic.
+LABOR_CATEGORY_NORMALIZATION_VERSION = 1
+
 
 def clean_search(query):
     '''
@@ -71,49 +85,279 @@ def clean_search(query):
     return terms
 
 
+def multi_phrase_search_filter(query, query_type='match_all',
+                               field='_normalized_labor_category'):
+    '''
+    Given a query as string, runs it through clean_search to get a list
+    of search terms, and returns a Q object that matches normalized
+    labor categories in the given field for any of those terms.
+
+    If `query_type` is 'match_exact', terms must match exactly;
+    otherwise, every word of a term must appear somewhere in the labor
+    category, unless the term is quoted, in which case the whole term
+    must.
+    '''
+
+    # Start with a filter that matches nothing, and then OR each
+    # term's matches onto it.
+    matches = Q(pk__in=[])
+    phrases = clean_search(query)
+    if query_type == 'match_exact':
+        # This will match each phrase they enter exactly.
+        for phrase in phrases:
+            matches |= Q(**{f'{field}__iexact': phrase})
+    else:
+        # Match any: Break phrases down into individual words
+        # So "business manager" finds results with "business" AND "manager"
+        # anywhere in the labor category.
+        # These case-insensitive substring matches are backed by a
+        # trigram index, so they don't require scanning every row.
+
+        for phrase in phrases:
+            # If the phrase is quoted, we want to use it as
+            if phrase.startswith("'") or phrase.startswith('"'):
+                matches |= Q(**{f'{field}__icontains': phrase})
+            else:
+                # Break out the individual words. Here, we only want results with AND matching.
+                # So 'business analyst' will only return phrases matching both words.
+                wmatches = Q()
+                for w in phrase.split(' '):
+                    wmatches &= Q(**{f'{field}__icontains': w})
+                # Now add the word matches onto the overall matches as an OR
+                matches |= wmatches
+    return matches
+
+
 class CurrentContractManager(models.Manager):
-    def bulk_update_normalized_labor_categories(self):
+    def bulk_update_normalized_labor_categories(self, only_changed=False,
+                                                dry_run=False,
+                                                batch_size=5000, workers=1,
+                                                progress=None):
         '''
         Iterate through all Contract models and update their
-        normalized labor categories if necessary.
+        normalized labor categories and search indexes if necessary,
+        returning the number of contracts that needed updating.
+
+        Contracts are read and updated in batches of `batch_size`, in
+        order of their ids, and each batch is committed separately,
+        so memory use and statement size stay constant regardless of
+        how many contracts there are. Unlike this manager's other
+        methods, contracts without a current price are included, so
+        that they're searchable if they get one.
+
+        If `only_changed` is true, only contracts that were last
+        normalized with an older LABOR_CATEGORY_NORMALIZATION_VERSION
+        are examined. If `dry_run` is true, nothing is written. If
+        `workers` is greater than one, labor categories are normalized
+        by a pool of that many processes.
+
+        After each batch, `progress` is called (if given) with the
+        number of contracts examined and updated so far, and the total
+        number to examine.
 
         This method does not trigger any pre/post save signals or
         call Contract.save().
         '''
 
-        pks = []
-        updates = []
+        contracts = self.model._base_manager.order_by('id')
+        if only_changed:
+            contracts = contracts.exclude(
+                normalization_version=LABOR_CATEGORY_NORMALIZATION_VERSION)
+        total = contracts.count() if progress else None
+        num_examined = 0
         num_updates = 0
-        for contract in self.only('id', 'labor_category', '_normalized_labor_category'):
-            if contract.update_normalized_labor_category():
-                pks.append(contract.id)
-                updates.append(contract.id)
-                updates.append(contract._normalized_labor_category)
-                num_updates += 1
-        if updates:
-            print("Updating {} rows.".format(num_updates))
-            with connection.cursor() as cursor:
-                values = []
-                for i in range(num_updates):
-                    values.append(r'(%s, %s)')
-                values_str = ", ".join(values)
-                sql = (  # nosec
-                    "UPDATE contracts_contract "
-                    "  SET _normalized_labor_category = v.nlc"
-                    "  FROM (VALUES" + values_str + ") AS v (id, nlc)"
-                    "  WHERE contracts_contract.id = v.id"
+        last_id = None
+        executor = ProcessPoolExecutor(workers) if workers > 1 else None
+
+        try:
+            while True:
+                batch = contracts
+                if last_id is not None:
+                    batch = batch.filter(id__gt=last_id)
+                batch = list(batch.values_list(
+                    'id', 'labor_category', '_normalized_labor_category',
+                    'normalization_version')[:batch_size])
+                if not batch:
+                    break
+                last_id = batch[-1][0]
+                num_examined += len(batch)
+                num_updates += self._update_normalized_batch(
+                    batch, dry_run, executor, workers)
+                if progress:
+                    progress(num_examined, num_updates, total)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        if num_updates and not dry_run:
+            bump_data_version()
+        return num_updates
+
+    def _update_normalized_batch(self, batch, dry_run, executor, workers):
+        categories = [labor_category for _, labor_category, _, _ in batch]
+        if executor is None:
+            normalized = normalize_labor_categories(categories)
+        else:
+            chunk_size = -(-len(categories) // workers)
+            chunks = [categories[i:i + chunk_size]
+                      for i in range(0, len(categories), chunk_size)]
+            normalized = [category for chunk in
+                          executor.map(normalize_labor_categories, chunks)
+                          for category in chunk]
+
+        updates = []
+        stale_ids = []
+        changed_categories = set()
+        for (pk, _, old, version), new in zip(batch, normalized):
+            if old != new:
+                updates.extend([pk, new])
+                changed_categories.update([old, new])
+            elif version != LABOR_CATEGORY_NORMALIZATION_VERSION:
+                stale_ids.append(pk)
+        num_updates = len(updates) // 2
+        if dry_run:
+            return num_updates
+
+        table = self.model._meta.db_table
+        with transaction.atomic(), connection.cursor() as cursor:
+            if updates:
+                values = ', '.join(['(%s, %s)'] * num_updates)
+                cursor.execute(  # nosec
+                    f'UPDATE {table} '
+                    f'  SET _normalized_labor_category = v.nlc,'
+                    f'      search_index = to_tsvector(v.nlc::text),'
+                    f'      normalization_version = %s'
+                    f'  FROM (VALUES {values}) AS v (id, nlc)'
+                    f'  WHERE {table}.id = v.id',
+                    [LABOR_CATEGORY_NORMALIZATION_VERSION, *updates]
+                )
+                LaborCategoryCount.objects.refresh(changed_categories)
+            if stale_ids:
+                cursor.execute(  # nosec
+                    f'UPDATE {table} SET normalization_version = %s '
+                    f'WHERE id = ANY(%s)',
+                    [LABOR_CATEGORY_NORMALIZATION_VERSION, stale_ids]
                 )
-                cursor.execute(sql, updates)
-            self.filter(pk__in=pks).update_search_index()
         return num_updates
 
     def bulk_create(self, contracts, *args, **kwargs):
         for contract in contracts:
             contract.update_normalized_labor_category()
-        contracts = super().bulk_create(contracts, *args, **kwargs)
+        with transaction.atomic():
+            contracts = super().bulk_create(contracts, *args, **kwargs)
+            ContractChange.objects.record(ContractChange.INSERTED,
+                                          [c.pk for c in contracts])
         self.filter(pk__in=[c.pk for c in contracts]).update_search_index()
+        LaborCategoryCount.objects.refresh(
+            c._normalized_labor_category for c in contracts)
+        bump_data_version()
         return contracts
 
+    def copy_create(self, contracts, keep_ids=False):
+        '''
+        Like bulk_create(), but streams the given unsaved contracts
+        (which may be any iterable, such as a generator) into the
+        database with PostgreSQL's COPY, via a temporary staging table.
+        Rather than Contract models, the contracts may also be dicts
+        mapping field attribute names to values, which saves the cost
+        of constructing models for them.
+
+        Normalized labor categories are computed as the contracts are
+        streamed, and search indexes as they're moved from the staging
+        table, so every contract is only written once rather than being
+        inserted and then updated.
+
+        Unlike bulk_create(), the contracts aren't given primary keys,
+        unless `keep_ids` is true, in which case the primary keys they
+        already have are inserted along with them.
+        Returns the number of contracts created.
+        '''
+
+        return self._copy(contracts, update=False, keep_ids=keep_ids)
+
+    def copy_update(self, contracts):
+        '''
+        Like copy_create(), but overwrites every field of the existing
+        contracts with the primary keys of the given ones. Returns the
+        number of contracts given.
+        '''
+
+        return self._copy(contracts, update=True)
+
+    def _copy(self, contracts, update, keep_ids=False):
+        fields = [f for f in self.model._meta.concrete_fields
+                  if f.name != 'search_index' and
+                  (update or keep_ids or f.name != 'id')]
+        table = self.model._meta.db_table
+        staging_table = f'{table}_staging'
+        columns = [connection.ops.quote_name(f.column) for f in fields]
+        column_list = ', '.join(columns)
+        field_defaults = {f.attname: f.get_default() for f in fields}
+        categories = set()
+        num_contracts = 0
+
+        def iter_rows():
+            nonlocal num_contracts
+            for contract in contracts:
+                if isinstance(contract, dict):
+                    values = {**field_defaults, **contract}
+                    values['_normalized_labor_category'] = \
+                        self.model.normalize_labor_category(
+                            values['labor_category'])
+                else:
+                    contract.update_normalized_labor_category()
+                    values = {f.attname: f.pre_save(contract, True)
+                              for f in fields}
+                categories.add(values['_normalized_labor_category'])
+                num_contracts += 1
+                yield [f.get_db_prep_save(values[f.attname], connection)
+                       for f in fields]
+
+        search_index = \
+            "to_tsvector(COALESCE(s._normalized_labor_category, ''))"
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(  # nosec
+                f'CREATE TEMPORARY TABLE {staging_table} AS '
+                f'SELECT {column_list} FROM {table} WITH NO DATA'
+            )
+            cursor.copy_expert(  # nosec
+                f'COPY {staging_table} ({column_list}) FROM STDIN',
+                CopyFile(iter_rows())
+            )
+            if update:
+                # The labor categories being replaced need recounting too.
+                cursor.execute(  # nosec
+                    f'SELECT DISTINCT c._normalized_labor_category '
+                    f'FROM {table} c JOIN {staging_table} s ON c.id = s.id'
+                )
+                categories.update(row[0] for row in cursor.fetchall())
+                assignments = ', '.join(
+                    f'{column} = s.{column}'
+                    for f, column in zip(fields, columns) if f.name != 'id')
+                ContractChange.objects.record_statement(
+                    ContractChange.UPDATED,
+                    f'UPDATE {table} SET {assignments}, '
+                    f'search_index = {search_index} '
+                    f'FROM {staging_table} s WHERE {table}.id = s.id '
+                    f'RETURNING {table}.id'
+                )
+            else:
+                ContractChange.objects.record_statement(
+                    ContractChange.INSERTED,
+                    f'INSERT INTO {table} ({column_list}, search_index) '
+                    f'SELECT {column_list}, {search_index} '
+                    f'FROM {staging_table} s RETURNING id'
+                )
+                if keep_ids:
+                    for sql in connection.ops.sequence_reset_sql(
+                            no_style(), [self.model]):
+                        cursor.execute(sql)
+            cursor.execute(f'DROP TABLE {staging_table}')  # nosec
+            LaborCategoryCount.objects.refresh(categories)
+            bump_data_version()
+        return num_contracts
+
     def multi_phrase_search(self, query, *args, **kwargs):
         """
         Given a query as string, runs it through clean_search to get a list of search terms,
@@ -123,37 +367,9 @@ class CurrentContractManager(models.Manager):
             'match_exact' only returns exact matches.
             'match_any" matches any word, so "business manager" will also match "dev manager"
         """
-        matches = Contract.objects.none()
-        qs = self.get_queryset()
-        phrases = clean_search(query)
-        if 'match_exact' in args:
-            # This will match each phrase they enter exactly.
-            # We use an or operator here to build up the total queryset from
-            # each exactly matched item they found.
-            for phrase in phrases:
-                matches = matches | qs.filter(_normalized_labor_category__iexact=phrase)
-        else:
-            # Match any: Break phrases down into individual words
-            # So "business manager" finds results with "business" AND "manager"
-            # anywhere in the labor category.
-            # Note this is relatively hard on the DB, producing one query per word,
-            # but given our number of users, small queries and indexing, we should be OK.
-
-            for phrase in phrases:
-                # If the phrase is quoted, we want to use it as
-                if phrase.startswith("'") or phrase.startswith('"'):
-                    matches = matches | qs.filter(_normalized_labor_category__icontains=phrase)
-                else:
-                    # Break out the individual words. Here, we only want results with AND matching.
-                    # So 'business analyst' will only return phrases matching both words.
-                    words = phrase.split(' ')
-                    # We need a starter queryset for the intersection
-                    wmatches = qs.filter(_normalized_labor_category__icontains=words[0])
-                    for w in words:
-                        wmatches = wmatches & qs.filter(_normalized_labor_category__icontains=w)
-                    # Now add the word matches onto the overall matches as an OR
-                    matches = matches | wmatches
-        return matches
+        query_type = 'match_exact' if 'match_exact' in args else 'match_all'
+        return self.get_queryset().filter(
+            multi_phrase_search_filter(query, query_type))
 
     def search(self, *args, **kwargs):
         return self.get_queryset().search(*args, **kwargs)
@@ -164,8 +380,23 @@ class CurrentContractManager(models.Manager):
             .exclude(current_price__isnull=True)
 
 
+def normalize_labor_categories(categories):
+    '''
+    Return the normalized versions of the given labor categories. This
+    is a module-level function so that it can be run in a process pool.
+    '''
+
+    return [Contract.normalize_labor_category(category)
+            for category in categories]
+
+
 class ContractsQuerySet(models.QuerySet):
 
+    def delete(self):
+        with transaction.atomic():
+            ContractChange.objects.record(ContractChange.DELETED, self)
+            return super().delete()
+
     def search(self, query):
         return self.filter(search_index=query)
 
@@ -227,6 +458,20 @@ class BulkUploadContractSource(models.Model):
     procurement_center = models.CharField(
         db_index=True, max_length=5, choices=PROCUREMENT_CENTER_CHOICES)
 
+    # The rows of original_file, converted and packed when it was
+    # uploaded, along with metadata about them, so that later steps
+    # don't need to parse it again. These are null for files uploaded
+    # before they were added. See data_capture.r10_spreadsheet_converter.
+    converted_rows = models.BinaryField(null=True, blank=True)
+    num_rows = models.IntegerField(null=True, blank=True)
+    heading_indices = JSONField(null=True, blank=True)
+
+    # The running totals of a checkpointed load of this upload which
+    # hasn't finished yet, saved along with each batch of contracts it
+    # writes, so that it can resume where it left off if interrupted.
+    # See data_capture.jobs.
+    load_checkpoint = JSONField(null=True, blank=True)
+
 
 class CashField(models.DecimalField):
     '''
@@ -340,9 +585,21 @@ class Contract(models.Model):
     #   https://github.com/18F/calc/issues/1033
     sin = models.TextField(null=True, blank=True)
 
+    # In addition to the default B-tree index, this field has a
+    # trigram-based GIN index on its upper-cased value (see migration
+    # 0025), which allows the case-insensitive substring matching
+    # done by CurrentContractManager.multi_phrase_search() to be
+    # indexed.
     _normalized_labor_category = models.TextField(db_index=True, blank=True)
 
-    search_index = SearchVectorField(default='', db_index=True, editable=False)
+    # The LABOR_CATEGORY_NORMALIZATION_VERSION that
+    # _normalized_labor_category was computed with.
+    normalization_version = models.PositiveSmallIntegerField(
+        default=LABOR_CATEGORY_NORMALIZATION_VERSION)
+
+    # This field has a GIN index (see migration 0009); a B-tree index
+    # would be useless for full-text search.
+    search_index = SearchVectorField(default='', editable=False)
 
     upload_source = models.ForeignKey(
         BulkUploadContractSource,
@@ -375,8 +632,9 @@ class Contract(models.Model):
         '''
 
         # Note also that any logic changes to this code should
+        # increment LABOR_CATEGORY_NORMALIZATION_VERSION, and
         # eventually be followed-up with
-        # `manage.py update_search_field`. Otherwise,
+        # `manage.py update_search_field --only-changed`. Otherwise,
         # all pre-existing contracts will still have search
         # index information corresponding to the old logic.
 
@@ -396,12 +654,16 @@ class Contract(models.Model):
         return val
 
     def get_readable_business_size(self):
+        return self.readable_business_size(self.business_size)
+
+    @staticmethod
+    def readable_business_size(business_size):
         """
         There appears to be a mismatch between how we store business size
         in the DB and how we collect it in form submissions that makes startswith
         a safer check than equivalency
         """
-        if self.business_size.lower().startswith('s'):
+        if business_size.lower().startswith('s'):
             return 'small business'
         else:  # We expect it should be 'o' but are not locking it down.
             return 'other than small business'
@@ -527,14 +789,346 @@ class Contract(models.Model):
 
     def update_normalized_labor_category(self):
         val = self.normalize_labor_category(self.labor_category)
+        self.normalization_version = LABOR_CATEGORY_NORMALIZATION_VERSION
         if self._normalized_labor_category != val:
             self._normalized_labor_category = val
             return True
         return False
 
     def save(self, *args, **kwargs):
+        previous_category = self._normalized_labor_category
         self.update_normalized_labor_category()
-        super().save(*args, **kwargs)
+        kind = ContractChange.INSERTED if self._state.adding else \
+            ContractChange.UPDATED
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            ContractChange.objects.record(kind, [self.pk])
+        LaborCategoryCount.objects.refresh(
+            [previous_category, self._normalized_labor_category])
+
+    def delete(self, *args, **kwargs):
+        pk = self.pk
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            ContractChange.objects.record(ContractChange.DELETED, [pk])
+        LaborCategoryCount.objects.refresh([self._normalized_labor_category])
+        return result
+
+
+class LaborCategoryCountManager(models.Manager):
+    def refresh(self, categories=None):
+        '''
+        Recompute the number of current contracts for each of the given
+        normalized labor categories, or for all of them if no
+        categories are given.
+
+        Counts are upserted, and only categories that no longer have
+        any contracts are deleted, so concurrent refreshes of the same
+        categories can't collide on their unique constraint.
+        '''
+
+        existing = self.all()
+        contracts = Contract.objects.all()
+        if categories is not None:
+            categories = list(set(categories))
+            if not categories:
+                return
+            existing = existing.filter(labor_category__in=categories)
+            contracts = contracts.filter(
+                _normalized_labor_category__in=categories)
+        counts = contracts.order_by()\
+            .values_list('_normalized_labor_category')\
+            .annotate(count=Count('id'))
+        counts_sql, params = counts.query.sql_with_params()
+        table = self.model._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(  # nosec
+                "INSERT INTO " + table +
+                "  (labor_category, count) " + counts_sql +
+                " ON CONFLICT (labor_category) DO UPDATE"
+                "  SET count = EXCLUDED.count"
+                "  WHERE " + table + ".count <> EXCLUDED.count",
+                params
+            )
+        existing.exclude(labor_category__in=contracts.values(
+            '_normalized_labor_category')).delete()
+
+    def multi_phrase_search(self, query, query_type='match_all'):
+        '''
+        Like CurrentContractManager.multi_phrase_search(), but returns
+        the matching labor categories rather than individual contracts.
+        '''
+
+        return self.filter(multi_phrase_search_filter(
+            query, query_type, field='labor_category'))
+
+
+class LaborCategoryCount(models.Model):
+    '''
+    The number of current contracts with each normalized labor
+    category. This is used to quickly provide autocomplete suggestions
+    without having to aggregate every matching contract.
+
+    It is kept up-to-date when individual contracts are saved or
+    deleted, and by CurrentContractManager.bulk_create() and
+    copy_create(); anything else
+    that changes contracts in bulk (e.g. by deleting a queryset) should
+    call `LaborCategoryCount.objects.refresh()` when it's done.
+    '''
+
+    labor_category = models.TextField(unique=True)
+
+    count = models.IntegerField()
+
+    objects = LaborCategoryCountManager()
+
+    def __str__(self):
+        return f'{self.labor_category} ({self.count})'
+
+
+class ContractChangeManager(models.Manager):
+    # The id of the oldest transaction that's still running.
+    XMIN_SQL = 'txid_snapshot_xmin(txid_current_snapshot())'
+
+    def published(self):
+        '''
+        Return the changes made by transactions that are known to have
+        finished, along with any made by the current transaction.
+
+        Transactions don't necessarily commit in the order of their
+        ids, so a change made by one that is still running could
+        otherwise appear after changes that come later than it in the
+        log have already been read. Every transaction with a lower id
+        than the oldest one still running has finished, though, so no
+        new change can ever appear before one of these.
+        '''
+
+        where = f'txid < {self.XMIN_SQL}'
+        current = self._current_txid_sql()
+        if current is not None:
+            where = f'CASE WHEN {where} THEN true ELSE txid = {current} END'
+        # The SQL is all our own.
+        return self.extra(where=[where])  # nosec
+
+    def unpublished(self):
+        '''
+        Return the committed changes that published() doesn't return
+        yet, because a transaction that started before they were made
+        is still running.
+        '''
+
+        where = [f'txid >= {self.XMIN_SQL}']
+        current = self._current_txid_sql()
+        if current is not None:
+            where.append(f'txid IS DISTINCT FROM {current}')
+        return self.extra(where=where)  # nosec
+
+    @staticmethod
+    def _current_txid_sql():
+        '''
+        Return SQL for the id of the current transaction, if it has
+        one, without giving it one if it doesn't, since that would
+        hold back what other transactions can publish until it ends.
+        '''
+
+        if connection.pg_version >= 100000:
+            return 'txid_current_if_assigned()'
+        # Before PostgreSQL 10, the only way to find out is to assign
+        # one. Only transactions we started could have made changes.
+        if connection.in_atomic_block:
+            return 'txid_current()'
+        return None
+
+    def record(self, kind, contracts):
+        '''
+        Record a change of the given kind to each of the given
+        contracts, which may be a queryset or a list of primary keys.
+        '''
+
+        if isinstance(contracts, models.QuerySet):
+            try:
+                ids_sql, params = contracts.order_by().values('id')\
+                    .query.sql_with_params()
+            except EmptyResultSet:
+                return
+        else:
+            ids = [pk for pk in contracts if pk is not None]
+            if not ids:
+                return
+            ids_sql, params = 'SELECT unnest(%s) AS id', [ids]
+        self.record_statement(kind, ids_sql, params)
+
+    def record_statement(self, kind, sql, params=()):
+        '''
+        Execute the given SQL statement, which must return the ids of
+        the contracts it changes, and record a change of the given kind
+        to each of them.
+        '''
+
+        with connection.cursor() as cursor:
+            cursor.execute(  # nosec
+                "WITH changed AS (" + sql + ") "
+                "INSERT INTO " + self.model._meta.db_table +
+                "  (contract_id, kind, txid, created_at) "
+                "SELECT id, %s, txid_current(), now() FROM changed",
+                [*params, kind]
+            )
+
+    def get_version(self):
+        '''
+        Return the id of the latest published change, or 0 if there are
+        none.
+        '''
+
+        latest = self.published().order_by('-txid', '-id')\
+            .values_list('id', flat=True).first()
+        return latest or 0
+
+    def after(self, version):
+        '''
+        Return the published changes that come after the given version,
+        in order, raising ContractChange.DoesNotExist if there's no
+        such version, or if changes after it may have been deleted by
+        delete_expired().
+        '''
+
+        changes = self.published().order_by('txid', 'id')
+        if not version:
+            # Version 0 comes before every change, so it's only still
+            # valid if none of them can have expired yet.
+            if self.filter(created_at__lt=self._expiry_cutoff()).exists():
+                raise self.model.DoesNotExist()
+            return changes
+        txid = self.values_list('txid', flat=True).get(id=version)
+        return changes.filter(Q(txid=txid, id__gt=version) |
+                              Q(txid__gt=txid))
+
+    @staticmethod
+    def _expiry_cutoff():
+        return timezone.now() - timedelta(
+            days=settings.CONTRACT_CHANGE_MAX_AGE_DAYS)
+
+    def delete_expired(self):
+        '''
+        Delete the changes that were made more than
+        `settings.CONTRACT_CHANGE_MAX_AGE_DAYS` days ago, along with any
+        that come before them, and return how many were deleted.
+
+        The latest expired change is kept, so that the versions after
+        it can still be told apart from the deleted ones by after().
+        '''
+
+        latest = self.published().filter(
+            created_at__lt=self._expiry_cutoff()
+        ).order_by('-txid', '-id').values_list('txid', 'id').first()
+        if latest is None:
+            return 0
+        txid, id = latest
+        count, _ = self.filter(Q(txid=txid, id__lt=id) |
+                               Q(txid__lt=txid)).delete()
+        return count
+
+
+class ContractChange(models.Model):
+    '''
+    A log of the contracts that have been inserted, updated or deleted,
+    which lets other CALC instances fetch only what has changed since
+    they last synced, via /api/rates/changes/.
+
+    It is written by Contract.save() and delete(), and in bulk by
+    CurrentContractManager.bulk_create(), copy_create(), copy_update()
+    and ContractsQuerySet.delete(); anything else that changes
+    contracts in bulk should call `ContractChange.objects.record()`.
+
+    Changes are ordered by the id of the transaction that made them,
+    and only published once every transaction that could come before
+    them has finished (see ContractChangeManager.published()), so
+    writers never have to wait for each other. The id of a published
+    change is thus a version of the contracts data: once a version is
+    visible, no change that comes before it can appear later.
+
+    Changes are kept for `settings.CONTRACT_CHANGE_MAX_AGE_DAYS` days,
+    after which they're deleted by the RQ scheduler (see
+    ContractChangeManager.delete_expired()), and anything syncing from
+    a version older than that has to load every rate again.
+    '''
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['txid', 'id']),
+        ]
+
+    INSERTED = 'I'
+    UPDATED = 'U'
+    DELETED = 'D'
+
+    KIND_CHOICES = (
+        (INSERTED, 'Inserted'),
+        (UPDATED, 'Updated'),
+        (DELETED, 'Deleted'),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+
+    # This isn't a foreign key, because it outlives deleted contracts.
+    contract_id = models.IntegerField()
+
+    kind = models.CharField(max_length=1, choices=KIND_CHOICES)
+
+    # The id of the transaction that made the change, as returned by
+    # PostgreSQL's txid_current().
+    txid = models.BigIntegerField()
+
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    objects = ContractChangeManager()
+
+    def __str__(self):
+        return f'{self.get_kind_display()} contract {self.contract_id}'
+
+
+class ContractSync(models.Model):
+    '''
+    The version of another CALC instance's contracts data (see
+    ContractChange) that was last copied from its API by
+    `load_api_data --incremental`.
+    '''
+
+    url = models.TextField(unique=True)
+
+    version = models.BigIntegerField()
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.url} (version {self.version})'
+
+
+class ContractLoadCheckpoint(models.Model):
+    '''
+    The progress of a `load_api_data` run from another CALC instance's
+    API. It's saved in the same transaction as each page of rates the
+    run writes, so that an interrupted run can be resumed from the page
+    after the last one it wrote, without writing any page twice.
+    '''
+
+    url = models.TextField(unique=True)
+
+    next_page = models.IntegerField()
+
+    end_page = models.IntegerField(null=True, blank=True)
+
+    num_rates = models.IntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def advance(self, num_rates):
+        self.next_page += 1
+        self.num_rates += num_rates
+        self.save()
+
+    def __str__(self):
+        return f'{self.url} (page {self.next_page})'
 
 
 class ScheduleMetadata(models.Model):
@@ -590,5 +1184,16 @@ class ScheduleMetadata(models.Model):
     def description_html(self):
         return markdown_to_sanitized_html(self.description)
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # This is served by /api/schedules/, so cached responses need
+        # to be invalidated.
+        bump_data_version()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        bump_data_version()
+        return result
+
     def __str__(self):
         return self.full_name
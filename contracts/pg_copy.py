@@ -0,0 +1,68 @@
+'''
+Helpers for streaming rows into PostgreSQL with `COPY ... FROM STDIN`,
+which is much faster than sending `INSERT` statements.
+
+Rows are encoded in COPY's text format, which is described at:
+
+    https://www.postgresql.org/docs/current/static/sql-copy.html
+'''
+
+from typing import Any, Iterable, Iterator, List, Sequence
+
+
+NULL = '\\N'
+
+ESCAPES = str.maketrans({
+    '\\': '\\\\',
+    '\t': '\\t',
+    '\n': '\\n',
+    '\r': '\\r',
+})
+
+
+def format_value(value: Any) -> str:
+    r'''
+    Encode the given value for COPY's text format, e.g.:
+
+        >>> print(format_value(None), format_value('one\ttwo'))
+        \N one\ttwo
+    '''
+
+    if value is None:
+        return NULL
+    return str(value).translate(ESCAPES)
+
+
+def format_row(row: Sequence[Any]) -> str:
+    '''
+    Encode the given row as a line of COPY's text format.
+    '''
+
+    return '\t'.join(map(format_value, row)) + '\n'
+
+
+class CopyFile:
+    '''
+    A read-only file-like object containing the given rows in COPY's
+    text format, which is encoded lazily as psycopg2 reads it, so the
+    rows can come from a generator without ever all being in memory.
+    '''
+
+    def __init__(self, rows: Iterable[Sequence[Any]]) -> None:
+        self.lines: Iterator[str] = map(format_row, rows)
+        self.buffer = ''
+
+    def read(self, size: int=-1) -> str:
+        chunks: List[str] = [self.buffer]
+        length = len(self.buffer)
+        while size < 0 or length < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            chunks.append(line)
+            length += len(line)
+        data = ''.join(chunks)
+        if size < 0:
+            size = length
+        self.buffer = data[size:]
+        return data[:size]
@@ -1,13 +1,21 @@
 import datetime
+import io
+import random
 from unittest.mock import patch
 from decimal import Decimal
 from itertools import cycle
 
-from django.db import connection
-from django.test import TestCase, SimpleTestCase
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import (TestCase, SimpleTestCase, TransactionTestCase,
+                         override_settings)
+from django.utils import timezone
 from contracts.mommy_recipes import get_contract_recipe
 
-from ..models import Contract, CashField
+from ..benchmarks import make_labor_category
+from ..models import (Contract, CashField, ContractChange,
+                      LaborCategoryCount, LABOR_CATEGORY_NORMALIZATION_VERSION,
+                      clean_search)
 
 
 _normalize = Contract.normalize_labor_category
@@ -74,7 +82,7 @@ class ContractTestCase(TestCase):
         self.assertEqual(update(), 0)
 
         with patch.object(Contract, 'normalize_labor_category',
-                          lambda self, val: 'lol ' + val):
+                          staticmethod(lambda val: 'lol ' + val)):
             self.assertEqual(update(), 2)
 
         c1.refresh_from_db()
@@ -85,6 +93,66 @@ class ContractTestCase(TestCase):
         results = Contract.objects.multi_phrase_search('lol foo')
         self.assertEqual([r.labor_category for r in results], ['foo'])
 
+    def test_bulk_update_normalized_labor_categories_works_in_batches(self):
+        update = Contract.objects.bulk_update_normalized_labor_categories
+        get_contract_recipe().make(labor_category='jr foo', _quantity=3)
+        Contract.objects.update(_normalized_labor_category='stale')
+        progress = []
+
+        self.assertEqual(update(batch_size=2, workers=2,
+                                progress=lambda *args: progress.append(args)),
+                         3)
+        self.assertEqual(progress, [(2, 2, 3), (3, 3, 3)])
+        self.assertEqual(
+            list(Contract.objects.search('junior').values_list(
+                '_normalized_labor_category', flat=True)),
+            ['junior foo'] * 3)
+        self.assertEqual(LaborCategoryCount.objects.get(
+            labor_category='junior foo').count, 3)
+
+    def test_bulk_update_normalized_labor_categories_dry_run(self):
+        update = Contract.objects.bulk_update_normalized_labor_categories
+        c = get_contract_recipe().make(labor_category='jr foo')
+        Contract.objects.update(_normalized_labor_category='stale',
+                                normalization_version=0)
+
+        self.assertEqual(update(dry_run=True), 1)
+        c.refresh_from_db()
+        self.assertEqual(c._normalized_labor_category, 'stale')
+        self.assertEqual(c.normalization_version, 0)
+
+    def test_bulk_update_normalized_labor_categories_only_changed(self):
+        update = Contract.objects.bulk_update_normalized_labor_categories
+        old, current = get_contract_recipe().make(
+            labor_category='jr foo', _quantity=2)
+        Contract.objects.update(_normalized_labor_category='stale')
+        Contract.objects.filter(pk=old.pk).update(normalization_version=0)
+
+        self.assertEqual(update(only_changed=True), 1)
+        old.refresh_from_db()
+        current.refresh_from_db()
+        self.assertEqual(old._normalized_labor_category, 'junior foo')
+        self.assertEqual(old.normalization_version,
+                         LABOR_CATEGORY_NORMALIZATION_VERSION)
+        self.assertEqual(current._normalized_labor_category, 'stale')
+
+    def test_bulk_update_normalized_labor_categories_stamps_version(self):
+        c = get_contract_recipe().make(labor_category='foo')
+        Contract.objects.update(normalization_version=0)
+
+        self.assertEqual(
+            Contract.objects.bulk_update_normalized_labor_categories(), 0)
+        c.refresh_from_db()
+        self.assertEqual(c.normalization_version,
+                         LABOR_CATEGORY_NORMALIZATION_VERSION)
+
+    def test_update_search_field_command_reports_progress(self):
+        get_contract_recipe().make(labor_category='foo')
+        out = io.StringIO()
+        call_command('update_search_field', '--dry-run', stdout=out)
+        self.assertIn('1 of 1 contracts examined', out.getvalue())
+        self.assertIn('0 contracts would be updated', out.getvalue())
+
     def test_update_normalized_labor_category_returns_bool(self):
         c = get_contract_recipe().prepare(labor_category='jr person')
         self.assertTrue(c.update_normalized_labor_category())
@@ -106,6 +174,80 @@ class ContractTestCase(TestCase):
         c = Contract.objects.all()[0]
         self.assertEqual(c._normalized_labor_category, 'junior person')
 
+    def test_copy_create_matches_bulk_create(self):
+        def make_contracts():
+            return [
+                get_contract_recipe().prepare(
+                    labor_category=category, sin=sin, contract_end=end,
+                    hourly_rate_year1=Decimal('12.5'), current_price=price)
+                for category, sin, end, price in [
+                    ('jr person', 'tab\there', None, Decimal('12.50')),
+                    ('Sr. Engineer\\II', 'new\nline\r', datetime.date(
+                        2020, 1, 31), Decimal('99.99')),
+                    ('unicode \u2603', None, None, Decimal('10.30')),
+                ]
+            ]
+
+        fields = [f.name for f in Contract._meta.concrete_fields
+                  if f.name != 'id']
+
+        def get_rows():
+            return list(Contract.objects.order_by('labor_category')
+                        .values_list(*fields))
+
+        Contract.objects.bulk_create(make_contracts())
+        expected = get_rows()
+        Contract.objects.all().delete()
+
+        self.assertEqual(Contract.objects.copy_create(
+            c for c in make_contracts()), 3)
+        self.assertEqual(get_rows(), expected)
+        self.assertEqual(
+            [r.labor_category for r in
+             Contract.objects.multi_phrase_search('senior engineer')],
+            ['Sr. Engineer\\II'])
+
+    def test_copy_create_accepts_dicts_of_values(self):
+        Contract.objects.copy_create([{
+            'labor_category': 'Sr. Person',
+            'idv_piid': 'GS-123',
+            'vendor_name': 'Foo',
+            'min_years_experience': 1,
+            'hourly_rate_year1': 10.5,
+            'current_price': 10.5,
+        }])
+        contract = Contract.objects.get()
+        self.assertEqual(contract._normalized_labor_category, 'senior person')
+        self.assertEqual(contract.current_price, Decimal('10.50'))
+        self.assertIsNone(contract.education_level)
+        self.assertEqual(
+            [c.labor_category for c in
+             Contract.objects.multi_phrase_search('senior person')],
+            ['Sr. Person'])
+
+    def test_copy_update_works(self):
+        contract = get_contract_recipe().make(labor_category='Engineer')
+        Contract.objects.copy_update([{
+            'id': contract.id,
+            'labor_category': 'Jr. Manager',
+            'idv_piid': 'GS-123',
+            'vendor_name': 'Foo',
+            'min_years_experience': 1,
+            'hourly_rate_year1': 10.5,
+            'current_price': 10.5,
+        }])
+        contract = Contract.objects.get()
+        self.assertEqual(contract._normalized_labor_category, 'junior manager')
+        self.assertEqual(contract.vendor_name, 'Foo')
+        self.assertEqual(
+            list(LaborCategoryCount.objects.values_list('labor_category',
+                                                        flat=True)),
+            ['junior manager'])
+
+    def test_copy_create_works_with_no_contracts(self):
+        self.assertEqual(Contract.objects.copy_create([]), 0)
+        self.assertEqual(Contract.objects.copy_create([]), 0)
+
     def test_readable_business_size(self):
         business_sizes = ('O', 'S')
         contract1, contract2 = get_contract_recipe().make(
@@ -415,6 +557,320 @@ class ContractSearchTestCase(BaseContractSearchTestCase):
         ])
 
 
+def reference_multi_phrase_search(contracts, query, query_type='match_all'):
+    '''
+    A straightforward Python implementation of the semantics of
+    CurrentContractManager.multi_phrase_search(), used to make sure
+    the database query it builds returns the right results.
+    '''
+
+    phrases = [p.upper() for p in clean_search(query)]
+    results = []
+    for contract in contracts:
+        category = contract._normalized_labor_category.upper()
+        if query_type == 'match_exact':
+            matched = category in phrases
+        else:
+            matched = any(
+                (phrase in category) if phrase.startswith(("'", '"'))
+                else all(word in category for word in phrase.split(' '))
+                for phrase in phrases
+            )
+        if matched:
+            results.append(contract)
+    return results
+
+
+class MultiPhraseSearchParityTests(BaseContractSearchTestCase):
+    CATEGORIES = [
+        make_labor_category(random.Random(i)) for i in range(60)
+    ] + [
+        'Sr. Engineer',
+        'Engineering Manager',
+        'SME - Policy',
+        'Jr. Analyst, Data',
+        'Senior Subject Matter Expert II',
+        'Analyst/Engineer',
+        'Manager',
+    ]
+
+    QUERIES = [
+        'engineer',
+        'Engineer',
+        'engineer, analyst',
+        'senior engineer',
+        'sr engineer',
+        'sme',
+        'jr. analyst',
+        'manager ii',
+        'analyst, data',
+        '"analyst, data"',
+        'gineer',
+        'manager, senior subject matter expert ii',
+        'nonexistent',
+        'subject matter expert',
+        'Program Manager III, Trainer',
+        'a',
+    ]
+
+    def assertMatchesReference(self, query, query_type):
+        expected = reference_multi_phrase_search(
+            Contract.objects.all(), query, query_type)
+        results = Contract.objects.multi_phrase_search(query, query_type)
+        self.assertEqual(
+            sorted(c.id for c in results),
+            sorted(c.id for c in expected),
+            f'results differ for {query_type} search of "{query}"'
+        )
+
+    def test_match_all(self):
+        for query in self.QUERIES:
+            self.assertMatchesReference(query, 'match_all')
+
+    def test_match_phrase(self):
+        for query in self.QUERIES:
+            self.assertMatchesReference(query, 'match_phrase')
+
+    def test_match_exact(self):
+        for query in self.QUERIES + [c.lower() for c in self.CATEGORIES]:
+            self.assertMatchesReference(query, 'match_exact')
+
+    def test_each_word_is_only_filtered_once(self):
+        results = Contract.objects.multi_phrase_search(
+            'business analyst, project manager')
+        self.assertEqual(str(results.query).count(' LIKE '), 4)
+
+
+class LaborCategoryCountTests(TestCase):
+    def get_counts(self):
+        return dict(LaborCategoryCount.objects.values_list(
+            'labor_category', 'count'))
+
+    def make_contracts(self, *categories, **kwargs):
+        return get_contract_recipe().make(
+            _quantity=len(categories),
+            labor_category=cycle(categories),
+            **kwargs
+        )
+
+    def test_save_updates_counts(self):
+        self.make_contracts('Engineer', 'Sr. Engineer', 'Engineer')
+        self.assertEqual(self.get_counts(), {
+            'engineer': 2,
+            'senior engineer': 1,
+        })
+
+    def test_changing_category_updates_counts(self):
+        contract = self.make_contracts('Engineer', 'Engineer')[0]
+        contract.labor_category = 'Manager'
+        contract.save()
+        self.assertEqual(self.get_counts(), {
+            'engineer': 1,
+            'manager': 1,
+        })
+
+    def test_delete_updates_counts(self):
+        contracts = self.make_contracts('Engineer', 'Manager')
+        contracts[0].delete()
+        self.assertEqual(self.get_counts(), {'manager': 1})
+
+    def test_bulk_create_updates_counts(self):
+        Contract.objects.bulk_create([
+            Contract(labor_category=category, current_price=10,
+                     hourly_rate_year1=10, idv_piid='GS-123',
+                     vendor_name='Foo', min_years_experience=1)
+            for category in ['Engineer', 'Manager', 'engineer']
+        ])
+        self.assertEqual(self.get_counts(), {
+            'engineer': 2,
+            'manager': 1,
+        })
+
+    def test_copy_create_updates_counts(self):
+        Contract.objects.copy_create(
+            Contract(labor_category=category, current_price=10,
+                     hourly_rate_year1=10, idv_piid='GS-123',
+                     vendor_name='Foo', min_years_experience=1)
+            for category in ['Engineer', 'Manager', 'engineer']
+        )
+        self.assertEqual(self.get_counts(), {
+            'engineer': 2,
+            'manager': 1,
+        })
+
+    def test_contracts_without_current_prices_are_not_counted(self):
+        self.make_contracts('Engineer', 'Manager',
+                            current_price=cycle([10, None]))
+        self.assertEqual(self.get_counts(), {'engineer': 1})
+
+    def test_refresh_recomputes_all_counts(self):
+        self.make_contracts('Engineer', 'Manager')
+        Contract.objects.filter(labor_category='Manager').delete()
+        LaborCategoryCount.objects.filter(labor_category='engineer')\
+            .update(count=50)
+        LaborCategoryCount.objects.refresh()
+        self.assertEqual(self.get_counts(), {'engineer': 1})
+
+    def test_refresh_only_recomputes_given_categories(self):
+        self.make_contracts('Engineer', 'Manager')
+        LaborCategoryCount.objects.update(count=50)
+        LaborCategoryCount.objects.refresh(['engineer'])
+        self.assertEqual(self.get_counts(), {
+            'engineer': 1,
+            'manager': 50,
+        })
+
+    def test_refresh_updates_existing_counts_in_place(self):
+        self.make_contracts('Engineer', 'Manager')
+        ids = dict(LaborCategoryCount.objects.values_list(
+            'labor_category', 'id'))
+        LaborCategoryCount.objects.update(count=50)
+        LaborCategoryCount.objects.refresh()
+        self.assertEqual(self.get_counts(), {'engineer': 1, 'manager': 1})
+        self.assertEqual(dict(LaborCategoryCount.objects.values_list(
+            'labor_category', 'id')), ids)
+
+    def test_refresh_does_nothing_with_empty_categories(self):
+        self.make_contracts('Engineer')
+        with self.assertNumQueries(0):
+            LaborCategoryCount.objects.refresh([])
+
+    def test_multi_phrase_search_matches_contract_search(self):
+        self.make_contracts(*MultiPhraseSearchParityTests.CATEGORIES)
+        for query in MultiPhraseSearchParityTests.QUERIES:
+            for query_type in ['match_all', 'match_phrase', 'match_exact']:
+                expected = set(Contract.objects.multi_phrase_search(
+                    query, query_type).values_list(
+                        '_normalized_labor_category', flat=True))
+                categories = set(LaborCategoryCount.objects
+                                 .multi_phrase_search(query, query_type)
+                                 .values_list('labor_category', flat=True))
+                self.assertEqual(categories, expected)
+
+
+class ContractChangeTests(TestCase):
+    def get_changes(self):
+        return list(ContractChange.objects.order_by('id').values_list(
+            'kind', 'contract_id'))
+
+    def make_values(self, **kwargs):
+        return {
+            'labor_category': 'Engineer',
+            'idv_piid': 'GS-123',
+            'vendor_name': 'Foo',
+            'min_years_experience': 1,
+            'hourly_rate_year1': 10,
+            'current_price': 10,
+            **kwargs
+        }
+
+    def test_save_and_delete_record_changes(self):
+        contract = get_contract_recipe().make()
+        pk = contract.pk
+        contract.save()
+        contract.delete()
+        self.assertEqual(self.get_changes(), [('I', pk), ('U', pk),
+                                              ('D', pk)])
+
+    def test_bulk_create_records_inserts(self):
+        contracts = Contract.objects.bulk_create([
+            Contract(**self.make_values()) for _ in range(2)])
+        self.assertEqual(self.get_changes(),
+                         [('I', c.pk) for c in contracts])
+
+    def test_copy_create_and_update_record_changes(self):
+        Contract.objects.copy_create([self.make_values()] * 2)
+        pks = sorted(Contract.objects.values_list('id', flat=True))
+        self.assertEqual(sorted(self.get_changes()),
+                         [('I', pk) for pk in pks])
+
+        Contract.objects.copy_update([self.make_values(id=pks[0])])
+        self.assertEqual(self.get_changes()[-1], ('U', pks[0]))
+
+    def test_queryset_delete_records_deletes(self):
+        contracts = get_contract_recipe().make(_quantity=3)
+        Contract.objects.filter(pk__in=[c.pk for c in contracts[1:]])\
+            .delete()
+        self.assertEqual(sorted(self.get_changes()[3:]),
+                         [('D', c.pk) for c in contracts[1:]])
+
+    def test_deleting_nothing_records_nothing(self):
+        Contract.objects.filter(pk__in=[]).delete()
+        self.assertEqual(self.get_changes(), [])
+
+    def test_copy_create_can_keep_ids(self):
+        Contract.objects.copy_create([self.make_values(id=500)],
+                                     keep_ids=True)
+        self.assertEqual(self.get_changes(), [('I', 500)])
+        # The sequence has moved past the ids we inserted.
+        self.assertGreater(get_contract_recipe().make().pk, 500)
+
+    def test_get_version_works(self):
+        self.assertEqual(ContractChange.objects.get_version(), 0)
+        get_contract_recipe().make()
+        self.assertEqual(ContractChange.objects.get_version(),
+                         ContractChange.objects.get().id)
+
+    def test_changes_are_ordered_by_transaction(self):
+        later = ContractChange.objects.create(contract_id=1, kind='I', txid=2)
+        earlier = ContractChange.objects.create(contract_id=2, kind='I',
+                                                txid=1)
+        self.assertEqual(list(ContractChange.objects.after(0)),
+                         [earlier, later])
+        self.assertEqual(list(ContractChange.objects.after(earlier.id)),
+                         [later])
+        self.assertEqual(ContractChange.objects.get_version(), later.id)
+
+    def test_changes_from_running_transactions_are_not_published(self):
+        ContractChange.objects.create(contract_id=1, kind='I', txid=2 ** 62)
+        self.assertEqual(list(ContractChange.objects.after(0)), [])
+        self.assertEqual(ContractChange.objects.get_version(), 0)
+
+    def test_changes_from_current_transaction_are_published(self):
+        contract = get_contract_recipe().make()
+        self.assertEqual(
+            list(ContractChange.objects.after(0).values_list(
+                'contract_id', flat=True)),
+            [contract.id])
+
+    def test_after_raises_for_unknown_versions(self):
+        with self.assertRaises(ContractChange.DoesNotExist):
+            ContractChange.objects.after(5)
+
+    @override_settings(CONTRACT_CHANGE_MAX_AGE_DAYS=30)
+    def test_delete_expired_keeps_latest_expired_change(self):
+        old = timezone.now() - datetime.timedelta(days=31)
+        first, second, latest_expired = [
+            ContractChange.objects.create(contract_id=1, kind='U', txid=txid,
+                                          created_at=old)
+            for txid in (1, 2, 3)]
+        recent = ContractChange.objects.create(contract_id=1, kind='U',
+                                               txid=4)
+
+        self.assertEqual(ContractChange.objects.delete_expired(), 2)
+        self.assertEqual(list(ContractChange.objects.order_by('txid')),
+                         [latest_expired, recent])
+        self.assertEqual(list(ContractChange.objects.after(
+            latest_expired.id)), [recent])
+        with self.assertRaises(ContractChange.DoesNotExist):
+            ContractChange.objects.after(second.id)
+        with self.assertRaises(ContractChange.DoesNotExist):
+            ContractChange.objects.after(0)
+        self.assertEqual(ContractChange.objects.delete_expired(), 0)
+
+
+class ContractChangeReadTests(TransactionTestCase):
+    def test_reading_changes_does_not_assign_a_transaction_id(self):
+        if connection.pg_version < 100000:
+            self.skipTest('txid_current_if_assigned() needs PostgreSQL 10')
+        with transaction.atomic():
+            ContractChange.objects.get_version()
+            list(ContractChange.objects.after(0))
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT txid_current_if_assigned()')
+                self.assertIsNone(cursor.fetchone()[0])
+
+
 class UnicodeContractSearchTestCase(BaseContractSearchTestCase):
     CATEGORIES = [
         '\u5982',
@@ -467,3 +923,40 @@ class SearchIndexTests(TestCase):
                 None,
                 'NO',
             ))
+
+    def has_trigram_extension(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            return cursor.fetchone() is not None
+
+    def get_index_definitions(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT indexname, indexdef FROM pg_indexes "
+                "WHERE tablename = 'contracts_contract'")
+            return dict(cursor.fetchall())
+
+    def test_search_index_only_has_gin_index(self):
+        indexes = [
+            definition for definition in self.get_index_definitions().values()
+            if '(search_index)' in definition
+        ]
+        self.assertEqual(len(indexes), 1)
+        self.assertIn('USING gin', indexes[0])
+
+    def test_trigram_index_matches_labor_category_search(self):
+        if not self.has_trigram_extension():
+            self.skipTest('pg_trgm extension is not installed')
+        # The planner won't necessarily use the index on a table this
+        # small, so check that it indexes what the search looks for.
+        index = self.get_index_definitions()[
+            'contracts_contract_nlc_upper_trgm']
+        self.assertIn(
+            'USING gin (upper(_normalized_labor_category) gin_trgm_ops)',
+            index)
+        sql = str(Contract.objects.multi_phrase_search('engineer').query)
+        self.assertIn(
+            'UPPER("contracts_contract"."_normalized_labor_category"::text) '
+            'LIKE UPPER(',
+            sql)
@@ -0,0 +1,25 @@
+from django.test import SimpleTestCase
+
+from ..pg_copy import CopyFile
+
+
+class CopyFileTests(SimpleTestCase):
+    ROWS = [['a', 1], ['b\tc', None], ['d', 2.5]]
+
+    EXPECTED = 'a\t1\nb\\tc\t\\N\nd\t2.5\n'
+
+    def test_read_returns_everything(self):
+        f = CopyFile(iter(self.ROWS))
+        self.assertEqual(f.read(), self.EXPECTED)
+        self.assertEqual(f.read(), '')
+
+    def test_read_returns_chunks_of_given_size(self):
+        f = CopyFile(iter(self.ROWS))
+        chunks = []
+        while True:
+            chunk = f.read(3)
+            if not chunk:
+                break
+            self.assertLessEqual(len(chunk), 3)
+            chunks.append(chunk)
+        self.assertEqual(''.join(chunks), self.EXPECTED)
@@ -1,9 +1,40 @@
 from django.test import TestCase
 
 from ..loaders.region_10 import Region10Loader
+from ..models import Contract
 
 
 class Region10LoaderTests(TestCase):
+    ROW = ['Engineer', '100.125', '101', '', '', '', 'Masters', '5.0', 'S',
+           'Both', 'Foobar Inc', 'GS-12F-0456S', 'MOBIS', '123-2', '2.0',
+           '05/01/2010', '']
+
     def test_error_raised_if_labor_category_is_missing(self):
         with self.assertRaisesRegexp(ValueError, 'missing labor category'):
             Region10Loader.make_contract([''])
+
+    def test_make_contract_values_matches_make_contract(self):
+        values = Region10Loader.make_contract_values(self.ROW)
+        contract = Region10Loader.make_contract(self.ROW)
+        for name in Region10Loader.CONTENT_FIELDS:
+            self.assertEqual(values[name], getattr(contract, name))
+        self.assertEqual(values['hourly_rate_year2'], 101)
+        self.assertIsNone(values['hourly_rate_year3'])
+        self.assertEqual(values['current_price'], 101)
+        self.assertIsNone(values['next_year_price'])
+
+    def test_content_hash_is_same_after_saving(self):
+        row = list(self.ROW)
+        values = Region10Loader.make_contract_values(row)
+        Contract.objects.copy_create([dict(values)])
+        saved = Contract.objects.values(*Region10Loader.CONTENT_FIELDS)[0]
+        self.assertEqual(Region10Loader.get_content_hash(values),
+                         Region10Loader.get_content_hash(saved))
+        self.assertEqual(Region10Loader.get_natural_key(saved),
+                         ('GS-12F-0456S', 'Engineer', 'Foobar Inc'))
+
+        row[2] = '102'
+        self.assertNotEqual(
+            Region10Loader.get_content_hash(
+                Region10Loader.make_contract_values(row)),
+            Region10Loader.get_content_hash(saved))
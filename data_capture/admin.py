@@ -1,7 +1,7 @@
 import os
 import re
 from django.contrib import admin
-from django.http import HttpResponse, HttpResponseForbidden
+from django.http import FileResponse, HttpResponseForbidden
 from django.db import models, transaction
 from django import forms
 from django.core.urlresolvers import reverse
@@ -505,8 +505,10 @@ class AttemptedPriceListSubmissionAdmin(admin.ModelAdmin):
 
         id = int(id)
         obj = get_object_or_404(AttemptedPriceListSubmission, pk=id)
-        response = HttpResponse(obj.uploaded_file.contents.read(),
+        contents = obj.uploaded_file.contents
+        response = FileResponse(contents.storage.open(contents.name),
                                 content_type='application/octet-stream')
+        response['Content-Length'] = contents.size
         response['Content-Disposition'] = 'attachment; filename="{}"'.format(
             clean_filename(obj.uploaded_file_name),
         )
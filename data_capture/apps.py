@@ -28,6 +28,12 @@ class DataCaptureSchedulerApp(AppConfig):
 
     # every Monday at noon, but scheduler uses UTC so it will be 5AM Pacific
     admin_reminder_cron = '* 12 * * MON'
+
+    # every hour, on the hour
+    gleaned_data_cleanup_cron = '0 * * * *'
+
+    # every hour, at half past
+    contract_change_cleanup_cron = '30 * * * *'
     rq_queue_name = 'default'
 
     @classmethod
@@ -53,3 +59,17 @@ class DataCaptureSchedulerApp(AppConfig):
                     'schedule "{}"'.format(self.admin_reminder_cron))
         scheduler.cron(self.admin_reminder_cron,
                        periodic_jobs.send_admin_approval_reminder_email)
+
+        # Add cron-type job to delete gleaned price list data from uploads
+        # that were abandoned
+        logger.info('Adding delete_expired_gleaned_data job on cron '
+                    'schedule "{}"'.format(self.gleaned_data_cleanup_cron))
+        scheduler.cron(self.gleaned_data_cleanup_cron,
+                       periodic_jobs.delete_expired_gleaned_data)
+
+        # Add cron-type job to delete changes to contracts that are too
+        # old to be synced from
+        logger.info('Adding delete_expired_contract_changes job on cron '
+                    'schedule "{}"'.format(self.contract_change_cleanup_cron))
+        scheduler.cron(self.contract_change_cleanup_cron,
+                       periodic_jobs.delete_expired_contract_changes)
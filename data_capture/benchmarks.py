@@ -0,0 +1,317 @@
+'''
+Benchmarks for data capture. See the `benchmark` management command
+for details.
+'''
+
+import io
+import json
+import zipfile
+from datetime import date
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Iterator, List, Sequence
+from xml.sax.saxutils import escape  # nosec
+
+from contracts.benchmarks import iter_synthetic_contracts
+from contracts.loaders.region_10 import Region10Loader
+from contracts.models import EDUCATION_CHOICES
+from . import jobs
+from .r10_spreadsheet_converter import Region10SpreadsheetConverter
+from .schedules import registry
+from .schedules.s70 import Schedule70PriceList
+
+
+# The headings of a Region 10 export, in the order they're exported.
+R10_HEADINGS = [
+    'Labor Category', 'Year 1/base', 'Year 2', 'Year 3', 'Year 4', 'Year 5',
+    'Education', 'MinExpAct', 'Bus Size', 'Location', 'COMPANY NAME',
+    'CONTRACT .', 'Schedule', 'SIN NUMBER', 'Begin Date', 'End Date',
+    'CurrentYearPricing', 'Contract Year',
+]
+
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+
+CONTENT_TYPES_XML = '''<?xml version="1.0" encoding="UTF-8"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels"
+ ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml"
+ ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml"
+ ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+<Override PartName="/xl/styles.xml"
+ ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>
+<Override PartName="/xl/sharedStrings.xml"
+ ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>
+</Types>'''
+
+ROOT_RELS_XML = f'''<?xml version="1.0" encoding="UTF-8"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="{REL_NS}/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>'''
+
+WORKBOOK_RELS_XML = f'''<?xml version="1.0" encoding="UTF-8"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="{REL_NS}/worksheet" Target="worksheets/sheet1.xml"/>
+<Relationship Id="rId2" Type="{REL_NS}/styles" Target="styles.xml"/>
+<Relationship Id="rId3" Type="{REL_NS}/sharedStrings" Target="sharedStrings.xml"/>
+</Relationships>'''
+
+# The second cell format is for dates.
+STYLES_XML = f'''<?xml version="1.0" encoding="UTF-8"?>
+<styleSheet xmlns="{MAIN_NS}">
+<cellXfs count="2">
+<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>
+<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0"
+ applyNumberFormat="1"/>
+</cellXfs>
+</styleSheet>'''
+
+DATE_STYLE = 1
+
+EXCEL_EPOCH = date(1899, 12, 30)
+
+
+def get_workbook_xml(date1904: bool=False) -> str:
+    return f'''<?xml version="1.0" encoding="UTF-8"?>
+<workbook xmlns="{MAIN_NS}" xmlns:r="{REL_NS}">
+<workbookPr date1904="{int(date1904)}"/>
+<sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets>
+</workbook>'''
+
+
+def get_column_name(colx: int) -> str:
+    '''
+    Return the name of the column with the given index, e.g.:
+
+        >>> get_column_name(0), get_column_name(25), get_column_name(26)
+        ('A', 'Z', 'AA')
+    '''
+
+    name = ''
+    colx += 1
+    while colx:
+        colx, remainder = divmod(colx - 1, 26)
+        name = chr(ord('A') + remainder) + name
+    return name
+
+
+def iter_sheet_xml(rows: Iterable[Sequence[Any]],
+                   strings: Dict[str, int]) -> Iterator[str]:
+    '''
+    Yield the XML of a worksheet containing the given rows, adding
+    their strings to the given shared strings table. Cells that are
+    None are left out.
+    '''
+
+    yield f'<?xml version="1.0" encoding="UTF-8"?>\n' \
+          f'<worksheet xmlns="{MAIN_NS}"><sheetData>'
+    for rowx, row in enumerate(rows, start=1):
+        cells = []
+        for colx, value in enumerate(row):
+            ref = f'{get_column_name(colx)}{rowx}'
+            if value is None:
+                continue
+            elif isinstance(value, str):
+                index = strings.setdefault(value, len(strings))
+                cells.append(f'<c r="{ref}" t="s"><v>{index}</v></c>')
+            elif isinstance(value, date):
+                serial = (value - EXCEL_EPOCH).days
+                cells.append(f'<c r="{ref}" s="{DATE_STYLE}">'
+                             f'<v>{serial}</v></c>')
+            else:
+                cells.append(f'<c r="{ref}"><v>{value}</v></c>')
+        yield f'<row r="{rowx}">{"".join(cells)}</row>'
+    yield '</sheetData></worksheet>'
+
+
+def write_xlsx(f, rows: Iterable[Sequence[Any]]) -> None:
+    '''
+    Write a minimal .xlsx file containing a single sheet with the
+    given rows of strings, numbers, dates and Nones to the given file.
+    '''
+
+    strings: Dict[str, int] = {}
+    with zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml', CONTENT_TYPES_XML)
+        zf.writestr('_rels/.rels', ROOT_RELS_XML)
+        zf.writestr('xl/workbook.xml', get_workbook_xml())
+        zf.writestr('xl/_rels/workbook.xml.rels', WORKBOOK_RELS_XML)
+        zf.writestr('xl/styles.xml', STYLES_XML)
+        with zf.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            for chunk in iter_sheet_xml(rows, strings):
+                sheet.write(chunk.encode('utf-8'))
+        zf.writestr('xl/sharedStrings.xml', ''.join([
+            f'<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<sst xmlns="{MAIN_NS}" uniqueCount="{len(strings)}">',
+            *(f'<si><t xml:space="preserve">{escape(s)}</t></si>'
+              for s in strings),
+            '</sst>',
+        ]))
+
+
+def iter_synthetic_r10_rows(num_rows: int, seed: int=1) -> Iterator[List[Any]]:
+    '''
+    Yield the heading row and then the given number of rows of a
+    randomly-generated (but reproducible) Region 10 export.
+    '''
+
+    education_names = dict(EDUCATION_CHOICES)
+    yield R10_HEADINGS
+    for c in iter_synthetic_contracts(num_rows, seed):
+        rates = [float(rate) for rate in (
+            c.hourly_rate_year1, c.hourly_rate_year2, c.hourly_rate_year3,
+            c.hourly_rate_year4, c.hourly_rate_year5)]
+        yield [
+            c.labor_category, *rates,
+            education_names.get(c.education_level, ''),
+            c.min_years_experience, c.business_size, c.contractor_site,
+            c.vendor_name, c.idv_piid, c.schedule, c.sin,
+            c.contract_start, c.contract_end,
+            float(c.current_price or Decimal(0)), c.contract_year,
+        ]
+
+
+def iter_synthetic_r10_csv_rows(num_rows: int,
+                                seed: int=1) -> Iterator[List[str]]:
+    '''
+    Yield the given number of rows of a randomly-generated (but
+    reproducible) Region 10 export, converted in the same way as by
+    Region10SpreadsheetConverter.convert_next().
+    '''
+
+    csv_indices = [
+        Region10SpreadsheetConverter.xl_heading_to_csv_idx_map.get(heading)
+        for heading in R10_HEADINGS
+    ]
+    rows = iter_synthetic_r10_rows(num_rows, seed)
+    next(rows)
+    for values in rows:
+        row = [''] * len(Region10SpreadsheetConverter.xl_heading_to_csv_idx_map)
+        for csv_index, value in zip(csv_indices, values):
+            if csv_index is None:
+                continue
+            if isinstance(value, date):
+                value = value.strftime('%m/%d/%Y')
+            elif isinstance(value, int):
+                # Spreadsheets store all numbers as floats.
+                value = float(value)
+            row[csv_index] = str(value)
+        yield row
+
+
+def make_synthetic_r10_xlsx(num_rows: int, seed: int=1) -> bytes:
+    f = io.BytesIO()
+    write_xlsx(f, iter_synthetic_r10_rows(num_rows, seed))
+    return f.getvalue()
+
+
+def r10_spreadsheet(num_rows):
+    '''
+    Compare converting a Region 10 export with xlrd, which loads the
+    whole workbook into memory, with streaming its rows.
+    '''
+
+    contents = make_synthetic_r10_xlsx(num_rows)
+
+    def with_xlrd():
+        converter = Region10SpreadsheetConverter(io.BytesIO(contents))
+        # Pretend it isn't an .xlsx file, so that xlrd is used.
+        converter._is_xlsx = False
+        return converter.convert_file()
+
+    def streaming():
+        converter = Region10SpreadsheetConverter(io.BytesIO(contents))
+        return converter.convert_file()
+
+    if with_xlrd() != streaming():
+        raise AssertionError('converted rows do not match')
+
+    yield 'xlrd.open_workbook', with_xlrd
+    yield 'StreamingXlsxSheet', streaming
+
+
+R10_CONVERSION_WORKERS = [1, 2, 4, 8]
+
+
+def r10_conversion(num_rows):
+    '''
+    Compare converting the rows of a Region 10 export to Contract
+    models one at a time with converting them to dicts of field values
+    with different numbers of worker processes.
+    '''
+
+    rows = list(iter_synthetic_r10_csv_rows(num_rows))
+
+    def to_models():
+        return [Region10Loader.make_contract(row) for row in rows]
+
+    def to_dicts(workers):
+        return list(jobs._create_contract_batches(
+            None, rows=rows, workers=workers))
+
+    expected = to_dicts(workers=1)
+    if any(to_dicts(workers) != expected for workers in
+           R10_CONVERSION_WORKERS[1:]):
+        raise AssertionError('converted rows do not match')
+    if sum(len(contracts) for contracts, _ in expected) != num_rows:
+        raise AssertionError('not all rows were converted')
+
+    yield 'make_contract', to_models
+    for workers in R10_CONVERSION_WORKERS:
+        yield (f'{workers} worker{"s" if workers > 1 else ""}',
+               lambda workers=workers: to_dicts(workers))
+
+
+def iter_synthetic_s70_rows(num_rows: int,
+                            seed: int=1) -> Iterator[Dict[str, str]]:
+    '''
+    Yield the given number of rows of a randomly-generated (but
+    reproducible) Schedule 70 price list, as gleaned from its
+    spreadsheet. Rows of contracts without an education level are
+    invalid.
+    '''
+
+    education_names = dict(EDUCATION_CHOICES)
+    for c in iter_synthetic_contracts(num_rows, seed):
+        yield {
+            'sin': c.sin,
+            'labor_category': c.labor_category,
+            'education_level': education_names.get(c.education_level, ''),
+            'min_years_experience': str(c.min_years_experience),
+            'unit_of_issue': 'Hour',
+            'price_including_iff': str(c.current_price),
+        }
+
+
+def gleaned_data(num_rows):
+    '''
+    Compare the cost of loading a price list of the given number of
+    rows from the session, as each step of the price list upload
+    process does, when its rows need to be validated again with when
+    the results of validating them were saved along with them. Each
+    approach is timed both on its own and with the price list's valid
+    rows then being rendered as a table.
+    '''
+
+    pricelist = Schedule70PriceList(list(iter_synthetic_s70_rows(num_rows)))
+    schedule, serialized = registry.serialize(pricelist)
+    session_data = {
+        'revalidate': json.dumps([schedule, serialized['rows']]),
+        'rehydrate': json.dumps([schedule, serialized]),
+    }
+
+    def load(approach):
+        return registry.deserialize(json.loads(session_data[approach]))
+
+    for approach in session_data:
+        if load(approach).to_table() != pricelist.to_table():
+            raise AssertionError('rendered tables do not match')
+
+    for approach in session_data:
+        yield approach, lambda approach=approach: load(approach)
+    for approach in session_data:
+        yield (f'{approach} + to_table',
+               lambda approach=approach: load(approach).to_table())
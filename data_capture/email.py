@@ -235,10 +235,14 @@ def price_list_rejected(template, price_list):
         'r10_upload_link': 'https://example.com/r10_bulk_upload',
         'num_contracts': 50123,
         'num_bad_rows': 25,
+        'num_inserted': 120,
+        'num_updated': 1043,
+        'num_deleted': 87,
     }
 )
 def bulk_upload_succeeded(template, upload_source, num_contracts,
-                          num_bad_rows):
+                          num_bad_rows, num_inserted=None, num_updated=None,
+                          num_deleted=None):
     r10_upload_link = absolute_reverse(
         'data_capture:bulk_region_10_step_1')
 
@@ -246,6 +250,9 @@ def bulk_upload_succeeded(template, upload_source, num_contracts,
         'upload_source': upload_source,
         'num_contracts': num_contracts,
         'num_bad_rows': num_bad_rows,
+        'num_inserted': num_inserted,
+        'num_updated': num_updated,
+        'num_deleted': num_deleted,
         'r10_upload_link': r10_upload_link,
     }
 
@@ -1,7 +1,8 @@
 from django import forms
 
 from frontend.upload import UploadWidget
-from ..r10_spreadsheet_converter import Region10SpreadsheetConverter
+from ..r10_spreadsheet_converter import (PARSE_ERRORS,
+                                         Region10SpreadsheetConverter)
 
 
 class Region10BulkUploadForm(forms.Form):
@@ -13,13 +14,24 @@ class Region10BulkUploadForm(forms.Form):
         extra_instructions="Region 10 export file (XLS or XLSX), please."
     ))
 
+    def invalid_file_error(self):
+        return forms.ValidationError("That file does not appear to be a "
+                                     "valid Region 10 export. Try another?")
+
     def clean(self):
         cleaned_data = super().clean()
 
         file = cleaned_data.get('file')
 
-        if file and not Region10SpreadsheetConverter(file).is_valid_file():
-            raise forms.ValidationError("That file does not appear to be a "
-                                        "valid Region 10 export. Try another?")
+        if file:
+            converter = Region10SpreadsheetConverter(file)
+            if not converter.is_valid_file():
+                raise self.invalid_file_error()
+            try:
+                # Convert the whole file now, so it never needs to be
+                # parsed again.
+                cleaned_data['packed_rows'] = converter.pack()
+            except PARSE_ERRORS:
+                raise self.invalid_file_error()
 
         return cleaned_data
@@ -1,54 +1,286 @@
 import logging
+import time
 import traceback
+from collections import defaultdict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from typing import (Any, Callable, DefaultDict, Deque, Dict, Iterator,
+                    List, NamedTuple, Optional, Tuple)
+from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.core.files.base import ContentFile
-from django.db import transaction
+from django.db import connection, transaction
 from django_rq import job
+from rq import get_current_job
 
 from . import email
-from .r10_spreadsheet_converter import Region10SpreadsheetConverter
+from .r10_spreadsheet_converter import get_upload_source_rows
+from api.cache import bump_data_version
 from contracts.loaders.region_10 import Region10Loader
-from contracts.models import Contract, BulkUploadContractSource
+from contracts.models import (Contract, BulkUploadContractSource,
+                              ContractChange, LaborCategoryCount)
 
 
 contracts_logger = logging.getLogger('contracts')
 
+# The number of contracts that are deleted, updated or inserted at a
+# time when applying the differences of an upload. When checkpointed,
+# each batch is committed in its own transaction.
+WRITE_BATCH_SIZE = 5000
 
-def _create_contract_batches(upload_source, batch_size=5000, rows=None):
-    if rows is None:
-        r10_file = ContentFile(upload_source.original_file)
-        converter = Region10SpreadsheetConverter(r10_file)
-        rows = converter.convert_next()
+
+class BulkUploadProgress:
+    '''
+    Tracks the progress of a bulk upload, publishing it to the meta
+    of the RQ job processing the upload (if any) as it changes, so that
+    it can be shown while the user waits.
+
+    The stage is one of 'parsing', 'writing', 'finishing', 'finished'
+    or 'failed'.
+    '''
+
+    def __init__(self, num_rows: Optional[int]=None, job=None) -> None:
+        self.job = job
+        self.num_rows = num_rows
+        self.stage = 'parsing'
+        self.rows_parsed = 0
+        self.bad_rows = 0
+        self.rows_written = 0
+        # The number of contracts that need writing, which isn't known
+        # until every row has been compared with the existing ones.
+        self.rows_to_write: Optional[int] = None
+        self.started_at = time.monotonic()
+
+    @property
+    def eta_seconds(self) -> Optional[float]:
+        '''
+        Estimate how many seconds are left, from the rate at which rows
+        have been parsed and written so far. This is None if the number
+        of rows isn't known or nothing has been done yet.
+
+        Until rows_to_write is known, the time needed for writing isn't
+        included.
+        '''
+
+        if self.stage in ('finished', 'failed'):
+            return 0
+        done = self.rows_parsed + self.rows_written
+        if self.num_rows is None or not done:
+            return None
+        remaining = max(self.num_rows - self.rows_parsed, 0) + \
+            max((self.rows_to_write or 0) - self.rows_written, 0)
+        elapsed = time.monotonic() - self.started_at
+        return round(elapsed / done * remaining, 1)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'stage': self.stage,
+            'num_rows': self.num_rows,
+            'rows_parsed': self.rows_parsed,
+            'bad_rows': self.bad_rows,
+            'rows_written': self.rows_written,
+            'rows_to_write': self.rows_to_write,
+            'eta_seconds': self.eta_seconds,
+        }
+
+    def update(self, stage: Optional[str]=None, **counts: int) -> None:
+        '''
+        Change the stage and/or any of the counts, and publish them.
+        '''
+
+        if stage is not None:
+            self.stage = stage
+        for name, value in counts.items():
+            if not hasattr(self, name):
+                raise AttributeError(f'Unknown progress count {name!r}')
+            setattr(self, name, value)
+        if self.job is not None:
+            # RQ 0.7 doesn't have Job.save_meta(), so we save the whole
+            # job, as its documentation suggests.
+            self.job.meta['progress'] = self.to_dict()
+            self.job.save()
+
+    def add_batch(self, contracts, bad_rows) -> None:
+        '''
+        Account for a batch yielded by _create_contract_batches().
+        '''
+
+        self.update(rows_parsed=self.rows_parsed + len(contracts) +
+                    len(bad_rows),
+                    bad_rows=self.bad_rows + len(bad_rows))
+
+
+def _convert_rows(rows, upload_source_id=None):
+    '''
+    Convert the given rows to dicts of contract field values (see
+    Region10Loader.make_contract_values()), returning them along with
+    the rows that couldn't be converted.
+
+    This may be run in a worker process, so it can't use the database.
+    '''
 
     contracts = []
     bad_rows = []
-    i = 0
-
     for row in rows:
         try:
-            c = Region10Loader.make_contract(row, upload_source=upload_source)
-            contracts.append(c)
-        except (ValueError, ValidationError) as e:
+            values = Region10Loader.make_contract_values(row)
+        except (ValueError, ValidationError):
             bad_rows.append(row)
-        i += 1
-        if i == batch_size:
-            yield contracts, bad_rows
-            i = 0
-            contracts = []
-            bad_rows = []
+            continue
+        values['upload_source_id'] = upload_source_id
+        contracts.append(values)
+    return contracts, bad_rows
+
+
+def _convert_rows_in_parallel(chunks, upload_source_id, workers):
+    '''
+    Like calling _convert_rows() on each of the given chunks of rows,
+    but using a pool of worker processes. Results are still yielded in
+    the same order as the chunks.
+    '''
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending: Deque[Future] = deque()
+        for chunk in chunks:
+            pending.append(
+                executor.submit(_convert_rows, chunk, upload_source_id))
+            # Only keep a couple of chunks per worker in flight, so
+            # that the whole upload isn't read into memory at once.
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _create_contract_batches(upload_source, batch_size=5000, rows=None,
+                             workers=None):
+    '''
+    Yield a (contracts, bad_rows) tuple for each batch of `batch_size`
+    rows of the given upload, where the contracts are dicts of field
+    values (see _convert_rows()).
+
+    If `workers` is greater than one, the batches are converted by a
+    pool of that many processes. It defaults to the
+    BULK_UPLOAD_WORKERS setting.
+    '''
+
+    if rows is None:
+        rows = get_upload_source_rows(upload_source)
+    if workers is None:
+        workers = settings.BULK_UPLOAD_WORKERS
+    upload_source_id = upload_source.id if upload_source else None
+
+    rows = iter(rows)
+    chunks: Iterator[List[List[str]]] = \
+        iter(lambda: list(islice(rows, batch_size)), [])
+
+    if workers > 1:
+        yield from _convert_rows_in_parallel(chunks, upload_source_id,
+                                             workers)
+    else:
+        for chunk in chunks:
+            yield _convert_rows(chunk, upload_source_id)
+
+
+class BulkUploadResult(NamedTuple):
+    # The number of rows that were successfully loaded, whether or not
+    # they changed.
+    num_contracts: int
+    num_bad_rows: int
+    num_inserted: int
+    num_updated: int
+    num_deleted: int
+
+
+class BulkUploadDiff(NamedTuple):
+    # These are dicts of field values, as yielded by
+    # _create_contract_batches().
+    inserted: List[Dict[str, Any]]
+    updated: List[Dict[str, Any]]
+    deleted_ids: List[int]
+    # The ids of existing contracts that match a row exactly.
+    unchanged_ids: List[int]
+    num_contracts: int
+    num_bad_rows: int
+
+
+def _get_region_10_contracts():
+    # Note that this includes contracts without a current price, which
+    # Contract.objects excludes.
+    return Contract._base_manager.filter(
+        upload_source__procurement_center=BulkUploadContractSource.REGION_10
+    )
+
+
+def _diff_contracts(upload_source, workers=None, progress=None):
+    '''
+    Compare the rows of the given upload with the existing Region 10
+    contracts, returning the contracts that need to be inserted or
+    updated and the existing ones that need to be deleted.
+
+    Rows whose content matches an existing contract are left alone,
+    and those contracts' ids are returned as unchanged. The remaining
+    rows update existing contracts with the same natural key (see
+    Region10Loader.KEY_FIELDS) if there are any, or are otherwise
+    inserted.
+    '''
+
+    unmatched_ids: DefaultDict[bytes, List[Tuple[int, Tuple]]] = \
+        defaultdict(list)
+    existing = _get_region_10_contracts().values_list(
+        'id', *Region10Loader.CONTENT_FIELDS)
+    for pk, *content in existing.iterator():
+        values = dict(zip(Region10Loader.CONTENT_FIELDS, content))
+        unmatched_ids[Region10Loader.get_content_hash(values)].append(
+            (pk, Region10Loader.get_natural_key(values)))
 
-    if i > 0:
-        yield contracts, bad_rows
+    changed = []
+    unchanged_ids = []
+    num_contracts = 0
+    num_bad_rows = 0
+    for contracts, bad_rows in _create_contract_batches(upload_source,
+                                                        workers=workers):
+        num_contracts += len(contracts)
+        num_bad_rows += len(bad_rows)
+        if progress is not None:
+            progress.add_batch(contracts, bad_rows)
+        for contract in contracts:
+            ids = unmatched_ids.get(Region10Loader.get_content_hash(contract))
+            if ids:
+                unchanged_ids.append(ids.pop()[0])
+            else:
+                changed.append(contract)
 
+    ids_by_key: DefaultDict[Tuple, List[int]] = defaultdict(list)
+    for unmatched in unmatched_ids.values():
+        for pk, key in unmatched:
+            ids_by_key[key].append(pk)
 
-@transaction.atomic
-def _process_bulk_upload(upload_source):
+    inserted = []
+    updated = []
+    for contract in changed:
+        pks = ids_by_key.get(Region10Loader.get_natural_key(contract))
+        if pks:
+            contract['id'] = pks.pop()
+            updated.append(contract)
+        else:
+            inserted.append(contract)
 
+    return BulkUploadDiff(
+        inserted=inserted,
+        updated=updated,
+        deleted_ids=[pk for pks in ids_by_key.values() for pk in pks],
+        unchanged_ids=unchanged_ids,
+        num_contracts=num_contracts,
+        num_bad_rows=num_bad_rows,
+    )
+
+
+def _replace_contracts(upload_source, workers, progress):
     contracts_logger.info("Deleting contract objects related to region 10.")
 
     # Delete existing contracts identified by the same
     # procurement_center
-    Contract.objects.filter(
+    _, num_deleted = Contract.objects.filter(
         upload_source__procurement_center=BulkUploadContractSource.REGION_10
     ).delete()
 
@@ -56,40 +288,202 @@ def _process_bulk_upload(upload_source):
 
     total_contracts = 0
     total_bad_rows = 0
+    progress.update('writing')
 
-    for contracts, bad_rows in _create_contract_batches(upload_source):
-        Contract.objects.bulk_create(contracts)
+    for contracts, bad_rows in _create_contract_batches(upload_source,
+                                                        workers=workers):
+        Contract.objects.copy_create(contracts)
         total_contracts += len(contracts)
         total_bad_rows += len(bad_rows)
+        # Every row is written as soon as it's parsed, so we can only
+        # expect to write as many as we haven't found to be bad.
+        progress.add_batch(contracts, bad_rows)
+        progress.update(
+            rows_written=total_contracts,
+            rows_to_write=(progress.num_rows or 0) - total_bad_rows,
+        )
         contracts_logger.info(
             f"Saved {total_contracts} contracts so far "
             f"({total_bad_rows} bad rows found)."
         )
 
+    return BulkUploadResult(
+        num_contracts=total_contracts,
+        num_bad_rows=total_bad_rows,
+        num_inserted=total_contracts,
+        num_updated=0,
+        num_deleted=num_deleted.get(Contract._meta.label, 0),
+    )
+
+
+def _delete_contracts(ids):
+    contracts = _get_region_10_contracts().filter(pk__in=ids)
+    ContractChange.objects.record(ContractChange.DELETED, contracts)
+    contracts.delete()
+
+
+def _move_contracts(upload_source, ids):
+    '''
+    Make the given upload the source of the contracts with the given
+    ids, so that they aren't deleted along with the upload they used to
+    come from.
+    '''
+
+    with connection.cursor() as cursor:
+        cursor.execute(  # nosec
+            "UPDATE " + Contract._meta.db_table +
+            "  SET upload_source_id = %s"
+            "  WHERE id = ANY(%s) AND upload_source_id <> %s",
+            [upload_source.id, ids, upload_source.id]
+        )
+
+
+def _apply_contract_diff(upload_source, workers, progress, checkpointed):
+    contracts_logger.info("Comparing rows with region 10 contract objects.")
+
+    diff = _diff_contracts(upload_source, workers, progress)
+
+    contracts_logger.info(
+        f"Inserting {len(diff.inserted)}, updating {len(diff.updated)} "
+        f"and deleting {len(diff.deleted_ids)} contracts "
+        f"({diff.num_bad_rows} bad rows found)."
+    )
+
+    # When resuming a checkpointed load, the diff only contains what
+    # the interrupted attempt didn't get around to, so its totals are
+    # added to the ones it committed.
+    totals = {'num_deleted': 0, 'num_updated': 0, 'num_inserted': 0}
+    if checkpointed and upload_source.load_checkpoint:
+        totals.update(upload_source.load_checkpoint)
+        contracts_logger.info(f"Resuming from checkpoint {totals}.")
+
+    writes: List[Tuple[str, List[Any], Callable[[List[Any]], Any]]] = [
+        ('num_deleted', diff.deleted_ids, _delete_contracts),
+        ('num_updated', diff.updated, Contract.objects.copy_update),
+        ('num_inserted', diff.inserted, Contract.objects.copy_create),
+    ]
+    progress.update('writing', rows_to_write=len(diff.deleted_ids) +
+                    len(diff.updated) + len(diff.inserted))
+
+    # This is idempotent, so it doesn't need to be checkpointed.
+    with transaction.atomic():
+        _move_contracts(upload_source, diff.unchanged_ids)
+
+    for name, items, write in writes:
+        for start in range(0, len(items), WRITE_BATCH_SIZE):
+            batch = items[start:start + WRITE_BATCH_SIZE]
+            with transaction.atomic():
+                write(batch)
+                totals[name] += len(batch)
+                if checkpointed:
+                    BulkUploadContractSource.objects.filter(
+                        pk=upload_source.pk).update(load_checkpoint=totals)
+            progress.update(rows_written=progress.rows_written + len(batch))
+
+    return BulkUploadResult(
+        num_contracts=diff.num_contracts,
+        num_bad_rows=diff.num_bad_rows,
+        **totals
+    )
+
+
+def _finish_bulk_upload(upload_source):
+    # Account for the labor categories of the contracts we deleted.
+    LaborCategoryCount.objects.refresh()
+    bump_data_version()
+
     # Update the upload_source
     upload_source.has_been_loaded = True
+    upload_source.load_checkpoint = None
     upload_source.save()
 
-    return total_contracts, total_bad_rows
+
+def _process_bulk_upload(upload_source, replace=False, workers=None,
+                         checkpointed=False, progress=None):
+    '''
+    Load the given Region 10 upload, returning a BulkUploadResult.
+
+    By default, only the differences between the upload and the
+    existing Region 10 contracts are applied. If `replace` is true, the
+    existing contracts are all deleted and the whole upload is inserted
+    instead.
+
+    The whole upload is normally loaded in a single transaction. If
+    `checkpointed` is true, the differences are instead committed in
+    batches, each along with a checkpoint of the totals so far. If the
+    load is interrupted, e.g. because its worker was restarted, loading
+    the upload again only applies the differences that weren't
+    committed. Replacing can't be checkpointed.
+
+    Rows are converted by the given number of worker processes, which
+    defaults to the BULK_UPLOAD_WORKERS setting. Progress is reported
+    to the given BulkUploadProgress, if any.
+    '''
+
+    if replace and checkpointed:
+        raise ValueError('Replacing contracts cannot be checkpointed')
+    if progress is None:
+        progress = BulkUploadProgress(upload_source.num_rows)
+
+    if checkpointed:
+        result = _apply_contract_diff(upload_source, workers, progress,
+                                      checkpointed=True)
+        progress.update('finishing')
+        with transaction.atomic():
+            _finish_bulk_upload(upload_source)
+        return result
+
+    with transaction.atomic():
+        if replace:
+            result = _replace_contracts(upload_source, workers, progress)
+        else:
+            result = _apply_contract_diff(upload_source, workers, progress,
+                                          checkpointed=False)
+        progress.update('finishing')
+        _finish_bulk_upload(upload_source)
+
+    return result
 
 
 @job
-def process_bulk_upload_and_send_email(upload_source_id):
+def process_bulk_upload_and_send_email(upload_source_id, checkpointed=None):
+    '''
+    Load the given upload and email its submitter about how it went.
+
+    While it runs, its progress is published to the job's meta as a
+    dict under 'progress' (see BulkUploadProgress.to_dict()). It's
+    checkpointed if `checkpointed` is true, which defaults to the
+    BULK_UPLOAD_CHECKPOINTED setting, so if the job is interrupted it
+    can be requeued to pick up where it left off.
+    '''
+
     contracts_logger.info(
         "Starting bulk upload processing (pk=%d)." % upload_source_id
     )
     upload_source = BulkUploadContractSource.objects.get(
         pk=upload_source_id
     )
+    if checkpointed is None:
+        checkpointed = settings.BULK_UPLOAD_CHECKPOINTED
+    progress = BulkUploadProgress(upload_source.num_rows, get_current_job())
 
     try:
-        num_contracts, num_bad_rows = _process_bulk_upload(upload_source)
-        email.bulk_upload_succeeded(upload_source, num_contracts, num_bad_rows)
+        result = _process_bulk_upload(upload_source,
+                                      checkpointed=checkpointed,
+                                      progress=progress)
+        progress.update('finished')
+        email.bulk_upload_succeeded(
+            upload_source, result.num_contracts, result.num_bad_rows,
+            num_inserted=result.num_inserted,
+            num_updated=result.num_updated,
+            num_deleted=result.num_deleted,
+        )
     except Exception:
         contracts_logger.exception(
             'An exception occurred during bulk upload processing '
             '(pk=%d).' % upload_source_id
         )
+        progress.update('failed')
         tb = traceback.format_exc()
         email.bulk_upload_failed(upload_source, tb)
 
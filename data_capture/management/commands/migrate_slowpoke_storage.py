@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from data_capture.models import ChunkedStorage, SlowpokeStorageModel
+
+
+class Command(BaseCommand):
+    help = '''
+    Move uploaded files from the old single-row SlowpokeStorage into
+    ChunkedStorage, one file at a time. This is safe to run more than
+    once, and does nothing if there are no files left to move.
+    '''
+
+    def handle(self, *args, **options):
+        storage = ChunkedStorage()
+        ids = list(SlowpokeStorageModel.objects.order_by('id').values_list(
+            'id', flat=True))
+        num_moved = 0
+
+        for num, id in enumerate(ids, start=1):
+            with transaction.atomic():
+                obj = SlowpokeStorageModel.objects.select_for_update().get(
+                    id=id)
+                moved = storage.move_from_slowpoke(obj)
+            if moved:
+                num_moved += 1
+                self.stdout.write(f"  Moved {obj.name} ({obj.size} bytes, "
+                                  f"{num} of {len(ids)}).")
+            else:
+                self.stderr.write(self.style.WARNING(
+                    f"  Not moving {obj.name}, since a different file "
+                    f"already has that name ({num} of {len(ids)})."))
+
+        self.stdout.write(f"Done. {num_moved} of {len(ids)} files were "
+                          f"moved.")
@@ -16,6 +16,30 @@ class Command(BaseCommand):
             help='input filename (.xlsx)'
         )
 
+        parser.add_argument(
+            '--replace',
+            default=False,
+            action='store_true',
+            help='delete all existing Region 10 rates and load every row '
+                 '(instead of only applying the differences)'
+        )
+
+        parser.add_argument(
+            '--checkpointed',
+            default=False,
+            action='store_true',
+            help='commit the differences in batches, so that the load can '
+                 'be resumed if interrupted (cannot be used with --replace)'
+        )
+
+        parser.add_argument(
+            '-w', '--workers',
+            default=None,
+            type=int,
+            help='number of processes to convert rows with (default is '
+                 'BULK_UPLOAD_WORKERS)'
+        )
+
     def handle(self, *args, **options):
         filename = options['filename']
 
@@ -28,8 +52,14 @@ class Command(BaseCommand):
         )
         f.close()
 
-        ok, fails = jobs._process_bulk_upload(upload_source)
+        result = jobs._process_bulk_upload(upload_source,
+                                           replace=options['replace'],
+                                           checkpointed=options['checkpointed'],
+                                           workers=options['workers'])
 
         self.stdout.write(
-            f"{ok} contracts successfully processed, {fails} failed.\n"
+            f"{result.num_contracts} contracts successfully processed, "
+            f"{result.num_bad_rows} failed.\n"
+            f"{result.num_inserted} inserted, {result.num_updated} updated, "
+            f"{result.num_deleted} deleted.\n"
         )
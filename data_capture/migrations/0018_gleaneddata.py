@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2026-10-18 05:41
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_capture', '0017_auto_20170316_1654'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GleanedData',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True)),
+                ('data', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2026-10-18 05:44
+from __future__ import unicode_literals
+
+import data_capture.models
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_capture', '0018_gleaneddata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkedStorageChunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.IntegerField()),
+                ('data', models.BinaryField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChunkedStorageFile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=128, unique=True)),
+                ('size', models.BigIntegerField()),
+                ('chunk_size', models.IntegerField()),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='hasheduploadedfile',
+            name='contents',
+            field=models.FileField(storage=data_capture.models.ChunkedStorage(), upload_to='data_capture_uploaded_files/'),
+        ),
+        migrations.AddField(
+            model_name='chunkedstoragechunk',
+            name='file',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='data_capture.ChunkedStorageFile'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='chunkedstoragechunk',
+            unique_together=set([('file', 'index')]),
+        ),
+    ]
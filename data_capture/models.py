@@ -1,17 +1,25 @@
 import hashlib
+import io
+import json
 import logging
+import zlib
+from datetime import timedelta
+from typing import Any, Optional
 
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.contrib.postgres.fields import JSONField
+from django.contrib.postgres.fields.jsonb import KeyTextTransform
 from django.core.validators import (MinValueValidator, MaxValueValidator,
                                     RegexValidator)
 from django.utils import timezone
 from django.core.files.storage import Storage
 from django.utils.deconstruct import deconstructible
-from django.core.files.base import ContentFile
-from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.base import ContentFile, File
+from django.core.files.uploadedfile import UploadedFile
 
+from api.cache import bump_data_version
 from contracts.models import (Contract, CashField, EDUCATION_CHOICES,
                               MIN_ESCALATION_RATE, MAX_ESCALATION_RATE)
 
@@ -21,6 +29,13 @@ logger = logging.getLogger('calc')
 
 @deconstructible
 class SlowpokeStorage(Storage):
+    '''
+    The storage backend that uploaded files used to be kept in, which
+    stores each of them in a single row. It's only kept around for old
+    migrations. ChunkedStorage reads files from its rows until they've
+    been moved by the `migrate_slowpoke_storage` management command.
+    '''
+
     def _open(self, name, mode='rb'):
         obj = SlowpokeStorageModel.objects.filter(name=name).get()
         return ContentFile(obj.data)
@@ -46,6 +61,171 @@ class SlowpokeStorageModel(models.Model):
     name = models.CharField(max_length=128, unique=True, db_index=True)
 
 
+class ChunkedFileReader(io.RawIOBase):
+    '''
+    A seekable, read-only file whose contents are read from the chunks
+    of a ChunkedStorageFile, fetching and decompressing one chunk at a
+    time, as it's needed.
+    '''
+
+    def __init__(self, file_id: int, size: int, chunk_size: int) -> None:
+        super().__init__()
+        self.file_id = file_id
+        self.size = size
+        self.chunk_size = chunk_size
+        self._pos = 0
+        self._chunk_index: Optional[int] = None
+        self._chunk = b''
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int=io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError(f'negative seek position {offset}')
+        self._pos = offset
+        return self._pos
+
+    def _get_chunk(self, index: int) -> bytes:
+        if index != self._chunk_index:
+            data = ChunkedStorageChunk.objects.filter(
+                file_id=self.file_id, index=index
+            ).values_list('data', flat=True).get()
+            self._chunk = zlib.decompress(data)
+            self._chunk_index = index
+        return self._chunk
+
+    def readinto(self, b) -> int:
+        if self._pos >= self.size:
+            return 0
+        index, offset = divmod(self._pos, self.chunk_size)
+        chunk = self._get_chunk(index)
+        n = min(len(b), len(chunk) - offset)
+        b[:n] = chunk[offset:offset + n]
+        self._pos += n
+        return n
+
+
+@deconstructible
+class ChunkedStorage(Storage):
+    '''
+    A storage backend that keeps files in the database, split into
+    fixed-size chunks that are compressed separately. Files are read
+    one chunk at a time, so they can be streamed with a bounded amount
+    of memory, and finding a file's size doesn't fetch any of its
+    contents.
+
+    Files that were stored by SlowpokeStorage are read from its rows
+    until move_from_slowpoke() has moved them, and their names are
+    still considered taken, so that no new file can be given one.
+    '''
+
+    CHUNK_SIZE = 256 * 1024
+
+    COMPRESS_LEVEL = 6
+
+    def __init__(self, chunk_size: Optional[int]=None) -> None:
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
+
+    def _open(self, name, mode='rb'):
+        try:
+            file_id, size, chunk_size = ChunkedStorageFile.objects.filter(
+                name=name).values_list('id', 'size', 'chunk_size').get()
+        except ChunkedStorageFile.DoesNotExist:
+            data = SlowpokeStorageModel.objects.filter(
+                name=name).values_list('data', flat=True).first()
+            if data is None:
+                raise FileNotFoundError(name)
+            return ContentFile(bytes(data), name=name)
+        reader = ChunkedFileReader(file_id, size, chunk_size)
+        return File(io.BufferedReader(reader, buffer_size=chunk_size),
+                    name=name)
+
+    @transaction.atomic
+    def _save(self, name, content):
+        obj = ChunkedStorageFile.objects.create(
+            name=name, size=0, chunk_size=self.chunk_size)
+        # File.chunks() reads exactly chunk_size bytes at a time, other
+        # than at the end of the file, which is what lets readers find
+        # the chunk containing any position in the file.
+        for index, data in enumerate(content.chunks(self.chunk_size)):
+            ChunkedStorageChunk.objects.create(
+                file=obj,
+                index=index,
+                data=zlib.compress(data, self.COMPRESS_LEVEL),
+            )
+            obj.size += len(data)
+        obj.save(update_fields=['size'])
+        return name
+
+    def delete(self, name):
+        ChunkedStorageFile.objects.filter(name=name).delete()
+        SlowpokeStorageModel.objects.filter(name=name).delete()
+
+    def exists(self, name):
+        return (ChunkedStorageFile.objects.filter(name=name).exists() or
+                SlowpokeStorageModel.objects.filter(name=name).exists())
+
+    def size(self, name):
+        size = ChunkedStorageFile.objects.filter(name=name).values_list(
+            'size', flat=True).first()
+        if size is None:
+            size = SlowpokeStorageModel.objects.filter(
+                name=name).values_list('size', flat=True).get()
+        return size
+
+    @transaction.atomic
+    def move_from_slowpoke(self, obj: SlowpokeStorageModel) -> bool:
+        '''
+        Move the file in the given SlowpokeStorageModel row into this
+        storage, under the same name, and delete the row. Returns
+        whether it was moved, which it isn't if a file with different
+        contents already has that name here.
+        '''
+
+        data = bytes(obj.data)
+        if ChunkedStorageFile.objects.filter(name=obj.name).exists():
+            with self.open(obj.name) as f:
+                if f.read() != data:
+                    return False
+        else:
+            # This is called rather than save(), since that would see
+            # that the name is taken by the row itself.
+            self._save(obj.name, ContentFile(data))
+        obj.delete()
+        return True
+
+
+class ChunkedStorageFile(models.Model):
+    name = models.CharField(max_length=128, unique=True)
+
+    size = models.BigIntegerField()
+
+    chunk_size = models.IntegerField()
+
+
+class ChunkedStorageChunk(models.Model):
+    file = models.ForeignKey(ChunkedStorageFile, on_delete=models.CASCADE,
+                             related_name='chunks')
+
+    index = models.IntegerField()
+
+    data = models.BinaryField()
+
+    class Meta:
+        unique_together = (('file', 'index'),)
+
+
 class HashedUploadedFile(models.Model):
     HASH_NAME = 'sha256'
 
@@ -63,14 +243,25 @@ class HashedUploadedFile(models.Model):
 
     contents = models.FileField(
         upload_to='data_capture_uploaded_files/',
-        storage=SlowpokeStorage()
+        storage=ChunkedStorage()
     )
 
+    READ_CHUNK_SIZE = 64 * 1024
+
     @classmethod
     def get_hex_hash(cls, f):
+        '''
+        Returns the hash of the given file. If it was hashed as it was
+        uploaded, by one of the handlers in data_capture.upload_handlers,
+        that hash is used, rather than reading the file again.
+        '''
+
+        hex_hash = getattr(f, 'hex_hash', None)
+        if hex_hash is not None:
+            return hex_hash
         f.seek(0)
         hasher = getattr(hashlib, cls.HASH_NAME)()
-        for chunk in iter(lambda: f.read(4096), b''):
+        for chunk in iter(lambda: f.read(cls.READ_CHUNK_SIZE), b''):
             hasher.update(chunk)
         f.seek(0)
         return hasher.hexdigest()
@@ -113,13 +304,96 @@ class AttemptedPriceListSubmission(models.Model):
         self.uploaded_file_content_type = f.content_type
 
     def restore_uploaded_file(self):
+        '''
+        Return the uploaded file as an UploadedFile that streams its
+        contents from storage. It should be closed once it's been read,
+        e.g. by using it in a `with` statement.
+        '''
+
         contents = self.uploaded_file.contents
-        contents.open()
-        return SimpleUploadedFile(
+        f = UploadedFile(
+            file=contents.storage.open(contents.name),
             name=self.uploaded_file_name,
-            content=contents.read(),
             content_type=self.uploaded_file_content_type,
+            size=contents.size,
         )
+        f.hex_hash = self.uploaded_file.hex_hash
+        return f
+
+
+class GleanedData(models.Model):
+    '''
+    Price list data gleaned from an uploaded file, as serialized by
+    data_capture.schedules.registry.serialize(), stored compressed while
+    the price list is being uploaded so that only its key needs to be
+    kept in the user's session.
+
+    It's addressed by the hash of the uploaded file and the schedule it
+    was gleaned under, so uploading the same file again reuses the same
+    row. Rows that haven't been stored for longer than a session can
+    last are deleted by delete_expired(), unless a recorded
+    AttemptedPriceListSubmission refers to them, since its replays
+    need them.
+    '''
+
+    COMPRESS_LEVEL = 6
+
+    key = models.CharField(max_length=255, unique=True)
+
+    data = models.BinaryField()
+
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    @staticmethod
+    def get_key(hex_hash: str, schedule: str) -> str:
+        return f'{schedule}:{hex_hash}'
+
+    @classmethod
+    def store(cls, hex_hash: str, serialized: Any) -> str:
+        '''
+        Stores the given serialized price list, gleaned from the file
+        with the given hash, and returns its key.
+        '''
+
+        schedule, _ = serialized
+        key = cls.get_key(hex_hash, schedule)
+        data = zlib.compress(json.dumps(serialized).encode('utf-8'),
+                             cls.COMPRESS_LEVEL)
+        cls.objects.update_or_create(key=key, defaults={'data': data})
+        return key
+
+    @classmethod
+    def load(cls, key: str) -> Optional[Any]:
+        '''
+        Returns the serialized price list stored with the given key,
+        or None if there isn't one, e.g. because it has expired.
+        '''
+
+        data = cls.objects.filter(key=key).values_list(
+            'data', flat=True).first()
+        if data is None:
+            return None
+        return json.loads(zlib.decompress(data).decode('utf-8'))
+
+    @classmethod
+    def delete_expired(cls, max_age: Optional[timedelta]=None) -> int:
+        '''
+        Deletes the price lists that haven't been stored for longer
+        than `max_age`, which defaults to the age of a session cookie,
+        and that no AttemptedPriceListSubmission's session state refers
+        to, and returns how many were deleted.
+        '''
+
+        if max_age is None:
+            max_age = timedelta(seconds=settings.SESSION_COOKIE_AGE)
+        referenced_keys = AttemptedPriceListSubmission.objects.annotate(
+            gleaned_data_key=KeyTextTransform('gleaned_data', 'session_state')
+        ).filter(gleaned_data_key__isnull=False).values('gleaned_data_key')
+        expired = cls.objects.filter(
+            updated_at__lt=timezone.now() - max_age
+        ).exclude(key__in=referenced_keys)
+        count, _ = expired.delete()
+        return count
 
 
 class SubmittedPriceList(models.Model):
@@ -266,6 +540,7 @@ class SubmittedPriceList(models.Model):
             row.save()
 
         self.save()
+        bump_data_version()
 
     def unreview(self, user):
         '''
@@ -277,6 +552,7 @@ class SubmittedPriceList(models.Model):
         self._change_status(self.STATUS_UNREVIEWED, user)
         self._delete_associated_contracts()
         self.save()
+        bump_data_version()
 
     def retire(self, user):
         '''
@@ -287,6 +563,7 @@ class SubmittedPriceList(models.Model):
         self._change_status(self.STATUS_RETIRED, user)
         self._delete_associated_contracts()
         self.save()
+        bump_data_version()
 
     def reject(self, user):
         '''
@@ -1,7 +1,8 @@
 import logging
 
+from contracts.models import ContractChange
 from . import email
-from .models import SubmittedPriceList
+from .models import GleanedData, SubmittedPriceList
 
 logger = logging.getLogger('rq_scheduler')
 
@@ -19,3 +20,21 @@ def send_admin_approval_reminder_email(threshold=10):
     else:
         logger.info(' -- Number unreviewed is less than {}, no email '
                     'will be sent'.format(threshold))
+
+
+def delete_expired_gleaned_data():
+    logger.info('Deleting expired gleaned price list data')
+
+    count = GleanedData.objects.count()
+    deleted = GleanedData.delete_expired()
+
+    logger.info(' -- Deleted {} of {} gleaned price lists'.format(
+        deleted, count))
+
+
+def delete_expired_contract_changes():
+    logger.info('Deleting expired contract changes')
+
+    deleted = ContractChange.objects.delete_expired()
+
+    logger.info(' -- Deleted {} contract changes'.format(deleted))
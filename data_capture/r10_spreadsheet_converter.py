@@ -1,8 +1,82 @@
-from typing import List, Optional
+import csv
+import gzip
+import io
+import zipfile
+from typing import (Dict, Generator, Iterable, Iterator, List, NamedTuple,
+                    Optional)
 
 import xlrd
-from xlrd.book import XL_CELL_DATE
+from xlrd.book import XL_CELL_DATE, XL_CELL_EMPTY
 from xlrd.xldate import xldate_as_datetime
+from xml.parsers import expat
+
+from .streaming_xlsx import Row, StreamingXlsxSheet
+
+
+# The exceptions raised while converting a file that isn't a valid
+# Region 10 spreadsheet.
+PARSE_ERRORS = (ValueError, KeyError, IndexError, xlrd.XLRDError,
+                zipfile.BadZipFile, expat.ExpatError)
+
+
+class PackedRows(NamedTuple):
+    '''
+    The converted rows of a Region 10 spreadsheet as gzipped CSV, along
+    with metadata about them, so that the spreadsheet doesn't need to be
+    parsed again.
+    '''
+
+    data: bytes
+    num_rows: int
+    heading_indices: Dict[str, int]
+
+
+def pack_rows(rows: Iterable[List[str]]) -> bytes:
+    '''
+    Returns the given CSV-like rows as gzipped CSV, e.g.:
+
+        >>> list(unpack_rows(pack_rows([['a', 'b,c'], ['', '1.0']])))
+        [['a', 'b,c'], ['', '1.0']]
+    '''
+    blob = io.BytesIO()
+    # Favor speed over size, since the rows are usually only read once.
+    with gzip.open(blob, 'wt', compresslevel=6, encoding='utf-8',
+                   newline='') as f:
+        csv.writer(f).writerows(rows)
+    return blob.getvalue()
+
+
+def unpack_rows(data: bytes) -> Iterator[List[str]]:
+    '''
+    Returns a generator that yields the rows packed by pack_rows().
+    '''
+    with gzip.open(io.BytesIO(data), 'rt', encoding='utf-8',
+                   newline='') as f:
+        yield from csv.reader(f)
+
+
+def get_upload_source_rows(upload_source) -> Iterator[List[str]]:
+    '''
+    Returns a generator that yields the converted rows of the given
+    BulkUploadContractSource, using the rows packed when it was
+    uploaded if there are any, rather than parsing its original file.
+    '''
+    if upload_source.converted_rows is not None:
+        return unpack_rows(bytes(upload_source.converted_rows))
+    r10_file = io.BytesIO(bytes(upload_source.original_file))
+    return Region10SpreadsheetConverter(r10_file).convert_next()
+
+
+def get_upload_source_metadata(upload_source):
+    '''
+    Returns a dict containing metadata about the given
+    BulkUploadContractSource, like
+    Region10SpreadsheetConverter.get_metadata().
+    '''
+    if upload_source.num_rows is not None:
+        return {'num_rows': upload_source.num_rows}
+    r10_file = io.BytesIO(bytes(upload_source.original_file))
+    return Region10SpreadsheetConverter(r10_file).get_metadata()
 
 
 class Region10SpreadsheetConverter():
@@ -16,9 +90,16 @@ class Region10SpreadsheetConverter():
     def __init__(self, xls_file):
         self.xls_file = xls_file
         self._book = None
+        self._is_xlsx: Optional[bool] = None
+        self._xlsx_sheet = None
 
     @property
     def book(self):
+        '''
+        The xlrd workbook for the file, which is only used for .xls
+        files, since .xlsx files are streamed instead.
+        '''
+
         if self._book is None:
             # Note that for spreadsheets with lots of rows, this can take
             # a really long time (e.g., 2 minutes for a sheet with 55,000
@@ -27,6 +108,48 @@ class Region10SpreadsheetConverter():
             self.xls_file.seek(0)
         return self._book
 
+    @property
+    def is_xlsx(self):
+        if self._is_xlsx is None:
+            self._is_xlsx = StreamingXlsxSheet.is_xlsx(self.xls_file)
+        return self._is_xlsx
+
+    @property
+    def xlsx_sheet(self):
+        if self._xlsx_sheet is None:
+            self._xlsx_sheet = StreamingXlsxSheet(self.xls_file,
+                                                  self.sheet_index)
+        return self._xlsx_sheet
+
+    @property
+    def datemode(self):
+        # necessary for Excel date parsing
+        if self.is_xlsx:
+            return self.xlsx_sheet.datemode
+        return self.book.datemode
+
+    def iter_rows(self) -> Generator[Row, None, None]:
+        '''
+        Returns a generator that yields each row of the sheet, including
+        the heading row, as a dict mapping column indices to the xlrd
+        types and values of their cells. Rows of .xlsx files are read
+        one at a time, rather than loading the whole file.
+        '''
+        if self.is_xlsx:
+            yield from self.xlsx_sheet.iter_rows()
+        else:
+            sheet = self.book.sheet_by_index(self.sheet_index)
+            for rx in range(sheet.nrows):
+                yield dict(enumerate(zip(sheet.row_types(rx),
+                                         sheet.row_values(rx))))
+
+    def get_heading_row(self) -> Row:
+        rows = self.iter_rows()
+        try:
+            return next(rows, {})
+        finally:
+            rows.close()
+
     # Dict of R10 Excel sheet headings to the expected col index of CSV rows
     # loaded by the existing R10 data loader
     #
@@ -67,9 +190,12 @@ class Region10SpreadsheetConverter():
         '''
         Returns a dict containing metadata about the related xls_file
         '''
-        sheet = self.book.sheet_by_index(self.sheet_index)
+        if self.is_xlsx:
+            num_rows = self.xlsx_sheet.count_rows()
+        else:
+            num_rows = self.book.sheet_by_index(self.sheet_index).nrows
         return {
-            'num_rows': sheet.nrows - 1  # subtract 1 for the header row
+            'num_rows': num_rows - 1  # subtract 1 for the header row
         }
 
     def convert_next(self):
@@ -80,25 +206,24 @@ class Region10SpreadsheetConverter():
         '''
         heading_indices = self.get_heading_indices_map()
 
-        datemode = self.book.datemode  # necessary for Excel date parsing
+        datemode = self.datemode
+
+        empty_cell = (XL_CELL_EMPTY, '')
 
-        sheet = self.book.sheet_by_index(self.sheet_index)
+        rows = self.iter_rows()
 
         # skip the heading row, process the rest
-        for rx in range(1, sheet.nrows):
+        next(rows, None)
+        for cells in rows:
             row: List[Optional[str]] = \
                 [None] * len(self.xl_heading_to_csv_idx_map)  # init row
 
             for heading, xl_idx in heading_indices.items():
-                # item_val = cval(xl_idx)
-                cell = sheet.cell(rx, xl_idx)
-
-                cell_type = cell.ctype
-                cell_value = cell.value
+                cell_type, cell_value = cells.get(xl_idx, empty_cell)
 
                 csv_col_idx = self.xl_heading_to_csv_idx_map[heading]
 
-                if cell_type is XL_CELL_DATE:
+                if cell_type == XL_CELL_DATE:
                     # convert to mm/dd/YYYY string
                     date = xldate_as_datetime(cell_value, datemode)
                     cell_value = date.strftime('%m/%d/%Y')
@@ -116,20 +241,37 @@ class Region10SpreadsheetConverter():
         '''
         return list(self.convert_next())
 
+    def pack(self) -> PackedRows:
+        '''
+        Converts the input Region 10 XLS/X spreadsheet, returning its
+        rows packed by pack_rows() along with its row count and heading
+        map, so it can be stored without needing to be parsed again.
+        '''
+        num_rows = 0
+
+        def count(rows):
+            nonlocal num_rows
+            for row in rows:
+                num_rows += 1
+                yield row
+
+        data = pack_rows(count(self.convert_next()))
+        return PackedRows(data=data, num_rows=num_rows,
+                          heading_indices=self.get_heading_indices_map())
+
     def get_heading_indices_map(self, raises=True):
         '''
         Given a sheet, returns a mapping of R10 Excel sheet headings
         to the column indices associated with those fields in that sheet
         '''
 
-        sheet = self.book.sheet_by_index(self.sheet_index)
-        headings = sheet.row(0)
+        headings = self.get_heading_row()
 
         idx_map = {}
-        for i, cell in enumerate(headings):
+        for i, (_, value) in sorted(headings.items()):
             # find the val in the xl_heading_to_csv_idx_map
-            if cell.value in self.xl_heading_to_csv_idx_map:
-                idx_map[cell.value] = i
+            if value in self.xl_heading_to_csv_idx_map:
+                idx_map[value] = i
 
         if raises:
             missing_headers = []
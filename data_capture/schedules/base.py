@@ -8,9 +8,13 @@ BasePriceList contains a variety of extension points to accommodate
 for these specifics while providing a common interface to clients.
 '''
 
+import csv
 import re
 import abc
-from typing import Dict, Any, Optional, List
+from io import StringIO
+from typing import Dict, Any, Callable, Iterator, Optional, List, Tuple, Type
+
+import xlrd
 
 from django.template.loader import render_to_string
 from django.core.validators import (
@@ -18,10 +22,12 @@ from django.core.validators import (
 from django.http import HttpRequest
 from django.utils.safestring import SafeString, mark_safe
 from django.forms import Form
+from django.forms.utils import ErrorList
 from django.core.files.uploadedfile import UploadedFile
 
 from contracts.loaders.region_10 import FEDERAL_MIN_CONTRACT_RATE
 from ..models import SubmittedPriceList
+from ..upload_handlers import HEADER_SIZE
 
 
 min_price_validator = MinValueValidator(
@@ -35,6 +41,190 @@ hour_regex = re.compile(r'^hour(ly|s)?$', flags=re.IGNORECASE)
 hourly_rates_only_validator = RegexValidator(
     hour_regex, 'Value must be "Hour" or "Hourly"')
 
+# The first bytes of .xls (OLE2) and .xlsx (zip) files.
+WORKBOOK_SIGNATURES = (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', b'PK\x03\x04')
+
+
+class ParsedUpload:
+    '''
+    An uploaded price list file, which is read, and parsed as a workbook
+    or as CSV, at most once no matter how many schedules try to make
+    sense of it. If reading or parsing it fails, the same exception is
+    raised every time it's asked for.
+    '''
+
+    def __init__(self, f: UploadedFile) -> None:
+        self.file = f
+        self._results: Dict[str, Tuple[Any, Optional[Exception]]] = {}
+
+    def _get(self, name: str, compute: Callable[[], Any]) -> Any:
+        if name not in self._results:
+            try:
+                self._results[name] = (compute(), None)
+            except Exception as e:
+                self._results[name] = (None, e)
+        value, error = self._results[name]
+        if error is not None:
+            raise error
+        return value
+
+    def _read(self) -> bytes:
+        self.file.seek(0)
+        contents = self.file.read()
+        self.file.seek(0)
+        return contents
+
+    @property
+    def contents(self) -> bytes:
+        return self._get('contents', self._read)
+
+    @property
+    def header(self) -> bytes:
+        '''
+        The first few bytes of the file. Files uploaded through the
+        handlers in data_capture.upload_handlers already have these,
+        so they don't need to be read again.
+        '''
+
+        header = getattr(self.file, 'header', None)
+        if header is None:
+            header = self.contents[:HEADER_SIZE]
+        return header
+
+    @property
+    def is_workbook(self) -> bool:
+        '''
+        Whether the file looks like an Excel workbook, judging by its
+        first few bytes, which is much cheaper than trying to open it.
+        '''
+
+        return self.header.startswith(WORKBOOK_SIGNATURES)
+
+    @property
+    def workbook(self) -> xlrd.book.Book:
+        return self._get('workbook', lambda: xlrd.open_workbook(
+            file_contents=self.contents))
+
+    @property
+    def text(self) -> str:
+        return self._get('text', lambda: self.contents.decode('utf-8'))
+
+    @property
+    def csv_header(self) -> Optional[List[str]]:
+        '''
+        The first row of the file, if it's a CSV file, or None
+        otherwise.
+        '''
+
+        def get_header():
+            try:
+                return next(csv.reader(StringIO(self.text)), None)
+            except (UnicodeDecodeError, csv.Error):
+                return None
+
+        return self._get('csv_header', get_header)
+
+
+class ValidatedField:
+    '''
+    A field of a ValidatedRow, which has the same `name`, `value()`
+    and `errors` as the bound field of a form would, so that templates
+    can render it in the same way.
+    '''
+
+    def __init__(self, name: str, value: Any, errors: List[str]) -> None:
+        self.name = name
+        self._value = value
+        self.errors = ErrorList(errors)
+
+    def value(self) -> Any:
+        return self._value
+
+
+class ValidatedRow:
+    '''
+    A row of a price list, along with the results of validating it
+    with a Django Form. It can be used in much the same way as the form
+    itself, e.g. by iterating over its fields in templates, but the
+    results of validation can be serialized and restored without
+    validating the row all over again.
+    '''
+
+    def __init__(self, form_class: Type[Form], data: Dict[str, Any],
+                 cleaned_data: Dict[str, Any],
+                 errors: Dict[str, List[str]]) -> None:
+        self.form_class = form_class
+        self.data = data
+        self.cleaned_data = cleaned_data
+        self.errors = errors
+
+    @classmethod
+    def from_form(cls, form: Form) -> 'ValidatedRow':
+        '''
+        Validates the given bound form, returning the results.
+        '''
+
+        form.is_valid()
+        return cls(
+            form_class=type(form),
+            data=form.data,
+            cleaned_data=form.cleaned_data,
+            errors={name: [str(message) for message in messages]
+                    for name, messages in form.errors.items()},
+        )
+
+    def is_valid(self) -> bool:
+        return not self.errors
+
+    def serialize(self) -> Dict[str, Any]:
+        '''
+        Returns a JSON-serializable representation of the results of
+        validating the row, not including the row itself. Cleaned values
+        that JSON can't represent, like Decimals, are converted to
+        strings.
+        '''
+
+        return {
+            'cleaned_data': {
+                name: value if isinstance(value, (str, int, float, bool,
+                                                  type(None)))
+                else str(value)
+                for name, value in self.cleaned_data.items()
+            },
+            'errors': self.errors,
+        }
+
+    @classmethod
+    def deserialize(cls, form_class: Type[Form], data: Dict[str, Any],
+                    obj: Dict[str, Any]) -> 'ValidatedRow':
+        '''
+        Given a form class, a row of data and an object previously
+        returned by serialize() for that row, returns a ValidatedRow.
+        Cleaned values are converted back to their original types by
+        their form fields, but aren't validated again.
+        '''
+
+        fields = form_class.base_fields
+        return cls(
+            form_class=form_class,
+            data=data,
+            cleaned_data={
+                name: fields[name].to_python(value)
+                for name, value in obj['cleaned_data'].items()
+            },
+            errors=obj['errors'],
+        )
+
+    def __getitem__(self, name: str) -> ValidatedField:
+        if name not in self.form_class.base_fields:
+            raise KeyError(name)
+        return ValidatedField(name, self.data.get(name),
+                              self.errors.get(name, []))
+
+    def __iter__(self) -> Iterator[ValidatedField]:
+        for name in self.form_class.base_fields:
+            yield self[name]
+
 
 class ConcreteBasePriceListMethods:
     '''
@@ -48,17 +238,52 @@ class ConcreteBasePriceListMethods:
     # what to upload.
     upload_example_template: Optional[str] = None
 
-    # This is a list of Django Form objects representing
+    # This is a list of ValidatedRow objects representing
     # valid rows in the price list.
-    valid_rows: List[Form]
+    valid_rows: List[ValidatedRow]
 
-    # This is a list of Django Form objects representing
+    # This is a list of ValidatedRow objects representing
     # invalid rows in the price list.
-    invalid_rows: List[Form]
+    invalid_rows: List[ValidatedRow]
+
+    # This is a list of the serialized results of validating every
+    # row in the price list, in order.
+    validation: List[Dict[str, Any]]
 
     def __init__(self) -> None:
         self.valid_rows = []
         self.invalid_rows = []
+        self.validation = []
+
+    def validate_rows(self, form_class: Type[Form],
+                      rows: List[Dict[str, Any]],
+                      validation: Optional[List[Dict[str, Any]]]=None
+                      ) -> None:
+        '''
+        Validates each of the given rows with the given form class,
+        sorting them into valid_rows and invalid_rows.
+
+        If `validation` is given, it should be the `validation` of a
+        price list previously made from the same rows, and the rows
+        will be sorted according to it instead of being validated
+        again, which is much faster.
+        '''
+
+        if validation is None:
+            validated_rows = [ValidatedRow.from_form(form_class(row))
+                              for row in rows]
+            validation = [row.serialize() for row in validated_rows]
+        else:
+            validated_rows = [
+                ValidatedRow.deserialize(form_class, row, obj)
+                for row, obj in zip(rows, validation)
+            ]
+        self.validation = validation
+        for row in validated_rows:
+            if row.is_valid():
+                self.valid_rows.append(row)
+            else:
+                self.invalid_rows.append(row)
 
     def is_empty(self) -> bool:
         '''
@@ -151,6 +376,37 @@ class BasePriceList(ConcreteBasePriceListMethods, metaclass=abc.ABCMeta):
 
         raise NotImplementedError()
 
+    @classmethod
+    def probe(cls, upload: ParsedUpload) -> Optional[float]:
+        '''
+        Returns a score between 0 and 1 of how much the given upload
+        looks like a price list for this schedule, e.g. the fraction of
+        its expected column headings that are present. This should be
+        much cheaper than gleaning the whole price list, and is used
+        to pick which schedule to fall back to when an upload can't be
+        interpreted under the one that was chosen.
+
+        A score of 0 means the upload is definitely not a price list for
+        this schedule. None, the default for schedules that don't
+        override this, means the schedule can't tell without gleaning
+        the whole price list, so it's tried after any schedules that
+        gave a positive score.
+        '''
+
+        return None
+
+    @classmethod
+    def load_from_parsed_upload(cls, upload: ParsedUpload) -> 'BasePriceList':
+        '''
+        Like load_from_upload(), but given a ParsedUpload, so that the
+        file doesn't need to be parsed again if other schedules have
+        already done so. By default, this just calls load_from_upload()
+        on the underlying file.
+        '''
+
+        upload.file.seek(0)
+        return cls.load_from_upload(upload.file)
+
     @classmethod
     @abc.abstractmethod
     def load_from_upload(cls, f: UploadedFile) -> 'BasePriceList':
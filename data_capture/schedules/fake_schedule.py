@@ -7,7 +7,7 @@ from django.core.exceptions import ValidationError
 from django.template.loader import render_to_string
 
 from contracts.models import EDUCATION_CHOICES as _EDUCATION_CHOICES
-from .base import BasePriceList, min_price_validator
+from .base import BasePriceList, ParsedUpload, min_price_validator
 
 
 EDU_LEVELS = {}
@@ -50,17 +50,12 @@ class FakeSchedulePriceList(BasePriceList):
                                'fake_schedule.html')
     upload_widget_extra_instructions = 'CSV format, please.'
 
-    def __init__(self, rows):
+    def __init__(self, rows, validation=None):
         super().__init__()
 
         self.rows = rows
 
-        for row in self.rows:
-            form = FakeScheduleRow(row)
-            if form.is_valid():
-                self.valid_rows.append(form)
-            else:
-                self.invalid_rows.append(form)
+        self.validate_rows(FakeScheduleRow, self.rows, validation)
 
     def add_to_price_list(self, price_list):
         for row in self.valid_rows:
@@ -73,7 +68,10 @@ class FakeSchedulePriceList(BasePriceList):
             )
 
     def serialize(self):
-        return self.rows
+        return {
+            'rows': self.rows,
+            'validation': self.validation,
+        }
 
     def to_table(self):
         return render_to_string(self.table_template,
@@ -84,16 +82,33 @@ class FakeSchedulePriceList(BasePriceList):
                                 {'rows': self.invalid_rows})
 
     @classmethod
-    def deserialize(cls, rows):
-        return cls(rows)
+    def deserialize(cls, obj):
+        if isinstance(obj, list):
+            # This was serialized before the results of validating its
+            # rows were, so they need to be validated again.
+            return cls(obj)
+        return cls(obj['rows'], obj['validation'])
+
+    @classmethod
+    def probe(cls, upload):
+        header = upload.csv_header
+        if not header:
+            return 0.0
+        fields = FakeScheduleRow.base_fields
+        return len(set(header) & set(fields)) / len(fields)
 
     @classmethod
     def load_from_upload(cls, f):
+        return cls.load_from_parsed_upload(ParsedUpload(f))
+
+    @classmethod
+    def load_from_parsed_upload(cls, upload):
         try:
-            reader = csv.DictReader(StringIO(f.read().decode('utf-8')))
+            reader = csv.DictReader(StringIO(upload.text))
             return cls([row for row in reader])
         except Exception as e:
-            logger.info('Failed to glean data from %s: %s' % (f.name, e))
+            logger.info('Failed to glean data from %s: %s' %
+                        (upload.file.name, e))
             raise ValidationError(
                 'Weird problems occurred when reading your file.'
             )
@@ -18,7 +18,7 @@ from django.forms import ValidationError
 from django.core.files.uploadedfile import UploadedFile
 from django.utils.module_loading import import_string
 
-from data_capture.schedules.base import BasePriceList
+from data_capture.schedules.base import BasePriceList, ParsedUpload
 
 
 class Choice(NamedTuple):
@@ -108,44 +108,69 @@ def load_from_upload(classname: str, f: UploadedFile) -> BasePriceList:
     return CLASSES[classname].load_from_upload(f)
 
 
+def rank_fallbacks(upload: ParsedUpload, classname: str) -> List[str]:
+    '''
+    Return the names of the registered schedule classes other than the
+    given one whose probe() thinks the given upload could be one of
+    their price lists, most likely first, followed by those whose
+    probe() can't tell.
+    '''
+
+    scores = []
+    unprobed = []
+    for fallback, _ in CHOICES:
+        if fallback == classname:
+            continue
+        score = CLASSES[fallback].probe(upload)
+        if score is None:
+            unprobed.append(fallback)
+        elif score > 0:
+            scores.append((score, fallback))
+    # sorted() is stable, so ties are broken by registration order.
+    ranked = [name for _, name in sorted(scores, key=lambda s: -s[0])]
+    return ranked + unprobed
+
+
 def smart_load_from_upload(classname: str, f: UploadedFile) -> BasePriceList:
     '''
     Attempt to intelligently load the given Django UploadedFile,
     interpreting it as a price list for the given schedule class name.
 
     If interpreting it under the preferred schedule results in either
-    a ValidationError or no valid rows, attempts will be made to
-    re-interpret the file under different schedules. The first found
-    that yields better interpretations of the data will be returned.
+    a ValidationError or no valid rows, the other schedules are asked to
+    probe the file, and re-interpret it in the order of how much they
+    think it looks like one of their price lists. The first that yields
+    a better interpretation of the data will be returned.
 
-    If no better matches are found, the original result or exception
+    If no better match is found, the original result or exception
     (from interpreting the data under the preferred price list) will
     be returned.
+
+    The file is only read and parsed once, however many schedules are
+    registered.
     '''
 
     original_error = None
     pricelist: Optional[BasePriceList] = None
+    upload = ParsedUpload(f)
 
     try:
-        pricelist = load_from_upload(classname, f)
+        pricelist = CLASSES[classname].load_from_parsed_upload(upload)
     except ValidationError as e:
         original_error = e
 
     if original_error or (pricelist and not pricelist.valid_rows):
-        # See if any of our other registered schedules can make better sense
-        # of it.
-        next_best_pricelist = None
-        for fallback, _ in CHOICES:
-            if fallback == classname:
-                continue
+        # See if the other registered schedules that the file looks most
+        # like can make better sense of it.
+        for fallback in rank_fallbacks(upload, classname):
             try:
-                f.seek(0)
-                next_best_pricelist = load_from_upload(fallback, f)
-                if next_best_pricelist.valid_rows:
-                    pricelist = next_best_pricelist
-                    break
-            except ValidationError as e:
-                pass
+                next_best_pricelist = \
+                    CLASSES[fallback].load_from_parsed_upload(upload)
+            except ValidationError:
+                continue
+            if next_best_pricelist.valid_rows:
+                pricelist = next_best_pricelist
+                break
 
     if pricelist is None:
         default_error = ValidationError('Unrecognized price list!')
@@ -10,12 +10,15 @@ from django.template.loader import render_to_string
 from .base import (BasePriceList, min_price_validator,
                    hourly_rates_only_validator)
 from .spreadsheet_utils import (generate_column_index_map,
+                                count_matching_columns,
                                 safe_cell_str_value, ColumnTitle)
 from .coercers import (strip_non_numeric, extract_min_education,
                        extract_hour_unit_of_issue, extract_first_int)
 from contracts.models import EDUCATION_CHOICES
 
 
+EDUCATION_CODES = {name: code for code, name in EDUCATION_CHOICES}
+
 DEFAULT_SHEET_NAME = '(3)Labor Categories'
 
 COLUMN_TITLES = {
@@ -204,18 +207,6 @@ class Schedule70Row(forms.Form):
 
         return value
 
-    def contract_model_education_level(self):
-        # Note that due to the way we've cleaned education_level, this
-        # code is guaranteed to work.
-
-        return [
-            code for code, name in EDUCATION_CHOICES
-            if name == self.cleaned_data['education_level']
-        ][0]
-
-    def contract_model_base_year_rate(self):
-        return self.cleaned_data['price_including_iff']
-
 
 class Schedule70PriceList(BasePriceList):
     title = 'IT Schedule 70'
@@ -224,30 +215,31 @@ class Schedule70PriceList(BasePriceList):
                                'schedule_70.html')
     upload_widget_extra_instructions = 'XLS or XLSX format, please.'
 
-    def __init__(self, rows):
+    def __init__(self, rows, validation=None):
         super().__init__()
 
         self.rows = rows
 
-        for row in self.rows:
-            form = Schedule70Row(row)
-            if form.is_valid():
-                self.valid_rows.append(form)
-            else:
-                self.invalid_rows.append(form)
+        self.validate_rows(Schedule70Row, self.rows, validation)
 
     def add_to_price_list(self, price_list):
         for row in self.valid_rows:
             price_list.add_row(
                 labor_category=row.cleaned_data['labor_category'],
-                education_level=row.contract_model_education_level(),
+                # Note that due to the way we've cleaned education_level,
+                # this is guaranteed to work.
+                education_level=EDUCATION_CODES[
+                    row.cleaned_data['education_level']],
                 min_years_experience=row.cleaned_data['min_years_experience'],
-                base_year_rate=row.contract_model_base_year_rate(),
+                base_year_rate=row.cleaned_data['price_including_iff'],
                 sin=row.cleaned_data['sin']
             )
 
     def serialize(self):
-        return self.rows
+        return {
+            'rows': self.rows,
+            'validation': self.validation,
+        }
 
     def to_table(self):
         return render_to_string(self.table_template,
@@ -267,13 +259,44 @@ class Schedule70PriceList(BasePriceList):
         }
 
     @classmethod
-    def deserialize(cls, rows):
-        return cls(rows)
+    def deserialize(cls, obj):
+        if isinstance(obj, list):
+            # This was serialized before the results of validating its
+            # rows were, so they need to be validated again.
+            return cls(obj)
+        return cls(obj['rows'], obj['validation'])
+
+    @classmethod
+    def probe(cls, upload):
+        if not upload.is_workbook:
+            return 0.0
+        try:
+            book = upload.workbook
+        except Exception:
+            return 0.0
+        if DEFAULT_SHEET_NAME not in book.sheet_names():
+            return 0.0
+        sheet = book.sheet_by_name(DEFAULT_SHEET_NAME)
+        try:
+            heading_row = sheet.row(find_header_row(sheet))
+        except ValidationError:
+            return 0.0
+        return count_matching_columns(heading_row, COLUMN_TITLES) / \
+            len(COLUMN_TITLES)
 
     @classmethod
     def load_from_upload(cls, f):
+        return cls._load(f, lambda: glean_labor_categories_from_file(f))
+
+    @classmethod
+    def load_from_parsed_upload(cls, upload):
+        return cls._load(upload.file, lambda: glean_labor_categories_from_book(
+            upload.workbook))
+
+    @classmethod
+    def _load(cls, f, glean):
         try:
-            rows = glean_labor_categories_from_file(f)
+            rows = glean()
             return Schedule70PriceList(rows)
         except ValidationError:
             raise
@@ -47,6 +47,23 @@ def safe_cell_str_value(sheet, rownum, colnum, coercer=None):
     return str(val)
 
 
+def count_matching_columns(heading_row, field_title_map):
+    '''
+    Returns how many of the titles in the given map of fields to column
+    titles match a cell of the given heading row. Unlike
+    generate_column_index_map(), this doesn't raise an error if any are
+    missing.
+    '''
+
+    count = 0
+    for title in field_title_map.values():
+        if isinstance(title, str):
+            title = ColumnTitle(title)
+        if any(title.matches(cell.value) for cell in heading_row):
+            count += 1
+    return count
+
+
 def generate_column_index_map(heading_row, field_title_map):
     def find_col(col_title):
         for idx, cell in enumerate(heading_row):
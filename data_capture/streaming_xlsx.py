@@ -0,0 +1,340 @@
+'''
+Read the rows of an .xlsx worksheet one at a time, without loading the
+whole workbook into memory.
+
+xlrd.open_workbook() parses every cell of every sheet into a tree of
+XML elements and then into memory before returning, which is slow and
+memory-hungry for large exports. StreamingXlsxSheet instead loads only
+the workbook's metadata, styles and shared strings table up-front
+(using xlrd's own handlers for them), and then incrementally parses
+the worksheet's XML with expat, yielding each row as soon as it has
+been read.
+
+Cells are typed and decoded in the same way as by
+xlrd.xlsx.X12Sheet.do_row(), so the rows are identical to those xlrd
+would read.
+'''
+
+import sys
+import zipfile
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from xml.parsers import expat
+
+from defusedxml.common import EntitiesForbidden, ExternalReferenceForbidden
+from xlrd import xlsx
+from xlrd.biffh import (XL_CELL_BOOLEAN, XL_CELL_ERROR, XL_CELL_TEXT)
+from xlrd.book import Book
+
+
+# A row is a dict mapping the column indices of its non-empty cells to
+# their xlrd cell types and values.
+Row = Dict[int, Tuple[int, Any]]
+
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+
+# expat joins namespaces and names with this.
+NS_SEPARATOR = ' '
+
+ROW_TAG, C_TAG, V_TAG, IS_TAG, R_TAG, T_TAG = [
+    MAIN_NS + NS_SEPARATOR + name for name in ('row', 'c', 'v', 'is', 'r', 't')
+]
+
+XML_SPACE_ATTR = 'http://www.w3.org/XML/1998/namespace' + NS_SEPARATOR + \
+    'space'
+
+# The number of bytes of the worksheet's XML to parse at a time.
+CHUNK_SIZE = 65536
+
+
+def get_column_index(cell_name: str) -> int:
+    '''
+    Return the index of the column in the given cell name, e.g.:
+
+        >>> get_column_index('A1'), get_column_index('$AB$12')
+        (0, 27)
+    '''
+
+    colx = 0
+    for c in cell_name:
+        if c == '$':
+            continue
+        if 'A' <= c <= 'Z':
+            colx = colx * 26 + ord(c) - ord('A') + 1
+        elif c.isdigit():
+            break
+        else:
+            raise ValueError(f'Unexpected character {c!r} in cell name '
+                             f'{cell_name!r}')
+    return colx - 1
+
+
+def cook_text(text: Optional[str], preserve_space: bool) -> str:
+    '''
+    Decode the text of an element, as xlrd.xlsx.cooked_text() does.
+    '''
+
+    if text is None:
+        return ''
+    if not preserve_space:
+        text = text.strip(xlsx.XML_WHITESPACE)
+    return xlsx.unescape(text)
+
+
+class SheetParser:
+    '''
+    An incremental parser for a worksheet's XML, which collects the
+    rows that have non-empty cells as (row index, row) tuples.
+
+    As with defusedxml, entity declarations and external references
+    are forbidden.
+    '''
+
+    def __init__(self, book: Book) -> None:
+        self.shared_strings = book._sharedstrings
+        self.xf_types = book._xf_index_to_xl_type_map
+        self.rows: List[Tuple[int, Row]] = []
+        self.rowx = -1
+        self.cells: Row = {}
+        self.colx = -1
+        self.cell_type = 'n'
+        self.xf_index = 0
+        self.value: Optional[str] = None
+        # The elements currently open within an inline string.
+        self.inline_stack: List[str] = []
+
+        # The text of the element being read, if it's one we're
+        # interested in.
+        self.text: Optional[List[str]] = None
+        self.preserve_space = False
+        self.inline_text: Optional[List[str]] = None
+
+        self.parser = expat.ParserCreate(namespace_separator=NS_SEPARATOR)
+        self.parser.buffer_text = True
+        self.parser.StartElementHandler = self.start_element
+        self.parser.EndElementHandler = self.end_element
+        self.parser.CharacterDataHandler = self.character_data
+        self.parser.EntityDeclHandler = self.forbid_entity_decl
+        self.parser.UnparsedEntityDeclHandler = \
+            self.forbid_unparsed_entity_decl
+        self.parser.ExternalEntityRefHandler = self.forbid_external_ref
+
+    def forbid_entity_decl(self, name, is_parameter_entity, value, base,
+                           sysid, pubid, notation_name):
+        raise EntitiesForbidden(name, value, base, sysid, pubid,
+                                notation_name)
+
+    def forbid_unparsed_entity_decl(self, name, base, sysid, pubid,
+                                    notation_name):
+        raise EntitiesForbidden(name, None, base, sysid, pubid,
+                                notation_name)
+
+    def forbid_external_ref(self, context, base, sysid, pubid):
+        raise ExternalReferenceForbidden(context, base, sysid, pubid)
+
+    def feed(self, data: bytes,
+             is_final: bool=False) -> List[Tuple[int, Row]]:
+        '''
+        Parse the given XML, returning the rows that were completed.
+        '''
+
+        self.parser.Parse(data, is_final)
+        rows = self.rows
+        self.rows = []
+        return rows
+
+    def start_element(self, name: str, attrs: Dict[str, str]) -> None:
+        if self.inline_text is not None:
+            self.inline_stack.append(name)
+        if name == C_TAG:
+            cell_name = attrs.get('r')
+            if cell_name is None:
+                self.colx += 1
+            else:
+                self.colx = get_column_index(cell_name)
+            self.cell_type = attrs.get('t', 'n')
+            self.xf_index = int(attrs.get('s', '0'))
+            self.value = None
+            self.inline_text = None
+        elif name == V_TAG or (name == T_TAG and self.is_inline_text()):
+            self.text = []
+            self.preserve_space = attrs.get(XML_SPACE_ATTR) == 'preserve'
+        elif name == IS_TAG:
+            self.inline_text = []
+            self.inline_stack = []
+        elif name == ROW_TAG:
+            row_number = attrs.get('r')
+            if row_number is None:
+                self.rowx += 1
+            else:
+                self.rowx = int(row_number) - 1
+            self.colx = -1
+            self.cells = {}
+
+    def is_inline_text(self) -> bool:
+        # Only the <t> children of an inline string, and of its rich
+        # text runs, make up its text.
+        return self.inline_stack in ([T_TAG], [R_TAG, T_TAG])
+
+    def character_data(self, data: str) -> None:
+        if self.text is not None:
+            self.text.append(data)
+
+    def end_element(self, name: str) -> None:
+        if self.text is not None and name in (V_TAG, T_TAG):
+            # Like ElementTree, treat elements without text as having
+            # None for their text.
+            text = ''.join(self.text) or None
+            self.text = None
+            if name == V_TAG:
+                if self.cell_type == 'str':
+                    self.value = cook_text(text, self.preserve_space)
+                else:
+                    self.value = text
+            elif self.inline_text is not None:
+                text = cook_text(text, self.preserve_space)
+                if text:
+                    self.inline_text.append(text)
+        elif name == IS_TAG and self.inline_text is not None:
+            self.value = ''.join(self.inline_text)
+            self.inline_text = None
+        elif name == C_TAG:
+            self.put_cell()
+        elif name == ROW_TAG:
+            if self.cells:
+                self.rows.append((self.rowx, self.cells))
+        if self.inline_stack:
+            self.inline_stack.pop()
+
+    def put_cell(self) -> None:
+        cell_type = self.cell_type
+        value = self.value
+        if cell_type == 'n':
+            if value:
+                self.cells[self.colx] = (self.xf_types[self.xf_index],
+                                         float(value))
+        elif cell_type == 's':
+            if value:
+                self.cells[self.colx] = (
+                    XL_CELL_TEXT, self.shared_strings[int(value)])
+        elif cell_type == 'str':
+            self.cells[self.colx] = (XL_CELL_TEXT, value)
+        elif cell_type == 'b':
+            if value:
+                self.cells[self.colx] = (XL_CELL_BOOLEAN, int(value))
+        elif cell_type == 'e':
+            self.cells[self.colx] = (XL_CELL_ERROR,
+                                     xlsx.error_code_from_text[value])
+        elif cell_type == 'inlineStr':
+            if value:
+                self.cells[self.colx] = (XL_CELL_TEXT, value)
+        else:
+            raise ValueError(f'Unknown cell type {cell_type!r} in '
+                             f'rowx={self.rowx} colx={self.colx}')
+
+
+class StreamingXlsxSheet:
+    '''
+    A worksheet in an .xlsx file, whose rows can be iterated over in
+    constant memory (aside from the workbook's shared strings table).
+
+    The rows are the same ones xlrd would read: rows without any
+    non-empty cells are included if they precede rows with content,
+    while trailing ones aren't.
+    '''
+
+    def __init__(self, f, sheet_index: int=0) -> None:
+        self.file = f
+        self.sheet_index = sheet_index
+        xlsx.ensure_elementtree_imported(0, sys.stdout)
+        with self.open_zipfile() as zf:
+            self.book, self.sheet_target = self.load_book(zf)
+
+    @property
+    def datemode(self) -> int:
+        return self.book.datemode
+
+    @staticmethod
+    def is_xlsx(f) -> bool:
+        '''
+        Return whether the given file looks like an .xlsx file.
+        '''
+
+        try:
+            return zipfile.is_zipfile(f)
+        finally:
+            f.seek(0)
+
+    def open_zipfile(self) -> zipfile.ZipFile:
+        self.file.seek(0)
+        zf = zipfile.ZipFile(self.file)
+        self.component_names = {
+            xlsx.X12Book.convert_filename(name): name
+            for name in zf.namelist()
+        }
+        return zf
+
+    def open_component(self, zf: zipfile.ZipFile, name: str):
+        return zf.open(self.component_names[name])
+
+    def load_book(self, zf: zipfile.ZipFile) -> Tuple[Book, str]:
+        '''
+        Load everything but the worksheets' cells, in the same way as
+        xlrd.xlsx.open_workbook_2007_xml().
+        '''
+
+        book = Book()
+        book.logfile = sys.stdout
+        book.verbosity = 0
+        book.formatting_info = False
+        book.use_mmap = False
+        book.on_demand = False
+        book.ragged_rows = False
+
+        x12book = xlsx.X12Book(book)
+        with self.open_component(zf, 'xl/_rels/workbook.xml.rels') as f:
+            x12book.process_rels(f)
+        with self.open_component(zf, 'xl/workbook.xml') as f:
+            x12book.process_stream(f, 'Workbook')
+
+        x12styles = xlsx.X12Styles(book)
+        if 'xl/styles.xml' in self.component_names:
+            with self.open_component(zf, 'xl/styles.xml') as f:
+                x12styles.process_stream(f, 'styles')
+
+        x12sst = xlsx.X12SST(book)
+        if 'xl/sharedstrings.xml' in self.component_names:
+            with self.open_component(zf, 'xl/sharedstrings.xml') as f:
+                x12sst.process_stream(f, 'SST')
+
+        if self.sheet_index >= book.nsheets:
+            raise IndexError(f'sheet index {self.sheet_index} out of range')
+        return book, x12book.sheet_targets[self.sheet_index]
+
+    def iter_rows(self) -> Iterator[Row]:
+        '''
+        Yield each row of the sheet, in order.
+        '''
+
+        parser = SheetParser(self.book)
+        num_rows = 0
+        try:
+            with self.open_zipfile() as zf:
+                with self.open_component(zf, self.sheet_target) as f:
+                    while True:
+                        data = f.read(CHUNK_SIZE)
+                        for rowx, row in parser.feed(data, not data):
+                            if rowx < num_rows:
+                                raise ValueError(
+                                    f'Row {rowx + 1} is out of order')
+                            while num_rows < rowx:
+                                yield {}
+                                num_rows += 1
+                            yield row
+                            num_rows += 1
+                        if not data:
+                            break
+        finally:
+            self.file.seek(0)
+
+    def count_rows(self) -> int:
+        return sum(1 for _ in self.iter_rows())
@@ -11,7 +11,7 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from calc.tests.common import BaseLoginTestCase
 from .. import admin, email
 from ..models import (SubmittedPriceList, SubmittedPriceListRow,
-                      AttemptedPriceListSubmission)
+                      AttemptedPriceListSubmission, ChunkedStorage)
 from .common import FAKE_SCHEDULE
 from .test_models import ModelTestCase
 
@@ -357,4 +357,21 @@ class AttemptedPriceListSubmissionAdminTests(BaseLoginTestCase):
         self.assertEqual(
             res['Content-Type'],
             'application/octet-stream')
-        self.assertEqual(res.content, b'blah,meh')
+        self.assertEqual(res['Content-Length'], '8')
+        self.assertEqual(b''.join(res.streaming_content), b'blah,meh')
+
+    def test_download_closes_file(self):
+        self.client.force_login(self.user)
+        opened = []
+        open_file = ChunkedStorage._open
+
+        def _open(self, *args, **kwargs):
+            f = open_file(self, *args, **kwargs)
+            opened.append(f)
+            return f
+
+        with mock.patch.object(ChunkedStorage, '_open', _open):
+            res = self.client.get(f'{self.URL_PREFIX}{self.apls.id}/download/')
+            b''.join(res.streaming_content)
+        self.assertEqual(len(opened), 1)
+        self.assertTrue(opened[0].closed)
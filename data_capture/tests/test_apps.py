@@ -17,10 +17,11 @@ class DataCaptureSchedulerAppTests(TestCase):
         self.assertIsInstance(config, DataCaptureSchedulerApp)
         config.ready()  # call the ready() method
         scheduler = django_rq.get_scheduler('default')
-        jobs = scheduler.get_jobs()
-        self.assertEqual(len(jobs), 1)
-        the_job = jobs[0]
-        self.assertEqual(
-            the_job.func,
-            periodic_jobs.send_admin_approval_reminder_email)
+        jobs = {job.func: job for job in scheduler.get_jobs()}
+        self.assertEqual(len(jobs), 3)
+        the_job = jobs[periodic_jobs.send_admin_approval_reminder_email]
         self.assertEqual(the_job.meta['cron_string'], "* 12 * * MON")
+        the_job = jobs[periodic_jobs.delete_expired_gleaned_data]
+        self.assertEqual(the_job.meta['cron_string'], "0 * * * *")
+        the_job = jobs[periodic_jobs.delete_expired_contract_changes]
+        self.assertEqual(the_job.meta['cron_string'], "30 * * * *")
@@ -1,8 +1,13 @@
+import json
+from decimal import Decimal
 from unittest.mock import patch
 from unittest import TestCase
 
+from django import forms
+from django.core.files.uploadedfile import SimpleUploadedFile
+
 from ..schedules import base
-from ..schedules.base import ConcreteBasePriceListMethods
+from ..schedules.base import ConcreteBasePriceListMethods, ValidatedRow
 
 
 class ConcreteBasePriceListMethodsTests(TestCase):
@@ -51,3 +56,91 @@ class ConcreteBasePriceListMethodsTests(TestCase):
         FunkyPriceList.render_upload_example('I am a fake request')
         r.assert_called_once_with('foo/bar.html', {'foo': 'bar'},
                                   request='I am a fake request')
+
+
+class ParsedUploadTests(TestCase):
+    def make_upload(self, content):
+        return base.ParsedUpload(SimpleUploadedFile('foo.csv', content))
+
+    def test_file_is_only_read_once(self):
+        upload = self.make_upload(b'a,b\n1,2\n')
+        with patch.object(base.ParsedUpload, '_read', autospec=True,
+                          side_effect=base.ParsedUpload._read) as read:
+            self.assertEqual(upload.text, 'a,b\n1,2\n')
+            self.assertEqual(upload.csv_header, ['a', 'b'])
+            self.assertEqual(read.call_count, 1)
+
+    def test_errors_are_raised_every_time(self):
+        upload = self.make_upload(b'nope')
+        with patch.object(base.xlrd, 'open_workbook',
+                          side_effect=ValueError('bad')) as open_workbook:
+            for _ in range(2):
+                with self.assertRaisesRegex(ValueError, 'bad'):
+                    upload.workbook
+            self.assertEqual(open_workbook.call_count, 1)
+
+    def test_csv_header_is_none_for_binary_files(self):
+        self.assertIsNone(self.make_upload(b'\xff\xfe\x00').csv_header)
+
+    def test_header_from_upload_handler_is_used(self):
+        upload = self.make_upload(b'PK\x03\x04 pretend this is big')
+        upload.file.header = b'PK\x03\x04'
+        with patch.object(base.ParsedUpload, '_read') as read:
+            self.assertTrue(upload.is_workbook)
+            read.assert_not_called()
+
+    def test_is_workbook_works(self):
+        self.assertTrue(self.make_upload(b'PK\x03\x04blah').is_workbook)
+        self.assertTrue(self.make_upload(
+            b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1blah').is_workbook)
+        self.assertFalse(self.make_upload(b'a,b\n1,2\n').is_workbook)
+
+
+class PriceRow(forms.Form):
+    name = forms.CharField()
+    price = forms.DecimalField()
+
+
+class ValidatedRowTests(TestCase):
+    def roundtrip(self, row):
+        obj = json.loads(json.dumps(row.serialize()))
+        return ValidatedRow.deserialize(PriceRow, row.data, obj)
+
+    def test_valid_rows_are_restored(self):
+        row = ValidatedRow.from_form(PriceRow({'name': 'a', 'price': '5.5'}))
+        restored = self.roundtrip(row)
+        self.assertTrue(restored.is_valid())
+        self.assertEqual(restored.cleaned_data,
+                         {'name': 'a', 'price': Decimal('5.5')})
+
+    def test_invalid_rows_are_restored(self):
+        row = ValidatedRow.from_form(PriceRow({'price': 'cheap'}))
+        restored = self.roundtrip(row)
+        self.assertFalse(restored.is_valid())
+        self.assertEqual(restored.errors, {
+            'name': ['This field is required.'],
+            'price': ['Enter a number.'],
+        })
+
+    def test_fields_are_like_bound_fields(self):
+        form = PriceRow({'price': 'cheap'})
+        row = self.roundtrip(ValidatedRow.from_form(form))
+        self.assertEqual(
+            [(f.name, f.value(), str(f.errors)) for f in row],
+            [(f.name, f.value(), str(f.errors)) for f in form],
+        )
+
+    def test_unknown_fields_raise_key_error(self):
+        row = ValidatedRow.from_form(PriceRow({}))
+        with self.assertRaises(KeyError):
+            row['blah']
+
+    @patch.object(PriceRow, 'full_clean')
+    def test_deserializing_does_not_validate(self, full_clean):
+        pl = ConcreteBasePriceListMethods()
+        pl.validate_rows(PriceRow, [{'name': 'a'}], [{
+            'cleaned_data': {'name': 'a', 'price': '1'},
+            'errors': {},
+        }])
+        full_clean.assert_not_called()
+        self.assertEqual(len(pl.valid_rows), 1)
@@ -1,5 +1,6 @@
 import json
 import unittest
+from unittest.mock import patch
 
 from django.core.files.base import ContentFile
 
@@ -8,6 +9,8 @@ from .test_jobs import process_worker_jobs
 from .common import (StepTestCase, R10_XLSX_PATH, XLSX_CONTENT_TYPE,
                      create_bulk_upload_contract_source)
 from ..views import bulk_upload
+from ..r10_spreadsheet_converter import (Region10SpreadsheetConverter,
+                                         unpack_rows)
 
 from contracts.models import Contract, BulkUploadContractSource
 
@@ -70,6 +73,10 @@ class Region10UploadStep1Tests(R10StepTestCase):
                 upload_source.pk)
             self.assertEqual(user, upload_source.submitter)
             self.assertFalse(upload_source.has_been_loaded)
+            self.assertEqual(upload_source.num_rows, 4)
+            self.assertEqual(
+                len(list(unpack_rows(bytes(upload_source.converted_rows)))),
+                4)
 
     def test_valid_post_redirects_to_step_2(self):
         self.login()
@@ -127,6 +134,17 @@ class Region10UploadStep2Tests(R10StepTestCase):
         self.assertEqual(res.status_code, 200)
         self.assertIn('file_metadata', res.context)
 
+    def test_get_does_not_parse_packed_file(self):
+        user = self.login()
+        src = self.setup_upload_source(user)
+        src.converted_rows = b''
+        src.num_rows = 12
+        src.save()
+        with patch.object(Region10SpreadsheetConverter, 'iter_rows') as m:
+            res = self.client.get(self.url)
+        m.assert_not_called()
+        self.assertEqual(res.context['file_metadata'], {'num_rows': 12})
+
     def test_post_is_ok_and_contracts_are_created_properly(self):
         user = self.login()
         self.setup_upload_source(user)
@@ -142,6 +160,7 @@ class Region10UploadStep2Tests(R10StepTestCase):
         for c in contracts:
             self.assertIsNotNone(c.search_index)
         self.assertNotIn('data_capture:upload_source_id', self.client.session)
+        self.assertIn('data_capture:bulk_upload_job_id', self.client.session)
 
     def test_old_contracts_are_deleted(self):
         user = self.login()
@@ -183,3 +202,40 @@ class Region10UploadStep3Tests(R10StepTestCase):
         res = self.client.get(self.url)
         self.assertEqual(res.status_code, 200)
         self.assertIn('SEND_TRANSACTIONAL_EMAILS', res.context)
+        self.assertNotContains(res, 'bulk-upload-progress')
+
+    def test_progress_is_shown_when_job_is_known(self):
+        self.login()
+        session = self.client.session
+        session['data_capture:bulk_upload_job_id'] = 'foo'
+        session.save()
+        res = self.client.get(self.url)
+        self.assertContains(
+            res, 'data-status-url="/data-capture/bulk/region-10/status"')
+
+
+class Region10UploadStatusTests(R10StepTestCase):
+    url = '/data-capture/bulk/region-10/status'
+
+    def test_unknown_job_is_not_found(self):
+        self.login()
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(json.loads(res.content.decode('utf-8')),
+                         {'status': None, 'progress': None})
+
+    def test_job_status_and_progress_are_returned(self):
+        user = self.login()
+        self.setup_upload_source(user)
+        self.client.post(Region10UploadStep2Tests.url)
+
+        res = self.client.get(self.url)
+        self.assertEqual(json.loads(res.content.decode('utf-8')),
+                         {'status': 'queued', 'progress': None})
+
+        process_worker_jobs()
+
+        data = json.loads(self.client.get(self.url).content.decode('utf-8'))
+        self.assertEqual(data['status'], 'finished')
+        self.assertEqual(data['progress']['stage'], 'finished')
+        self.assertEqual(data['progress']['rows_written'], 3)
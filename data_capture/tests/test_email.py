@@ -151,6 +151,20 @@ class EmailTests(ModelTestCase):
         self.assertIn('r10_upload_link', result.context)
         self.assertEqual(result.context['num_contracts'], 5)
         self.assertEqual(result.context['num_bad_rows'], 2)
+        self.assertIn('previous Region 10 data has been removed',
+                      message.body)
+
+    def test_bulk_upload_succeeded_reports_differences(self):
+        src = create_bulk_upload_contract_source(
+            self.user)
+        src.save()
+        result = email.bulk_upload_succeeded(src, 5, 2, num_inserted=3,
+                                             num_updated=1, num_deleted=4)
+        self.assertTrue(result.was_successful)
+        body = mail.outbox[0].body
+        self.assertRegex(body, r'3 rows\s+were added')
+        self.assertRegex(body, r'1 rows\s+were changed')
+        self.assertRegex(body, r'4 rows\s+were removed')
 
     def test_bulk_upload_failed(self):
         src = create_bulk_upload_contract_source(
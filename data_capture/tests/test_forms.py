@@ -1,3 +1,5 @@
+from unittest import mock
+
 from model_mommy import mommy
 from django.test import TestCase, override_settings
 
@@ -6,6 +8,7 @@ from ..schedules.fake_schedule import FakeSchedulePriceList
 from ..forms import (Step1Form, Step2Form, PriceListUploadForm, Step4Form,
                      PriceListDetailsForm, Region10BulkUploadForm)
 from ..models import SubmittedPriceList
+from ..r10_spreadsheet_converter import Region10SpreadsheetConverter
 
 
 @override_settings(DATA_CAPTURE_SCHEDULES=[FAKE_SCHEDULE])
@@ -165,6 +168,21 @@ class Region10BulkUploadFormTests(TestCase):
             ]
         })
 
+    def test_invalid_when_rows_cannot_be_converted(self):
+        with mock.patch.object(Region10SpreadsheetConverter, 'pack',
+                               side_effect=ValueError('bad date')):
+            form = Region10BulkUploadForm({}, {'file': r10_file()})
+            self.assertFalse(form.is_valid())
+        self.assertIn('__all__', form.errors)
+
+    def test_conversion_bugs_are_not_hidden(self):
+        with mock.patch.object(Region10SpreadsheetConverter, 'pack',
+                               side_effect=TypeError('oops')):
+            form = Region10BulkUploadForm({}, {'file': r10_file()})
+            with self.assertRaisesRegex(TypeError, 'oops'):
+                form.is_valid()
+
     def test_valid_when_file_is_valid(self):
         form = Region10BulkUploadForm({}, {'file': r10_file()})
         self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['packed_rows'].num_rows, 4)
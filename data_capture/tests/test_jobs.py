@@ -1,11 +1,17 @@
+from decimal import Decimal
 from unittest.mock import patch
 from django.core import mail
 from django.test import TestCase
 from rq import SimpleWorker
+from rq.job import Job
 import django_rq
 
+from contracts.mommy_recipes import get_contract_recipe
+from contracts.models import Contract, LaborCategoryCount
 from .common import create_bulk_upload_contract_source
+from .test_r10_spreadsheet_converter import expected_results
 from .. import jobs
+from ..r10_spreadsheet_converter import Region10SpreadsheetConverter, pack_rows
 
 
 def process_worker_jobs():
@@ -41,6 +47,69 @@ class ProcessBulkUploadTests(TestCase):
         self.assertEqual(len(mail.outbox), 1)
         self.assertEqual(mail.outbox[0].recipients(), ['foo@example.org'])
 
+    @patch.object(jobs, 'bump_data_version')
+    def test_invalidates_api_cache(self, mock):
+        src = create_bulk_upload_contract_source(user='foo@example.org')
+        src.save()
+        jobs._process_bulk_upload(src)
+        mock.assert_called_once_with()
+
+    def test_updates_labor_category_counts(self):
+        old_src = create_bulk_upload_contract_source(user='foo@example.org')
+        old_src.save()
+        get_contract_recipe().make(labor_category='Old Category',
+                                   upload_source=old_src)
+        src = create_bulk_upload_contract_source(user=old_src.submitter)
+        src.save()
+        jobs._process_bulk_upload(src)
+        categories = LaborCategoryCount.objects.values_list(
+            'labor_category', flat=True)
+        self.assertNotIn('old category', categories)
+        self.assertGreater(len(categories), 0)
+
+    def test_packed_rows_are_loaded_without_parsing_file(self):
+        src = create_bulk_upload_contract_source(
+            user='foo@example.org',
+            converted_rows=pack_rows([['']] * 2),
+            num_rows=2,
+        )
+        src.save()
+        with patch.object(Region10SpreadsheetConverter, 'iter_rows') as m:
+            result = jobs._process_bulk_upload(src)
+        m.assert_not_called()
+        self.assertEqual((result.num_contracts, result.num_bad_rows), (0, 2))
+
+    def test_job_publishes_progress(self):
+        src = create_bulk_upload_contract_source(
+            user='foo@example.org',
+            converted_rows=pack_rows([PROJECT_MANAGER, BAD_ROW, QA_ENGINEER]),
+            num_rows=3,
+        )
+        src.save()
+        job = jobs.process_bulk_upload_and_send_email.delay(src.id)
+        process_worker_jobs()
+        progress = Job.fetch(job.id, connection=job.connection).meta[
+            'progress']
+        self.assertEqual(progress, {
+            'stage': 'finished',
+            'num_rows': 3,
+            'rows_parsed': 3,
+            'bad_rows': 1,
+            'rows_written': 2,
+            'rows_to_write': 2,
+            'eta_seconds': 0,
+        })
+
+    @patch.object(jobs, '_process_bulk_upload')
+    def test_job_publishes_failure(self, mock):
+        mock.side_effect = Exception('KABLOOEY')
+        src = create_bulk_upload_contract_source(user='foo@example.org')
+        src.save()
+        job = jobs.process_bulk_upload_and_send_email.delay(src.id)
+        process_worker_jobs()
+        job.refresh()
+        self.assertEqual(job.meta['progress']['stage'], 'failed')
+
     def test_contract_creation_batching_yields_leftovers(self):
         rows = [['']] * 3
         generator = jobs._create_contract_batches(
@@ -60,6 +129,19 @@ class ProcessBulkUploadTests(TestCase):
         with self.assertRaises(StopIteration):
             next(generator)
 
+    def test_contract_creation_in_parallel_matches_serial(self):
+        rows = [PROJECT_MANAGER, BAD_ROW, QA_ENGINEER] * 3 + [BAD_ROW]
+
+        def create(workers):
+            return list(jobs._create_contract_batches(
+                None, batch_size=2, rows=iter(rows), workers=workers))
+
+        serial = create(workers=1)
+        self.assertEqual([(len(c), len(b)) for c, b in serial],
+                         [(1, 1), (2, 0), (1, 1), (1, 1), (1, 1)])
+        self.assertEqual(serial[1][0][0]['labor_category'], 'QA Engineer')
+        self.assertEqual(create(workers=2), serial)
+
     def test_contract_creation_batching_does_not_yield_empty_leftovers(self):
         rows = [['']] * 2
         generator = jobs._create_contract_batches(
@@ -74,3 +156,182 @@ class ProcessBulkUploadTests(TestCase):
 
         with self.assertRaises(StopIteration):
             next(generator)
+
+
+PROJECT_MANAGER, BAD_ROW, SOFTWARE_DEVELOPER, QA_ENGINEER = expected_results
+
+
+class BulkUploadProgressTests(TestCase):
+    @patch.object(jobs.time, 'monotonic')
+    def test_eta_is_estimated_from_rate_so_far(self, monotonic):
+        monotonic.return_value = 100
+        progress = jobs.BulkUploadProgress(num_rows=1000)
+        self.assertIsNone(progress.eta_seconds)
+
+        monotonic.return_value = 110
+        progress.update(rows_parsed=500)
+        self.assertEqual(progress.eta_seconds, 10)
+
+        monotonic.return_value = 130
+        progress.update('writing', rows_parsed=1000, rows_to_write=500)
+        self.assertEqual(progress.eta_seconds, 15)
+
+        progress.update('finished')
+        self.assertEqual(progress.eta_seconds, 0)
+
+    def test_eta_is_none_without_num_rows(self):
+        progress = jobs.BulkUploadProgress()
+        progress.update(rows_parsed=5)
+        self.assertIsNone(progress.eta_seconds)
+
+    def test_unknown_counts_raise_error(self):
+        with self.assertRaisesRegex(AttributeError, 'rows_read'):
+            jobs.BulkUploadProgress().update(rows_read=5)
+
+
+class DifferentialBulkUploadTests(TestCase):
+    def setUp(self):
+        self.user = create_bulk_upload_contract_source(
+            user='foo@example.org').submitter
+
+    def make_source(self, *rows):
+        src = create_bulk_upload_contract_source(
+            user=self.user,
+            converted_rows=pack_rows(rows),
+            num_rows=len(rows),
+        )
+        src.save()
+        return src
+
+    def upload(self, *rows, **kwargs):
+        return jobs._process_bulk_upload(self.make_source(*rows), **kwargs)
+
+    def get_ids(self):
+        return dict(Contract.objects.values_list('labor_category', 'id'))
+
+    def test_first_upload_inserts_everything(self):
+        result = self.upload(PROJECT_MANAGER, SOFTWARE_DEVELOPER, BAD_ROW)
+        self.assertEqual(result, jobs.BulkUploadResult(
+            num_contracts=2, num_bad_rows=1, num_inserted=2, num_updated=0,
+            num_deleted=0))
+        self.assertEqual(set(self.get_ids()),
+                         {'Project Manager', 'Software Developer'})
+
+    def test_only_differences_are_applied(self):
+        self.upload(PROJECT_MANAGER, SOFTWARE_DEVELOPER, QA_ENGINEER)
+        old_ids = self.get_ids()
+
+        cheaper_developer = list(SOFTWARE_DEVELOPER)
+        cheaper_developer[1] = '99.0'
+        new_manager = list(PROJECT_MANAGER)
+        new_manager[0] = 'Program Manager'
+        result = self.upload(QA_ENGINEER, cheaper_developer, new_manager)
+
+        self.assertEqual(result, jobs.BulkUploadResult(
+            num_contracts=3, num_bad_rows=0, num_inserted=1, num_updated=1,
+            num_deleted=1))
+        ids = self.get_ids()
+        self.assertEqual(set(ids), {'QA Engineer', 'Software Developer',
+                                    'Program Manager'})
+        self.assertEqual(ids['QA Engineer'], old_ids['QA Engineer'])
+        self.assertEqual(ids['Software Developer'],
+                         old_ids['Software Developer'])
+        developer = Contract.objects.get(labor_category='Software Developer')
+        self.assertEqual(developer.hourly_rate_year1, Decimal('99.00'))
+        self.assertEqual(
+            [c.labor_category for c in
+             Contract.objects.multi_phrase_search('program')],
+            ['Program Manager'])
+        self.assertEqual(
+            set(LaborCategoryCount.objects.values_list('labor_category',
+                                                       flat=True)),
+            {'qa engineer', 'software developer', 'program manager'})
+
+    def test_unchanged_upload_changes_nothing(self):
+        self.upload(PROJECT_MANAGER, PROJECT_MANAGER, QA_ENGINEER)
+        result = self.upload(QA_ENGINEER, PROJECT_MANAGER, PROJECT_MANAGER)
+        self.assertEqual(result, jobs.BulkUploadResult(
+            num_contracts=3, num_bad_rows=0, num_inserted=0, num_updated=0,
+            num_deleted=0))
+        self.assertEqual(Contract.objects.count(), 3)
+
+    def test_unchanged_contracts_move_to_new_upload(self):
+        self.upload(PROJECT_MANAGER, QA_ENGINEER)
+        old_src = Contract.objects.first().upload_source
+        src = self.make_source(QA_ENGINEER, PROJECT_MANAGER)
+        jobs._process_bulk_upload(src)
+        self.assertEqual(
+            set(Contract.objects.values_list('upload_source', flat=True)),
+            {src.id})
+        old_src.delete()
+        self.assertEqual(Contract.objects.count(), 2)
+
+    def test_replace_deletes_and_reinserts_everything(self):
+        self.upload(PROJECT_MANAGER, QA_ENGINEER)
+        old_ids = self.get_ids()
+        result = self.upload(PROJECT_MANAGER, QA_ENGINEER, replace=True)
+        self.assertEqual(result, jobs.BulkUploadResult(
+            num_contracts=2, num_bad_rows=0, num_inserted=2, num_updated=0,
+            num_deleted=2))
+        self.assertEqual(set(self.get_ids()), set(old_ids))
+        self.assertNotEqual(self.get_ids(), old_ids)
+
+    def test_success_email_reports_differences(self):
+        self.upload(PROJECT_MANAGER)
+        src = create_bulk_upload_contract_source(
+            user=self.user, converted_rows=pack_rows([QA_ENGINEER]))
+        src.save()
+        jobs.process_bulk_upload_and_send_email(src.id)
+        self.assertRegex(mail.outbox[0].body,
+                         r'1 rows\s+were added,\s+0 rows\s+were changed, '
+                         r'and\s+1 rows\s+were removed')
+
+    def test_checkpointed_upload_matches_normal_one(self):
+        self.upload(PROJECT_MANAGER, SOFTWARE_DEVELOPER)
+        result = self.upload(QA_ENGINEER, SOFTWARE_DEVELOPER, BAD_ROW,
+                             checkpointed=True)
+        self.assertEqual(result, jobs.BulkUploadResult(
+            num_contracts=2, num_bad_rows=1, num_inserted=1, num_updated=0,
+            num_deleted=1))
+        self.assertEqual(set(self.get_ids()),
+                         {'QA Engineer', 'Software Developer'})
+
+    def test_replace_cannot_be_checkpointed(self):
+        with self.assertRaisesRegex(ValueError, 'cannot be checkpointed'):
+            self.upload(PROJECT_MANAGER, replace=True, checkpointed=True)
+
+    @patch.object(jobs, 'WRITE_BATCH_SIZE', 1)
+    def test_interrupted_checkpointed_upload_resumes(self):
+        self.upload(PROJECT_MANAGER)
+        src = self.make_source(QA_ENGINEER, SOFTWARE_DEVELOPER)
+        copy_create = Contract.objects.copy_create
+
+        def interrupt_second_batch(contracts):
+            if Contract.objects.count() == 1:
+                raise Exception('Worker restarted')
+            copy_create(contracts)
+
+        with patch.object(Contract.objects, 'copy_create',
+                          side_effect=interrupt_second_batch):
+            with self.assertRaisesRegex(Exception, 'Worker restarted'):
+                jobs._process_bulk_upload(src, checkpointed=True)
+
+        src.refresh_from_db()
+        self.assertEqual(src.load_checkpoint, {
+            'num_deleted': 1, 'num_updated': 0, 'num_inserted': 1})
+        self.assertFalse(src.has_been_loaded)
+        self.assertEqual(Contract.objects.count(), 1)
+
+        with patch.object(Contract.objects, 'copy_create',
+                          wraps=copy_create) as mock:
+            result = jobs._process_bulk_upload(src, checkpointed=True)
+        mock.assert_called_once()
+        self.assertEqual(len(mock.call_args[0][0]), 1)
+        self.assertEqual(result, jobs.BulkUploadResult(
+            num_contracts=2, num_bad_rows=0, num_inserted=2, num_updated=0,
+            num_deleted=1))
+        self.assertEqual(set(self.get_ids()),
+                         {'QA Engineer', 'Software Developer'})
+        src.refresh_from_db()
+        self.assertIsNone(src.load_checkpoint)
+        self.assertTrue(src.has_been_loaded)
@@ -1,11 +1,13 @@
 import io
 
 from django.test import TestCase
+from django.core.files.base import ContentFile
 from django.core.management import call_command
 from django.contrib.auth.models import Group
 from click.testing import CliRunner
 
 from ..management.commands import initgroups, send_example_emails
+from ..models import ChunkedStorage, SlowpokeStorageModel
 from .common import R10_XLSX_PATH
 
 
@@ -42,3 +44,36 @@ class TestSendtesthtmlemail(TestCase):
 class TestProcessBulkUpload(TestCase):
     def test_it_does_not_explode(self):
         call_command('process_bulk_upload', R10_XLSX_PATH)
+
+
+class TestMigrateSlowpokeStorage(TestCase):
+    def test_it_moves_files(self):
+        SlowpokeStorageModel(name='foo.csv', data=b'foo', size=3).save()
+        output = io.StringIO()
+        call_command('migrate_slowpoke_storage', stdout=output)
+        self.assertIn('1 of 1 files were moved', output.getvalue())
+        self.assertFalse(SlowpokeStorageModel.objects.exists())
+        with ChunkedStorage().open('foo.csv') as f:
+            self.assertEqual(f.read(), b'foo')
+
+    def test_it_skips_files_already_moved(self):
+        ChunkedStorage()._save('foo.csv', ContentFile(b'foo'))
+        SlowpokeStorageModel(name='foo.csv', data=b'foo', size=3).save()
+        call_command('migrate_slowpoke_storage', stdout=io.StringIO())
+        self.assertFalse(SlowpokeStorageModel.objects.exists())
+        with ChunkedStorage().open('foo.csv') as f:
+            self.assertEqual(f.read(), b'foo')
+
+    def test_it_keeps_files_whose_names_are_taken(self):
+        ChunkedStorage()._save('foo.csv', ContentFile(b'new'))
+        SlowpokeStorageModel(name='foo.csv', data=b'old', size=3).save()
+        output = io.StringIO()
+        stderr = io.StringIO()
+        call_command('migrate_slowpoke_storage', stdout=output,
+                     stderr=stderr)
+        self.assertIn('0 of 1 files were moved', output.getvalue())
+        self.assertIn('Not moving foo.csv', stderr.getvalue())
+        self.assertEqual(bytes(SlowpokeStorageModel.objects.get().data),
+                         b'old')
+        with ChunkedStorage().open('foo.csv') as f:
+            self.assertEqual(f.read(), b'new')
@@ -1,24 +1,94 @@
-from datetime import datetime, date
+import io
+import zlib
+from datetime import datetime, date, timedelta
 from decimal import Decimal
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 from freezegun import freeze_time
+from django.contrib.auth.models import User
 from django.test import override_settings, TestCase
 from django.utils import timezone
 from django.forms import ValidationError
 from django.core.files.uploadedfile import SimpleUploadedFile
 
 from calc.tests.common import BaseLoginTestCase
-from contracts.models import Contract
+from contracts.models import Contract, LaborCategoryCount
+from ..schedules import registry
 from ..schedules.fake_schedule import FakeSchedulePriceList
 from ..models import (SubmittedPriceList, SubmittedPriceListRow,
-                      HashedUploadedFile)
+                      HashedUploadedFile, GleanedData, ChunkedStorage,
+                      ChunkedStorageChunk, AttemptedPriceListSubmission,
+                      SlowpokeStorageModel)
 from .common import FAKE_SCHEDULE
 
 
 frozen_datetime = datetime(2017, 1, 12, 9, 15, 20)
 
 
+class ChunkedStorageTests(TestCase):
+    CONTENTS = b'0123456789' * 10
+
+    def test_unmoved_slowpoke_files_can_be_used(self):
+        SlowpokeStorageModel(name='old.csv', data=b'old', size=3).save()
+        storage = ChunkedStorage()
+        self.assertTrue(storage.exists('old.csv'))
+        self.assertEqual(storage.size('old.csv'), 3)
+        with storage.open('old.csv') as f:
+            self.assertEqual(f.read(), b'old')
+        self.assertNotEqual(storage.save('old.csv', io.BytesIO(b'new')),
+                            'old.csv')
+        storage.delete('old.csv')
+        self.assertFalse(storage.exists('old.csv'))
+
+    def setUp(self):
+        self.storage = ChunkedStorage(chunk_size=16)
+        self.name = self.storage.save('foo.bin', io.BytesIO(self.CONTENTS))
+
+    def test_files_are_split_into_compressed_chunks(self):
+        self.assertEqual(ChunkedStorageChunk.objects.count(), 7)
+        chunk = ChunkedStorageChunk.objects.get(index=6)
+        self.assertEqual(zlib.decompress(chunk.data), self.CONTENTS[96:])
+
+    def test_files_can_be_read(self):
+        with self.storage.open(self.name) as f:
+            self.assertEqual(f.read(), self.CONTENTS)
+
+    def test_files_can_be_seeked(self):
+        with self.storage.open(self.name) as f:
+            f.seek(30)
+            self.assertEqual(f.read(5), self.CONTENTS[30:35])
+            f.seek(-4, io.SEEK_END)
+            self.assertEqual(f.read(), self.CONTENTS[-4:])
+
+    def test_files_are_streamed_a_chunk_at_a_time(self):
+        with self.storage.open(self.name) as f:
+            with self.assertNumQueries(1):
+                self.assertEqual(f.read(3), self.CONTENTS[:3])
+            with self.assertNumQueries(0):
+                self.assertEqual(f.read(13), self.CONTENTS[3:16])
+
+    def test_size_does_not_fetch_contents(self):
+        with patch.object(ChunkedStorageChunk.objects, 'filter') as filter:
+            self.assertEqual(self.storage.size(self.name), 100)
+            filter.assert_not_called()
+
+    def test_exists_and_delete_work(self):
+        self.assertTrue(self.storage.exists(self.name))
+        self.storage.delete(self.name)
+        self.assertFalse(self.storage.exists(self.name))
+        self.assertFalse(ChunkedStorageChunk.objects.exists())
+
+    def test_empty_files_work(self):
+        name = self.storage.save('empty.bin', io.BytesIO(b''))
+        self.assertEqual(self.storage.size(name), 0)
+        with self.storage.open(name) as f:
+            self.assertEqual(f.read(), b'')
+
+    def test_missing_files_raise_error(self):
+        with self.assertRaises(FileNotFoundError):
+            self.storage.open('blarg')
+
+
 class HashedUploadedFileTests(TestCase):
     UPLOAD_DIR = 'data_capture_uploaded_files'
 
@@ -34,6 +104,21 @@ class HashedUploadedFileTests(TestCase):
         self.assertIn(self.UPLOAD_DIR, uf.contents.name)
         self.assertIn('blah', uf.contents.name)
 
+    def test_attempts_restore_uploaded_files(self):
+        attempt = AttemptedPriceListSubmission()
+        attempt.set_uploaded_file(SimpleUploadedFile(
+            name='blah.csv', content=b'a,b', content_type='text/csv'))
+        f = attempt.restore_uploaded_file()
+        self.assertEqual(f.name, 'blah.csv')
+        self.assertEqual(f.content_type, 'text/csv')
+        self.assertEqual(f.size, 3)
+        self.assertEqual(f.read(), b'a,b')
+
+    def test_get_hex_hash_uses_hash_from_upload_handler(self):
+        f = MagicMock(hex_hash='abcd')
+        self.assertEqual(HashedUploadedFile.get_hex_hash(f), 'abcd')
+        f.read.assert_not_called()
+
     def test_store_returns_existing_files(self):
         uf1 = HashedUploadedFile.store(SimpleUploadedFile(
             name='f1', content=b'zz'))
@@ -52,6 +137,52 @@ class HashedUploadedFileTests(TestCase):
         self.assertNotEqual(uf1.contents.name, uf2.contents.name)
 
 
+@override_settings(DATA_CAPTURE_SCHEDULES=[FAKE_SCHEDULE])
+class GleanedDataTests(TestCase):
+    def serialize(self, rows):
+        return registry.serialize(FakeSchedulePriceList(rows))
+
+    def test_stored_data_can_be_loaded(self):
+        serialized = self.serialize([{'sin': '132-51'}])
+        key = GleanedData.store('abcd', serialized)
+        self.assertEqual(key, f'{FAKE_SCHEDULE}:abcd')
+        self.assertEqual(GleanedData.load(key), list(serialized))
+
+    def test_load_returns_none_for_unknown_keys(self):
+        self.assertIsNone(GleanedData.load('blarg:abcd'))
+
+    def test_storing_again_replaces_data(self):
+        GleanedData.store('abcd', self.serialize([{'sin': '1'}]))
+        key = GleanedData.store('abcd', self.serialize([{'sin': '2'}]))
+        self.assertEqual(GleanedData.objects.count(), 1)
+        self.assertEqual(GleanedData.load(key)[1]['rows'], [{'sin': '2'}])
+
+    def test_delete_expired_works(self):
+        with freeze_time(datetime(2017, 1, 1)):
+            GleanedData.store('old', self.serialize([]))
+        with freeze_time(datetime(2017, 1, 10)):
+            key = GleanedData.store('new', self.serialize([]))
+            self.assertEqual(
+                GleanedData.delete_expired(max_age=timedelta(days=2)), 1)
+        self.assertEqual(
+            list(GleanedData.objects.values_list('key', flat=True)), [key])
+
+    def test_delete_expired_keeps_data_needed_by_replays(self):
+        user = User.objects.create_user('foo')
+        with freeze_time(datetime(2017, 1, 1)):
+            key = GleanedData.store('replayed', self.serialize([]))
+            GleanedData.store('abandoned', self.serialize([]))
+        AttemptedPriceListSubmission.objects.create(
+            submitter=user, session_state={'gleaned_data': key})
+        AttemptedPriceListSubmission.objects.create(
+            submitter=user, session_state={})
+        with freeze_time(datetime(2017, 1, 10)):
+            self.assertEqual(
+                GleanedData.delete_expired(max_age=timedelta(days=2)), 1)
+        self.assertEqual(
+            list(GleanedData.objects.values_list('key', flat=True)), [key])
+
+
 class ModelTestCase(BaseLoginTestCase):
     DEFAULT_SCHEDULE = FAKE_SCHEDULE
 
@@ -252,6 +383,34 @@ class ModelsTests(ModelTestCase):
             f'Price list with id 5 has been set to unreviewed by user id '
             f'{self.user.id} ({self.user.email})')
 
+    @patch('data_capture.models.bump_data_version')
+    def test_status_changes_invalidate_api_cache(self, mock):
+        p = self.create_price_list()
+        p.save()
+        self.create_row(price_list=p).save()
+        p.approve(self.user)
+        self.assertEqual(mock.call_count, 1)
+        p.unreview(self.user)
+        self.assertEqual(mock.call_count, 2)
+        p.approve(self.user)
+        p.retire(self.user)
+        self.assertEqual(mock.call_count, 4)
+
+    @freeze_time(frozen_datetime)
+    def test_approve_and_retire_update_labor_category_counts(self):
+        p = self.create_price_list()
+        p.save()
+        self.create_row(price_list=p).save()
+        self.create_row(price_list=p).save()
+        p.approve(self.user)
+        self.assertEqual(
+            list(LaborCategoryCount.objects.values_list(
+                'labor_category', 'count')),
+            [('project manager', 2)]
+        )
+        p.retire(self.user)
+        self.assertEqual(LaborCategoryCount.objects.count(), 0)
+
     def test_row_stringify_works(self):
         self.assertEqual(str(self.create_row()), 'Submitted price list row')
 
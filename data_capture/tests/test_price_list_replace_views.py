@@ -11,7 +11,7 @@ from .common import (StepTestCase, FAKE_SCHEDULE, uploaded_csv_file,
                      create_csv_content)
 from ..schedules import registry
 from ..schedules.fake_schedule import FakeSchedulePriceList
-from ..models import SubmittedPriceList
+from ..models import SubmittedPriceList, GleanedData
 from ..management.commands.initgroups import PRICE_LIST_UPLOAD_PERMISSION
 from ..views.price_list_replace import SESSION_KEY
 
@@ -126,7 +126,8 @@ class ReplaceStep1Tests(ReplaceStepTest):
         self.assertIn('gleaned_data', sess)
         self.assertIn('price_list_id', sess)
         self.assertIn('uploaded_filename', sess)
-        gleaned_data = registry.deserialize(sess['gleaned_data'])
+        gleaned_data = registry.deserialize(
+            GleanedData.load(sess['gleaned_data']))
         assert isinstance(gleaned_data, FakeSchedulePriceList)
         self.assertEqual(sess['uploaded_filename'], 'foo.csv')
         self.assertEqual(sess['price_list_id'], str(self.price_list.pk))
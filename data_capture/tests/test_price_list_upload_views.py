@@ -3,12 +3,15 @@ from datetime import datetime
 
 from model_mommy import mommy
 from django.utils import timezone
-from django.test import override_settings
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
 from freezegun import freeze_time
 
-from ..models import SubmittedPriceList, AttemptedPriceListSubmission
+from ..models import (SubmittedPriceList, AttemptedPriceListSubmission,
+                      GleanedData, HashedUploadedFile)
 from ..schedules.fake_schedule import FakeSchedulePriceList
 from ..schedules import registry
+from ..views.replay import Replayer
 from ..management.commands.initgroups import (
     PRICE_LIST_UPLOAD_PERMISSION,
     VIEW_ATTEMPT_PERMISSION)
@@ -48,7 +51,7 @@ class PriceListStepTestCase(StepTestCase):
         session['data_capture:price_list']['schedule'] = \
             registry.get_classname(pricelist)
         session['data_capture:price_list']['gleaned_data'] = \
-            registry.serialize(pricelist)
+            GleanedData.store(filename, registry.serialize(pricelist))
         session['data_capture:price_list']['filename'] = filename
         session.save()
 
@@ -313,6 +316,25 @@ class Step3Tests(PriceListStepTestCase, HandleCancelMixin):
         self.assertEqual(AttemptedPriceListSubmission.objects.all().count(),
                          1)
 
+    def test_replay_closes_restored_file(self):
+        user = self.login(is_staff=True,
+                          permissions=[VIEW_ATTEMPT_PERMISSION])
+        attempt = AttemptedPriceListSubmission(
+            submitter=user,
+            session_state=self.client.session['data_capture:price_list'],
+        )
+        attempt.set_uploaded_file(uploaded_csv_file())
+        attempt.save()
+        view = Replayer('foo').recordable(
+            lambda request, recorder: HttpResponse())
+        request = RequestFactory().post('/', {
+            'replay-attempted-submission': str(attempt.id)
+        })
+        request.user = user
+        request.session = {}
+        view(request)
+        self.assertTrue(request.FILES['file'].closed)
+
     def test_replay_is_forbidden_for_non_tech_support_folks(self):
         self.login(is_staff=True)
         res = self.client.post(self.url, {
@@ -360,7 +382,11 @@ class Step3Tests(PriceListStepTestCase, HandleCancelMixin):
         session_pl = self.client.session['data_capture:price_list']
         self.assertEqual(session_pl['step_1_POST']['schedule'],
                          FAKE_SCHEDULE)
-        gleaned_data = session_pl['gleaned_data']
+        self.assertEqual(session_pl['gleaned_data'],
+                         GleanedData.get_key(
+                             HashedUploadedFile.get_hex_hash(
+                                 uploaded_csv_file()), FAKE_SCHEDULE))
+        gleaned_data = GleanedData.load(session_pl['gleaned_data'])
         gleaned_data = registry.deserialize(gleaned_data)
         assert isinstance(gleaned_data, FakeSchedulePriceList)
         self.assertEqual(gleaned_data.rows, [{
@@ -513,6 +539,28 @@ class Step4Tests(PriceListStepTestCase,
         self.assertFalse(res.context['show_edit_form'])
         self.assertEqual(res.status_code, 200)
 
+    def test_expired_gleaned_data_redirects_to_step_3(self):
+        self.login()
+        session = self.client.session
+        session['data_capture:price_list'] = self.session_data
+        session.save()
+        self.set_fake_gleaned_data(self.rows)
+        GleanedData.objects.all().delete()
+        res = self.client.get(self.url)
+        self.assertRedirects(res, Step3Tests.url)
+
+    def test_gleaned_data_serialized_in_session_works(self):
+        self.login()
+        session = self.client.session
+        session['data_capture:price_list'] = {
+            'gleaned_data': registry.serialize(
+                FakeSchedulePriceList(self.rows)),
+            **self.session_data
+        }
+        session.save()
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, 200)
+
     def test_context_has_prev_url_if_query_param_present(self):
         self.login()
         session = self.client.session
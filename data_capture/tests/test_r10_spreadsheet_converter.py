@@ -3,7 +3,10 @@ from django.test import TestCase
 import xlrd
 
 from .common import r10_file
-from ..r10_spreadsheet_converter import Region10SpreadsheetConverter
+from contracts.models import BulkUploadContractSource
+from ..r10_spreadsheet_converter import (
+    Region10SpreadsheetConverter, unpack_rows, get_upload_source_rows,
+    get_upload_source_metadata)
 
 expected_results = [
     ['Project Manager', '123.466', '134.3844', '145.6253', '156.1946', '165.0981', 'Bachelors', '8.0', 'S', 'Both', 'Acme, LLC', 'GS-12F-0123S', 'MOBIS', '123-1, 123-1RC, 456-7, 456-7RC', '2.0', '06/01/2006', '05/31/2021'],  # NOQA
@@ -86,3 +89,26 @@ class TestRegion10SpreadsheetConverter(TestCase):
         parsed_rows = converter.convert_file()
         self.assertEqual(len(parsed_rows), 4)
         self.assertEqual(expected_results, parsed_rows)
+
+    def test_pack(self):
+        converter = Region10SpreadsheetConverter(xls_file=r10_file())
+        packed = converter.pack()
+        self.assertEqual(list(unpack_rows(packed.data)), expected_results)
+        self.assertEqual(packed.num_rows, 4)
+        self.assertEqual(packed.heading_indices,
+                         converter.get_heading_indices_map())
+
+
+class UploadSourceRowsTests(TestCase):
+    def test_packed_rows_are_used(self):
+        packed = Region10SpreadsheetConverter(xls_file=r10_file()).pack()
+        src = BulkUploadContractSource(original_file=b'not a spreadsheet',
+                                       converted_rows=packed.data,
+                                       num_rows=packed.num_rows)
+        self.assertEqual(list(get_upload_source_rows(src)), expected_results)
+        self.assertEqual(get_upload_source_metadata(src), {'num_rows': 4})
+
+    def test_original_file_is_converted_when_rows_are_not_packed(self):
+        src = BulkUploadContractSource(original_file=r10_file().read())
+        self.assertEqual(list(get_upload_source_rows(src)), expected_results)
+        self.assertEqual(get_upload_source_metadata(src), {'num_rows': 4})
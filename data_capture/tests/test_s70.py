@@ -6,9 +6,11 @@ from unittest.mock import MagicMock, patch
 from django.test import TestCase, override_settings
 from django.core.exceptions import ValidationError
 
-from .common import path, uploaded_xlsx_file, FakeWorkbook, FakeSheet
+from .common import (path, uploaded_xlsx_file, uploaded_csv_file,
+                     FakeWorkbook, FakeSheet, R10_XLSX_PATH)
 from .test_models import ModelTestCase
 from ..schedules import s70, registry
+from ..schedules.base import ParsedUpload
 
 
 S70 = '%s.Schedule70PriceList' % s70.__name__
@@ -143,6 +145,32 @@ class LoadFromUploadValidationErrorTests(TestCase):
             s70.Schedule70PriceList.load_from_upload(f)
 
 
+class ProbeTests(TestCase):
+    def probe(self, f):
+        return s70.Schedule70PriceList.probe(ParsedUpload(f))
+
+    def test_price_lists_score_highly(self):
+        self.assertEqual(self.probe(uploaded_xlsx_file(S70_XLSX_PATH)), 1.0)
+
+    def test_other_files_score_zero(self):
+        self.assertEqual(self.probe(uploaded_csv_file()), 0.0)
+        self.assertEqual(self.probe(uploaded_xlsx_file(R10_XLSX_PATH)), 0.0)
+
+    def test_missing_columns_lower_score(self):
+        rows = deepcopy(s70.EXAMPLE_SHEET_ROWS)
+        rows[0][11] = 'Something else'
+        book = FakeWorkbook(sheets=[FakeSheet(s70.DEFAULT_SHEET_NAME, rows)])
+        upload = ParsedUpload(uploaded_xlsx_file(S70_XLSX_PATH))
+        with patch.object(ParsedUpload, 'workbook', book):
+            score = s70.Schedule70PriceList.probe(upload)
+        self.assertEqual(score, 5 / 6)
+
+    def test_load_from_parsed_upload_works(self):
+        upload = ParsedUpload(uploaded_xlsx_file(S70_XLSX_PATH))
+        p = s70.Schedule70PriceList.load_from_parsed_upload(upload)
+        self.assertEqual(len(p.valid_rows), 1)
+
+
 @override_settings(DATA_CAPTURE_SCHEDULES=[S70])
 class S70Tests(ModelTestCase):
     DEFAULT_SCHEDULE = S70
@@ -228,6 +256,32 @@ class S70Tests(ModelTestCase):
 
         self.assertTrue(isinstance(restored, s70.Schedule70PriceList))
         self.assertEqual(s.rows, restored.rows)
+        self.assertEqual(restored.valid_rows[0].cleaned_data,
+                         s.valid_rows[0].cleaned_data)
+        self.assertEqual(restored.to_table(), s.to_table())
+
+    def test_deserialize_does_not_revalidate_rows(self):
+        s = s70.Schedule70PriceList(rows=[
+            {'education_level': 'Batchelorz'},
+        ])
+        saved = json.dumps(registry.serialize(s))
+
+        with patch.object(s70.Schedule70Row, 'full_clean') as full_clean:
+            restored = registry.deserialize(json.loads(saved))
+            full_clean.assert_not_called()
+
+        self.assertEqual(restored.invalid_rows[0].errors,
+                         s.invalid_rows[0].errors)
+        self.assertEqual(restored.to_error_table(), s.to_error_table())
+
+    def test_deserialize_revalidates_rows_serialized_without_results(self):
+        s = s70.Schedule70PriceList.load_from_upload(
+            uploaded_xlsx_file(S70_XLSX_PATH))
+
+        restored = s70.Schedule70PriceList.deserialize(s.rows)
+
+        self.assertEqual(len(restored.valid_rows), 1)
+        self.assertEqual(restored.to_table(), s.to_table())
 
     def test_to_table_works(self):
         s = s70.Schedule70PriceList.load_from_upload(
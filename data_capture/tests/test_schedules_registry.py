@@ -4,7 +4,7 @@ from django.core.exceptions import ValidationError
 
 from ..schedules import registry
 from ..schedules.registry import smart_load_from_upload
-from ..schedules.base import BasePriceList
+from ..schedules.base import BasePriceList, ParsedUpload
 from ..schedules.fake_schedule import FakeSchedulePriceList
 from .common import FAKE_SCHEDULE, uploaded_csv_file, create_csv_content
 
@@ -73,6 +73,19 @@ class FooSchedulePriceList(BasePriceList):
 FOO_SCHEDULE = '%s.FooSchedulePriceList' % __name__
 
 
+class BazSchedulePriceList(BasePriceList):
+    title = 'Baz Schedule'
+
+    @classmethod
+    def probe(cls, upload):
+        return 0.5
+
+
+BAZ_SCHEDULE = '%s.BazSchedulePriceList' % __name__
+
+S70_SCHEDULE = 'data_capture.schedules.s70.Schedule70PriceList'
+
+
 @override_settings(DATA_CAPTURE_SCHEDULES=[FAKE_SCHEDULE, FOO_SCHEDULE])
 class FooScheduleTests(TestCase):
     def test_get_choices_works(self):
@@ -98,3 +111,45 @@ class SmartLoadFromUploadTests(TestCase):
     def test_original_error_propagated_when_better_matches_not_found(self):
         with self.assertRaisesRegexp(ValidationError, 'Bar'):
             smart_load_from_upload(FOO_SCHEDULE, uploaded_csv_file(b'nope'))
+
+
+@override_settings(DATA_CAPTURE_SCHEDULES=[BAZ_SCHEDULE, FOO_SCHEDULE,
+                                           FAKE_SCHEDULE])
+class RankedFallbackTests(TestCase):
+    def test_fallbacks_are_ranked_by_probe_score(self):
+        upload = ParsedUpload(uploaded_csv_file())
+        self.assertEqual(registry.rank_fallbacks(upload, FOO_SCHEDULE),
+                         [FAKE_SCHEDULE, BAZ_SCHEDULE])
+
+    def test_schedules_that_do_not_probe_are_ranked_last(self):
+        upload = ParsedUpload(uploaded_csv_file())
+        self.assertEqual(registry.rank_fallbacks(upload, BAZ_SCHEDULE),
+                         [FAKE_SCHEDULE, FOO_SCHEDULE])
+
+    @override_settings(DATA_CAPTURE_SCHEDULES=[FOO_SCHEDULE, FAKE_SCHEDULE])
+    @patch.object(FakeSchedulePriceList, 'probe', return_value=None)
+    def test_schedules_that_do_not_probe_are_still_tried(self, m):
+        p = smart_load_from_upload(FOO_SCHEDULE, uploaded_csv_file())
+        self.assertTrue(isinstance(p, FakeSchedulePriceList))
+
+    @patch.object(FakeSchedulePriceList, 'probe', return_value=0.25)
+    def test_next_fallback_is_tried_if_best_one_fails(self, m):
+        with patch.object(BazSchedulePriceList, 'load_from_parsed_upload',
+                          side_effect=ValidationError('Nope')) as baz:
+            p = smart_load_from_upload(FOO_SCHEDULE, uploaded_csv_file())
+        self.assertTrue(isinstance(p, FakeSchedulePriceList))
+        self.assertEqual(baz.call_count, 1)
+
+    @patch.object(BazSchedulePriceList, 'load_from_parsed_upload')
+    def test_only_the_best_fallback_is_loaded(self, m):
+        p = smart_load_from_upload(FOO_SCHEDULE, uploaded_csv_file())
+        self.assertTrue(isinstance(p, FakeSchedulePriceList))
+        self.assertEqual(m.call_count, 0)
+
+    @override_settings(DATA_CAPTURE_SCHEDULES=[S70_SCHEDULE, FAKE_SCHEDULE])
+    def test_upload_is_only_read_once(self):
+        with patch.object(ParsedUpload, '_read', autospec=True,
+                          side_effect=ParsedUpload._read) as read:
+            p = smart_load_from_upload(S70_SCHEDULE, uploaded_csv_file())
+        self.assertTrue(isinstance(p, FakeSchedulePriceList))
+        self.assertEqual(read.call_count, 1)
@@ -0,0 +1,136 @@
+import io
+import zipfile
+
+import xlrd
+from defusedxml.common import EntitiesForbidden
+from django.test import SimpleTestCase
+
+from .common import R10_XLSX_PATH
+from .test_xlsx_security import BILLION_LAUGHS_XML
+from .. import benchmarks
+from ..r10_spreadsheet_converter import Region10SpreadsheetConverter
+from ..streaming_xlsx import StreamingXlsxSheet, get_column_index
+
+
+NS = f'xmlns="{benchmarks.MAIN_NS}"'
+
+SHARED_STRINGS_XML = f'''<?xml version="1.0" encoding="UTF-8"?>
+<sst {NS}>
+<si><t>hello</t></si>
+<si><r><t xml:space="preserve">rich </t></r><r><t>text</t></r></si>
+</sst>'''
+
+# A sheet with every type of cell, rows without numbers, cells without
+# names, blank rows and trailing rows without any values.
+SHEET_XML = f'''<?xml version="1.0" encoding="UTF-8"?>
+<worksheet {NS}><sheetData>
+<row r="1"><c r="A1" t="s"><v>0</v></c><c r="C1" t="s"><v>1</v></c></row>
+<row r="2"><c r="A2"><v>1.5</v></c><c r="B2" s="1"><v>38869</v></c>
+  <c r="C2" t="b"><v>1</v></c><c r="D2" t="e"><v>#DIV/0!</v></c></row>
+<row r="4"><c r="A4" t="str"><f>A1</f><v> padded_x000D_ </v></c>
+  <c r="$B$4" t="inlineStr"><is><t xml:space="preserve"> in </t>
+  <r><t>line</t></r><rPh><t>ignored</t></rPh></is></c>
+  <c r="C4" t="s"/><c r="D4"/></row>
+<row><c t="s"><v>0</v></c><c><v>2</v></c></row>
+<row r="7"><c r="A7" s="1"/></row>
+<row r="8"><c r="AB8" t="inlineStr"><is><t>far</t></is></c></row>
+<row r="9"><c r="A9" t="s"/></row>
+</sheetData></worksheet>'''
+
+
+def make_xlsx(sheet_xml=SHEET_XML, date1904=False):
+    blob = io.BytesIO()
+    with zipfile.ZipFile(blob, 'w') as zf:
+        zf.writestr('[Content_Types].xml', benchmarks.CONTENT_TYPES_XML)
+        zf.writestr('xl/workbook.xml', benchmarks.get_workbook_xml(date1904))
+        zf.writestr('xl/_rels/workbook.xml.rels',
+                    benchmarks.WORKBOOK_RELS_XML)
+        zf.writestr('xl/styles.xml', benchmarks.STYLES_XML)
+        zf.writestr('xl/sharedStrings.xml', SHARED_STRINGS_XML)
+        zf.writestr('xl/worksheets/sheet1.xml', sheet_xml)
+    blob.seek(0)
+    return blob
+
+
+def read_with_xlrd(f):
+    sheet = xlrd.open_workbook(file_contents=f.read()).sheet_by_index(0)
+    f.seek(0)
+    return [
+        {colx: (ctype, value) for colx, (ctype, value) in
+         enumerate(zip(sheet.row_types(rx), sheet.row_values(rx)))
+         if ctype != xlrd.XL_CELL_EMPTY}
+        for rx in range(sheet.nrows)
+    ]
+
+
+class StreamingXlsxSheetTests(SimpleTestCase):
+    def assertMatchesXlrd(self, f):
+        self.assertEqual(list(StreamingXlsxSheet(f).iter_rows()),
+                         read_with_xlrd(f))
+
+    def test_rows_match_xlrd(self):
+        self.assertMatchesXlrd(make_xlsx())
+
+    def test_rows_match_xlrd_for_r10_export(self):
+        with open(R10_XLSX_PATH, 'rb') as f:
+            self.assertMatchesXlrd(f)
+
+    def test_cells_are_decoded(self):
+        rows = list(StreamingXlsxSheet(make_xlsx()).iter_rows())
+        self.assertEqual(len(rows), 8)
+        self.assertEqual(rows[0], {0: (xlrd.XL_CELL_TEXT, 'hello'),
+                                   2: (xlrd.XL_CELL_TEXT, 'rich text')})
+        self.assertEqual(rows[1][1], (xlrd.XL_CELL_DATE, 38869.0))
+        self.assertEqual(rows[2], {})
+        self.assertEqual(rows[3], {0: (xlrd.XL_CELL_TEXT, 'padded\r'),
+                                   1: (xlrd.XL_CELL_TEXT, ' in line')})
+        self.assertEqual(rows[7], {27: (xlrd.XL_CELL_TEXT, 'far')})
+
+    def test_datemode_is_read(self):
+        self.assertEqual(StreamingXlsxSheet(make_xlsx()).datemode, 0)
+        self.assertEqual(
+            StreamingXlsxSheet(make_xlsx(date1904=True)).datemode, 1)
+
+    def test_count_rows_works(self):
+        self.assertEqual(StreamingXlsxSheet(make_xlsx()).count_rows(), 8)
+
+    def test_file_is_rewound(self):
+        f = make_xlsx()
+        rows = StreamingXlsxSheet(f).iter_rows()
+        next(rows)
+        rows.close()
+        self.assertEqual(f.tell(), 0)
+
+    def test_rows_out_of_order_raise_error(self):
+        f = make_xlsx(f'''<worksheet {NS}><sheetData>
+            <row r="2"><c r="A2"><v>1</v></c></row>
+            <row r="1"><c r="A1"><v>1</v></c></row>
+        </sheetData></worksheet>''')
+        with self.assertRaisesRegex(ValueError, 'out of order'):
+            list(StreamingXlsxSheet(f).iter_rows())
+
+    def test_entities_are_forbidden(self):
+        f = make_xlsx(BILLION_LAUGHS_XML)
+        with self.assertRaises(EntitiesForbidden):
+            list(StreamingXlsxSheet(f).iter_rows())
+
+    def test_get_column_index_works(self):
+        self.assertEqual(get_column_index('XFD1048576'), 16383)
+        with self.assertRaisesRegex(ValueError, 'Unexpected character'):
+            get_column_index('a1')
+
+
+class StreamingConversionTests(SimpleTestCase):
+    def test_conversion_matches_xlrd(self):
+        contents = benchmarks.make_synthetic_r10_xlsx(50)
+
+        converter = Region10SpreadsheetConverter(io.BytesIO(contents))
+        converter._is_xlsx = False
+        expected = converter.convert_file()
+
+        converter = Region10SpreadsheetConverter(io.BytesIO(contents))
+        self.assertTrue(converter.is_xlsx)
+        self.assertEqual(converter.convert_file(), expected)
+        self.assertEqual(len(expected), 50)
+        self.assertRegex(expected[0][15], r'^\d\d/\d\d/\d{4}$')
+        self.assertEqual(converter.get_metadata(), {'num_rows': 50})
@@ -0,0 +1,40 @@
+import hashlib
+from unittest.mock import patch
+
+from django.core.files.uploadedfile import (InMemoryUploadedFile,
+                                            SimpleUploadedFile,
+                                            TemporaryUploadedFile)
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from ..upload_handlers import HEADER_SIZE, HashingUploadHandlerMixin
+
+
+class UploadHandlerTests(SimpleTestCase):
+    CONTENT = bytes(range(256)) * 10
+
+    def upload(self):
+        request = RequestFactory().post('/', {
+            'file': SimpleUploadedFile('foo.xlsx', self.CONTENT),
+        })
+        return request.FILES['file']
+
+    def assert_hashed(self, f):
+        self.assertEqual(f.hex_hash,
+                         hashlib.sha256(self.CONTENT).hexdigest())
+        self.assertEqual(f.header, self.CONTENT[:HEADER_SIZE])
+        self.assertEqual(f.read(), self.CONTENT)
+
+    def test_files_in_memory_are_hashed(self):
+        f = self.upload()
+        self.assertIsInstance(f, InMemoryUploadedFile)
+        self.assert_hashed(f)
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=100)
+    def test_temporary_files_are_hashed(self):
+        f = self.upload()
+        self.assertIsInstance(f, TemporaryUploadedFile)
+        self.assert_hashed(f)
+
+    @patch.object(HashingUploadHandlerMixin, 'chunk_size', 100)
+    def test_files_uploaded_in_many_chunks_are_hashed(self):
+        self.assert_hashed(self.upload())
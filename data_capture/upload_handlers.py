@@ -0,0 +1,63 @@
+'''
+Upload handlers that hash uploaded files, and keep their first few
+bytes, as their chunks arrive, so that nothing needs to read the whole
+file again just to find its hash or to guess what kind of file it is.
+
+Each uploaded file they create has two extra attributes:
+
+  * `hex_hash`, the hex digest of its contents, hashed with
+    `HashedUploadedFile.HASH_NAME`, and
+
+  * `header`, its first `HEADER_SIZE` bytes (or fewer, if the file
+    is smaller than that).
+
+See `FILE_UPLOAD_HANDLERS` in settings.py.
+'''
+
+import hashlib
+
+from django.core.files.uploadhandler import (FileUploadHandler,
+                                             MemoryFileUploadHandler,
+                                             TemporaryFileUploadHandler)
+
+from .models import HashedUploadedFile
+
+
+HEADER_SIZE = 512
+
+
+class HashingUploadHandlerMixin(FileUploadHandler):
+    def new_file(self, *args, **kwargs):
+        # This needs to happen first, since MemoryFileUploadHandler raises
+        # StopFutureHandlers from new_file() when it's taking the file.
+        self.hasher = hashlib.new(HashedUploadedFile.HASH_NAME)
+        self.header = b''
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        result = super().receive_data_chunk(raw_data, start)
+        # Handlers return None once they've taken care of a chunk, rather
+        # than passing it on to the next handler, so only the handler
+        # that's actually storing the file hashes it.
+        if result is None:
+            self.hasher.update(raw_data)
+            if len(self.header) < HEADER_SIZE:
+                self.header += raw_data[:HEADER_SIZE - len(self.header)]
+        return result
+
+    def file_complete(self, file_size):
+        f = super().file_complete(file_size)
+        if f is not None:
+            f.hex_hash = self.hasher.hexdigest()
+            f.header = self.header
+        return f
+
+
+class HashingMemoryFileUploadHandler(HashingUploadHandlerMixin,
+                                     MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadHandlerMixin,
+                                        TemporaryFileUploadHandler):
+    pass
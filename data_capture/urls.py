@@ -8,6 +8,8 @@ urlpatterns = [
     url(r'^step/3/errors$', price_list_upload.step_3_errors,
         name='step_3_errors'),
     url(r'^bulk/region-10/step/', include(bulk_upload.steps.urls)),
+    url(r'^bulk/region-10/status$', bulk_upload.bulk_region_10_status,
+        name='bulk_region_10_status'),
     url(r'^price-lists$', price_lists.list_price_lists,
         name="price_lists"),
     url(r'^price-lists/(?P<id>[0-9]+)$', price_lists.price_list_details,
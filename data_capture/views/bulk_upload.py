@@ -1,12 +1,15 @@
+from django.http import JsonResponse
 from django.shortcuts import redirect
-from django.core.files.base import ContentFile
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import require_GET, require_http_methods
 from django.conf import settings
 from django.contrib.auth.decorators import login_required, permission_required
 from django.template.loader import render_to_string
+from rq.exceptions import NoSuchJobError
+from rq.job import Job
+import django_rq
 
 from .. import forms, jobs
-from ..r10_spreadsheet_converter import Region10SpreadsheetConverter
+from ..r10_spreadsheet_converter import get_upload_source_metadata
 from ..management.commands.initgroups import BULK_UPLOAD_PERMISSION
 from ..decorators import handle_cancel
 from .common import add_generic_form_error
@@ -83,13 +86,17 @@ def bulk_region_10_step_1(request, step):
 
         if form.is_valid():
             file = form.cleaned_data['file']
+            packed_rows = form.cleaned_data['packed_rows']
 
             upload_source = BulkUploadContractSource.objects.create(
                 submitter=request.user,
                 procurement_center=BulkUploadContractSource.REGION_10,
                 has_been_loaded=False,
                 original_file=file.read(),
-                file_mime_type=file.content_type
+                file_mime_type=file.content_type,
+                converted_rows=packed_rows.data,
+                num_rows=packed_rows.num_rows,
+                heading_indices=packed_rows.heading_indices,
             )
 
             request.session['data_capture:upload_source_id'] = upload_source.pk
@@ -132,19 +139,19 @@ def bulk_region_10_step_2(request, step):
         upload_source = BulkUploadContractSource.objects.get(
             pk=upload_source_id)
 
-        file = ContentFile(upload_source.original_file)
-
-        file_metadata = Region10SpreadsheetConverter(file).get_metadata()
+        file_metadata = get_upload_source_metadata(upload_source)
 
         return step.render(request, {
             'file_metadata': file_metadata,
         })
 
     # else 'POST' because of @require_http_methods decorator
-    jobs.process_bulk_upload_and_send_email.delay(upload_source_id)
+    job = jobs.process_bulk_upload_and_send_email.delay(upload_source_id)
 
-    # remove the upload_source_id from session
+    # remove the upload_source_id from session, and remember the job
+    # so that step 3 can show its progress
     del request.session['data_capture:upload_source_id']
+    request.session['data_capture:bulk_upload_job_id'] = job.id
 
     return redirect('data_capture:bulk_region_10_step_3')
 
@@ -157,4 +164,29 @@ def bulk_region_10_step_3(request, step):
 
     return step.render(request, {
         'SEND_TRANSACTIONAL_EMAILS': settings.SEND_TRANSACTIONAL_EMAILS,
+        'has_job': 'data_capture:bulk_upload_job_id' in request.session,
+    })
+
+
+@login_required
+@permission_required(BULK_UPLOAD_PERMISSION, raise_exception=True)
+@require_GET
+def bulk_region_10_status(request):
+    '''
+    Return the status of the job processing the user's latest upload,
+    along with the progress it has published (see
+    jobs.BulkUploadProgress), as JSON.
+    '''
+
+    job_id = request.session.get('data_capture:bulk_upload_job_id')
+    try:
+        if job_id is None:
+            raise NoSuchJobError()
+        job = Job.fetch(job_id, connection=django_rq.get_connection())
+    except NoSuchJobError:
+        return JsonResponse({'status': None, 'progress': None}, status=404)
+
+    return JsonResponse({
+        'status': job.get_status(),
+        'progress': job.meta.get('progress'),
     })
@@ -3,6 +3,7 @@ from django.contrib import messages
 from django.template.defaultfilters import pluralize
 from django.core.urlresolvers import reverse
 
+from ..models import GleanedData, HashedUploadedFile
 from ..schedules import registry
 
 
@@ -75,14 +76,33 @@ def get_nested_item(obj, keys, default=None):
     return obj[key]
 
 
+def store_gleaned_data(f, gleaned_data):
+    '''
+    Stores the given price list, gleaned from the given uploaded file,
+    in GleanedData, returning the key that should be put in the session
+    as its 'gleaned_data'.
+    '''
+
+    return GleanedData.store(HashedUploadedFile.get_hex_hash(f),
+                             registry.serialize(gleaned_data))
+
+
 def get_deserialized_gleaned_data(
         request, primary_session_key='data_capture:price_list'):
     '''
-    Gets 'gleaned_data' from session and uses the registry to deserialize
-    it. Returns None if 'gleaned_data' is not in session.
+    Gets 'gleaned_data' from session, which is the key it was stored
+    under by store_gleaned_data(), loads it and uses the registry to
+    deserialize it. Returns None if 'gleaned_data' is not in session,
+    or if it has expired.
+
+    Sessions (and replays of them) from before gleaned data was stored
+    outside of them contain the serialized price list itself, which is
+    deserialized as-is.
     '''
     serialized_gleaned_data = get_nested_item(request.session, (
         primary_session_key, 'gleaned_data'))
+    if isinstance(serialized_gleaned_data, str):
+        serialized_gleaned_data = GleanedData.load(serialized_gleaned_data)
     if serialized_gleaned_data:
         return registry.deserialize(serialized_gleaned_data)
     return None
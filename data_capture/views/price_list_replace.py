@@ -9,7 +9,8 @@ from django.contrib.auth.decorators import login_required, permission_required
 from django.core.exceptions import SuspiciousOperation
 
 from .common import (add_generic_form_error, get_nested_item,
-                     get_deserialized_gleaned_data, add_change_success_message)
+                     get_deserialized_gleaned_data, store_gleaned_data,
+                     add_change_success_message)
 from .. import forms
 from ..schedules import registry
 from ..models import SubmittedPriceList
@@ -83,7 +84,8 @@ def replace_step_1(request, id, step):
         if form.is_valid():
             gleaned_data = form.cleaned_data['gleaned_data']
             request.session[SESSION_KEY] = {
-                'gleaned_data': registry.serialize(gleaned_data),
+                'gleaned_data': store_gleaned_data(
+                    form.cleaned_data['file'], gleaned_data),
                 'uploaded_filename': form.cleaned_data['file'].name,
                 # save the id in session to make sure flow is not messed with
                 'price_list_id': id,
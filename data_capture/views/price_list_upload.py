@@ -17,7 +17,8 @@ from ..decorators import handle_cancel
 from ..schedules import registry
 from ..management.commands.initgroups import PRICE_LIST_UPLOAD_PERMISSION
 from .common import (add_generic_form_error, build_url,
-                     get_nested_item, get_deserialized_gleaned_data)
+                     get_nested_item, get_deserialized_gleaned_data,
+                     store_gleaned_data)
 from .replay import Replayer
 from frontend import ajaxform
 from frontend.steps import Steps
@@ -195,7 +196,8 @@ def step_3(request, step, recorder):
             if 'gleaned_data' in form.cleaned_data:
                 gleaned_data = form.cleaned_data['gleaned_data']
 
-                session_pl['gleaned_data'] = registry.serialize(gleaned_data)
+                session_pl['gleaned_data'] = store_gleaned_data(
+                    form.cleaned_data['file'], gleaned_data)
                 session_pl['filename'] = form.cleaned_data['file'].name
                 request.session.modified = True
 
@@ -322,7 +324,7 @@ def step_4(request, step):
 
                 price_list.submitter = request.user
                 price_list.serialized_gleaned_data = json.dumps(
-                    session_pl['gleaned_data'])
+                    registry.serialize(gleaned_data))
 
                 # We always want to explicitly set the schedule to the
                 # one that the gleaned data is part of, in case we gracefully
@@ -59,6 +59,9 @@ class Replayer:
         This essentially makes the request's session and POST
         data look like it did when the replay was originally
         recorded.
+
+        Returns the restored uploaded file, if any, which the caller
+        should close once the request has been handled.
         '''
 
         attempt_id = request.POST['replay-attempted-submission']
@@ -69,7 +72,10 @@ class Replayer:
             **attempt.session_state
         }
         if attempt.uploaded_file:
-            request.FILES['file'] = attempt.restore_uploaded_file()
+            f = attempt.restore_uploaded_file()
+            request.FILES['file'] = f
+            return f
+        return None
 
     @staticmethod
     def can_view_replays(user):
@@ -91,15 +97,20 @@ class Replayer:
 
         @wraps(func)
         def view(request, *args, **kwargs):
+            replayed_file = None
             if (request.method == 'POST' and
                     'replay-attempted-submission' in request.POST):
                 if not self.can_view_replays(request.user):
                     return HttpResponseForbidden()
-                self._load_replay(request)
-
-            with Recorder(self, request) as recorder:
-                kwargs['recorder'] = recorder
-                return func(request, *args, **kwargs)
+                replayed_file = self._load_replay(request)
+
+            try:
+                with Recorder(self, request) as recorder:
+                    kwargs['recorder'] = recorder
+                    return func(request, *args, **kwargs)
+            finally:
+                if replayed_file is not None:
+                    replayed_file.close()
 
         return view
 
@@ -0,0 +1,88 @@
+/* global jQuery, window, document */
+
+import * as supports from './feature-detection';
+
+const $ = jQuery;
+
+const POLL_INTERVAL = 2000;
+
+const DONE_STAGES = ['finished', 'failed'];
+
+/**
+ * Describe the status of a bulk upload job, as returned by the
+ * data_capture:bulk_region_10_status view, in plain English.
+ */
+
+export function describeStatus({ status, progress }) {
+  if (status === 'failed' || (progress && progress.stage === 'failed')) {
+    return 'Sorry, an error occurred while processing your data.';
+  }
+  if (!progress) {
+    return status === 'finished' ? 'Processing is complete.'
+      : 'Waiting for processing to start…';
+  }
+  if (progress.stage === 'finished') {
+    return `Processing is complete. ${progress.rows_parsed} rows were `
+           + `read, of which ${progress.bad_rows} could not be loaded.`;
+  }
+
+  const parts = [];
+  const total = progress.num_rows === null ? '' : ` of ${progress.num_rows}`;
+  parts.push(`Read ${progress.rows_parsed}${total} rows `
+             + `(${progress.bad_rows} bad).`);
+  if (progress.rows_to_write !== null) {
+    parts.push(`Saved ${progress.rows_written} of `
+               + `${progress.rows_to_write} changes.`);
+  }
+  if (progress.eta_seconds !== null) {
+    const minutes = Math.ceil(progress.eta_seconds / 60);
+    parts.push(`About ${minutes} minute${minutes === 1 ? '' : 's'} left.`);
+  }
+  return parts.join(' ');
+}
+
+/**
+ * BulkUploadProgress represents a <bulk-upload-progress> web component,
+ * which periodically fetches the status of a bulk upload job from the
+ * URL in its data-status-url attribute and describes it in its first
+ * child element.
+ */
+
+class BulkUploadProgress extends window.HTMLElement {
+  attachedCallback() {
+    if ('isUpgraded' in this) {
+      // We've already been attached.
+      return;
+    }
+
+    this.output = this.firstElementChild;
+    this.isUpgraded = Boolean(this.output
+                              && !supports.isForciblyDegraded(this));
+
+    if (this.isUpgraded) {
+      this.poll();
+    }
+  }
+
+  detachedCallback() {
+    window.clearTimeout(this.timeout);
+  }
+
+  poll() {
+    $.getJSON(this.getAttribute('data-status-url'))
+      .done((data) => {
+        this.output.textContent = describeStatus(data);
+        const isDone = data.status === 'finished' || data.status === 'failed'
+          || (data.progress && DONE_STAGES.indexOf(data.progress.stage) >= 0);
+        if (!isDone) {
+          this.timeout = window.setTimeout(() => this.poll(), POLL_INTERVAL);
+        }
+      });
+  }
+}
+
+BulkUploadProgress.prototype.SOURCE_FILENAME = __filename;
+
+document.registerElement('bulk-upload-progress', {
+  prototype: BulkUploadProgress.prototype,
+});
@@ -15,6 +15,7 @@ require('./upload');
 require('./ajaxform');
 require('./alerts');
 require('./expandable-area');
+require('./bulk-upload-progress');
 require('./date');
 require('./smooth-scroll');
 require('./modal-dialogs');
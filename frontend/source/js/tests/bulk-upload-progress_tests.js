@@ -0,0 +1,47 @@
+/* global QUnit */
+
+import { describeStatus } from '../data-capture/bulk-upload-progress';
+
+QUnit.module('bulk-upload-progress');
+
+const progress = {
+  stage: 'writing',
+  num_rows: 100,
+  rows_parsed: 100,
+  bad_rows: 2,
+  rows_written: 10,
+  rows_to_write: 40,
+  eta_seconds: 61,
+};
+
+QUnit.test('describes queued jobs', (assert) => {
+  assert.equal(describeStatus({ status: 'queued', progress: null }),
+               'Waiting for processing to start…');
+});
+
+QUnit.test('describes jobs in progress', (assert) => {
+  assert.equal(describeStatus({ status: 'started', progress }),
+               'Read 100 of 100 rows (2 bad). Saved 10 of 40 changes. '
+               + 'About 2 minutes left.');
+});
+
+QUnit.test('omits what is not known yet', (assert) => {
+  assert.equal(describeStatus({
+    status: 'started',
+    progress: Object.assign({}, progress, {
+      stage: 'parsing', num_rows: null, rows_to_write: null, eta_seconds: null,
+    }),
+  }), 'Read 100 rows (2 bad).');
+});
+
+QUnit.test('describes finished and failed jobs', (assert) => {
+  assert.equal(describeStatus({
+    status: 'finished',
+    progress: Object.assign({}, progress, { stage: 'finished' }),
+  }), 'Processing is complete. 100 rows were read, of which 2 could not '
+      + 'be loaded.');
+  assert.equal(describeStatus({
+    status: 'finished',
+    progress: Object.assign({}, progress, { stage: 'failed' }),
+  }), 'Sorry, an error occurred while processing your data.');
+});
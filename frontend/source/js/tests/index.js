@@ -3,6 +3,7 @@ require('../data-capture');
 require('./ajaxform_tests');
 require('./upload_tests');
 require('./expandable-area_tests');
+require('./bulk-upload-progress_tests');
 require('./alerts_tests');
 require('./date_tests');
 require('./smooth-scroll_tests');
@@ -0,0 +1,122 @@
+import time
+from typing import NamedTuple, List
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+class Benchmark(NamedTuple):
+    name: str
+
+    # Fully-qualified name of a generator function that takes the number
+    # of rows to benchmark against, sets up any data it needs, and then
+    # yields (label, callable) tuples for each approach being compared.
+    func: str
+
+
+BENCHMARKS: List[Benchmark] = [
+    Benchmark(name='histogram', func='api.benchmarks.histogram'),
+    Benchmark(name='rates_stats', func='api.benchmarks.rates_stats'),
+    Benchmark(name='rates_deep_page',
+              func='api.benchmarks.rates_deep_page'),
+    Benchmark(name='rates_csv', func='api.benchmarks.rates_csv'),
+    Benchmark(name='rates_revalidation',
+              func='api.benchmarks.rates_revalidation'),
+    Benchmark(name='rates_snapshot', func='api.benchmarks.rates_snapshot'),
+    Benchmark(name='rates_snapshot_reload',
+              func='api.benchmarks.rates_snapshot_reload'),
+    Benchmark(name='bulk_load', func='contracts.benchmarks.bulk_load'),
+    Benchmark(name='search', func='contracts.benchmarks.search'),
+    Benchmark(name='autocomplete', func='contracts.benchmarks.autocomplete'),
+    Benchmark(name='r10_spreadsheet',
+              func='data_capture.benchmarks.r10_spreadsheet'),
+    Benchmark(name='r10_conversion',
+              func='data_capture.benchmarks.r10_conversion'),
+    Benchmark(name='gleaned_data',
+              func='data_capture.benchmarks.gleaned_data'),
+]
+
+
+def get_benchmark_names(joiner: str=", ") -> str:
+    return joiner.join([b.name for b in BENCHMARKS])
+
+
+class Command(BaseCommand):
+    help = f'''
+    Run benchmarks against synthetic data. All database changes
+    are rolled back once the benchmarks are finished.
+
+    Available benchmarks are: {get_benchmark_names()}.
+    '''
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'names',
+            nargs='*',
+            help='names of benchmarks to run (default is to run all)'
+        )
+
+        parser.add_argument(
+            '-r', '--rows',
+            default=100000,
+            type=int,
+            help='number of rows of synthetic data (default is 100000)'
+        )
+
+        parser.add_argument(
+            '--repeat',
+            default=3,
+            type=int,
+            help='number of times to run each approach (default is 3)'
+        )
+
+    def time_it(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            # Roll back anything the approach does to the database, so that
+            # every run starts from the same state.
+            sid = transaction.savepoint()
+            try:
+                start = time.perf_counter()
+                func()
+                timings.append(time.perf_counter() - start)
+            finally:
+                transaction.savepoint_rollback(sid)
+        return min(timings)
+
+    def run_benchmark(self, benchmark, num_rows, repeat):
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Benchmark '{benchmark.name}' with {num_rows} rows:"))
+        baseline = None
+        for label, func in import_string(benchmark.func)(num_rows):
+            best = self.time_it(func, repeat)
+            if baseline is None:
+                baseline = best
+            speedup = baseline / best if best else float('inf')
+            self.stdout.write(
+                f"  {label}: {best * 1000:.1f} ms "
+                f"({num_rows / best if best else 0:.0f} rows/sec, "
+                f"{speedup:.1f}x)"
+            )
+
+    def handle(self, *args, **options):
+        names = options['names'] or [b.name for b in BENCHMARKS]
+        benchmarks = {b.name: b for b in BENCHMARKS}
+
+        for name in names:
+            if name not in benchmarks:
+                raise CommandError(
+                    f'Unknown benchmark "{name}". Available benchmarks '
+                    f'are: {get_benchmark_names()}.'
+                )
+
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1.')
+
+        for name in names:
+            # Each benchmark gets a fresh database to work with.
+            with transaction.atomic():
+                self.run_benchmark(benchmarks[name], options['rows'],
+                                   options['repeat'])
+                transaction.set_rollback(True)
@@ -0,0 +1,39 @@
+import io
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from contracts.models import Contract
+from ..management.commands.benchmark import BENCHMARKS
+
+
+def run_benchmark(*args, **kwargs):
+    out = io.StringIO()
+    call_command('benchmark', *args, stdout=out, **kwargs)
+    return out.getvalue()
+
+
+class TestBenchmark(TestCase):
+    def test_all_benchmarks_run(self):
+        output = run_benchmark(rows=50, repeat=1)
+        for benchmark in BENCHMARKS:
+            self.assertIn(f"Benchmark '{benchmark.name}' with 50 rows",
+                          output)
+
+    def test_histogram_benchmark_works(self):
+        output = run_benchmark('histogram', rows=50, repeat=1)
+        self.assertIn('get_histogram (Python)', output)
+        self.assertIn('get_histogram_from_queryset (SQL)', output)
+
+    def test_rates_stats_benchmark_works(self):
+        output = run_benchmark('rates_stats', rows=50, repeat=1)
+        self.assertIn('get_stats_from_queryset (1 query)', output)
+
+    def test_changes_are_rolled_back(self):
+        run_benchmark('histogram', rows=50, repeat=1)
+        self.assertEqual(Contract.objects.count(), 0)
+
+    def test_unknown_benchmark_raises_error(self):
+        with self.assertRaisesRegexp(CommandError, 'Unknown benchmark'):
+            run_benchmark('blarg')
@@ -16,11 +16,14 @@ echo "----- Migrating Database -----"
 python manage.py migrate --noinput
 
 echo "----- Updating search field -----"
-python manage.py update_search_field
+python manage.py update_search_field --only-changed
 
 echo "----- Initializing Groups -----"
 python manage.py initgroups
 
+echo "----- Moving uploaded files to chunked storage -----"
+python manage.py migrate_slowpoke_storage
+
 if [ -n "${CALC_IS_ON_DOCKER_IN_CLOUD}" ]; then
   echo "----- Building Static Assets -----"
   gulp build